@@ -0,0 +1,265 @@
+"""
+📦 BLACKBOX WRITER
+Фоновая запись событий blackbox (JSONL) с ротацией и сжатием сегментов
+"""
+
+import os
+import gzip
+import json
+import queue
+import shutil
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from config import (
+    BLACKBOX_FILE, BLACKBOX_QUEUE_SIZE, BLACKBOX_FLUSH_INTERVAL, BLACKBOX_FSYNC_EVERY,
+    BLACKBOX_MAX_BYTES, BLACKBOX_ROTATE_DAILY, BLACKBOX_COMPRESSION,
+)
+
+# ==========================================
+# 🛡️ ZSTD SAFE IMPORT (опционально)
+# ==========================================
+HAS_ZSTD = False
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    pass
+
+_STOP = object()
+
+
+class BlackboxWriter:
+    """
+    Горячий путь — только put_nowait в ограниченную очередь.
+    Сериализация, запись, fsync и ротация выполняются фоновым потоком.
+    """
+
+    def __init__(self, path=BLACKBOX_FILE, queue_size=BLACKBOX_QUEUE_SIZE,
+                 flush_interval=BLACKBOX_FLUSH_INTERVAL, fsync_every=BLACKBOX_FSYNC_EVERY,
+                 max_bytes=BLACKBOX_MAX_BYTES, rotate_daily=BLACKBOX_ROTATE_DAILY,
+                 compression=BLACKBOX_COMPRESSION):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync_every = fsync_every
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compression = compression
+        if self.compression == "zstd" and not HAS_ZSTD:
+            self.compression = "gzip"
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_day = None
+        self._segment_bytes = 0
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._overflowing = False
+
+        # Счётчики
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.overflows = 0
+        self.errors = 0
+        self.rotations = 0
+        self.fsyncs = 0
+        self.max_queue_depth = 0
+
+        self._thread = threading.Thread(target=self._writer_loop, name="blackbox-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Горячий путь
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def write(self, event_type, data):
+        """Неблокирующая постановка события в очередь. False — событие отброшено"""
+        try:
+            self._queue.put_nowait((time.time(), event_type, data))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                if not self._overflowing:
+                    self._overflowing = True
+                    self.overflows += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def stats(self):
+        """Счётчики для дашборда/метрик"""
+        with self._lock:
+            return {
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "overflows": self.overflows,
+                "errors": self.errors,
+                "rotations": self.rotations,
+                "fsyncs": self.fsyncs,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+    def close(self, timeout=5.0):
+        """Дописывает очередь, делает fsync и останавливает поток"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Фоновый поток
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _writer_loop(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < 1000:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = _STOP in batch
+            events = [item for item in batch if item is not _STOP]
+
+            depth = len(events) + self._queue.qsize()
+            with self._lock:
+                if depth > self.max_queue_depth:
+                    self.max_queue_depth = depth
+                if self._overflowing and self._queue.qsize() < self._queue.maxsize // 2:
+                    self._overflowing = False
+
+            if events:
+                self._write_batch(events)
+            self._maybe_fsync(force=stop)
+
+            if stop:
+                self._close_segment()
+                return
+
+    def _write_batch(self, events):
+        lines = []
+        for ts, event_type, data in events:
+            try:
+                entry = {"timestamp": datetime.fromtimestamp(ts).isoformat(), "event": event_type, **data}
+                lines.append(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+        if not lines:
+            return
+
+        try:
+            self._maybe_rotate()
+            if self._file is None:
+                self._open_segment()
+            payload = "".join(lines).encode("utf-8")
+            self._file.write(payload)
+            self._segment_bytes += len(payload)
+            self._unsynced += len(lines)
+            with self._lock:
+                self.written += len(lines)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+
+    def _maybe_fsync(self, force=False):
+        if self._file is None or self._unsynced == 0:
+            return
+        due = self._unsynced >= self.fsync_every or time.time() - self._last_sync >= self.flush_interval
+        if not (force or due):
+            return
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.time()
+            with self._lock:
+                self.fsyncs += 1
+        except Exception:
+            with self._lock:
+                self.errors += 1
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Сегменты
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _open_segment(self):
+        self._file = open(self.path, "ab")
+        self._segment_bytes = self._file.tell()
+        if self._segment_bytes > 0:
+            self._segment_day = datetime.fromtimestamp(os.path.getmtime(self.path)).date()
+        else:
+            self._segment_day = datetime.now().date()
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+        self._file = None
+        self._unsynced = 0
+
+    def _maybe_rotate(self):
+        if self._file is None and os.path.exists(self.path):
+            self._open_segment()
+        if self._file is None:
+            return
+
+        too_big = self.max_bytes and self._segment_bytes >= self.max_bytes
+        new_day = self.rotate_daily and datetime.now().date() != self._segment_day
+        if not (too_big or new_day) or self._segment_bytes == 0:
+            return
+
+        segment_day = self._segment_day
+        self._close_segment()
+        closed_path = self._next_segment_path(segment_day)
+        os.replace(self.path, closed_path)
+        with self._lock:
+            self.rotations += 1
+
+        if self.compression:
+            threading.Thread(target=self._compress_segment, args=(closed_path,),
+                             name="blackbox-compress", daemon=True).start()
+
+    def _next_segment_path(self, day):
+        root, ext = os.path.splitext(self.path)
+        seq = 1
+        while True:
+            candidate = f"{root}.{day:%Y%m%d}.{seq:03d}{ext}"
+            if not any(os.path.exists(candidate + suffix) for suffix in ("", ".gz", ".zst")):
+                return candidate
+            seq += 1
+
+    def _compress_segment(self, segment_path):
+        """Сжатие закрытого сегмента (в отдельном потоке, чтобы не тормозить очередь)"""
+        try:
+            if self.compression == "zstd":
+                target = segment_path + ".zst"
+                with open(segment_path, "rb") as src, open(target, "wb") as dst:
+                    zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+            else:
+                target = segment_path + ".gz"
+                with open(segment_path, "rb") as src, gzip.open(target, "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst)
+            os.remove(segment_path)
+        except Exception:
+            with self._lock:
+                self.errors += 1
@@ -0,0 +1,789 @@
+"""
+📼 CASSETTE
+Запись и воспроизведение сессии: каждый вызов биржи (ccxt) и TelegramBot - время, длительность,
+аргументы, ответ или исключение - строкой JSON в сжатый файл (zstd / gzip, сброс раз в секунду).
+    python main.py --record                                   - обычная торговля + запись в cassettes/
+    python cassette.py info cassettes/session_20260125_065812.cassette.zst
+    python cassette.py replay cassettes/session_20260125_065812.cassette.zst             - без сети, максимально быстро
+    python cassette.py replay cassettes/session_20260125_065812.cassette.zst --speed 60  - в 60 раз быстрее
+Воспроизведение:
+- Время бота виртуальное: time.time / time.sleep / perf_counter / Condition.wait (Event, queue) подменяются, сон
+  цикла и длительности записанных вызовов сдвигают часы без ожидания, фоновые потоки просыпаются
+  в свой виртуальный момент; long polling Telegram возвращает записанную команду тогда же, что и в сессии
+- Чтения (fetch_*) - ближайший к текущему виртуальному моменту записанный ответ с теми же аргументами
+  (аргументы другие - тот же символ); действия (create / cancel / edit / send...) - по порядку записи
+- Файлы состояния (bot_state*, market_state*) на начало записи лежат в кассете и восстанавливаются
+  в отдельной папке воспроизведения - файлы живого бота не трогаются. Папка перед каждым
+  прогоном очищается целиком (журнал, blackbox, логи прошлого прогона), текущая папка - возвращается
+- random - с зерном записи, AI и websocket риск-вотчера выключены (REST по записанным тикерам):
+  повторное воспроизведение кассеты даёт тот же результат
+Не записываются: --supervisor (процесс на символ), websocket тикеры, запросы AI
+"""
+
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import zlib
+import queue
+import bisect
+import random
+import shutil
+import builtins
+import argparse
+import threading
+from collections import Counter
+
+import ccxt
+
+from config import (
+    CASSETTE_DIR, CASSETTE_COMPRESSION, CASSETTE_FLUSH_INTERVAL, STATE_FILE, WARM_START_FILE,
+)
+
+# ==========================================
+# 🛡️ ZSTD SAFE IMPORT (опционально)
+# ==========================================
+HAS_ZSTD = False
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    pass
+
+CASSETTE_VERSION = 1
+EXCHANGE_PREFIXES = ("fetch", "create", "cancel", "edit", "load_markets",
+                     "set_leverage", "set_margin", "set_position")
+TELEGRAM_PREFIXES = ("send", "edit", "get_updates", "answer")
+READ_PREFIXES = ("fetch", "load_markets")
+MATCH_WINDOW = 32        # Действий вперёд, среди которых ищется вызов с теми же аргументами
+WORKER_WAIT_CAP = 0.25   # Сек реального времени: дольше цикл не ждёт работающий поток, а поток - цикл
+
+_real_time = time.time
+_real_sleep = time.sleep
+_real_perf = time.perf_counter
+_real_monotonic = time.monotonic
+_cond_wait = threading.Condition.wait
+_cond_notify = threading.Condition.notify
+_thread_start = threading.Thread.start
+_simple_queue = queue.SimpleQueue
+_lock_types = (threading.Lock, threading.RLock)
+
+
+class CassetteMiss(ccxt.ExchangeError):
+    """В кассете нет ответа на вызов (для бота - обычная ошибка биржи)"""
+
+
+def _state_paths():
+    """bot_state*.json / .wal и market_state*.json в текущей папке"""
+    paths = []
+    for base in (STATE_FILE, WARM_START_FILE):
+        root, ext = os.path.splitext(base)
+        paths += glob.glob(f"{root}*{ext}") + glob.glob(f"{root}*.wal")
+    return paths
+
+
+def _state_files():
+    """Файлы состояния бота на момент начала записи: имя -> текст"""
+    files = {}
+    for path in _state_paths():
+        try:
+            with open(path, encoding="utf-8") as f:
+                files[os.path.basename(path)] = f.read()
+        except (OSError, UnicodeDecodeError):
+            pass
+    return files
+
+
+def _key(args, kwargs):
+    return json.dumps([list(args), kwargs], sort_keys=True, default=str)
+
+
+def _loose_key(args, kwargs):
+    """Символ вызова (первый аргумент) - запасной ключ чтений, если аргументы разошлись"""
+    first = args[0] if args else kwargs.get("symbol", kwargs.get("symbols"))
+    return json.dumps(first, sort_keys=True, default=str)
+
+
+def _clone(value):
+    """Ответ для бота - своя копия (бот может менять dict, а чтение отдаётся много раз)"""
+    return json.loads(json.dumps(value))
+
+
+def _exception(name, message):
+    cls = getattr(ccxt, name, None) or getattr(builtins, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        cls = ccxt.ExchangeError
+    return cls(message)
+
+
+def read_cassette(path):
+    """(заголовок, записи) - недописанный хвост (обрыв процесса) отбрасывается"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] == b"\x28\xb5\x2f\xfd":
+        if not HAS_ZSTD:
+            raise RuntimeError(f"{path}: zstandard is not installed")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    elif data[:2] == b"\x1f\x8b":
+        data = zlib.decompressobj(wbits=31).decompress(data)
+    records = []
+    for line in data.split(b"\n"):
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break  # Оборванная последняя строка
+    if not records or records[0].get("v") != CASSETTE_VERSION:
+        raise ValueError(f"{path}: not a cassette v{CASSETTE_VERSION}")
+    return records[0], records[1:]
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Запись
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+class CassetteRecorder:
+    def __init__(self, path=None, mode="single", compression=CASSETTE_COMPRESSION,
+                 flush_interval=CASSETTE_FLUSH_INTERVAL):
+        if compression == "zstd" and not HAS_ZSTD:
+            compression = "gzip"
+        if path is None:
+            suffix = ".zst" if compression == "zstd" else ".gz"
+            path = os.path.join(CASSETTE_DIR, time.strftime("session_%Y%m%d_%H%M%S.cassette") + suffix)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.start = time.time()
+        self.flush_interval = flush_interval
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self.seed = random.randrange(2 ** 32)
+        random.seed(self.seed)  # Джиттер планировщика повторится при воспроизведении
+        if compression == "zstd":
+            self._out = zstandard.ZstdCompressor(level=3).stream_writer(open(path, "wb"))
+            self._flush_mode = zstandard.FLUSH_BLOCK
+        else:
+            self._out = gzip.open(path, "wb", compresslevel=6)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+        self._write({"v": CASSETTE_VERSION, "start": self.start, "mode": mode, "seed": self.seed,
+                     "files": _state_files()},
+                    flush=True)
+
+    def exchange(self, exchange):
+        self._write({"s": "meta", "exchange": exchange.id,
+                     "options": {"defaultType": getattr(exchange, "options", {}).get("defaultType")}})
+        return RecordingClient(exchange, self, "x", EXCHANGE_PREFIXES)
+
+    def telegram(self, telegram_bot):
+        self._write({"s": "meta", "chat_id": getattr(telegram_bot, "chat_id", None)})
+        return RecordingClient(telegram_bot, self, "tg", TELEGRAM_PREFIXES)
+
+    def record(self, source, name, started, elapsed, args, kwargs, result=None, error=None):
+        entry = {"t": round(started - self.start, 6), "d": round(elapsed, 6), "s": source, "m": name,
+                 "a": args, "k": kwargs, "th": threading.current_thread().name}
+        if error is not None:
+            entry["e"] = [type(error).__name__, str(error)]
+            self.errors += 1
+        else:
+            entry["r"] = result
+        self.calls += 1
+        self._write(entry)
+
+    def _write(self, record, flush=False):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+        with self._lock:
+            if self._out is None:
+                return
+            self._out.write(line)
+            now = time.time()
+            if flush or now - self._last_flush >= self.flush_interval:
+                self._out.flush(self._flush_mode)  # Читаемо до этого места даже после kill
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+
+
+class RecordingClient:
+    """
+    Прозрачная обёртка над ccxt exchange / TelegramBot (как InstrumentedClient):
+    методы с заданными префиксами пишутся в кассету, остальное - напрямую
+    """
+
+    def __init__(self, target, recorder, source, prefixes):
+        self._target = target
+        self._recorder = recorder
+        self._source = source
+        self._prefixes = tuple(prefixes)
+        self._wrapped = {}
+        self._markets_saved = source != "x"
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or not name.startswith(self._prefixes):
+            return attr
+        wrapper = self._wrapped.get(name)
+        if wrapper is None:
+            wrapper = self._wrapped[name] = self._wrap(name)
+        return wrapper
+
+    def _wrap(self, name):
+        recorder = self._recorder
+
+        def call(*args, **kwargs):
+            started, start = time.time(), time.perf_counter()
+            try:
+                result = getattr(self._target, name)(*args, **kwargs)
+            except Exception as e:
+                recorder.record(self._source, name, started, time.perf_counter() - start, args, kwargs, error=e)
+                raise
+            recorder.record(self._source, name, started, time.perf_counter() - start, args, kwargs, result=result)
+            if not self._markets_saved and getattr(self._target, "markets", None):
+                # Рынки ccxt грузит сам внутри первого запроса - нужны для *_to_precision при воспроизведении
+                self._markets_saved = True
+                recorder._write({"s": "x", "m": "__markets__", "r": self._target.markets})
+            return result
+
+        call.__name__ = name
+        return call
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Воспроизведение
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+class VirtualClock:
+    """
+    Часы воспроизведения - маленький планировщик событий. Время двигает поток торгового цикла
+    (тот, что вызвал install): его сон сдвигает часы сразу (speed > 0 - с паузой seconds / speed),
+    но только когда все потоки, запущенные под часами, "припаркованы" - спят по часам или ждут
+    Condition (Event, queue). Спящие просыпаются по очереди своих сроков, каждый в свой момент:
+    порядок вызовов фоновых потоков и цикла тот же при каждом воспроизведении.
+    Поток, не паркующийся дольше WORKER_WAIT_CAP реального времени (ждёт lock цикла), не ждут
+    """
+
+    def __init__(self, start, speed=0.0):
+        self.now = float(start)
+        self.speed = speed
+        self.end = None
+        self.on_end = None
+        self._ended = False
+        self._driver = None
+        self._lock = threading.Lock()
+        self._active = set()     # Потоки под часами, которые сейчас работают
+        self._sleepers = {}      # Поток -> срок (виртуальное время)
+        self._waiters = {}       # id(Condition) -> [поток] в порядке ожидания
+        self._moved = _real_perf()
+        self._blocked = False    # Цикл ждёт lock / Condition (может ждать фоновый поток)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds is None or seconds <= 0:
+            return
+        if threading.current_thread() is self._driver:
+            self.advance(seconds)
+        else:
+            self._sleep_until(self.now + seconds)
+
+    def advance(self, seconds):
+        target = self.now + seconds
+        if self.speed > 0:
+            _real_sleep(seconds / self.speed)
+        while True:
+            self._settle()
+            with self._lock:
+                due = min(self._sleepers.values(), default=None)
+                if due is None or due > target:
+                    self.now = target
+                    break
+                self.now = max(self.now, due)
+                self._wake_due()
+        self._settle()
+        fire = not self._ended and self.end is not None and self.now > self.end
+        self._ended = self._ended or fire
+        if fire and self.on_end:
+            self.on_end()
+
+    def _wake_due(self):
+        for thread, deadline in list(self._sleepers.items()):
+            if deadline <= self.now:
+                del self._sleepers[thread]
+                self._active.add(thread)
+        self._moved = _real_perf()
+
+    def _settle(self):
+        """Ждать, пока все рабочие потоки припаркуются (не дольше WORKER_WAIT_CAP)"""
+        limit = _real_perf() + WORKER_WAIT_CAP
+        while True:
+            with self._lock:
+                self._active = {t for t in self._active if t.is_alive()}
+                if not self._active:
+                    return
+            if _real_perf() > limit:
+                return
+            _real_sleep(0.0002)
+
+    def _sleep_until(self, deadline, cond=None):
+        """Фоновый поток: спать до deadline по часам (cond - ждать и notify этого Condition)"""
+        me = threading.current_thread()
+        with self._lock:
+            if deadline <= self.now:
+                return False
+            self._active.discard(me)
+            self._sleepers[me] = deadline
+            if cond is not None:
+                self._waiters.setdefault(id(cond), []).append(me)
+        notified = False
+        try:
+            while True:
+                if cond is not None:
+                    if _cond_wait(cond, 0.0005):
+                        notified = True
+                        break
+                else:
+                    _real_sleep(0.0005)
+                with self._lock:
+                    if me not in self._sleepers:
+                        break  # Срок наступил
+                    if cond is not None and me not in self._waiters.get(id(cond), ()):
+                        notified = True  # notify() пришёл между ожиданиями
+                        break
+                    if self._blocked and _real_perf() - self._moved > WORKER_WAIT_CAP:
+                        # Цикл ждёт lock / notify фонового потока - время двигает сам поток
+                        self.now = max(self.now, deadline)
+                        self._wake_due()
+        finally:
+            with self._lock:
+                self._sleepers.pop(me, None)
+                if cond is not None and me in self._waiters.get(id(cond), ()):
+                    self._waiters[id(cond)].remove(me)
+                self._active.add(me)
+        return notified
+
+    def _cond_wait(self, cond, timeout=None):
+        me = threading.current_thread()
+        if me is self._driver:
+            if timeout is None:
+                return self._blocking(_cond_wait, cond, None)
+            if _cond_wait(cond, 0):
+                return True
+            with self._lock:
+                self._waiters.setdefault(id(cond), []).append(me)
+            cond.release()  # Пока идёт время, фоновые потоки могут сделать notify
+            try:
+                self.advance(max(timeout, 0.0))
+            finally:
+                cond.acquire()
+                with self._lock:
+                    waiting = self._waiters.get(id(cond), ())
+                    notified = me not in waiting
+                    if not notified:
+                        waiting.remove(me)
+            return notified
+        if me not in self._tracked:
+            return _cond_wait(cond, timeout)
+        if timeout is not None:
+            return self._sleep_until(self.now + max(timeout, 0.0), cond)
+        with self._lock:
+            self._active.discard(me)
+            self._waiters.setdefault(id(cond), []).append(me)
+        try:
+            return _cond_wait(cond, None)
+        finally:
+            with self._lock:
+                if me in self._waiters.get(id(cond), ()):
+                    self._waiters[id(cond)].remove(me)
+                self._active.add(me)
+
+    def _cond_notify(self, cond, n=1):
+        with self._lock:
+            waiters = self._waiters.get(id(cond))
+            for thread in waiters[:n] if waiters else ():
+                waiters.remove(thread)
+                self._sleepers.pop(thread, None)
+                if thread is not self._driver:
+                    self._active.add(thread)  # Проснётся - цикл подождёт его работу
+        _cond_notify(cond, n)
+
+    def _acquire(self, lock, timeout):
+        """Блокирующий acquire фонового потока: ждёт, припарковавшись (timeout - по часам)"""
+        me = threading.current_thread()
+        if me is self._driver:
+            return self._blocking(lock.acquire, True, timeout)
+        if me not in self._tracked:
+            return lock.acquire(True, timeout)
+        with self._lock:
+            self._active.discard(me)
+            self._waiters.setdefault(id(lock), []).append(me)
+            if timeout >= 0:
+                self._sleepers[me] = self.now + timeout
+        try:
+            while True:
+                if lock.acquire(True, 0.0005):
+                    return True
+                with self._lock:
+                    if timeout >= 0 and me not in self._sleepers and me in self._waiters.get(id(lock), ()):
+                        return False  # Срок наступил
+        finally:
+            with self._lock:
+                self._sleepers.pop(me, None)
+                if me in self._waiters.get(id(lock), ()):
+                    self._waiters[id(lock)].remove(me)
+                self._active.add(me)
+
+    def _blocking(self, wait, *args):
+        self._blocked = True
+        self._moved = _real_perf()
+        try:
+            return wait(*args)
+        finally:
+            self._blocked = False
+
+    def _released(self, lock):
+        """Ждущие lock потоки - в работу: цикл не двинет время, пока они его не возьмут"""
+        with self._lock:
+            for thread in self._waiters.pop(id(lock), ()):
+                self._sleepers.pop(thread, None)
+                self._active.add(thread)
+
+    def _start(self, thread):
+        run = thread.run
+
+        def tracked():
+            try:
+                run()
+            finally:
+                with self._lock:
+                    self._active.discard(thread)
+
+        thread.run = tracked
+        with self._lock:
+            self._tracked.add(thread)
+            self._active.add(thread)
+        _thread_start(thread)
+
+    def install(self):
+        self._driver = threading.current_thread()
+        self._tracked = set()
+        clock = self
+        time.time, time.sleep = self.time, self.sleep
+        time.perf_counter = time.monotonic = self.time  # Паузы цикла считаются от длительности итерации
+        threading.Condition.wait = lambda cond, timeout=None: clock._cond_wait(cond, timeout)
+        threading.Condition.notify = lambda cond, n=1: clock._cond_notify(cond, n)
+        threading.Thread.start = lambda thread: clock._start(thread)
+        queue.SimpleQueue = queue._PySimpleQueue  # C-очередь (пул потоков, логи) ждёт мимо Condition
+        threading.Lock = lambda: _ClockLock(clock, _lock_types[0]())
+        threading.RLock = lambda: _ClockLock(clock, _lock_types[1]())
+
+    def uninstall(self):
+        time.time, time.sleep = _real_time, _real_sleep
+        time.perf_counter, time.monotonic = _real_perf, _real_monotonic
+        threading.Condition.wait, threading.Condition.notify = _cond_wait, _cond_notify
+        threading.Thread.start = _thread_start
+        queue.SimpleQueue = _simple_queue
+        threading.Lock, threading.RLock = _lock_types
+
+
+class _ClockLock:
+    """Lock / RLock, созданный под часами: ожидание - парковка (см. VirtualClock._acquire)"""
+
+    __slots__ = ("_clock", "_lock")
+
+    def __init__(self, clock, lock):
+        self._clock = clock
+        self._lock = lock
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        return self._clock._acquire(self._lock, timeout)
+
+    def release(self):
+        self._lock.release()
+        self._clock._released(self._lock)
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def __getattr__(self, name):
+        return getattr(self._lock, name)  # locked(), _is_owned / _release_save для Condition
+
+
+class CassettePlayer:
+    """Ответы кассеты на вызовы бота по виртуальному времени (см. описание модуля)"""
+
+    def __init__(self, start, records, clock):
+        self.clock = clock
+        self.markets = None
+        self.meta = {}
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._reads = {}     # (s, m, ключ) -> ([t], [запись])
+        self._loose = {}     # (s, m, символ) -> ([t], [запись])
+        self._actions = {}   # (s, m) -> [запись] в порядке записи
+        self._cursor = {}    # (s, m) -> первая неиспользованная
+        self._used = {}      # (s, m) -> номера отданных записей
+        self._served = {}    # id(список чтений) -> следующая по порядку запись
+        self._updates = []   # get_updates с командами, по времени ответа
+        self._updates_pos = 0
+        self.end = start
+
+        for entry in records:
+            source = entry.get("s")
+            if source == "meta":
+                self.meta.update({k: v for k, v in entry.items() if k != "s"})
+                continue
+            if entry.get("m") == "__markets__":
+                self.markets = entry["r"]
+                continue
+            entry["t"] = start + entry["t"]
+            self.end = max(self.end, entry["t"] + entry["d"])
+            name = entry["m"]
+            args, kwargs = entry.get("a") or [], entry.get("k") or {}
+            if source == "tg" and name == "get_updates":
+                if entry.get("r"):
+                    self._updates.append(entry)
+            elif name.startswith(READ_PREFIXES):
+                for index, key in ((self._reads, (source, name, _key(args, kwargs))),
+                                   (self._loose, (source, name, _loose_key(args, kwargs)))):
+                    times, entries = index.setdefault(key, ([], []))
+                    times.append(entry["t"])
+                    entries.append(entry)
+            else:
+                self._actions.setdefault((source, name), []).append(entry)
+        for index in (self._reads, self._loose):
+            for times, entries in index.values():
+                order = sorted(range(len(times)), key=times.__getitem__)
+                times[:] = [times[i] for i in order]
+                entries[:] = [entries[i] for i in order]
+        self._updates.sort(key=lambda e: e["t"] + e["d"])
+
+    def call(self, source, name, args, kwargs):
+        with self._lock:
+            if name.startswith(READ_PREFIXES):
+                entry = self._read(source, name, args, kwargs)
+            else:
+                entry = self._action(source, name, args, kwargs)
+        if entry is None:
+            self.stats["miss"] += 1
+            if source == "tg":
+                return None
+            raise CassetteMiss(f"cassette has no {name}{tuple(args)} at {self.clock.now:.3f}")
+        self.clock.sleep(entry["d"])
+        if "e" in entry:
+            raise _exception(*entry["e"])
+        return _clone(entry.get("r"))
+
+    def _read(self, source, name, args, kwargs):
+        found = self._reads.get((source, name, _key(args, kwargs)))
+        if found is not None:
+            self.stats["exact"] += 1
+        else:
+            found = self._loose.get((source, name, _loose_key(args, kwargs)))
+            if found is None:
+                return None
+            self.stats["loose"] += 1
+        # Ближайший по времени ответ: цикл в воспроизведении может опередить запись на миллисекунды.
+        # Ответы с одним временем (fetch_order до и после cancel) - по порядку записи
+        times, entries = found
+        now = self.clock.now
+        i = bisect.bisect_right(times, now)
+        if i == len(times) or (i and now - times[i - 1] <= times[i] - now):
+            i -= 1
+        first, last = bisect.bisect_left(times, times[i]), bisect.bisect_right(times, times[i]) - 1
+        i = min(max(first, self._served.get(id(entries), 0)), last)
+        self._served[id(entries)] = i + 1
+        return entries[i]
+
+    def _action(self, source, name, args, kwargs):
+        entries = self._actions.get((source, name))
+        if not entries:
+            return None
+        cursor = self._cursor.get((source, name), 0)
+        used = self._used.setdefault((source, name), set())
+        key = _key(args, kwargs)
+        candidates = [i for i in range(cursor, min(cursor + MATCH_WINDOW, len(entries))) if i not in used]
+        if not candidates:
+            return None
+        chosen = next((i for i in candidates if _key(entries[i].get("a") or [], entries[i].get("k") or {}) == key),
+                      None)
+        if chosen is None:
+            chosen = candidates[0]
+            self.stats["loose"] += 1
+        else:
+            self.stats["exact"] += 1
+        used.add(chosen)
+        while cursor < len(entries) and cursor in used:
+            cursor += 1
+        self._cursor[(source, name)] = cursor
+        return entries[chosen]
+
+    def get_updates(self, timeout=5):
+        """Long polling: команда, пришедшая за timeout виртуальных секунд, - в свой момент, иначе []"""
+        now = self.clock.now
+        with self._lock:
+            entry = None
+            if self._updates_pos < len(self._updates):
+                candidate = self._updates[self._updates_pos]
+                if candidate["t"] + candidate["d"] <= now + timeout:
+                    entry = candidate
+                    self._updates_pos += 1
+        if entry is None:
+            self.clock.sleep(timeout)
+            return []
+        self.stats["exact"] += 1
+        self.clock.sleep(max(entry["t"] + entry["d"] - now, 0.0))
+        return _clone(entry["r"])
+
+
+class ReplayExchange:
+    """Exchange для бота: записанные методы - из кассеты, точность / таймфреймы - офлайн ccxt с рынками сессии"""
+
+    def __init__(self, player):
+        self._player = player
+        self._offline = getattr(ccxt, player.meta.get("exchange", "bingx"))(
+            {"options": {k: v for k, v in player.meta.get("options", {}).items() if v is not None}})
+        if player.markets:
+            self._offline.set_markets(player.markets)
+        self._wrapped = {}
+
+    def __getattr__(self, name):
+        if not name.startswith(EXCHANGE_PREFIXES):
+            return getattr(self._offline, name)
+        wrapper = self._wrapped.get(name)
+        if wrapper is None:
+            player = self._player
+            wrapper = self._wrapped[name] = lambda *args, **kwargs: player.call("x", name, args, kwargs)
+        return wrapper
+
+
+class ReplayTelegram:
+    """TelegramBot для бота: команды из кассеты, отправка никуда не уходит"""
+
+    token = None
+
+    def __init__(self, player):
+        self._player = player
+        self.chat_id = player.meta.get("chat_id")
+
+    def get_updates(self, timeout=5):
+        return self._player.get_updates(timeout)
+
+    def __getattr__(self, name):
+        if not name.startswith(TELEGRAM_PREFIXES):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._player.call("tg", name, args, kwargs)
+
+
+REPLAY_MARKER = ".cassette_replay"  # Папку с этим файлом создал replay - её можно очищать
+
+
+def _fresh_workdir(workdir):
+    """Пустая папка воспроизведения: прошлый прогон удаляется целиком, чужая непустая папка - ошибка"""
+    marker = os.path.join(workdir, REPLAY_MARKER)
+    if os.path.isdir(workdir) and os.listdir(workdir):
+        if not os.path.exists(marker):
+            raise RuntimeError(f"{workdir} is not empty and was not created by replay, choose another --workdir")
+        shutil.rmtree(workdir)
+    os.makedirs(workdir, exist_ok=True)
+    open(marker, "w").close()
+
+
+def replay(path, speed=0.0, workdir=None, log_fn=print):
+    """Прогон HybridTradingBot / Portfolio по кассете в пустой workdir (по умолчанию <кассета>_replay)"""
+    header, records = read_cassette(path)
+    if workdir is None:
+        workdir = os.path.basename(path).split(".")[0] + "_replay"
+    path = os.path.abspath(path)
+    _fresh_workdir(workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return _replay(path, header, records, speed, log_fn)
+    finally:
+        os.chdir(cwd)
+
+
+def _replay(path, header, records, speed, log_fn):
+    for name, text in header.get("files", {}).items():
+        with open(name, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    random.seed(header.get("seed", 0))
+    clock = VirtualClock(header["start"], speed)
+    player = CassettePlayer(header["start"], records, clock)
+    clock.end = player.end + 1.0
+    exchange, telegram = ReplayExchange(player), ReplayTelegram(player)
+    log_fn(f"📼 Replay {os.path.basename(path)}: {len(records)} records, "
+           f"{player.end - header['start']:.0f}s of session, speed {'max' if speed <= 0 else f'x{speed:g}'}, "
+           f"files in {os.path.abspath('.')}")
+
+    # Модули бота импортируются здесь: до подмены времени и в папке воспроизведения
+    from trading_bot import HybridTradingBot
+    from portfolio import Portfolio
+
+    wall = _real_perf()
+    clock.install()
+    try:
+        if header.get("mode") == "portfolio":
+            bot = Portfolio(exchange, telegram)
+            bots = list(bot.bots.values())
+        else:
+            bot = HybridTradingBot(exchange, telegram)
+            bots = [bot]
+        for b in bots:
+            b.has_ai = False
+            b.risk_watcher.use_websocket = False
+        clock.on_end = lambda: setattr(bot, "running", False)
+        bot.run()
+    finally:
+        clock.uninstall()
+    wall = _real_perf() - wall
+    span = clock.now - header["start"]
+    log_fn(f"📼 Replay done: {span:.0f}s of session in {wall:.1f}s (x{span / wall if wall else 0:.0f}), "
+           f"calls exact {player.stats['exact']} / loose {player.stats['loose']} / missing {player.stats['miss']}")
+    return player.stats
+
+
+def info(path):
+    header, records = read_cassette(path)
+    calls = Counter((r.get("s"), r.get("m")) for r in records if r.get("s") in ("x", "tg") and r.get("m") != "__markets__")
+    errors = Counter((r.get("s"), r.get("m"), r["e"][0]) for r in records if "e" in r)
+    end = max((r["t"] + r["d"] for r in records if "t" in r), default=0.0)
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(header["start"]))
+    print(f"📼 {path}: {os.path.getsize(path) / 1024:.0f} KB, mode {header.get('mode')}, "
+          f"from {started}, {end:.0f}s, {sum(calls.values())} calls, state files: {', '.join(header.get('files', {})) or '-'}")
+    for (source, name), n in calls.most_common():
+        print(f"   {source:>2} {name:<22} {n}")
+    for (source, name, error), n in errors.most_common():
+        print(f"   ⚠️ {source} {name}: {error} x{n}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record / replay bot sessions")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("info", help="calls and errors in a cassette")
+    i.add_argument("path")
+    r = sub.add_parser("replay", help="re-run the session locally without network")
+    r.add_argument("path")
+    r.add_argument("--speed", type=float, default=0.0, help="x real time, 0 - as fast as possible")
+    r.add_argument("--workdir", help="where replay writes state / journal / logs (default <cassette>_replay)")
+    args = parser.parse_args()
+    if args.cmd == "info":
+        info(args.path)
+    else:
+        stats = replay(args.path, speed=args.speed, workdir=args.workdir)
+        sys.exit(1 if stats["miss"] else 0)
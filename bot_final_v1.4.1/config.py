@@ -33,6 +33,25 @@ HAS_AI = True
 SYMBOL = 'BTC/USDT:USDT'
 TIMEFRAME = '1m'
 
+# 🗂️ ПОРТФЕЛЬ (python main.py --portfolio - несколько символов в одном процессе)
+# Символ -> переопределения констант этого файла только для него (см. SymbolConfig)
+PORTFOLIO_SYMBOLS = {
+    'BTC/USDT:USDT': {},
+    'ETH/USDT:USDT': {'LEVERAGE': 10, 'ALLOWED_CAPITAL_PCT': 0.25},
+}
+PORTFOLIO_MAX_POSITIONS = 5        # Одновременно открытых позиций (включая набираемые smart entry)
+PORTFOLIO_MAX_MARGIN_PCT = 0.5     # Маржа всех позиций + оставшихся DCA уровней от баланса
+PORTFOLIO_BALANCE_TTL = 30         # Сек кэша общего fetch_balance
+
+# 🧩 SUPERVISOR (python main.py --supervisor - процесс на символ из PORTFOLIO_SYMBOLS, лимиты портфеля те же)
+SUPERVISOR_CANDLES = 200           # Свечей в окне индикаторов воркера
+SUPERVISOR_RING_CAPACITY = 256     # Слотов кольцевого буфера свечей в shared memory (> SUPERVISOR_CANDLES)
+SUPERVISOR_FEED_INTERVAL = 1.0     # Сек между fetch_tickers без позиций (в позиции - RISK_WATCHER_REST_INTERVAL)
+SUPERVISOR_REPORT_INTERVAL = 5.0   # Сек между отчётами воркера родителю (дашборд, метрики)
+SUPERVISOR_RESTART_BACKOFF = 5.0   # Сек до перезапуска упавшего воркера, удваивается при повторных падениях
+SUPERVISOR_RESTART_MAX_BACKOFF = 300.0
+SUPERVISOR_STABLE_UPTIME = 600     # Сек работы воркера, после которых пауза перезапуска сбрасывается
+
 FUNDING_RATE_8H = 0.0001 
 
 # 💰 УПРАВЛЕНИЕ КАПИТАЛОМ
@@ -55,10 +74,27 @@ STAGE3_MIN_ENTRY = 0.018
 STAGE3_BASE_ENTRY = 0.025
 STAGE3_MAX_ENTRY = 0.030
 
+# ⚡ УМНЫЙ ВХОД (post-only с перекотировкой по стакану, в отдельном потоке)
+SMART_ENTRY_ENABLED = True
+ENTRY_TIME_LIMIT = 30              # Сек на набор позиции
+ENTRY_REPRICE_INTERVAL = 2.0       # Сек между перекотировками
+ENTRY_SLIPPAGE_BUDGET_PCT = 0.05   # Макс. ухудшение лучшей цены против цены сигнала, %
+ENTRY_TAKER_STAGE = 3              # С этой стадии остаток добирается рыночным ордером
+ENTRY_TAKER_SLIPPAGE_PCT = 0.15    # ...если проскальзывание taker не больше, %
+
 # 🔨 СЕТКА (из ultrabtc7 - БЕЗ ИЗМЕНЕНИЙ!)
 SAFETY_ORDERS_COUNT = 5      
 MIN_EXCHANGE_ORDER_USD = 5.1 
 
+# 🪜 Лестница DCA: все уровни выставляются сразу при входе и не перекотируются
+DCA_LADDER_MODE = False      # False - один следующий DCA (как в ultrabtc7)
+DCA_LADDER_BATCH = True      # create_orders одним запросом, если биржа поддерживает
+
+# 🔁 Doctor (сверка ордеров каждые 20 сек)
+RECONCILE_TP_TOLERANCE_PCT = 0.2    # Переставить TP, если цена ушла от динамической > 0.2%
+RECONCILE_DCA_TOLERANCE_PCT = 0.5   # Переставить DCA при отклонении > 0.5% (как раньше)
+RECONCILE_AMOUNT_TOLERANCE = 0.001  # Относительный допуск объёма (TP vs позиция, fill vs cancel)
+
 # Дистанции (из ultrabtc7)
 HAMMER_DISTANCES_TREND = [0.006, 0.012, 0.020, 0.030, 0.045]
 HAMMER_DISTANCES_RANGE = [0.010, 0.018, 0.030, 0.045, 0.065]
@@ -78,6 +114,20 @@ TRAILING_ACTIVATION_PCT = 0.0080
 TRAILING_CALLBACK_PCT = 0.0035     
 TRAILING_UPDATE_INTERVAL = 3       
 
+# ⏲️ АДАПТИВНЫЙ ТЕМП ЦИКЛА (пауза = long polling Telegram, команды прерывают ожидание)
+LOOP_INTERVAL_MIN = 1.0            # Сек, цена у ближайшего уровня
+LOOP_INTERVAL_MAX = 15.0           # Сек, цена далеко от всех уровней / нет позиции
+LOOP_CADENCE_FAR_ATR = 3.0         # Дистанция (в ATR), начиная с которой пауза максимальна
+
+# ⏰ ПЛАНИРОВЩИК ЗАДАЧ
+SCHEDULER_WORKERS = 2              # Потоки для медленных задач (дашборд, AI отчёт, Future Spy)
+
+# 🛡️ RISK WATCHER (trailing + жёсткий SL в отдельном потоке на каждом тике)
+RISK_WATCHER_ENABLED = True
+RISK_WATCHER_WEBSOCKET = True      # watch_ticker через ccxt.pro, иначе REST
+RISK_WATCHER_INTERVAL = 0.5        # Сек между проверками без запросов к бирже (websocket / shared memory супервизора)
+RISK_WATCHER_REST_INTERVAL = TRAILING_UPDATE_INTERVAL  # Сек между REST fetch_ticker(s) в позиции (без ccxt.pro)
+
 # 🛡️ ЗАЩИТА
 MAX_ACCOUNT_LOSS_PCT = 0.30    
 
@@ -105,11 +155,90 @@ TAKER_FEE = 0.0005
 
 # ФАЙЛЫ
 LOG_FILE = "bot_hybrid.log"
-CSV_FILE = "trades_hybrid.csv"
+LOG_JSON_FILE = "bot_hybrid.jsonl"     # Структурированный sink (JSON lines)
+CSV_FILE = "trades_hybrid.csv"          # Только выгрузка из журнала (trade_journal.py export)
 MARKET_LOG_FILE = "market_hybrid.csv"
 SECRETS_FILE = "encrypted_config.bin"
 KEY_FILE = "secret.key"
 
+# 📦 BLACKBOX (фоновая запись событий)
+BLACKBOX_FILE = "blackbox.json"
+BLACKBOX_QUEUE_SIZE = 10000          # Макс. событий в очереди (дальше — drop)
+BLACKBOX_FLUSH_INTERVAL = 1.0        # Сек между flush+fsync
+BLACKBOX_FSYNC_EVERY = 200           # ...или каждые N событий
+BLACKBOX_MAX_BYTES = 50 * 1024 * 1024  # Ротация по размеру сегмента
+BLACKBOX_ROTATE_DAILY = True         # Ротация при смене дня
+BLACKBOX_COMPRESSION = "zstd"        # "zstd" / "gzip" / None (zstd -> gzip если нет библиотеки)
+
+# 🗃️ EVENT STORE (колоночная копия blackbox для запросов, event_store.py)
+EVENT_STORE_DIR = "events"
+EVENT_STORE_CHUNK_BYTES = 32 * 1024 * 1024  # Байт blackbox.json за шаг загрузки
+EVENT_STORE_COMPACT_PARTS = 8        # Частей одного дня события до слияния в одну
+
+# 📼 CASSETTE (запись / воспроизведение сессии, cassette.py)
+CASSETTE_DIR = "cassettes"           # python main.py --record -> cassettes/session_20260125_065812.cassette.zst
+CASSETTE_COMPRESSION = "zstd"        # "zstd" / "gzip" (zstd -> gzip если нет библиотеки)
+CASSETTE_FLUSH_INTERVAL = 1.0        # Сек между сбросами сжатого потока (обрыв процесса теряет не больше)
+
+# 📝 ЛОГИРОВАНИЕ (асинхронный конвейер)
+LOG_LEVEL = "INFO"
+LOG_MAX_BYTES = 20 * 1024 * 1024     # Ротация bot_hybrid.log / .jsonl по размеру
+LOG_BACKUP_COUNT = 5
+LOG_RATE_LIMITS = {                  # Категория -> не чаще раза в N секунд
+    "dynamic_tp": 60.0,
+}
+LOG_SAMPLING = {}                    # Категория -> писать только каждое N-е
+
+# 🔎 АНАЛИЗ ЛОГОВ (log_analytics.py)
+LOG_ANALYTICS_STALL_SEC = 120.0      # Пауза между строками в позиции, считающаяся зависанием цикла
+LOG_ANALYTICS_BURST = 5              # Ошибок группы в минуту - всплеск
+
+# 📈 МЕТРИКИ (Prometheus text format)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"           # Только локально
+METRICS_PORT = 9108                  # http://127.0.0.1:9108/metrics
+
+# ⏱️ ТРЕЙСИНГ ЛАТЕНТНОСТИ (сигнал → fill → следующие ордера)
+TRACE_WINDOW = 500                   # Трейсов в окне для перцентилей
+
+# 🔥 ПРОФАЙЛЕР (команды /profile в Telegram, только TG_CHAT_ID из credentials)
+PROFILER_DIR = "profiles"
+PROFILER_DEFAULT_DURATION = 30       # Сек
+PROFILER_MAX_DURATION = 120          # Жёсткий лимит сек
+PROFILER_SAMPLE_INTERVAL = 0.01      # Сек между сэмплами стеков
+PROFILER_SEND_TO_TELEGRAM = True     # False - только сохранить локально
+
+# 📒 ЖУРНАЛ СДЕЛОК (SQLite)
+JOURNAL_DB_FILE = "trades_hybrid.db"
+JOURNAL_BATCH_SIZE = 100             # Операций в одной транзакции
+JOURNAL_FLUSH_INTERVAL = 1.0         # Сек ожидания перед записью батча
+
+# 💾 ЧЕКПОИНТ СОСТОЯНИЯ (рестарт без пересинхронизации позиции)
+STATE_ENABLED = True
+STATE_FILE = "bot_state.json"        # Снимок + bot_state.wal, к имени добавляется символ (bot_state_BTC.json)
+STATE_COMPACT_EVERY = 100            # Записей WAL до сжатия в снимок
+
+# 👥 SHADOW (бумажные боты с другим конфигом на рыночных данных живого, paper.py)
+SHADOW_CONFIGS = {}                  # Имя -> переопределения, напр. {"wide": {"HAMMER_DISTANCES_TREND": [0.008, 0.016, 0.026, 0.040, 0.060]}}
+SHADOW_START_BALANCE = None          # Бумажный баланс USDT на тень (None - баланс живого бота)
+SHADOW_JOURNAL_FILE = "trades_paper.db"        # Журнал на конфиг: trades_paper_wide.db
+SHADOW_BLACKBOX_FILE = "blackbox_paper.json"   # Blackbox на конфиг: blackbox_paper_wide.json
+
+# 🗄️ ИСТОРИЯ СВЕЧЕЙ (history.py: загрузка для бэктеста, Parquet на символ и месяц)
+HISTORY_DIR = "history"
+HISTORY_WORKERS = 4                  # Окон загрузки параллельно (у каждого потока свой ccxt exchange)
+HISTORY_RATE_LIMIT = 8.0             # fetch_ohlcv в секунду на все потоки
+HISTORY_PAGE_LIMIT = 1000            # Свечей за запрос
+HISTORY_RETRIES = 5                  # Повторы запроса при сетевой ошибке / rate limit
+HISTORY_EMPTY_RETRIES = 2            # Повторы пустой страницы, прежде чем считать окно пустым на бирже
+
+# 🔥 ТЁПЛЫЙ СТАРТ (буфер свечей и рекурсия индикаторов на диске, warm_start.py)
+WARM_START_ENABLED = True
+WARM_START_FILE = "market_state.json"  # К имени добавляется символ (market_state_BTC.json)
+WARM_START_CANDLES = 200             # Свечей в DataFrame индикаторов
+WARM_START_SAVE_INTERVAL = 300       # Сек между записями на диск (и при остановке)
+WARM_START_MAX_GAP = 1000            # Свечей простоя, которые докачиваются одним запросом; больше - холодный старт
+
 class Col:
     WHITE = '\033[97m'    # ← ДОБАВЛЕНО!
     GREEN = '\033[92m'
@@ -121,3 +250,23 @@ class Col:
     BOLD = '\033[1m'
     MAGENTA = '\033[95m'
     GRAY = '\033[90m'
+
+
+class SymbolConfig:
+    """
+    Параметры символа: переопределения из PORTFOLIO_SYMBOLS поверх констант config.py
+    (cfg.LEVERAGE, cfg.SAFETY_ORDERS_COUNT...). Без переопределений - глобальные значения
+    """
+
+    def __init__(self, overrides=None):
+        overrides = dict(overrides or {})
+        unknown = [k for k in overrides if not k.isupper() or k not in globals()]
+        if unknown:
+            raise ValueError(f"Unknown config overrides: {', '.join(unknown)}")
+        self.overrides = overrides
+
+    def __getattr__(self, name):
+        try:
+            return self.overrides[name] if name in self.overrides else globals()[name]
+        except KeyError:
+            raise AttributeError(name) from None
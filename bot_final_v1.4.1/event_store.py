@@ -0,0 +1,600 @@
+"""
+🗃️ EVENT STORE
+Колоночное хранилище событий blackbox для запросов без перебора JSONL:
+    python event_store.py ingest                                   - догрузить новые события (инкрементально)
+    python event_store.py query PNL_MISMATCH --where dca_level=3
+    python event_store.py query FUTURE_SPY --join --by trade_reason --agg mean:missed_profit
+    python event_store.py trade 20260125065812453                  - все события сделки
+- Parquet (zstd) по типу события и дню: events/PNL_MISMATCH/2026-01-26/part-00001.parquet
+- Вложенные словари (TRACE stages / spans) - колонки "spans.entry->fill"; числа - float64
+- При загрузке каждому событию добавляются trade_id (старые записи без id - сделка от ENTRY)
+  и dca_level - уровень DCA позиции в момент события
+- Индекс сделок events/trades.parquet: вход, выход, причина, PnL, число DCA и интервал времени
+  событий сделки (first_ts / last_ts)
+- Источники: blackbox.json и blackbox_<ASSET>.json процессов supervisor.py (+ их закрытые сегменты)
+- Манифест events/_manifest.json: файлы с min/max времени, схема типа события и позиция загрузки
+  в каждом источнике (+ закрытые сегменты .gz / .zst).
+  Манифест пишется атомарно после Parquet - оборванная загрузка повторяется с той же позиции
+- Чтение: части типа события склеиваются в несжатый Arrow IPC events/<EVENT>/_cache.arrow,
+  отсортированный по времени (новые части дописываются, после сжатия дней - пересборка),
+  и открываются через memory map; интервал времени / сделки - бинарный поиск по timestamp,
+  остальные фильтры - по срезу (миллисекунды вместо открытия сотен дневных файлов)
+"""
+
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from config import BLACKBOX_FILE, EVENT_STORE_DIR, EVENT_STORE_CHUNK_BYTES, EVENT_STORE_COMPACT_PARTS
+
+# ==========================================
+# 🛡️ PYARROW SAFE IMPORT (опционально)
+# ==========================================
+HAS_ARROW = False
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.ipc  # noqa: F401 (pa.ipc)
+    import pyarrow.parquet as pq
+    HAS_ARROW = True
+except ImportError:
+    pass
+
+# ==========================================
+# 🛡️ ZSTD SAFE IMPORT (опционально)
+# ==========================================
+HAS_ZSTD = False
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    pass
+
+MANIFEST_VERSION = 1
+BASE_COLUMNS = {"timestamp": "timestamp", "event": "string", "trade_id": "string", "symbol": "string",
+                "dca_level": "int"}
+TRADE_COLUMNS = ("trade_id", "symbol", "side", "stage", "confluence", "entry_time", "entry_price", "entry_usd",
+                 "exit_time", "reason", "pnl", "pnl_pct", "fees", "duration_sec", "dca_count", "events",
+                 "first_ts", "last_ts")
+OPS = {"=": pc.equal, "!=": pc.not_equal, ">=": pc.greater_equal, "<=": pc.less_equal,
+       ">": pc.greater, "<": pc.less} if HAS_ARROW else {}
+
+
+def _arrow_type(name):
+    return {"timestamp": pa.timestamp("us"), "string": pa.string(), "double": pa.float64(),
+            "bool": pa.bool_(), "int": pa.int64()}[name]
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "double"
+    return "string"
+
+
+def _scalar(value, field_type):
+    """Значение фильтра из CLI / Python -> scalar типа колонки"""
+    if isinstance(value, str):
+        if pa.types.is_timestamp(field_type):
+            value = datetime.fromisoformat(value)
+        elif pa.types.is_boolean(field_type):
+            value = value.lower() in ("1", "true", "yes")
+        elif pa.types.is_floating(field_type) or pa.types.is_integer(field_type):
+            value = float(value)
+    return pa.scalar(value).cast(field_type)
+
+
+def flatten(record, prefix=""):
+    """{"spans": {"a->b": 0.1}} -> {"spans.a->b": 0.1}; списки - JSON строкой"""
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value, ensure_ascii=False, default=str)
+        else:
+            flat[name] = value
+    return flat
+
+
+def _segments(path):
+    """Закрытые сегменты blackbox по порядку (blackbox.20260125.001.json[.gz|.zst])"""
+    root, ext = os.path.splitext(path)
+    segments = {}
+    for found in glob.glob(glob.escape(root) + ".[0-9]*" + ext + "*"):
+        base = found[:-len(".zst")] if found.endswith(".zst") else found[:-len(".gz")] if found.endswith(".gz") else found
+        if base.endswith(ext) and (base not in segments or found == base):
+            segments[base] = found  # Пока сжатие не закончено, читается несжатый
+    return [segments[base] for base in sorted(segments)]
+
+
+def _read_segment(path):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    if path.endswith(".zst"):
+        if not HAS_ZSTD:
+            raise RuntimeError(f"{path}: zstandard is not installed")
+        with open(path, "rb") as f:
+            return zstandard.ZstdDecompressor().stream_reader(f).read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _sources(path):
+    """blackbox.json и файлы процессов supervisor.py blackbox_<ASSET>.json (в том числе только с сегментами)"""
+    root, ext = os.path.splitext(path)
+    prefix = os.path.basename(root) + "_"
+    assets = set()
+    for found in glob.glob(glob.escape(root) + "_*" + ext + "*"):
+        asset = os.path.basename(found)[len(prefix):].split(".", 1)[0]
+        if asset:
+            assets.add(asset)
+    return [path] + [f"{root}_{asset}{ext}" for asset in sorted(assets)]
+
+
+class EventStore:
+    def __init__(self, root=EVENT_STORE_DIR, source=BLACKBOX_FILE, log_fn=print):
+        if not HAS_ARROW:
+            raise RuntimeError("event_store.py requires pyarrow (pip install pyarrow)")
+        self.root = root
+        self.source = source
+        self._log = log_fn
+        self.manifest_path = os.path.join(root, "_manifest.json")
+        self.trades_path = os.path.join(root, "trades.parquet")
+        self.manifest = self._load_manifest()
+        self._trades = None
+        self._mapped = {}  # event -> (файлы + схема, Table из _cache.arrow)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("v") == MANIFEST_VERSION:
+                if "source" in manifest:  # Манифест до blackbox_<ASSET>.json: один источник
+                    manifest["sources"] = {os.path.basename(self.source): manifest.pop("source")}
+                return manifest
+            self._log(f"⚠️ Event store manifest v{manifest.get('v')} != {MANIFEST_VERSION}, rebuilding")
+        except FileNotFoundError:
+            pass
+        return {"v": MANIFEST_VERSION, "events": {}, "seq": 0,
+                "sources": {},  # Имя файла -> {"segments": [...], "inode": ..., "offset": ...}
+                "positions": {}}  # symbol -> [trade_id, dca_level] открытой позиции
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Загрузка
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def ingest(self):
+        """Новые события всех источников (_sources), затем сжатие дней и кэш чтения"""
+        os.makedirs(self.root, exist_ok=True)
+        total = 0
+        for path in _sources(self.source):
+            src = self.manifest["sources"].setdefault(os.path.basename(path),
+                                                       {"segments": [], "inode": None, "offset": 0})
+            total += self._ingest_source(path, src)
+        self.compact()
+        for event in self.manifest["events"]:
+            self.table(event)  # Кэш чтения дописывается здесь, а не в первом запросе
+        return total
+
+    def _ingest_source(self, path, src):
+        """
+        Сначала ещё не загруженные закрытые сегменты, затем хвост файла.
+        Сегмент после ротации - бывший живой файл: уже загруженная его часть пропускается
+        """
+        total = 0
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            inode = None
+        for segment in _segments(path):
+            name = os.path.basename(segment).removesuffix(".gz").removesuffix(".zst")
+            if name in src["segments"]:
+                continue
+            data = _read_segment(segment)
+            skip = src["offset"] if src["inode"] is not None and src["inode"] != inode else 0
+            total += self._ingest_bytes(data[skip:])
+            src["segments"].append(name)
+            src["inode"], src["offset"] = None, 0  # Хвост старого живого файла дочитан из сегмента
+            self._commit()
+        if inode is not None:
+            if src["inode"] != inode:
+                src["inode"], src["offset"] = inode, 0
+            with open(path, "rb") as f:
+                f.seek(src["offset"])
+                while True:
+                    chunk = f.read(EVENT_STORE_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    end = chunk.rfind(b"\n") + 1  # Недописанная строка - в следующий раз
+                    if end == 0:
+                        break
+                    total += self._ingest_bytes(chunk[:end])
+                    src["offset"] += end
+                    f.seek(src["offset"])
+                    self._commit()
+        return total
+
+    def _ingest_bytes(self, data):
+        groups = {}  # (event, день) -> строки
+        bad = 0
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                bad += 1
+                continue
+            row = self._enrich(flatten(record))
+            if row is not None:
+                groups.setdefault((row["event"], row["timestamp"].strftime("%Y-%m-%d")), []).append(row)
+        if bad:
+            self._log(f"⚠️ Event store: {bad} unreadable line(s) skipped")
+        for (event, day), rows in groups.items():
+            self._write_part(event, day, rows)
+        return sum(len(rows) for rows in groups.values())
+
+    def _enrich(self, row):
+        """trade_id / dca_level по ходу позиции + строка индекса сделок"""
+        try:
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        event = row.get("event") or "UNKNOWN"
+        row["event"] = event
+        symbol = row.get("symbol")
+        key = symbol or ""
+        positions = self.manifest["positions"]
+        current = positions.get(key)
+
+        if event == "ENTRY":
+            trade_id = row.get("trade_id") or row["timestamp"].strftime("%Y%m%d%H%M%S%f")[:-3]
+            current = positions[key] = [str(trade_id), 0]
+            trade = self._trade(current[0], symbol)
+            trade.update(side=row.get("side"), stage=row.get("stage"), confluence=row.get("confluence"),
+                         entry_time=row["timestamp"], entry_price=row.get("price"), entry_usd=row.get("entry_usd"))
+        elif event == "DCA_EXECUTED" and current:
+            current[1] = int(row.get("level") or current[1])
+
+        if not row.get("trade_id") and current:
+            row["trade_id"] = current[0]
+        if row.get("trade_id") is not None:
+            row["trade_id"] = str(row["trade_id"])
+        if current and row.get("trade_id") == current[0]:
+            row["dca_level"] = current[1]
+
+        if event == "EXIT" and current:
+            trade = self._trade(current[0], symbol)
+            trade.update(exit_time=row["timestamp"], reason=row.get("reason"), pnl=row.get("pnl"),
+                         pnl_pct=row.get("pnl_pct"), fees=row.get("fees"), duration_sec=row.get("duration_sec"),
+                         dca_count=row.get("dca_count", current[1]))
+            del positions[key]
+        if row.get("trade_id"):
+            trade = self._trade(row["trade_id"], symbol)
+            trade["events"] += 1
+            ts = row["timestamp"]
+            if trade["first_ts"] is None or ts < trade["first_ts"]:
+                trade["first_ts"] = ts
+            if trade["last_ts"] is None or ts > trade["last_ts"]:
+                trade["last_ts"] = ts
+        return row
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Файлы
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _schema(self, event, rows=()):
+        """Схема типа события: известные колонки + новые из rows (конфликт типов -> строка)"""
+        meta = self.manifest["events"].setdefault(event, {"columns": dict(BASE_COLUMNS), "files": []})
+        columns = meta["columns"]
+        for row in rows:
+            for name, value in row.items():
+                if value is None or name in BASE_COLUMNS:
+                    continue
+                kind = _kind(value)
+                if columns.get(name, kind) != kind:
+                    kind = "string"
+                columns[name] = kind
+        return pa.schema([(name, _arrow_type(kind)) for name, kind in columns.items()])
+
+    def _write_part(self, event, day, rows):
+        schema = self._schema(event, rows)
+        columns = self.manifest["events"][event]["columns"]
+        for row in rows:
+            for name, value in row.items():
+                if value is not None and columns.get(name) == "string" and not isinstance(value, str):
+                    row[name] = json.dumps(value) if isinstance(value, (bool, int, float)) else str(value)
+        table = pa.Table.from_pylist(rows, schema=schema)
+        self.manifest["seq"] += 1
+        rel = os.path.join(event, day, f"part-{self.manifest['seq']:05d}.parquet")
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, path, compression="zstd")
+        ts = table.column("timestamp")
+        self.manifest["events"][event]["files"].append(
+            {"path": rel, "day": day, "rows": table.num_rows,
+             "min_ts": pc.min(ts).as_py().isoformat(), "max_ts": pc.max(ts).as_py().isoformat()})
+
+    def compact(self, max_parts=EVENT_STORE_COMPACT_PARTS):
+        """Мелкие части дня одного события -> одна (после многих инкрементальных загрузок)"""
+        changed = False
+        for event, meta in self.manifest["events"].items():
+            by_day = {}
+            for entry in meta["files"]:
+                by_day.setdefault(entry["day"], []).append(entry)
+            for day, entries in by_day.items():
+                if len(entries) <= max_parts:
+                    continue
+                schema = self._schema(event)
+                table = ds.dataset([os.path.join(self.root, e["path"]) for e in entries],
+                                   schema=schema, format="parquet").to_table()
+                table = table.sort_by("timestamp")
+                self.manifest["seq"] += 1
+                rel = os.path.join(event, day, f"part-{self.manifest['seq']:05d}.parquet")
+                pq.write_table(table, os.path.join(self.root, rel), compression="zstd")
+                old = {e["path"] for e in entries}
+                meta["files"] = [e for e in meta["files"] if e["path"] not in old] + [{
+                    "path": rel, "day": day, "rows": table.num_rows,
+                    "min_ts": min(e["min_ts"] for e in entries), "max_ts": max(e["max_ts"] for e in entries)}]
+                self._commit()
+                for path in old:
+                    os.remove(os.path.join(self.root, path))
+                changed = True
+        return changed
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Индекс сделок
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def trades_dict(self):
+        if self._trades is None:
+            self._trades = {}
+            if os.path.exists(self.trades_path):
+                for row in pq.read_table(self.trades_path).to_pylist():
+                    self._trades[row["trade_id"]] = row
+        return self._trades
+
+    def _trade(self, trade_id, symbol):
+        trades = self.trades_dict()
+        trade = trades.get(trade_id)
+        if trade is None:
+            trade = trades[trade_id] = dict.fromkeys(TRADE_COLUMNS)
+            trade.update(trade_id=trade_id, events=0)
+        if symbol and not trade["symbol"]:
+            trade["symbol"] = symbol
+        return trade
+
+    def _commit(self):
+        """Индекс сделок, затем манифест (он делает загруженное видимым)"""
+        if self._trades is not None:
+            schema = pa.schema([
+                ("trade_id", pa.string()), ("symbol", pa.string()), ("side", pa.string()), ("stage", pa.float64()),
+                ("confluence", pa.float64()), ("entry_time", pa.timestamp("us")), ("entry_price", pa.float64()),
+                ("entry_usd", pa.float64()), ("exit_time", pa.timestamp("us")), ("reason", pa.string()),
+                ("pnl", pa.float64()), ("pnl_pct", pa.float64()), ("fees", pa.float64()),
+                ("duration_sec", pa.float64()), ("dca_count", pa.float64()), ("events", pa.int64()),
+                ("first_ts", pa.timestamp("us")), ("last_ts", pa.timestamp("us")),
+            ])
+            tmp = self.trades_path + ".tmp"
+            pq.write_table(pa.Table.from_pylist(list(self._trades.values()), schema=schema), tmp)
+            os.replace(tmp, self.trades_path)
+        self._save_manifest()
+
+    def _trade_range(self, trade_id):
+        """(first_ts, last_ts) событий сделки без чтения всего индекса в словари"""
+        if self._trades is not None:
+            trade = self._trades.get(trade_id, {})
+            return trade.get("first_ts"), trade.get("last_ts")
+        if not os.path.exists(self.trades_path):
+            return None, None
+        rows = pq.read_table(self.trades_path, columns=["first_ts", "last_ts"],
+                             filters=[("trade_id", "=", trade_id)]).to_pylist()
+        return (rows[0]["first_ts"], rows[0]["last_ts"]) if rows else (None, None)
+
+    def trades(self, where=()):
+        """Таблица сделок (фильтры как в query)"""
+        table = pq.read_table(self.trades_path) if os.path.exists(self.trades_path) else None
+        if table is None:
+            return pa.table({name: [] for name in TRADE_COLUMNS})
+        mask = self._mask(table, where)
+        return table.filter(mask) if mask is not None else table
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Запросы
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    @staticmethod
+    def _mask(table, where):
+        mask = None
+        for column, op, value in where:
+            if column not in table.column_names:
+                raise KeyError(f"unknown column {column!r}")
+            col = table.column(column)
+            cond = OPS[op](col, _scalar(value, col.type))
+            mask = cond if mask is None else pc.and_(mask, cond)
+        return mask
+
+    def table(self, event):
+        """Все события типа одним куском в memory map (_cache.arrow дописывается новыми частями)"""
+        meta = self.manifest["events"].get(event)
+        if not meta:
+            return None
+        schema = self._schema(event)
+        paths = [f["path"] for f in meta["files"]]
+        key = (tuple(paths), schema)
+        cached = self._mapped.get(event)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        path = os.path.join(self.root, event, "_cache.arrow")
+        table, have = None, ()
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            have = json.loads(table.schema.metadata[b"paths"])
+            table = table.replace_schema_metadata(None)
+        except (OSError, pa.ArrowInvalid, KeyError, TypeError, ValueError):
+            table = None
+        if table is not None and (table.schema != schema or not set(have) <= set(paths)):
+            table, have = None, ()  # Новые колонки или сжатые дни - пересборка
+        new = [p for p in paths if p not in set(have)]
+        if table is None or new:
+            part = ds.dataset([os.path.join(self.root, p) for p in new], schema=schema,
+                              format="parquet").to_table().sort_by("timestamp")
+            if table is not None and table.num_rows and part.num_rows:
+                late = pc.less(pc.min(part.column("timestamp")), pc.max(table.column("timestamp"))).as_py()
+                table = pa.concat_tables([table, part])
+                if late:
+                    table = table.sort_by("timestamp")
+            elif table is None or not table.num_rows:
+                table = part
+            table = table.replace_schema_metadata({"paths": json.dumps(paths)})
+            tmp = path + ".tmp"
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table.combine_chunks())  # Один batch: timestamp - непрерывный буфер
+            os.replace(tmp, path)
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all().replace_schema_metadata(None)
+        self._mapped[event] = (key, table)
+        return table
+
+    def query(self, event, start=None, end=None, trade_id=None, where=(), columns=None, join=False):
+        """
+        События типа event: start / end - datetime, trade_id - интервал сделки из индекса
+        (бинарный поиск по времени), where - [(колонка, оп, значение)],
+        join - колонки сделки (trade_reason, trade_pnl, trade_dca_count...) по trade_id
+        """
+        table = self.table(event)
+        if table is None:
+            return pa.table({})
+        if trade_id is not None:
+            first, last = self._trade_range(str(trade_id))
+            if first is None:
+                return table.slice(0, 0)
+            start = max(start or first, first)
+            end = min(end or datetime.max, last + timedelta(microseconds=1))
+        if table.num_rows and (start is not None or end is not None):
+            ts = table.column("timestamp").chunk(0).to_numpy()
+            lo = np.searchsorted(ts, np.datetime64(start, "us")) if start is not None else 0
+            hi = np.searchsorted(ts, np.datetime64(min(end, datetime.max), "us")) if end is not None else len(ts)
+            table = table.slice(lo, max(hi - lo, 0))
+
+        event_where = [w for w in where if not w[0].startswith("trade_")]
+        trade_where = [w for w in where if w[0].startswith("trade_")]
+        if trade_id is not None:
+            event_where.append(("trade_id", "=", str(trade_id)))
+        mask = self._mask(table, event_where)
+        if mask is not None:
+            table = table.filter(mask)
+
+        if join or trade_where:
+            trades = self.trades()
+            trades = trades.rename_columns([name if name == "trade_id" else f"trade_{name}" for name in trades.column_names])
+            table = table.join(trades, keys="trade_id", join_type="left outer")
+            mask = self._mask(table, trade_where)
+            if mask is not None:
+                table = table.filter(mask)
+            table = table.sort_by("timestamp")  # join не сохраняет порядок
+        if columns:
+            table = table.select(columns)
+        return table
+
+    @staticmethod
+    def aggregate(table, by=(), metrics=(("timestamp", "count"),)):
+        """metrics - [(колонка, функция)]: count / mean / sum / min / max / stddev / approximate_median"""
+        if not by:
+            return pa.table({f"{column}_{fn}": [getattr(pc, fn)(table.column(column)).as_py()]
+                             for column, fn in metrics})
+        return table.group_by(list(by)).aggregate(list(metrics)).sort_by(list(by)[0])
+
+    def stats(self):
+        return {event: {"files": len(meta["files"]), "rows": sum(f["rows"] for f in meta["files"]),
+                        "columns": len(meta["columns"])}
+                for event, meta in sorted(self.manifest["events"].items())}
+
+
+def _parse_where(items):
+    where = []
+    for item in items or ():
+        for op in (">=", "<=", "!=", "=", ">", "<"):
+            if op in item:
+                column, value = item.split(op, 1)
+                where.append((column.strip(), op, value.strip()))
+                break
+        else:
+            raise ValueError(f"bad --where {item!r}, expected column<op>value")
+    return where
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar blackbox event store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("ingest", help=f"load new events from {BLACKBOX_FILE} and per-asset blackbox files")
+    sub.add_parser("stats", help="events / files / rows")
+    q = sub.add_parser("query", help="filter and aggregate events of one type")
+    q.add_argument("event")
+    q.add_argument("--since", help="ISO date/time")
+    q.add_argument("--until", help="ISO date/time")
+    q.add_argument("--trade")
+    q.add_argument("--where", action="append", help="column=value, column>=value... (trade_* - columns of the trade)")
+    q.add_argument("--join", action="store_true", help="add trade_* columns from the trade index")
+    q.add_argument("--by", action="append", help="group by column")
+    q.add_argument("--agg", action="append", help="fn:column, e.g. mean:missed_profit (default count)")
+    q.add_argument("--limit", type=int, default=20)
+    t = sub.add_parser("trade", help="all events of a trade")
+    t.add_argument("trade_id")
+    args = parser.parse_args()
+
+    store = EventStore()
+    if args.cmd == "ingest":
+        started = time.perf_counter()
+        n = store.ingest()
+        print(f"✅ Ingested {n} events in {time.perf_counter() - started:.2f}s")
+        for event, s in store.stats().items():
+            print(f"   {event}: {s['rows']} rows, {s['files']} files")
+    elif args.cmd == "stats":
+        for event, s in store.stats().items():
+            print(f"🗃️ {event}: {s['rows']} rows, {s['files']} files, {s['columns']} columns")
+        print(f"🗃️ trades: {store.trades().num_rows}")
+    elif args.cmd == "query":
+        started = time.perf_counter()
+        table = store.query(args.event,
+                            start=datetime.fromisoformat(args.since) if args.since else None,
+                            end=datetime.fromisoformat(args.until) if args.until else None,
+                            trade_id=args.trade, where=_parse_where(args.where), join=args.join)
+        if (args.by or args.agg) and table.num_rows:
+            metrics = [tuple(reversed(a.split(":", 1))) for a in args.agg] if args.agg else [("timestamp", "count")]
+            table = store.aggregate(table, args.by or (), metrics)
+        elapsed = (time.perf_counter() - started) * 1000
+        with_pd = table.slice(0, args.limit).to_pandas()
+        print(with_pd.to_string(index=False) if table.num_rows else "(no rows)")
+        print(f"🗃️ {table.num_rows} row(s) in {elapsed:.1f} ms")
+    elif args.cmd == "trade":
+        trade = store.trades_dict().get(args.trade_id)
+        if not trade:
+            print(f"❌ Trade {args.trade_id} not found")
+            sys.exit(1)
+        print(f"🗃️ {trade['trade_id']} {trade['side']} stage {trade['stage']} | {trade['reason']} "
+              f"PnL {trade['pnl']} | DCA {trade['dca_count']} | {trade['events']} events")
+        rows = [row for event in store.manifest["events"] for row in store.query(event, trade_id=args.trade_id).to_pylist()]
+        for row in sorted(rows, key=lambda r: r["timestamp"]):
+            fields = {k: v for k, v in row.items() if v is not None and k not in ("event", "trade_id", "timestamp")}
+            print(f"   {row['timestamp']:%Y-%m-%d %H:%M:%S} {row['event']}: {fields}")
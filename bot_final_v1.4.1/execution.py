@@ -0,0 +1,275 @@
+"""
+⚡ SMART ENTRY EXECUTION
+Вход post-only лимиткой с перекотировкой по лучшей цене стакана
+в пределах бюджета проскальзывания и лимита времени, с taker fallback
+для сильных сигналов. Работает в отдельном потоке - торговый цикл
+забирает готовый результат через poll()
+"""
+
+import time
+import queue
+import threading
+
+from config import (
+    ENTRY_TIME_LIMIT, ENTRY_REPRICE_INTERVAL, ENTRY_SLIPPAGE_BUDGET_PCT,
+    ENTRY_TAKER_STAGE, ENTRY_TAKER_SLIPPAGE_PCT,
+)
+from metrics import METRICS, mute_thread, thread_muted
+
+ENTRY_ATTEMPTS = METRICS.counter("bot_entry_attempts_total", "Smart entry attempts by result", ("result",))
+ENTRY_SLIPPAGE = METRICS.histogram("bot_entry_slippage_bps", "Entry fill vs signal price (bps, positive = worse)",
+                                   buckets=(-20, -10, -5, -2, 0, 2, 5, 10, 20, 50))
+ENTRY_TIME_TO_FILL = METRICS.histogram("bot_entry_time_to_fill_seconds", "Signal to last entry fill",
+                                       buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+
+
+class EntryRequest:
+    __slots__ = ("side", "amount", "signal_price", "stage", "confluence", "context", "created")
+
+    def __init__(self, side, amount, signal_price, stage, confluence, context=None):
+        self.side = side                    # "Buy" / "Sell"
+        self.amount = amount
+        self.signal_price = signal_price
+        self.stage = stage
+        self.confluence = confluence
+        self.context = context or {}        # Данные бота для завершения входа (объём USD и т.п.)
+        self.created = time.time()
+
+
+class EntryResult:
+    __slots__ = ("request", "status", "filled", "avg_price", "order_ids", "taker_order_id",
+                 "reprices", "first_ack", "filled_at", "slippage_pct", "reason", "cancelled")
+
+    def __init__(self, request):
+        self.request = request
+        self.status = "failed"              # filled / partial / failed
+        self.filled = 0.0
+        self.avg_price = 0.0
+        self.order_ids = []
+        self.taker_order_id = None
+        self.reprices = 0
+        self.first_ack = None
+        self.filled_at = None
+        self.slippage_pct = 0.0
+        self.reason = ""
+        self.cancelled = False              # Вход прерван cancel() (panic / stop)
+
+    @property
+    def time_to_fill(self):
+        return (self.filled_at - self.request.created) if self.filled_at else None
+
+
+class EntryExecutor:
+    def __init__(self, exchange, symbol, log_fn=None):
+        self.exchange = exchange
+        self.symbol = symbol
+        self._log = log_fn or (lambda msg: None)
+        self._results = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+        self._stats = {"attempts": 0, "filled": 0, "partial": 0, "failed": 0, "taker": 0,
+                       "slippage_sum": 0.0, "time_sum": 0.0, "reprices": 0}
+
+    @property
+    def busy(self):
+        """Вход исполняется или его результат ещё не забран poll() - позиция может уже быть на бирже"""
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        return not self._results.empty()  # Поток кладёт результат до завершения
+
+    def submit(self, request):
+        if self.busy:
+            return False
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self._run, args=(request, thread_muted()), name="entry-exec", daemon=True)
+        self._thread.start()
+        return True
+
+    def cancel(self):
+        """Прервать текущий вход (panic / stop). Уже исполненная часть вернётся в результате"""
+        self._cancel.set()
+
+    def poll(self):
+        """Готовые результаты (вызывается из торгового цикла)"""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Исполнение
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _run(self, req, muted=False):
+        if muted:
+            mute_thread()  # Вход shadow бота
+        result = EntryResult(req)
+        fills = {}  # order_id -> (filled, price)
+        try:
+            self._execute(req, result, fills)
+        except Exception as e:
+            result.reason = f"error: {e}"
+            self._log(f"❌ Smart entry error: {e}")
+
+        filled = sum(f for f, _ in fills.values())
+        if filled > 0:
+            result.filled = filled
+            result.avg_price = sum(f * p for f, p in fills.values()) / filled
+            side_mult = 1 if req.side == "Buy" else -1
+            result.slippage_pct = (result.avg_price - req.signal_price) / req.signal_price * 100 * side_mult
+            result.status = "filled" if filled >= req.amount * 0.999 else "partial"
+        result.order_ids = [oid for oid, (f, _) in fills.items() if f > 0]
+        result.cancelled = self._cancel.is_set()
+        self._record(result)
+        self._results.put(result)
+
+    def _execute(self, req, result, fills):
+        is_buy = req.side == "Buy"
+        order_side = "buy" if is_buy else "sell"
+        pos_side = 'LONG' if is_buy else 'SHORT'
+        deadline = req.created + ENTRY_TIME_LIMIT
+        budget = ENTRY_SLIPPAGE_BUDGET_PCT / 100
+        order_id, order_price = None, None
+
+        def slippage(price):
+            return (price - req.signal_price) / req.signal_price * (1 if is_buy else -1)
+
+        def remaining():
+            left = req.amount - sum(f for f, _ in fills.values())
+            try:
+                return float(self.exchange.amount_to_precision(self.symbol, left))
+            except Exception:
+                return 0.0  # Меньше минимального шага
+
+        def refresh(oid):
+            o = self.exchange.fetch_order(oid, self.symbol)
+            done = float(o.get('filled') or 0)
+            if done > 0:
+                fills[oid] = (done, float(o.get('average') or o.get('price') or 0))
+                result.filled_at = time.time()
+            return o
+
+        def cancel(oid):
+            try:
+                self.exchange.cancel_order(oid, self.symbol)
+            except Exception:
+                pass
+            refresh(oid)  # Исполнение могло случиться до отмены
+
+        try:
+            while True:
+                if order_id:
+                    o = refresh(order_id)
+                    if o['status'] != 'open':
+                        # closed - исполнен; canceled/rejected - post-only отклонён (пересёк бы стакан)
+                        order_id = None
+                if remaining() <= 0:
+                    result.reason = "filled"
+                    break
+                if self._cancel.is_set():
+                    result.reason = "cancelled"
+                    break
+
+                book = self.exchange.fetch_order_book(self.symbol, 5)
+                quote = float(book['bids'][0][0] if is_buy else book['asks'][0][0])
+                if time.time() >= deadline or slippage(quote) > budget:
+                    result.reason = "timeout" if time.time() >= deadline else "slippage budget"
+                    break
+
+                if order_id and quote != order_price:
+                    cancel(order_id)
+                    order_id = None
+                    continue  # Пересчитать остаток после отмены
+
+                if not order_id:
+                    amount = remaining()
+                    order = self.exchange.create_order(
+                        symbol=self.symbol, type='limit', side=order_side, amount=amount, price=quote,
+                        params={'positionSide': pos_side, 'postOnly': True}
+                    )
+                    order_id, order_price = str(order['id']), quote
+                    fills.setdefault(order_id, (0.0, quote))
+                    result.first_ack = result.first_ack or time.time()
+                    result.reprices += 1
+
+                self._cancel.wait(ENTRY_REPRICE_INTERVAL)
+        finally:
+            # И при ошибке (стакан, fetch_order): post-only ордер не остаётся на бирже без учёта
+            if order_id:
+                self._cancel_order(order_id, cancel, refresh)
+
+        # Taker fallback для сильного сигнала: добираем остаток по рынку
+        left = remaining()
+        if left > 0 and req.stage >= ENTRY_TAKER_STAGE and not self._cancel.is_set():
+            book = self.exchange.fetch_order_book(self.symbol, 5)
+            taker_price = float(book['asks'][0][0] if is_buy else book['bids'][0][0])
+            if slippage(taker_price) <= ENTRY_TAKER_SLIPPAGE_PCT / 100:
+                order = self.exchange.create_order(
+                    symbol=self.symbol, type='market', side=order_side, amount=left,
+                    params={'positionSide': pos_side}
+                )
+                oid = str(order['id'])
+                result.taker_order_id = oid
+                result.first_ack = result.first_ack or time.time()
+                fills[oid] = (left, taker_price)  # Рыночный - оценка, пока fetch_order не ответил
+                time.sleep(0.5)
+                refresh(oid)
+                result.reason += " → taker"
+            else:
+                result.reason += f" (taker skipped, slippage {slippage(taker_price)*100:.3f}%)"
+
+    def _cancel_order(self, order_id, cancel, refresh):
+        """Отмена с учётом исполнения; повтор fetch_order, если первый не ответил"""
+        try:
+            cancel(order_id)
+            return
+        except Exception as e:
+            self._log(f"⚠️ Smart entry: fill check of {order_id} failed ({e}), retrying")
+        time.sleep(ENTRY_REPRICE_INTERVAL)
+        try:
+            refresh(order_id)
+        except Exception as e:
+            self._log(f"❌ Smart entry: fill of {order_id} unknown ({e}), Doctor will sync")
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Статистика
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _record(self, result):
+        st = self._stats
+        st["attempts"] += 1
+        st[result.status] += 1
+        st["reprices"] += result.reprices
+        ENTRY_ATTEMPTS.inc(result=result.status)
+        if result.taker_order_id:
+            st["taker"] += 1
+        if result.filled > 0:
+            st["slippage_sum"] += result.slippage_pct
+            ENTRY_SLIPPAGE.observe(result.slippage_pct * 100)
+            if result.time_to_fill is not None:
+                st["time_sum"] += result.time_to_fill
+                ENTRY_TIME_TO_FILL.observe(result.time_to_fill)
+
+    def stats(self):
+        st = self._stats
+        executed = st["filled"] + st["partial"]
+        return {
+            "attempts": st["attempts"],
+            "filled": st["filled"],
+            "partial": st["partial"],
+            "failed": st["failed"],
+            "taker_fallbacks": st["taker"],
+            "fill_rate": executed / st["attempts"] if st["attempts"] else 0.0,
+            "avg_slippage_pct": st["slippage_sum"] / executed if executed else 0.0,
+            "avg_time_to_fill": st["time_sum"] / executed if executed else 0.0,
+            "avg_reprices": st["reprices"] / st["attempts"] if st["attempts"] else 0.0,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"Attempts: {s['attempts']} (filled {s['filled']}, partial {s['partial']}, failed {s['failed']})\n"
+                f"Fill rate: {s['fill_rate']*100:.0f}% | Taker fallbacks: {s['taker_fallbacks']}\n"
+                f"Avg slippage: {s['avg_slippage_pct']:+.3f}% | Avg time to fill: {s['avg_time_to_fill']:.1f}s | "
+                f"Avg quotes: {s['avg_reprices']:.1f}")
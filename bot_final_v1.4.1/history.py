@@ -0,0 +1,390 @@
+"""
+🗄️ HISTORY
+Исторические свечи для бэктеста и подбора параметров:
+    python history.py BTC/USDT:USDT ETH/USDT:USDT --since 2025-01-01 [--until 2025-07-01] [--timeframe 1m]
+    python history.py BTC/USDT:USDT --check        - разрывы в кэше без загрузки (и на стыках месяцев)
+    python history.py BTC/USDT:USDT --repair [--since ...] - заново запросить и запомненные пропуски биржи
+- Загрузка: недостающие интервалы месяца режутся на окна по HISTORY_PAGE_LIMIT свечей,
+  окна качаются параллельно (HISTORY_WORKERS потоков, у каждого свой ccxt exchange)
+  под общим лимитом HISTORY_RATE_LIMIT запросов в секунду
+- Хранение: Parquet (zstd) на символ и месяц: history/BTC_USDT_USDT/1m/2025-01.parquet,
+  запись атомарная (tmp + os.replace) - прерванная загрузка продолжается с готовых месяцев
+- Разрывы: повторный запуск докачивает только дырки. Пустая страница повторяется
+  HISTORY_EMPTY_RETRIES раз и пропуском не считается. Интервал, которого нет на бирже (техработы),
+  запоминается в метаданных месяца и больше не запрашивается, только если свечи есть по обе
+  его стороны: биржа сама отдала свечу после него, а перед ним свеча есть в кэше (на стыке -
+  в прошлом месяце). Иначе это мог быть сбой, и он запрашивается снова
+- Чтение: все месяцы склеиваются в несжатый Arrow IPC (all.arrow, пересборка при изменении
+  Parquet) и открываются через memory map - numpy массивы колонок без копии, сеть не нужна
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import ccxt
+
+from config import (
+    HISTORY_DIR, HISTORY_WORKERS, HISTORY_RATE_LIMIT, HISTORY_PAGE_LIMIT, HISTORY_RETRIES, HISTORY_EMPTY_RETRIES,
+    TIMEFRAME, Col,
+)
+
+# ==========================================
+# 🛡️ PYARROW SAFE IMPORT (опционально)
+# ==========================================
+HAS_ARROW = False
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_ARROW = True
+except ImportError:
+    pass
+
+COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+RETRY_ERRORS = (ccxt.NetworkError, ccxt.RateLimitExceeded, ccxt.ExchangeNotAvailable)
+
+
+def _ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def _month_start(ts_ms):
+    dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def _next_month(dt):
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _missing(ts, lo, hi, step, known=()):
+    """Интервалы [a, b) сетки step в [lo, hi), которых нет в отсортированном ts и в known"""
+    ts = ts[(ts >= lo) & (ts < hi)]
+    edges = np.concatenate(([lo - step], ts, [hi]))
+    holes = np.nonzero(np.diff(edges) > step)[0]
+    ranges = [(int(edges[i] + step), int(edges[i + 1])) for i in holes]
+    for k_lo, k_hi in known:
+        ranges = [part for a, b in ranges
+                  for part in ((a, min(b, k_lo)), (max(a, k_hi), b)) if part[0] < part[1]]
+    return ranges
+
+
+def _merge(ranges):
+    """Объединение пересекающихся / смежных интервалов [a, b)"""
+    merged = []
+    for a, b in sorted(ranges):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+
+class RateLimiter:
+    """Token bucket на все потоки загрузки"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HistoryStore:
+    """Кэш свечей на диске: Parquet на месяц (источник) + Arrow IPC на символ (чтение через mmap)"""
+
+    def __init__(self, root=HISTORY_DIR):
+        if not HAS_ARROW:
+            raise RuntimeError("history.py requires pyarrow (pip install pyarrow)")
+        self.root = root
+        self._mapped = {}  # путь all.arrow -> (mtime, Table)
+
+    def _dir(self, symbol, timeframe):
+        return os.path.join(self.root, symbol.replace('/', '_').replace(':', '_'), timeframe)
+
+    def month_path(self, symbol, timeframe, month):
+        return os.path.join(self._dir(symbol, timeframe), f"{month:%Y-%m}.parquet")
+
+    def months(self, symbol, timeframe):
+        folder = self._dir(symbol, timeframe)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".parquet"))
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Месяцы (Parquet)
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def read_month(self, symbol, timeframe, month):
+        """(timestamps, Table или None, known_gaps)"""
+        path = self.month_path(symbol, timeframe, month)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.int64), None, []
+        table = pq.read_table(path)
+        meta = table.schema.metadata or {}
+        known = [tuple(g) for g in json.loads(meta.get(b"known_gaps", b"[]"))]
+        return table.column('timestamp').to_numpy(), table, known
+
+    def write_month(self, symbol, timeframe, month, table, known_gaps):
+        """Сортировка, удаление дублей и атомарная запись месяца"""
+        ts = table.column('timestamp').to_numpy()
+        _, first = np.unique(ts, return_index=True)  # Индексы по возрастанию timestamp
+        table = table.take(pa.array(first)).replace_schema_metadata(
+            {"known_gaps": json.dumps(sorted(known_gaps)), "timeframe": timeframe, "symbol": symbol})
+        path = self.month_path(symbol, timeframe, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        return table.num_rows
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Чтение без копии (Arrow IPC + memory map)
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def table(self, symbol, timeframe=TIMEFRAME):
+        """Вся история символа одним куском в memory map (пересборка all.arrow, если месяцы новее)"""
+        months = self.months(symbol, timeframe)
+        if not months:
+            raise FileNotFoundError(f"No cached history for {symbol} {timeframe} in {self.root}")
+        path = os.path.join(self._dir(symbol, timeframe), "all.arrow")
+        newest = max(os.path.getmtime(m) for m in months)
+        if not os.path.exists(path) or os.path.getmtime(path) < newest:
+            combined = pa.concat_tables(pq.read_table(m).replace_schema_metadata(None) for m in months)
+            tmp = path + ".tmp"
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, combined.schema) as writer:
+                writer.write_table(combined.combine_chunks())  # Один batch: колонки - непрерывные буферы
+            os.replace(tmp, path)
+        mtime = os.path.getmtime(path)
+        cached = self._mapped.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = self._mapped[path] = (mtime, pa.ipc.open_file(pa.memory_map(path, "r")).read_all())
+        return cached[1]
+
+    def arrays(self, symbol, timeframe=TIMEFRAME, start=None, end=None):
+        """{колонка: numpy view} свечей [start, end) (мс) - срез memory map без копии"""
+        table = self.table(symbol, timeframe)
+        columns = {name: table.column(name).chunk(0).to_numpy(zero_copy_only=True) for name in COLUMNS}
+        ts = columns['timestamp']
+        lo = 0 if start is None else int(np.searchsorted(ts, start, "left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, "left"))
+        return {name: values[lo:hi] for name, values in columns.items()}
+
+    def frame(self, symbol, timeframe=TIMEFRAME, start=None, end=None):
+        """DataFrame колонок без копии (индикаторы / бэктест)"""
+        return pd.DataFrame(self.arrays(symbol, timeframe, start, end), copy=False)
+
+    def fetch_ohlcv(self, symbol, timeframe=TIMEFRAME, since=None, limit=None, params=None):
+        """Как ccxt fetch_ohlcv, но из кэша: массив [N, 6] для HybridTradingBot.build_market_df"""
+        cols = self.arrays(symbol, timeframe, start=since)
+        n = len(cols['timestamp']) if limit is None else min(limit, len(cols['timestamp']))
+        rows = slice(0, n) if since is not None else slice(len(cols['timestamp']) - n, None)
+        return np.column_stack([cols[name][rows].astype(np.float64) for name in COLUMNS])
+
+    def month_of(self, path):
+        return datetime.strptime(os.path.basename(path)[:7], "%Y-%m").replace(tzinfo=timezone.utc)
+
+    def last_candle(self, symbol, timeframe, month):
+        """timestamp последней свечи месяца или None (пропуск на стыке месяцев)"""
+        ts, _, _ = self.read_month(symbol, timeframe, month)
+        return int(ts.max()) if len(ts) else None
+
+    def check(self, symbol, timeframe=TIMEFRAME):
+        """Разрывы в кэше: [(a, b)] мс без известных пропусков биржи, в том числе на стыках месяцев"""
+        step = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        stamps, known = [], []
+        for path in self.months(symbol, timeframe):
+            ts, _, month_known = self.read_month(symbol, timeframe, self.month_of(path))
+            stamps.append(ts)
+            known += month_known
+        ts = np.sort(np.concatenate(stamps)) if stamps else np.empty(0, dtype=np.int64)
+        if not len(ts):
+            return []
+        return _missing(ts, int(ts[0]), int(ts[-1]) + step, step, known)
+
+
+class HistoryDownloader:
+    def __init__(self, exchange_factory, store=None, workers=HISTORY_WORKERS, rate=HISTORY_RATE_LIMIT,
+                 page_limit=HISTORY_PAGE_LIMIT, retries=HISTORY_RETRIES, empty_retries=HISTORY_EMPTY_RETRIES,
+                 log_fn=print):
+        """exchange_factory() -> ccxt exchange: по экземпляру на поток (requests.Session не делится)"""
+        self.exchange_factory = exchange_factory
+        self.store = store or HistoryStore()
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.page_limit = page_limit
+        self.retries = retries
+        self.empty_retries = empty_retries
+        self._log = log_fn
+        self._local = threading.local()
+        self._count_lock = threading.Lock()
+        self.requests = 0
+
+    def _exchange(self):
+        ex = getattr(self._local, "exchange", None)
+        if ex is None:
+            ex = self._local.exchange = self.exchange_factory()
+        return ex
+
+    def _fetch(self, symbol, timeframe, since, limit):
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            with self._count_lock:
+                self.requests += 1
+            try:
+                return self._exchange().fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+            except RETRY_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                delay = min(2 ** attempt, 30)
+                self._log(f"{Col.YELLOW}⚠️ {symbol} @ {since}: {type(e).__name__}, retry in {delay}s{Col.WHITE}")
+                time.sleep(delay)
+
+    def _fetch_window(self, symbol, timeframe, start, end, step):
+        """
+        Свечи [start, end) постранично -> (rows, skipped). Пустой ответ повторяется HISTORY_EMPTY_RETRIES раз
+        (сбой / ограничение биржи) и пропуском не считается. skipped - интервалы, через которые биржа
+        сама перешла к следующей свече (она есть в ответе): подтверждение пропуска справа
+        """
+        rows, skipped, cursor = [], [], start
+        while cursor < end:
+            limit = min(self.page_limit, (end - cursor) // step)
+            for attempt in range(self.empty_retries + 1):
+                raw = [r for r in self._fetch(symbol, timeframe, cursor, limit) if r[0] >= cursor]
+                if raw or attempt == self.empty_retries:
+                    break
+                time.sleep(min(2 ** attempt, 30))
+            expected = cursor
+            for r in raw:
+                if r[0] > expected:
+                    skipped.append((expected, min(int(r[0]), end)))
+                if r[0] >= end:
+                    break
+                expected = int(r[0]) + step
+            page = [r for r in raw if r[0] < end]
+            if not page:
+                break
+            rows += page
+            cursor = int(page[-1][0]) + step
+        return rows, skipped
+
+    def sync(self, symbol, timeframe=TIMEFRAME, since=None, until=None, repair=False):
+        """
+        Докачать [since, until) (datetime UTC, until по умолчанию - последняя закрытая свеча).
+        Месяцы пишутся по одному: прерванная загрузка продолжится с первого недокачанного.
+        repair - забыть запомненные пропуски биржи и запросить их заново (since по умолчанию - первый месяц кэша)
+        """
+        step = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        closed = (int(time.time() * 1000) // step) * step  # Текущая свеча ещё формируется
+        if since is None:
+            months = self.store.months(symbol, timeframe)
+            if not months:
+                raise ValueError(f"{symbol}: since is required, cache is empty")
+            since = self.store.month_of(months[0])
+        lo = _ms(since)
+        hi = min(_ms(until), closed) if until else closed
+        stats = {"candles": 0, "requests": 0, "months": 0, "gaps_left": 0}
+        month = _month_start(lo)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="history") as pool:
+            while _ms(month) < hi:
+                m_lo, m_hi = max(lo, _ms(month)), min(hi, _ms(_next_month(month)))
+                added, gaps = self._sync_month(pool, symbol, timeframe, month, m_lo, m_hi, step, closed, repair)
+                stats["candles"] += added
+                stats["gaps_left"] += gaps
+                stats["months"] += 1
+                month = _next_month(month)
+        stats["requests"] = self.requests
+        return stats
+
+    def _sync_month(self, pool, symbol, timeframe, month, lo, hi, step, closed, repair=False):
+        ts, table, known = self.store.read_month(symbol, timeframe, month)
+        if repair and known:
+            # Запомненные пропуски вне [lo, hi) остаются, внутри - запрашиваются заново
+            known = [g for g in known if g[1] <= lo or g[0] >= hi]
+            if table is not None:
+                self.store.write_month(symbol, timeframe, month, table, known)
+        missing = _missing(ts, lo, hi, step, known)
+        if not missing:
+            return 0, 0
+        span = self.page_limit * step
+        windows = [(a, min(a + span, b)) for a, b in missing for a in range(a, b, span)]
+        started = time.time()
+        results = list(pool.map(lambda w: self._fetch_window(symbol, timeframe, w[0], w[1], step), windows))
+        rows = [r for chunk, _ in results for r in chunk]
+        skipped = _merge(g for _, gaps in results for g in gaps)
+
+        fresh = pa.table({name: pa.array([r[i] for r in rows], type=pa.int64() if i == 0 else pa.float64())
+                          for i, name in enumerate(COLUMNS)})
+        merged = fresh if table is None else pa.concat_tables([table.replace_schema_metadata(None), fresh])
+        # Пропуск на стороне биржи (больше не запрашиваем) - если свечи есть по обе стороны: справа биржа
+        # сама перешла через него к следующей свече, слева - свеча в кэше. Пустые ответы, хвост у последней
+        # закрытой свечи и пропуск без свечи слева не подтверждены - запросим при следующем запуске
+        merged_ts = np.sort(merged.column('timestamp').to_numpy())
+        still = _missing(merged_ts, lo, hi, step, known)
+        confirmed = [g for g in still if g[1] < closed and any(a <= g[0] and g[1] <= b for a, b in skipped)
+                     and self._left_confirmed(symbol, timeframe, month, merged_ts, g[0], step)]
+        total = self.store.write_month(symbol, timeframe, month, merged, known + confirmed)
+        self._log(f"{Col.CYAN}🗄️ {symbol} {timeframe} {month:%Y-%m}: +{len(rows)} candles in {len(windows)} windows "
+                  f"({time.time() - started:.1f}s), {total} total, {len(confirmed)} exchange gap(s)"
+                  f"{f', {len(still) - len(confirmed)} unconfirmed' if len(still) > len(confirmed) else ''}{Col.WHITE}")
+        return len(rows), len(still)
+
+    def _left_confirmed(self, symbol, timeframe, month, ts, a, step):
+        """Свеча перед пропуском, начинающимся в a: в этом месяце или на стыке - последняя свеча прошлого"""
+        if a == _ms(month):
+            prev = datetime(month.year - (month.month == 1), (month.month - 2) % 12 + 1, 1, tzinfo=timezone.utc)
+            return self.store.last_candle(symbol, timeframe, prev) is not None
+        i = np.searchsorted(ts, a - step)
+        return i < len(ts) and ts[i] == a - step
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Historical OHLCV cache (Parquet per symbol / month)")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--since", help="YYYY-MM-DD (UTC)")
+    parser.add_argument("--until", help="YYYY-MM-DD (UTC), default - last closed candle")
+    parser.add_argument("--timeframe", default=TIMEFRAME)
+    parser.add_argument("--check", action="store_true", help="only report gaps in the cache")
+    parser.add_argument("--repair", action="store_true",
+                        help="re-request remembered exchange gaps (default --since - first cached month)")
+    args = parser.parse_args()
+
+    def parse_day(value):
+        return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc) if value else None
+
+    if args.check:
+        store = HistoryStore()
+        for symbol in args.symbols:
+            gaps = store.check(symbol, args.timeframe)
+            arrays = store.arrays(symbol, args.timeframe)
+            print(f"🗄️ {symbol}: {len(arrays['timestamp'])} candles, {len(gaps)} gap(s)")
+            for a, b in gaps[:20]:
+                print(f"   {datetime.fromtimestamp(a / 1000, tz=timezone.utc):%Y-%m-%d %H:%M} → "
+                      f"{datetime.fromtimestamp(b / 1000, tz=timezone.utc):%Y-%m-%d %H:%M}")
+        sys.exit(0)
+    if not args.since and not args.repair:
+        parser.error("--since is required for download")
+
+    downloader = HistoryDownloader(lambda: ccxt.bingx({'enableRateLimit': True, 'options': {'defaultType': 'swap'}}))
+    for symbol in args.symbols:
+        try:
+            s = downloader.sync(symbol, args.timeframe, parse_day(args.since), parse_day(args.until), args.repair)
+            print(f"✅ {symbol}: +{s['candles']} candles, {s['months']} months, {s['requests']} requests total, "
+                  f"{s['gaps_left']} exchange gap(s)")
+        except KeyboardInterrupt:
+            print("⏸️ Interrupted - finished months are kept, run again to resume")
+            sys.exit(1)
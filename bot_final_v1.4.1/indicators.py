@@ -0,0 +1,303 @@
+"""
+⚡ INDICATORS
+Индикаторы бота (EMA 9/15/20/50, RSI, ATR, ADX, MACD) одним ядром на numpy вместо восьми объектов ta
+и их промежуточных Series - для окна живого бота и для истории бэктеста:
+    python indicators.py verify --symbol BTC/USDT:USDT     - сверка с ta на свечах кэша history.py
+    python indicators.py verify --rows 100000              - то же на синтетических свечах
+    python indicators.py bench                             - ta против ядра на 200 / 10k / 1M свечей
+- Вход - колонки close / high / low (float64; view колонок history.py без копии),
+  выход - заранее выделенный [N, INDICATOR_COLUMNS] (в том числе view в таблице DataFrame)
+- Формулы и прогрев как в ta: те же NaN / 0 в начале, ATR и ADX Уайлдера с усреднения первых 14
+  (как и рекурсия warm_start.py - колонки и периоды оттуда)
+- Рекурсии (EMA, средние Уайлдера, сигнал MACD) - линейный фильтр y[i] = x[i] + b * y[i-1]:
+  внутри блока SCAN_BLOCK свечей - умножение на треугольную матрицу степеней b, между блоками -
+  тот же фильтр по концам блоков. Все фильтры шага - один batched matmul, Python циклов по свечам нет
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from warm_start import COLUMNS, INDICATOR_COLUMNS, EMA_SPANS, MACD_SIGNAL, WILDER
+
+# ==========================================
+# 🛡️ TA SAFE IMPORT (только сверка / бенчмарк)
+# ==========================================
+HAS_TA = False
+try:
+    import ta
+    HAS_TA = True
+except ImportError:
+    pass
+
+SCAN_BLOCK = 32  # Свечей в блоке фильтра: матрица 32x32 на коэффициент, перенос между блоками - рекурсивно
+
+_COL = {name: i for i, name in enumerate(INDICATOR_COLUMNS)}
+_decay_cache = {}  # (коэффициенты, блок) -> [K, блок, блок]
+
+
+def _decay(betas, size):
+    """Матрицы D[k][j, i] = b_k ** (i - j) при i >= j: отклик блока на вход при нулевом начале"""
+    key = (betas, size)
+    matrix = _decay_cache.get(key)
+    if matrix is None:
+        lag = np.arange(size)[None, :] - np.arange(size)[:, None]
+        powers = np.asarray(betas)[:, None, None] ** np.maximum(lag, 0)
+        matrix = _decay_cache[key] = np.where(lag >= 0, powers, 0.0)
+    return matrix
+
+
+def scan(x, betas):
+    """
+    Линейный фильтр по строкам x [K, N]: y[k, i] = x[k, i] + betas[k] * y[k, i-1], y[k, -1] = 0.
+    Блоки по SCAN_BLOCK считаются одним matmul, концы блоков - тем же фильтром с b ** SCAN_BLOCK
+    """
+    k, n = x.shape
+    size = SCAN_BLOCK
+    blocks = -(-n // size)
+    if n != blocks * size:
+        padded = np.zeros((k, blocks * size))
+        padded[:, :n] = x
+        x = padded
+    betas = tuple(float(b) for b in betas)
+    y = np.matmul(x.reshape(k, blocks, size), _decay(betas, size))
+    if blocks > 1:
+        b = np.array(betas)[:, None]
+        ends = scan(np.ascontiguousarray(y[:, :, -1]), b[:, 0] ** size)
+        y[:, 1:] += ends[:, :-1, None] * (b ** np.arange(1, size + 1))[:, None, :]
+    return y.reshape(k, -1)[:, :n]
+
+
+def compute(close, high, low, out=None):
+    """
+    INDICATOR_COLUMNS по колонкам свечей -> out [N, 11] (новый массив, если out не задан).
+    Два шага фильтров: EMA + RSI + ATR + суммы ADX, затем сигнал MACD и сглаживание ADX
+    """
+    c = np.ascontiguousarray(close, dtype=np.float64)
+    h = np.ascontiguousarray(high, dtype=np.float64)
+    l = np.ascontiguousarray(low, dtype=np.float64)
+    n = len(c)
+    if out is None:
+        out = np.empty((n, len(INDICATOR_COLUMNS)))
+    if n == 0:
+        return out
+    w = WILDER
+    a = 1.0 / w
+    width = -(-n // SCAN_BLOCK) * SCAN_BLOCK
+
+    # Шаг 1: входы фильтров - EMA_SPANS, RSI up / down, ATR, ADX TR / +DM / -DM
+    spans = len(EMA_SPANS)
+    rsi_up, rsi_dn, atr, adx_tr, adx_pos, adx_neg = range(spans, spans + 6)
+    x = np.zeros((spans + 6, width))
+    alphas = [2.0 / (span + 1) for span in EMA_SPANS]
+    for row, alpha in enumerate(alphas):
+        np.multiply(c, alpha, out=x[row, :n])
+        x[row, 0] = c[0]  # ewm(adjust=False) начинается с первого значения
+
+    pc = c[:-1]
+    diff = c[1:] - pc
+    np.multiply(np.maximum(diff, 0.0), a, out=x[rsi_up, 1:n])
+    np.multiply(np.maximum(-diff, 0.0), a, out=x[rsi_dn, 1:n])
+
+    tr = np.empty(n)
+    tr[0] = h[0] - l[0]
+    np.maximum(np.maximum(h[1:] - l[1:], np.abs(h[1:] - pc)), np.abs(l[1:] - pc), out=tr[1:])
+    if n >= w:
+        x[atr, w - 1] = tr[:w].mean()
+        np.multiply(tr[w:], a, out=x[atr, w:n])
+
+    up, down = h[1:] - h[:-1], l[:-1] - l[1:]
+    moves = (np.maximum(h[1:], pc) - np.minimum(l[1:], pc),
+             np.where((up > down) & (up > 0), up, 0.0),
+             np.where((down > up) & (down > 0), down, 0.0))
+    if n > w:
+        for row, move in zip((adx_tr, adx_pos, adx_neg), moves):
+            x[row, w] = move[:w].sum()  # Сумма с 1-й по 14-ю свечу, дальше s - s/14 + move
+            x[row, w + 1:n] = move[w:]
+
+    y = scan(x, [1 - alpha for alpha in alphas] + [1 - a] * 6)[:, :n]
+
+    def ema(span):
+        values = y[EMA_SPANS.index(span)]
+        values[:span - 1] = np.nan  # min_periods
+        return values
+
+    for span, name in ((9, 'EMA9'), (15, 'EMA15'), (20, 'EMA20'), (50, 'EMA50')):
+        out[:, _COL[name]] = ema(span)
+    macd = ema(12) - ema(26)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dn = y[rsi_dn]
+        rsi = np.where(dn == 0, 100.0, 100 - 100 / (1 + y[rsi_up] / dn))
+        rsi[:w - 1] = np.nan
+        out[:, _COL['RSI']] = rsi
+
+        atr_values = y[atr]  # До 14-й свечи 0, как в ta
+        out[:, _COL['ATR']] = atr_values
+        out[:, _COL['ATR_pct']] = atr_values / c
+
+        trs = y[adx_tr]
+        dip = np.where(trs != 0, 100 * y[adx_pos] / trs, 0.0)
+        din = np.where(trs != 0, 100 * y[adx_neg] / trs, 0.0)
+        dx = np.where(dip + din != 0, 100 * np.abs((dip - din) / (dip + din)), 0.0)
+
+    # Шаг 2: сигнал MACD (EMA9 от MACD с 26-й свечи) и ADX (среднее 14 DX, затем Уайлдер)
+    x = np.zeros((2, width))
+    a_signal = 2.0 / (MACD_SIGNAL + 1)
+    start = EMA_SPANS[-1] - 1
+    if n > start:
+        x[0, start] = macd[start]
+        np.multiply(macd[start + 1:], a_signal, out=x[0, start + 1:n])
+    if n >= 2 * w:
+        x[1, 2 * w - 1] = dx[w:2 * w].mean()
+        np.multiply(dx[2 * w:], a, out=x[1, 2 * w:n])
+    y = scan(x, (1 - a_signal, 1 - a))[:, :n]
+
+    signal = y[0]
+    signal[:start + MACD_SIGNAL - 1] = np.nan
+    out[:, _COL['ADX']] = y[1]
+    out[:, _COL['MACD']] = macd
+    out[:, _COL['MACD_signal']] = signal
+    out[:, _COL['MACD_hist']] = macd - signal
+    return out
+
+
+def frame(ohlcv):
+    """
+    DataFrame COLUMNS (как MarketFeed.build) по свечам [timestamp, open, high, low, close, volume]:
+    индикаторы пишутся прямо в таблицу DataFrame
+    """
+    arr = np.asarray(ohlcv, dtype=np.float64)
+    if arr.size == 0:
+        arr = arr.reshape(0, 6)  # [] - одномерный массив: пустой DataFrame тех же колонок
+    table = np.empty((len(arr), len(COLUMNS)), order='F')  # Колонки непрерывны - и для ядра, и для pandas
+    table[:, :6] = arr[:, :6]
+    compute(arr[:, 4], arr[:, 2], arr[:, 3], out=table[:, 6:])
+    return pd.DataFrame(table, columns=list(COLUMNS), copy=False)
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Сверка с ta / бенчмарк
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+def ta_frame(ohlcv):
+    """Прежний расчёт get_market_data_enhanced - восемь индикаторов ta (эталон)"""
+    if not HAS_TA:
+        raise RuntimeError("reference requires ta (pip install ta)")
+    df = pd.DataFrame(np.asarray(ohlcv, dtype=np.float64)[:, :6], columns=list(COLUMNS[:6]))
+    df['EMA9'] = ta.trend.EMAIndicator(df['close'], 9).ema_indicator()
+    df['EMA15'] = ta.trend.EMAIndicator(df['close'], 15).ema_indicator()
+    df['EMA20'] = ta.trend.EMAIndicator(df['close'], 20).ema_indicator()
+    df['EMA50'] = ta.trend.EMAIndicator(df['close'], 50).ema_indicator()
+    df['RSI'] = ta.momentum.RSIIndicator(df['close'], 14).rsi()
+    df['ATR'] = ta.volatility.AverageTrueRange(df['high'], df['low'], df['close'], 14).average_true_range()
+    df['ATR_pct'] = df['ATR'] / df['close']
+    df['ADX'] = ta.trend.ADXIndicator(df['high'], df['low'], df['close'], 14).adx()
+    macd = ta.trend.MACD(df['close'])
+    df['MACD'] = macd.macd()
+    df['MACD_signal'] = macd.macd_signal()
+    df['MACD_hist'] = macd.macd_diff()
+    return df
+
+
+def synthetic(rows, seed=0):
+    """Случайное блуждание 1m свечей [N, 6] (когда нет кэша history.py)"""
+    rng = np.random.default_rng(seed)
+    close = 100000 * np.exp(np.cumsum(rng.normal(0, 0.0008, rows)))
+    opens = np.concatenate(([close[0]], close[:-1]))
+    spread = close * np.abs(rng.normal(0, 0.0005, (2, rows)))
+    return np.column_stack((60000.0 * np.arange(rows), opens, np.maximum(opens, close) + spread[0],
+                            np.minimum(opens, close) - spread[1], close, rng.uniform(1, 50, rows)))
+
+
+def compare(ohlcv, rtol=1e-9):
+    """{колонка: максимальное относительное расхождение с ta}; NaN должны совпадать по позициям"""
+    ours, ref = frame(ohlcv), ta_frame(ohlcv)
+    worst = {}
+    for name in INDICATOR_COLUMNS:
+        a, b = ours[name].to_numpy(), ref[name].to_numpy()
+        nan = np.isnan(b)
+        if not np.array_equal(np.isnan(a), nan):
+            worst[name] = float("inf")
+            continue
+        scale = np.maximum(np.abs(b[~nan]), 1.0)
+        worst[name] = float(np.max(np.abs(a[~nan] - b[~nan]) / scale, initial=0.0))
+    return worst
+
+
+def check_edges():
+    """Пустое и короткие окна: те же колонки, без исключений; список ошибок"""
+    errors = []
+    cases = [("[]", [], 0), ("0 rows", np.empty((0, 6)), 0),
+             ("1 row", synthetic(1), 1), ("2 rows", synthetic(2), 2)]
+    for label, ohlcv, rows in cases:
+        try:
+            df = frame(ohlcv)
+        except Exception as e:
+            errors.append(f"{label}: {type(e).__name__}: {e}")
+            continue
+        if list(df.columns) != list(COLUMNS) or len(df) != rows:
+            errors.append(f"{label}: shape {df.shape}, columns {list(df.columns)}")
+    return errors
+
+
+def _timed(fn, *args, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench(sizes=(200, 10_000, 1_000_000), log_fn=print):
+    """Лучшее время ta и ядра (frame, с DataFrame) на окне каждого размера"""
+    results = []
+    for rows in sizes:
+        ohlcv = synthetic(rows)
+        repeat = 50 if rows <= 1000 else 5 if rows <= 100_000 else 1
+        frame(ohlcv)  # Матрицы фильтра в кэше, как в живом цикле
+        ours = _timed(frame, ohlcv, repeat=repeat)
+        ref = _timed(ta_frame, ohlcv, repeat=repeat)
+        results.append((rows, ref, ours))
+        log_fn(f"⚡ {rows:>9,} rows: ta {ref * 1000:10.2f} ms | kernel {ours * 1000:8.2f} ms | x{ref / ours:,.0f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NumPy indicator kernel: verification against ta and benchmark")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    v = sub.add_parser("verify", help="compare with ta on cached history or synthetic candles")
+    v.add_argument("--symbol", help="symbol from the history.py cache, e.g. BTC/USDT:USDT")
+    v.add_argument("--timeframe", default="1m")
+    v.add_argument("--rows", type=int, default=100_000, help="last N candles")
+    v.add_argument("--rtol", type=float, default=1e-9)
+    b = sub.add_parser("bench", help="ta vs kernel timings")
+    b.add_argument("--sizes", type=int, nargs="+", default=[200, 10_000, 1_000_000])
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        bench(args.sizes)
+        sys.exit(0)
+
+    if args.symbol:
+        from history import HistoryStore
+        ohlcv = HistoryStore().fetch_ohlcv(args.symbol, args.timeframe, limit=args.rows)
+        source = f"{args.symbol} {args.timeframe} (history cache)"
+    else:
+        ohlcv = synthetic(args.rows)
+        source = "synthetic random walk"
+    edge_errors = check_edges()
+    failed = bool(edge_errors)
+    print(f"{'❌' if edge_errors else '✅'} empty / short windows" + "".join(f"\n   {e}" for e in edge_errors))
+    # Всё окно и окно живого бота (200 свечей, прогрев с нуля)
+    for label, window in ((f"{len(ohlcv)} rows", ohlcv), ("last 200 rows", ohlcv[-200:])):
+        worst = compare(window, args.rtol)
+        bad = {name: err for name, err in worst.items() if err > args.rtol}
+        failed |= bool(bad)
+        print(f"{'❌' if bad else '✅'} {source}, {label}: max rel diff {max(worst.values()):.2e}"
+              + "".join(f"\n   {name}: {err:.2e}" for name, err in bad.items()))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,488 @@
+"""
+🔎 LOG ANALYTICS
+Потоковый разбор bot_hybrid.log ("%(asctime)s %(message)s") для поиска регрессий:
+    python log_analytics.py                       - bot_hybrid.log и все ротации (.1 ... .gz/.bz2/.xz/.zst)
+    python log_analytics.py a.log b.log.gz --workers 4 [--json]
+- Память постоянная: строка за строкой, только счётчики и гистограммы с фиксированными корзинами
+- Файлы разбираются параллельно (процесс на файл), результаты складываются
+- Старые логи Windows: cp1251 и эмодзи как \\U0001f3af - декодируются обратно
+- Отчёт: интервалы между строками (Dynamic TP, Status - задача status),
+  паузы в позиции дольше LOG_ANALYTICS_STALL_SEC, ошибки по группам и категориям с пиками в минуту,
+  время в позиции и время на каждом уровне DCA
+- Dynamic TP ограничена LOG_RATE_LIMITS["dynamic_tp"]: в логах с фильтром её интервал - период
+  фильтра, а не цикла (период цикла - метрика bot_loop_interval_seconds), в отчёте помечен как throttled
+"""
+
+import os
+import re
+import io
+import bz2
+import sys
+import glob
+import gzip
+import json
+import lzma
+import bisect
+import argparse
+import calendar
+from concurrent.futures import ProcessPoolExecutor
+
+from config import LOG_FILE, LOG_ANALYTICS_STALL_SEC, LOG_ANALYTICS_BURST, LOG_RATE_LIMITS
+
+# ==========================================
+# 🛡️ ZSTD SAFE IMPORT (опционально)
+# ==========================================
+HAS_ZSTD = False
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    pass
+
+INTERVAL_BUCKETS = (0.25, 0.5, 1, 1.5, 2, 2.5, 3, 4, 5, 6, 8) + tuple(range(10, 61, 2)) + (75, 90, 120, 180, 300, 600, 1800, 3600)
+DWELL_BUCKETS = (60, 300, 900, 1800, 3600, 2 * 3600, 4 * 3600, 8 * 3600, 24 * 3600, 72 * 3600)
+
+TIMESTAMP = re.compile(rb"(\d{4}-\d\d-\d\d) (\d\d):(\d\d):(\d\d),(\d{3}) ")
+ESCAPE = re.compile(r"\\U([0-9a-fA-F]{8})|\\u([0-9a-fA-F]{4})")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+KIND = re.compile(r"[^\W\d_][\w#]*(?:[ \-/][\w#]+)*")  # Первые слова сообщения без эмодзи
+
+OPENED = re.compile(r"OPENED")
+DCA_EXECUTED = re.compile(r"DCA(\d+) EXECUTED")
+CLOSED = re.compile(r"CLOSED:|TP Executed!")
+STATUS = re.compile(r"Status: PnL .*\| DCA: (\d+)")
+STARTED = re.compile(r"Bot v[\d.]+ Started!")
+
+DIGITS = b"0123456789"
+
+# Строки - точки отсчёта интервалов (по шаблону, числа уже заменены на #)
+TIMED_PREFIXES = {"dynamic_tp": re.compile(r"Dynamic TP:"), "status": re.compile(r"Status: PnL")}
+TIMED_KINDS = tuple(TIMED_PREFIXES)
+POSITION_WORDS = ("OPENED", "EXECUTED", "CLOSED:", "TP Executed", "Status: PnL")
+
+ERROR_MARKS = ("❌", "⚠️", "🚨", "💥")
+EXCHANGE_ERRORS = re.compile(r"bingx|NetworkError|ExchangeError|RequestTimeout|RateLimitExceeded|DDoSProtection|"
+                             r"InvalidOrder|OrderNotFound|InsufficientFunds|ExchangeNotAvailable")
+TELEGRAM_ERRORS = re.compile(r"[Tt]elegram|\bTG\b|Bad Request|getUpdates|sendMessage|editMessage")
+
+
+def decode(raw, partial=False):
+    """
+    Строка лога -> str: utf-8 или cp1251 (старые логи), \\U0001f3af -> 🎯.
+    partial - начало строки: обрезанный на конце символ utf-8 отбрасывается
+    """
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if partial and e.start >= len(raw) - 3 and e.reason == "unexpected end of data":
+            text = raw[:e.start].decode("utf-8")
+        else:
+            text = raw.decode("cp1251", "replace")
+    if "\\u" in text or "\\U" in text:
+        text = ESCAPE.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)), text)
+    return text.rstrip("\r\n")
+
+
+def kind_of(message):
+    """Шаблон сообщения: первые слова до ':' / '!' / '(' с числами -> #"""
+    match = KIND.search(NUMBER.sub("#", message[:80]))
+    return match.group(0)[:48] if match else "?"
+
+
+def open_log(path):
+    """Бинарный поток строк с учётом сжатия ротаций"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith((".xz", ".lzma")):
+        return lzma.open(path, "rb")
+    if path.endswith(".zst"):
+        if not HAS_ZSTD:
+            raise RuntimeError(f"{path}: zstandard is not installed")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb", buffering=1024 * 1024)
+
+
+def discover(base=LOG_FILE):
+    """Основной лог и ротации (bot_hybrid.log.1, .2.gz, ...)"""
+    return sorted(p for p in glob.glob(glob.escape(base) + "*") if not p.endswith(".tmp"))
+
+
+class Histogram:
+    """Корзины фиксированы: складывается между процессами, перцентили - интерполяция внутри корзины"""
+
+    def __init__(self, buckets, counts=None, total=0.0, count=0, low=None, high=None):
+        self.buckets = tuple(buckets)
+        self.counts = list(counts) if counts else [0] * (len(self.buckets) + 1)
+        self.total, self.count, self.low, self.high = total, count, low, high
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+        for attr, pick in (("low", min), ("high", max)):
+            values = [v for v in (getattr(self, attr), getattr(other, attr)) if v is not None]
+            setattr(self, attr, pick(values) if values else None)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i > 0 else self.low
+                hi = self.buckets[i] if i < len(self.buckets) else self.high
+                lo, hi = max(lo, self.low), min(hi, self.high)
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.high
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.total / self.count, "min": self.low,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99), "max": self.high}
+
+    def to_dict(self):
+        return {"counts": self.counts, "total": self.total, "count": self.count, "low": self.low, "high": self.high}
+
+    @classmethod
+    def from_dict(cls, buckets, data):
+        return cls(buckets, **data)
+
+
+class LogStats:
+    """Счётчики одного файла (или суммы файлов). Состояние позиции между файлами не переносится"""
+
+    def __init__(self):
+        self.files = 0
+        self.lines = 0
+        self.records = 0
+        self.continuations = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.restarts = 0
+        self.kinds = {}                       # шаблон -> строк
+        self.intervals = {name: Histogram(INTERVAL_BUCKETS) for name in TIMED_KINDS}
+        self.gaps = Histogram(INTERVAL_BUCKETS)  # Между любыми строками в позиции
+        self.stalls = 0
+        self.errors = {}                      # (группа, шаблон) -> строк
+        self.error_minutes = {}               # группа -> [пик в минуту, минут >= LOG_ANALYTICS_BURST]
+        self.positions = Histogram(DWELL_BUCKETS)
+        self.position_seconds = 0.0
+        self.positions_truncated = 0
+        self.dca_dwell = {}                   # уровень -> Histogram
+        self.max_dca = {}                     # уровень -> позиций
+
+        # Потоковое состояние (не складывается)
+        self._last = {name: None for name in TIMED_KINDS}
+        self._templates = {}                  # начало строки -> признаки (_template)
+        self._minute = {}                     # группа -> (минута, ошибок)
+        self._open_at = None
+        self._level = 0
+        self._level_at = None
+        self._peak_level = 0
+        self._prev_ts = None
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Разбор
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def feed(self, lines):
+        days = {}  # дата -> unix time полуночи (asctime без зоны: считаем как UTC, интервалы не зависят)
+        for raw in lines:
+            self.lines += 1
+            match = TIMESTAMP.match(raw)
+            if match is None:
+                self.continuations += 1  # Продолжение многострочного сообщения (PnL MISMATCH...)
+                continue
+            day, hh, mm, ss, ms = match.groups()
+            midnight = days.get(day)
+            if midnight is None:
+                y, m, d = map(int, day.split(b"-"))
+                midnight = days[day] = calendar.timegm((y, m, d, 0, 0, 0))
+            ts = midnight + int(hh) * 3600 + int(mm) * 60 + int(ss) + int(ms) / 1000
+            self._record(ts, raw, match.end())
+        self._finish()
+        return self
+
+    def _template(self, raw, start):
+        """
+        Признаки строки по её шаблону (начало строки без цифр), кэш на файл: строки без событий
+        (Dynamic TP - большая часть лога) не декодируются вовсе. (шаблон, рестарт, имена TIMED_KINDS, ошибка, событие позиции)
+        """
+        head = raw[start:start + 64]
+        key = head.translate(None, DIGITS)
+        info = self._templates.get(key)
+        if info is None:
+            head = decode(head, partial=True)
+            kind = kind_of(head)
+            info = (kind, bool(STARTED.search(head)),
+                    tuple(name for name, pattern in TIMED_PREFIXES.items() if pattern.search(head)),
+                    head.startswith(ERROR_MARKS) or "rror" in kind or "CRITICAL" in head,
+                    any(word in head for word in POSITION_WORDS))
+            if len(self._templates) < 10000:
+                self._templates[key] = info
+        return info
+
+    def _record(self, ts, raw, start):
+        self.records += 1
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        kind, started, timed, error, event = self._template(raw, start)
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+
+        if started:
+            self.restarts += 1
+            self._close(self._prev_ts, truncated=True)
+        else:
+            if self._open_at is not None and self._prev_ts is not None:
+                gap = ts - self._prev_ts
+                self.gaps.observe(gap)
+                if gap > LOG_ANALYTICS_STALL_SEC:
+                    self.stalls += 1
+            for name in timed:
+                if self._last[name] is not None and self._open_at is not None:
+                    self.intervals[name].observe(ts - self._last[name])
+                self._last[name] = ts
+
+        if error or event:
+            message = decode(raw[start:])
+            if error:
+                self._error(ts, kind, message)
+            if event:
+                self._position(ts, message)
+        self._prev_ts = ts
+
+    def _error(self, ts, kind, message):
+        if "PnL MISMATCH" in message:
+            group = "pnl_audit"
+        elif EXCHANGE_ERRORS.search(message):
+            group = "exchange"
+        elif TELEGRAM_ERRORS.search(message):
+            group = "telegram"
+        else:
+            group = "bot"
+        key = (group, kind)
+        self.errors[key] = self.errors.get(key, 0) + 1
+        minute = int(ts // 60)
+        current, count = self._minute.get(group, (minute, 0))
+        if current != minute:
+            self._close_minute(group, count)
+            count = 0
+        self._minute[group] = (minute, count + 1)
+
+    def _close_minute(self, group, count):
+        peak = self.error_minutes.setdefault(group, [0, 0])
+        peak[0] = max(peak[0], count)
+        if count >= LOG_ANALYTICS_BURST:
+            peak[1] += 1
+
+    def _position(self, ts, message):
+        """Позиция и уровень DCA: OPENED / DCA# EXECUTED / CLOSED; Status с DCA: # - пересинхронизация"""
+        if OPENED.search(message):
+            self._close(ts, truncated=True)  # Не видели закрытия прошлой - рестарт без записи в лог
+            self._open(ts, 0)
+            return
+        m = DCA_EXECUTED.search(message)
+        if m:
+            if self._open_at is None:
+                self._open(ts, int(m.group(1)))
+            else:
+                self._set_level(ts, int(m.group(1)))
+            return
+        if CLOSED.search(message):
+            self._close(ts)
+            return
+        m = STATUS.search(message)
+        if m:
+            if self._open_at is None:
+                self._open(ts, int(m.group(1)))  # Позиция уже была (начало файла / после рестарта)
+            elif int(m.group(1)) != self._level:
+                self._set_level(ts, int(m.group(1)))
+
+    def _open(self, ts, level):
+        self._open_at = self._level_at = ts
+        self._level = self._peak_level = level
+
+    def _set_level(self, ts, level):
+        self._dwell(ts)
+        self._level, self._level_at = level, ts
+        self._peak_level = max(self._peak_level, level)
+
+    def _dwell(self, ts):
+        hist = self.dca_dwell.get(self._level)
+        if hist is None:
+            hist = self.dca_dwell[self._level] = Histogram(DWELL_BUCKETS)
+        hist.observe(ts - self._level_at)
+
+    def _close(self, ts, truncated=False):
+        if self._open_at is None or ts is None:
+            return
+        self._dwell(ts)
+        self._last = {name: None for name in TIMED_KINDS}  # Интервалы - только внутри позиции
+        self.position_seconds += ts - self._open_at
+        if truncated:
+            self.positions_truncated += 1
+        else:
+            self.positions.observe(ts - self._open_at)
+            self.max_dca[self._peak_level] = self.max_dca.get(self._peak_level, 0) + 1
+        self._open_at = None
+
+    def _finish(self):
+        self.files += 1
+        self._close(self.last_ts, truncated=True)  # Позиция открыта на конце файла
+        for group, (_, count) in self._minute.items():
+            self._close_minute(group, count)
+        self._minute = {}
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Сложение и отчёт
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def to_dict(self):
+        """Для передачи из процесса и --json"""
+        return {
+            "files": self.files, "lines": self.lines, "records": self.records,
+            "continuations": self.continuations, "first_ts": self.first_ts, "last_ts": self.last_ts,
+            "restarts": self.restarts, "kinds": self.kinds, "stalls": self.stalls,
+            "intervals": {name: h.to_dict() for name, h in self.intervals.items()},
+            "gaps": self.gaps.to_dict(),
+            "errors": [[group, kind, n] for (group, kind), n in self.errors.items()],
+            "error_minutes": self.error_minutes,
+            "positions": self.positions.to_dict(), "position_seconds": self.position_seconds,
+            "positions_truncated": self.positions_truncated,
+            "dca_dwell": {str(level): h.to_dict() for level, h in self.dca_dwell.items()},
+            "max_dca": {str(level): n for level, n in self.max_dca.items()},
+        }
+
+    def merge(self, data):
+        for name in ("files", "lines", "records", "continuations", "restarts", "stalls",
+                     "position_seconds", "positions_truncated"):
+            setattr(self, name, getattr(self, name) + data[name])
+        if data["first_ts"] is not None:
+            self.first_ts = data["first_ts"] if self.first_ts is None else min(self.first_ts, data["first_ts"])
+            self.last_ts = data["last_ts"] if self.last_ts is None else max(self.last_ts, data["last_ts"])
+        for kind, n in data["kinds"].items():
+            self.kinds[kind] = self.kinds.get(kind, 0) + n
+        for name, h in data["intervals"].items():
+            self.intervals[name].merge(Histogram.from_dict(INTERVAL_BUCKETS, h))
+        self.gaps.merge(Histogram.from_dict(INTERVAL_BUCKETS, data["gaps"]))
+        for group, kind, n in data["errors"]:
+            self.errors[(group, kind)] = self.errors.get((group, kind), 0) + n
+        for group, (peak, bursts) in data["error_minutes"].items():
+            mine = self.error_minutes.setdefault(group, [0, 0])
+            mine[0], mine[1] = max(mine[0], peak), mine[1] + bursts
+        self.positions.merge(Histogram.from_dict(DWELL_BUCKETS, data["positions"]))
+        for level, h in data["dca_dwell"].items():
+            self.dca_dwell.setdefault(int(level), Histogram(DWELL_BUCKETS)).merge(Histogram.from_dict(DWELL_BUCKETS, h))
+        for level, n in data["max_dca"].items():
+            self.max_dca[int(level)] = self.max_dca.get(int(level), 0) + n
+        return self
+
+
+def analyze_file(path):
+    """Воркер: один файл -> dict (LogStats.to_dict)"""
+    with open_log(path) as f:
+        return LogStats().feed(f).to_dict()
+
+
+def analyze(paths, workers=None):
+    total = LogStats()
+    if len(paths) == 1 or workers == 1:
+        results = map(analyze_file, paths)
+        for data in results:
+            total.merge(data)
+        return total
+    with ProcessPoolExecutor(max_workers=workers or min(len(paths), os.cpu_count() or 1)) as pool:
+        for data in pool.map(analyze_file, paths):
+            total.merge(data)
+    return total
+
+
+def _fmt_sec(value):
+    if value is None:
+        return "-"
+    if value >= 3600:
+        return f"{value / 3600:.1f}h"
+    if value >= 60:
+        return f"{value / 60:.1f}m"
+    return f"{value:.1f}s"
+
+
+def _fmt_hist(h):
+    s = h.summary()
+    if not s["count"]:
+        return "no data"
+    return (f"n={s['count']} mean {_fmt_sec(s['mean'])} | p50 {_fmt_sec(s['p50'])} p90 {_fmt_sec(s['p90'])} "
+            f"p99 {_fmt_sec(s['p99'])} | max {_fmt_sec(s['max'])}")
+
+
+def report(stats, top=15):
+    hours = max((stats.last_ts - stats.first_ts) / 3600, 1e-9) if stats.first_ts is not None else 0
+    lines = [f"🔎 {stats.files} file(s), {stats.lines} lines, {stats.records} records "
+             f"({stats.continuations} continuation lines), {hours:.1f}h, {stats.restarts} restart(s)",
+             "", "⏱️ Intervals"]
+    throttle = LOG_RATE_LIMITS.get("dynamic_tp")
+    lines.append(f"   Dynamic TP:        {_fmt_hist(stats.intervals['dynamic_tp'])}")
+    if throttle:
+        lines.append(f"      throttled: LOG_RATE_LIMITS['dynamic_tp'] = {throttle:g}s - filter period, not the loop")
+    lines.append(f"   status:            {_fmt_hist(stats.intervals['status'])}")
+    lines.append(f"   any line in position: {_fmt_hist(stats.gaps)}")
+    lines.append(f"   stalls > {LOG_ANALYTICS_STALL_SEC:.0f}s in position: {stats.stalls}")
+
+    lines += ["", "❌ Errors"]
+    groups = {}
+    for (group, kind), n in stats.errors.items():
+        groups.setdefault(group, []).append((n, kind))
+    for group, items in sorted(groups.items(), key=lambda kv: -sum(n for n, _ in kv[1])):
+        count = sum(n for n, _ in items)
+        peak, bursts = stats.error_minutes.get(group, (0, 0))
+        lines.append(f"   {group}: {count} ({count / hours if hours else 0:.2f}/h), peak {peak}/min, "
+                     f"{bursts} burst minute(s) >= {LOG_ANALYTICS_BURST}")
+        for n, kind in sorted(items, reverse=True)[:top]:
+            lines.append(f"      {n:>7}  {kind}")
+    if not groups:
+        lines.append("   none")
+
+    lines += ["", "📍 Position"]
+    lines.append(f"   in position: {_fmt_sec(stats.position_seconds)}"
+                 f" ({stats.position_seconds / 3600 / hours * 100 if hours else 0:.1f}% of log time)")
+    lines.append(f"   closed positions: {_fmt_hist(stats.positions)}")
+    lines.append(f"   truncated (restart / end of file): {stats.positions_truncated}")
+    for level in sorted(stats.dca_dwell):
+        lines.append(f"   DCA{level} dwell: {_fmt_hist(stats.dca_dwell[level])}")
+    if stats.max_dca:
+        lines.append("   max DCA per position: " + ", ".join(
+            f"DCA{level}: {n}" for level, n in sorted(stats.max_dca.items())))
+
+    lines += ["", "📝 Top messages"]
+    for kind, n in sorted(stats.kinds.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"   {n:>7}  {kind}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming analytics over bot_hybrid.log")
+    parser.add_argument("paths", nargs="*", help=f"log files (default: {LOG_FILE} and rotations)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per file, up to CPU count)")
+    parser.add_argument("--json", action="store_true", help="print raw counters as JSON")
+    args = parser.parse_args()
+
+    paths = args.paths or discover()
+    if not paths:
+        print(f"❌ No logs found ({LOG_FILE}*)")
+        sys.exit(1)
+    stats = analyze(paths, args.workers)
+    print(json.dumps(stats.to_dict(), ensure_ascii=False, indent=2) if args.json else report(stats))
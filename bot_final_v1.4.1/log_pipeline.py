@@ -0,0 +1,175 @@
+"""
+📝 LOG PIPELINE
+Асинхронное логирование: на горячем пути только QueueHandler,
+консоль / bot_hybrid.log / JSON lines пишутся фоновым QueueListener
+"""
+
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from collections import defaultdict
+
+from config import (
+    LOG_FILE, LOG_JSON_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+    LOG_RATE_LIMITS, LOG_SAMPLING, Col,
+)
+
+LOGGER_NAME = "hybrid"
+
+_listener = None
+_queue_handler = None
+_handlers = ()
+
+
+class CategoryRateLimitFilter(logging.Filter):
+    """
+    Ограничение частых сообщений по категории (extra={'category': ...}):
+    - LOG_RATE_LIMITS: не чаще одного сообщения за N секунд
+    - LOG_SAMPLING: пропускать только каждое N-е сообщение
+    Работает до постановки в очередь, поэтому отброшенные записи ничего не стоят.
+    Логируют торговый поток, пул планировщика, risk watcher и тени - счётчики под lock
+    """
+
+    def __init__(self, rate_limits=None, sampling=None):
+        super().__init__()
+        self.rate_limits = rate_limits or {}
+        self.sampling = sampling or {}
+        self._last_emit = {}
+        self._seen = defaultdict(int)
+        self.suppressed = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        category = getattr(record, "category", None)
+        if category is None:
+            return True
+        with self._lock:
+            return self._admit(category, record)
+
+    def _admit(self, category, record):
+        every = self.sampling.get(category)
+        if every and every > 1:
+            self._seen[category] += 1
+            if self._seen[category] % every != 1:
+                self.suppressed[category] += 1
+                return False
+
+        interval = self.rate_limits.get(category)
+        if interval:
+            last = self._last_emit.get(category)
+            if last is not None and record.created - last < interval:
+                self.suppressed[category] += 1
+                return False
+            self._last_emit[category] = record.created
+
+        record.suppressed = self.suppressed.pop(category, 0)
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке: msg % args считается в listener"""
+
+    def prepare(self, record):
+        return record
+
+
+class ColorConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        color = getattr(record, "color", None) or Col.WHITE
+        return f"{color}{record.getMessage()}{Col.RESET}"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Компактный структурированный sink: одна JSON-строка на запись"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "lvl": record.levelname,
+            "msg": record.getMessage(),
+        }
+        category = getattr(record, "category", None)
+        if category:
+            entry["cat"] = category
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.name != LOGGER_NAME:
+            entry["src"] = record.name
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+def setup_logging():
+    """Настройка конвейера (идемпотентно). Возвращает логгер бота"""
+    global _listener, _queue_handler, _handlers
+    logger = logging.getLogger(LOGGER_NAME)
+    if _queue_handler is not None:
+        return logger
+
+    log_queue = queue.SimpleQueue()
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+
+    json_handler = logging.handlers.RotatingFileHandler(
+        LOG_JSON_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    json_handler.setFormatter(JsonLinesFormatter())
+
+    # В консоль — только сообщения бота (как раньше print), библиотеки — только в файлы
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(ColorConsoleFormatter())
+    console_handler.addFilter(lambda record: record.name == LOGGER_NAME)
+
+    _queue_handler = DeferredQueueHandler(log_queue)
+    _queue_handler.addFilter(CategoryRateLimitFilter(LOG_RATE_LIMITS, LOG_SAMPLING))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_queue_handler)
+
+    _handlers = (console_handler, file_handler, json_handler)
+    _listener = logging.handlers.QueueListener(log_queue, *_handlers)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return logger
+
+
+def setup_worker_logging(log_queue):
+    """
+    Логирование в процессе-воркере (supervisor.py): записи уходят в multiprocessing очередь,
+    файлы и консоль пишет только родитель. Сообщение форматируется здесь - record должен пикклиться
+    """
+    global _queue_handler
+    logger = logging.getLogger(LOGGER_NAME)
+    if _queue_handler is not None:
+        return logger
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _queue_handler.addFilter(CategoryRateLimitFilter(LOG_RATE_LIMITS, LOG_SAMPLING))
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_queue_handler)
+    return logger
+
+
+def listen_worker_logs(log_queue):
+    """Записи воркеров - в те же консоль / bot_hybrid.log / JSON lines. Возвращает запущенный listener"""
+    setup_logging()
+    listener = logging.handlers.QueueListener(log_queue, *_handlers)
+    listener.start()
+    return listener
+
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает listener"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
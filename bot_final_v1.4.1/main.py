@@ -3,7 +3,9 @@
 Главная точка входа в программу
 """
 
+import sys
 import time
+import functools
 import socket
 import requests.packages.urllib3.util.connection as urllib3_cn
 import ccxt
@@ -22,7 +24,12 @@ socket.getaddrinfo = new_getaddrinfo
 from security import SecurityManager
 from telegram_bot import TelegramBot
 from trading_bot import HybridTradingBot
-from config import TG_BOT_TOKEN
+from portfolio import Portfolio
+from supervisor import Supervisor
+from paper import ShadowManager
+from cassette import CassetteRecorder
+from metrics import start_metrics_server
+from config import TG_BOT_TOKEN, METRICS_ENABLED, SHADOW_CONFIGS
 
 
 if __name__ == "__main__":
@@ -38,16 +45,44 @@ if __name__ == "__main__":
         )
         creds = sec.load_credentials()
     
+    recorder = None
     try:
-        ex = ccxt.bingx({
+        exchange_config = {
             'apiKey': creds['api_key'], 
             'secret': creds['secret_key'], 
             'enableRateLimit': True, 
             'timeout': 10000,
             'options': {'defaultType': 'swap'}
-        })
+        }
+        ex = ccxt.bingx(exchange_config)
         tg_token = creds['tg_token'] if creds['tg_token'] else TG_BOT_TOKEN
-        bot = HybridTradingBot(ex, TelegramBot(tg_token, creds['tg_chat_id']))
+        tg = TelegramBot(tg_token, creds['tg_chat_id'])
+        if "--record" in sys.argv:
+            if "--supervisor" in sys.argv:
+                print("⚠️ --record is not supported with --supervisor (process per symbol), not recording")
+            else:
+                # Запись вызовов биржи и Telegram для python cassette.py replay
+                recorder = CassetteRecorder(mode="portfolio" if "--portfolio" in sys.argv else "single")
+                ex, tg = recorder.exchange(ex), recorder.telegram(tg)
+                print(f"📼 Recording session to {recorder.path}")
+        if METRICS_ENABLED:
+            try:
+                start_metrics_server()
+            except OSError as e:
+                print(f"⚠️ Metrics endpoint disabled: {e}")
+        if "--supervisor" in sys.argv:
+            # Процесс на символ PORTFOLIO_SYMBOLS, биржа создаётся в каждом процессе
+            bot = Supervisor(functools.partial(ccxt.bingx, exchange_config), tg)
+        elif "--portfolio" in sys.argv:
+            # Все символы PORTFOLIO_SYMBOLS в одном процессе
+            bot = Portfolio(ex, tg)
+        else:
+            bot = HybridTradingBot(ex, tg)
+            if SHADOW_CONFIGS:
+                ShadowManager().attach(bot)  # Бумажные тени на данных этого бота
         bot.run()
     except Exception as e: 
         print(f"\n❌ Error: {e}")
+    finally:
+        if recorder:
+            recorder.close()
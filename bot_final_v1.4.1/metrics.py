@@ -0,0 +1,309 @@
+"""
+📈 METRICS
+Встроенный реестр метрик (counter / gauge / histogram) и HTTP endpoint
+в текстовом формате Prometheus
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_HOST, METRICS_PORT
+
+try:
+    import ccxt
+    NETWORK_ERRORS = (ccxt.NetworkError, ConnectionError, TimeoutError)
+except ImportError:
+    NETWORK_ERRORS = (ConnectionError, TimeoutError)
+
+# Бакеты латентности (сек): от 1 мс до 30 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_thread_state = threading.local()
+
+
+def mute_thread():
+    """Значения из текущего потока не пишутся (бумажные shadow боты paper.py не смешиваются с живым)"""
+    _thread_state.muted = True
+
+
+def thread_muted():
+    return getattr(_thread_state, "muted", False)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = [f'{n}="{v}"' for n, v in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if thread_muted():
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if thread_muted():
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if thread_muted():
+            return
+        key = _label_key(self.labelnames, labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}  # Владелец -> fn
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, fn, key=None):
+        """
+        fn() вызывается перед каждой выдачей /metrics (для дорогих/внешних значений).
+        key - владелец ("bot:BTC/USDT:USDT", "portfolio"...): пересозданный бот / replay заменяет
+        collector прежнего экземпляра, а не копит их вместе со старыми объектами
+        """
+        with self._lock:
+            self._collectors[fn if key is None else key] = fn
+
+    def remove_collector(self, key, fn=None):
+        """fn - убрать, только если key всё ещё у этого collector (не снимать у нового владельца)"""
+        with self._lock:
+            if fn is None or self._collectors.get(key) == fn:
+                self._collectors.pop(key, None)
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors.values())
+        for fn in collectors:
+            try:
+                fn()
+            except Exception:
+                pass
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Метрики бота
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+LOOP_ITERATION = METRICS.histogram("bot_loop_iteration_seconds", "Full run() iteration time")
+LOOP_PHASE = METRICS.histogram("bot_loop_phase_seconds", "run() phase time", ("phase",))
+EXCHANGE_LATENCY = METRICS.histogram("bot_exchange_request_seconds", "ccxt call latency", ("method",))
+TELEGRAM_LATENCY = METRICS.histogram("bot_telegram_request_seconds", "Telegram API call latency", ("method",))
+
+ORDERS_PLACED = METRICS.counter("bot_orders_placed_total", "Orders sent to the exchange", ("type",))
+ORDERS_CANCELLED = METRICS.counter("bot_orders_cancelled_total", "Order cancel requests")
+FILLS = METRICS.counter("bot_fills_total", "Detected fills", ("kind",))
+RECONNECTS = METRICS.counter("bot_reconnects_total", "Successful calls after a network failure", ("target",))
+ERRORS = METRICS.counter("bot_errors_total", "Errors by source", ("source",))
+
+POSITION_SIZE = METRICS.gauge("bot_position_size_coins", "Open position size", ("symbol",))
+MARGIN_USED = METRICS.gauge("bot_margin_used_usd", "Margin used by the open position", ("symbol",))
+DCA_DEPTH = METRICS.gauge("bot_dca_depth", "Executed safety orders", ("symbol",))
+BALANCE = METRICS.gauge("bot_balance_usd", "Wallet balance")
+LAST_PRICE = METRICS.gauge("bot_last_price", "Last ticker price", ("symbol",))
+LOOP_INTERVAL = METRICS.gauge("bot_loop_interval_seconds", "Adaptive run() cadence chosen for the next iteration")
+NEAREST_TRIGGER_ATR = METRICS.gauge("bot_nearest_trigger_atr", "Distance to the nearest position level in ATRs", ("symbol",))
+
+
+class InstrumentedClient:
+    """
+    Прозрачная обёртка над ccxt exchange / TelegramBot:
+    замеряет латентность методов с заданными префиксами, считает ошибки и переподключения
+    """
+
+    def __init__(self, target, histogram, source, prefixes):
+        self._target = target
+        self._histogram = histogram
+        self._source = source
+        self._prefixes = tuple(prefixes)
+        self._wrapped = {}
+        self._failing = False
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or not name.startswith(self._prefixes):
+            return attr
+        wrapper = self._wrapped.get(name)
+        if wrapper is None:
+            wrapper = self._wrapped[name] = self._wrap(name)
+        return wrapper
+
+    def _wrap(self, name):
+        histogram = self._histogram
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = getattr(self._target, name)(*args, **kwargs)
+            except Exception as e:
+                histogram.observe(time.perf_counter() - start, method=name)
+                ERRORS.inc(source=self._source)
+                if isinstance(e, NETWORK_ERRORS):
+                    self._failing = True
+                raise
+            histogram.observe(time.perf_counter() - start, method=name)
+            if self._failing:
+                self._failing = False
+                RECONNECTS.inc(target=self._source)
+            if name == "create_order":
+                ORDERS_PLACED.inc(type=kwargs.get("type") or (args[1] if len(args) > 1 else ""))
+            elif name == "create_orders":
+                for o in (args[0] if args else kwargs.get("orders", [])):
+                    ORDERS_PLACED.inc(type=o.get("type", ""))
+            elif name == "cancel_order":
+                ORDERS_CANCELLED.inc()
+            elif name == "cancel_orders":
+                ORDERS_CANCELLED.inc(len(args[0]) if args else 1)
+            return result
+
+        call.__name__ = name
+        return call
+
+
+def instrument_exchange(exchange):
+    if isinstance(exchange, InstrumentedClient):
+        return exchange  # Уже обёрнут (общий exchange портфеля)
+    return InstrumentedClient(exchange, EXCHANGE_LATENCY, "exchange",
+                              ("fetch", "create", "cancel", "edit", "watch"))
+
+
+def instrument_telegram(telegram_bot):
+    if isinstance(telegram_bot, InstrumentedClient):
+        return telegram_bot
+    return InstrumentedClient(telegram_bot, TELEGRAM_LATENCY, "telegram",
+                              ("send", "edit", "get_updates", "answer"))
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# HTTP endpoint
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(registry=METRICS, host=METRICS_HOST, port=METRICS_PORT):
+    """HTTP /metrics в фоновом потоке"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,413 @@
+"""
+👥 PAPER / SHADOW
+Бумажные HybridTradingBot с альтернативным конфигом (SHADOW_CONFIGS) рядом с живым ботом.
+Рыночные данные - те, что живой бот уже получил за итерацию (тикер и DataFrame с
+индикаторами, без копии): тень не делает ни одного запроса к бирже.
+Ордера исполняет PaperExchange по реальным bid / ask:
+- limit - при касании ценой (maker), сразу пересекающий спред - как taker, post-only такой - rejected
+- market и сработавший stop_market - по bid / ask (taker)
+Тень работает в своём потоке (блокирующее ожидание fill не задерживает живой цикл),
+пишет сделки в отдельный журнал и blackbox на конфиг, в Telegram не пишет, метрики не смешивает
+"""
+
+import os
+import time
+import itertools
+import threading
+import traceback
+
+import ccxt
+
+from config import (
+    SHADOW_CONFIGS, SHADOW_START_BALANCE, SHADOW_JOURNAL_FILE, SHADOW_BLACKBOX_FILE,
+    MAKER_FEE, TAKER_FEE, SymbolConfig, Col,
+)
+from trading_bot import HybridTradingBot
+from blackbox import BlackboxWriter
+from trade_journal import TradeJournal
+from metrics import METRICS, mute_thread
+
+SHADOW_PNL = METRICS.gauge("bot_shadow_pnl_usd", "Paper session PnL of a shadow config", ("shadow", "symbol"))
+SHADOW_FILLS = METRICS.gauge("bot_shadow_fills", "Paper fills of a shadow config", ("shadow", "symbol"))
+
+
+def _suffixed(path, name):
+    root, ext = os.path.splitext(path)
+    return f"{root}_{name}{ext}"
+
+
+class PaperExchange:
+    """
+    Бумажный аккаунт USDT-M фьючерсов (hedge mode: LONG / SHORT отдельно) с интерфейсом ccxt.
+    Цены приходят через update(); точность и таймфреймы - локальные методы реального
+    exchange (рынки уже загружены), любой другой вызов - AttributeError, а не запрос
+    """
+
+    LOCAL_METHODS = ("amount_to_precision", "price_to_precision", "parse_timeframe", "market", "markets", "id")
+
+    has = {'createOrders': True, 'cancelOrders': True, 'editOrder': False}
+
+    def __init__(self, exchange, balance, leverage):
+        self._exchange = exchange
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._tickers = {}      # symbol -> {"last", "bid", "ask", "timestamp"}
+        self._orders = {}       # id -> ccxt-подобный dict
+        self._open = {}         # id -> тот же dict, пока status == "open"
+        self._trades = {}       # id ордера -> исполнение (fetch_my_trades)
+        self._positions = {}    # (symbol, "LONG" / "SHORT") -> [размер, средняя цена]
+        self.balance = float(balance)
+        self.leverage = leverage
+        self.fills = 0
+        self.fees = 0.0
+
+    def __getattr__(self, name):
+        if name in self.LOCAL_METHODS:
+            return getattr(self._exchange, name)
+        raise AttributeError(f"PaperExchange.{name} is not simulated (paper trading makes no exchange requests)")
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Рыночные данные и матчинг
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def update(self, symbol, ticker):
+        """Тикер живого бота: исполнение ордеров, которых коснулась цена"""
+        last = float(ticker['last'])
+        quote = {
+            "symbol": symbol,
+            "last": last,
+            "bid": float(ticker.get('bid') or last),
+            "ask": float(ticker.get('ask') or last),
+            "timestamp": ticker.get('timestamp') or int(time.time() * 1000),
+        }
+        with self._lock:
+            self._tickers[symbol] = quote
+            for order in [o for o in self._open.values() if o['symbol'] == symbol]:
+                self._match(order, quote)
+
+    def _quote(self, symbol):
+        quote = self._tickers.get(symbol)
+        if quote is None:
+            raise ccxt.ExchangeNotAvailable(f"PaperExchange: no ticker for {symbol} yet")
+        return quote
+
+    def _match(self, order, quote):
+        is_buy = order['side'] == 'buy'
+        if order['type'] == 'limit':
+            touched = min(quote['last'], quote['ask']) <= order['price'] if is_buy else \
+                max(quote['last'], quote['bid']) >= order['price']
+            if touched:
+                self._fill(order, order['price'], MAKER_FEE)
+        elif order['type'] == 'stop_market':
+            if (quote['last'] >= order['stopPrice']) if is_buy else (quote['last'] <= order['stopPrice']):
+                self._fill(order, quote['ask'] if is_buy else quote['bid'], TAKER_FEE)
+
+    def _fill(self, order, price, fee_rate):
+        pos = self._positions.setdefault((order['symbol'], order['positionSide']), [0.0, 0.0])
+        amount = order['amount']
+        if order['reduceOnly']:
+            amount = min(amount, pos[0])
+            if amount <= 0:
+                self._close(order, 'rejected')  # Позиции уже нет (SL после TP)
+                return
+            side_mult = 1 if order['positionSide'] == 'LONG' else -1
+            self.balance += (price - pos[1]) * amount * side_mult
+            pos[0] -= amount
+            if pos[0] <= amount * 1e-9:
+                pos[0], pos[1] = 0.0, 0.0
+        else:
+            pos[1] = (pos[0] * pos[1] + amount * price) / (pos[0] + amount)
+            pos[0] += amount
+        fee = amount * price * fee_rate
+        self.balance -= fee
+        self.fees += fee
+        self.fills += 1
+        now = int(time.time() * 1000)
+        order.update(filled=amount, remaining=order['amount'] - amount, average=price, cost=amount * price,
+                     lastTradeTimestamp=now, fee={'cost': fee, 'currency': 'USDT'})
+        self._trades[order['id']] = {'id': order['id'], 'order': order['id'], 'symbol': order['symbol'],
+                                     'side': order['side'], 'price': price, 'amount': amount, 'timestamp': now,
+                                     'fee': {'cost': fee, 'currency': 'USDT'}}
+        self._close(order, 'closed')
+
+    def _close(self, order, status):
+        order['status'] = status
+        self._open.pop(order['id'], None)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Ордера
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        params = params or {}
+        with self._lock:
+            quote = self._quote(symbol)
+            pos_side = params.get('positionSide') or ('LONG' if side == 'buy' else 'SHORT')
+            order = {
+                'id': f"paper-{next(self._ids)}", 'symbol': symbol, 'type': type, 'side': side,
+                'amount': float(amount), 'price': float(price) if price else None,
+                'stopPrice': float(params['stopPrice']) if params.get('stopPrice') else None,
+                'positionSide': pos_side, 'postOnly': bool(params.get('postOnly')),
+                'reduceOnly': bool(params.get('reduceOnly')) or (pos_side == 'LONG') == (side == 'sell'),
+                'status': 'open', 'filled': 0.0, 'remaining': float(amount), 'average': None, 'cost': 0.0,
+                'timestamp': int(time.time() * 1000), 'lastTradeTimestamp': None, 'fee': None,
+            }
+            self._orders[order['id']] = order
+            is_buy = side == 'buy'
+            if type == 'market':
+                self._fill(order, quote['ask'] if is_buy else quote['bid'], TAKER_FEE)
+            elif type == 'limit' and (quote['ask'] <= order['price'] if is_buy else quote['bid'] >= order['price']):
+                # Пересекает спред: post-only отклоняется, обычный исполняется как taker
+                if order['postOnly']:
+                    self._close(order, 'rejected')
+                else:
+                    self._fill(order, quote['ask'] if is_buy else quote['bid'], TAKER_FEE)
+            elif type in ('limit', 'stop_market'):
+                self._open[order['id']] = order
+            else:
+                raise ccxt.NotSupported(f"PaperExchange: order type {type}")
+            return dict(order)
+
+    def create_orders(self, orders, params=None):
+        return [self.create_order(**o) for o in orders]
+
+    def cancel_order(self, id, symbol=None, params=None):
+        with self._lock:
+            order = self._open.get(str(id))
+            if order is None:
+                raise ccxt.OrderNotFound(f"PaperExchange: order {id} is not open")
+            self._close(order, 'canceled')
+            return dict(order)
+
+    def cancel_orders(self, ids, symbol=None, params=None):
+        return [self.cancel_order(i, symbol) for i in ids]
+
+    def cancel_all_orders(self, symbol=None, params=None):
+        with self._lock:
+            orders = [o for o in self._open.values() if symbol is None or o['symbol'] == symbol]
+            for order in orders:
+                self._close(order, 'canceled')
+            return [dict(o) for o in orders]
+
+    def fetch_order(self, id, symbol=None, params=None):
+        with self._lock:
+            order = self._orders.get(str(id))
+            if order is None:
+                raise ccxt.OrderNotFound(f"PaperExchange: order {id} not found")
+            return dict(order)
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        with self._lock:
+            return [dict(o) for o in self._open.values() if symbol is None or o['symbol'] == symbol]
+
+    def fetch_my_trades(self, symbol=None, since=None, limit=None, params=None):
+        order_id = (params or {}).get('orderId')
+        with self._lock:
+            trades = [self._trades[order_id]] if order_id in self._trades else [] if order_id else \
+                [t for t in self._trades.values() if symbol is None or t['symbol'] == symbol]
+            return [dict(t) for t in trades[-limit:]] if limit else [dict(t) for t in trades]
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Аккаунт и котировки
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def fetch_positions(self, symbols=None, params=None):
+        with self._lock:
+            positions = []
+            for (symbol, pos_side), (size, entry) in self._positions.items():
+                if size <= 0 or (symbols and symbol not in symbols):
+                    continue
+                last = self._tickers[symbol]['last']
+                side_mult = 1 if pos_side == 'LONG' else -1
+                positions.append({
+                    'symbol': symbol, 'contracts': size, 'side': 'long' if side_mult > 0 else 'short',
+                    'entryPrice': entry, 'markPrice': last, 'leverage': self.leverage,
+                    'unrealizedPnl': (last - entry) * size * side_mult,
+                    'info': {'positionAmt': str(size), 'positionSide': pos_side, 'entryPrice': str(entry)},
+                })
+            return positions
+
+    def fetch_balance(self, params=None):
+        with self._lock:
+            used = sum(size * entry / self.leverage for size, entry in self._positions.values())
+            usdt = {'total': self.balance, 'free': self.balance - used, 'used': used}
+            return {'USDT': usdt, 'total': {'USDT': usdt['total']}, 'free': {'USDT': usdt['free']}}
+
+    def fetch_ticker(self, symbol, params=None):
+        with self._lock:
+            return dict(self._quote(symbol))
+
+    def fetch_tickers(self, symbols=None, params=None):
+        with self._lock:
+            return {s: dict(q) for s, q in self._tickers.items() if not symbols or s in symbols}
+
+    def fetch_order_book(self, symbol, limit=None, params=None):
+        """Один уровень из bid / ask тикера, объём не ограничен"""
+        with self._lock:
+            quote = self._quote(symbol)
+            return {'symbol': symbol, 'bids': [[quote['bid'], float('inf')]], 'asks': [[quote['ask'], float('inf')]],
+                    'timestamp': quote['timestamp']}
+
+
+class PaperTelegram:
+    """Тени не пишут в Telegram (итоги - /shadow у живого бота)"""
+
+    chat_id = None
+
+    def send(self, message, keyboard=None):
+        return None
+
+    def edit_message(self, message_id, text, keyboard=None):
+        return True
+
+    def get_updates(self, timeout=0):
+        return []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class ShadowSpec:
+    """Что отличает тень от живого бота (HybridTradingBot(shadow=...))"""
+
+    __slots__ = ("name", "journal", "blackbox")
+
+    def __init__(self, name, journal, blackbox):
+        self.name = name
+        self.journal = journal
+        self.blackbox = blackbox
+
+
+class ShadowRunner:
+    """
+    Поток одной тени. Живой цикл кладёт последние данные (post), поток их забирает;
+    если тень не успела, промежуточные итерации пропускаются (флаг новой свечи сохраняется)
+    """
+
+    def __init__(self, bot, exchange):
+        self.bot = bot
+        self.exchange = exchange
+        self._cond = threading.Condition()
+        self._pending = None
+        self._thread = None
+        self.steps = 0
+        self.skipped = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=f"shadow-{self.bot.shadow.name}-{self.bot.asset}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self.bot.running = False
+            self._cond.notify()
+        self.bot.execution.cancel()
+
+    def post(self, price, df, new_candle, data_received):
+        with self._cond:
+            if self._pending is not None:
+                self.skipped += 1
+                new_candle = new_candle or self._pending[2]
+            self._pending = (price, df, new_candle, data_received)
+            self._cond.notify()
+
+    def _run(self):
+        mute_thread()
+        bot = self.bot
+        while True:
+            with self._cond:
+                while self._pending is None and bot.running:
+                    self._cond.wait()
+                if not bot.running:
+                    break
+                price, df, new_candle, data_received = self._pending
+                self._pending = None
+            try:
+                bot.last_price = price
+                bot.set_market_df(df)
+                bot.step(df, data_received, check_entry=new_candle)
+                self.steps += 1
+            except Exception as e:
+                bot.log(f"⚠️ Shadow step error: {e}", Col.YELLOW)
+                bot.log_debug(traceback.format_exc())
+        bot.scheduler.shutdown()
+
+
+class ShadowManager:
+    """
+    Все тени процесса: по ShadowRunner на (конфиг, символ живого бота).
+    Журнал и blackbox - один на конфиг (символ в записи), бумажный аккаунт - на каждую тень
+    """
+
+    def __init__(self, configs=SHADOW_CONFIGS, start_balance=SHADOW_START_BALANCE):
+        self.configs = dict(configs)
+        self.start_balance = start_balance
+        self.specs = {
+            name: ShadowSpec(name, TradeJournal(_suffixed(SHADOW_JOURNAL_FILE, name)),
+                             BlackboxWriter(_suffixed(SHADOW_BLACKBOX_FILE, name)))
+            for name in self.configs
+        }
+        self.runners = {}   # symbol живого -> [ShadowRunner]
+        self.live = {}      # symbol -> живой HybridTradingBot
+        METRICS.add_collector(self._collect_metrics, key="shadows")
+
+    def attach(self, live):
+        """Тени для живого бота: его символ и переопределения + переопределения конфига тени"""
+        runners = []
+        balance = self.start_balance if self.start_balance is not None else live.balance
+        for name, overrides in self.configs.items():
+            merged = {**live.cfg.overrides, **overrides}
+            exchange = PaperExchange(live.exchange, balance, SymbolConfig(merged).LEVERAGE)
+            bot = HybridTradingBot(exchange, PaperTelegram(), live.symbol, merged, shadow=self.specs[name])
+            runners.append(ShadowRunner(bot, exchange))
+        self.runners[live.symbol] = runners
+        self.live[live.symbol] = live
+        live.shadows = self
+        live.log(f"👥 Shadow: {', '.join(self.configs)} on {live.asset} (paper, ${balance:.2f} each)", Col.CYAN)
+        return runners
+
+    def feed(self, symbol, ticker, df, new_candle=True, data_received=None):
+        """
+        Данные итерации живого бота (вызывается из его цикла). Матчинг бумажных ордеров -
+        здесь же (дёшево), торговая логика тени - в её потоке
+        """
+        if not ticker or not ticker.get('last') or df is None:
+            return
+        price = float(ticker['last'])
+        for runner in self.runners.get(symbol, ()):
+            runner.exchange.update(symbol, ticker)
+            runner.start()
+            runner.post(price, df, new_candle, data_received or time.time())
+
+    def stop(self):
+        METRICS.remove_collector("shadows", self._collect_metrics)
+        for runners in self.runners.values():
+            for runner in runners:
+                runner.stop()
+        for spec in self.specs.values():
+            spec.journal.flush()
+
+    def format_stats(self):
+        lines = []
+        for symbol, runners in self.runners.items():
+            live = self.live[symbol].snapshot.session
+            lines.append(f"{symbol} live: pnl=${live.pnl:+.2f} W/L {live.wins}/{live.losses}")
+            for runner in runners:
+                bot = runner.bot
+                snap = bot.snapshot
+                pos, session = snap.position, snap.session
+                state = f"{pos.side} DCA {pos.safety_count}/{bot.cfg.SAFETY_ORDERS_COUNT}" if pos.in_position else "flat"
+                lines.append(f"  {bot.shadow.name}: {state} pnl=${session.pnl:+.2f} W/L {session.wins}/{session.losses} "
+                             f"bal=${runner.exchange.balance:.2f} fills={runner.exchange.fills} "
+                             f"steps={runner.steps} skipped={runner.skipped}")
+        return "\n".join(lines)
+
+    def _collect_metrics(self):
+        for symbol, runners in self.runners.items():
+            for runner in runners:
+                name = runner.bot.shadow.name
+                SHADOW_PNL.set(round(runner.bot.snapshot.session.pnl, 4), shadow=name, symbol=symbol)
+                SHADOW_FILLS.set(runner.exchange.fills, shadow=name, symbol=symbol)
@@ -0,0 +1,454 @@
+"""
+🗂️ PORTFOLIO
+Несколько символов в одном процессе (python main.py --portfolio): по HybridTradingBot
+на символ со своим состоянием позиции и переопределениями конфига (PORTFOLIO_SYMBOLS),
+общие подключение к бирже, Telegram, дашборд, blackbox и журнал.
+Число REST запросов за цикл не растёт с числом символов: fetch_tickers и
+fetch_open_orders одним запросом на весь портфель, Doctor - один снимок на все
+символы, баланс - общий кэш, OHLCV - только после закрытия свечи.
+Глобальные лимиты: число позиций и суммарная маржа (с оставшимися уровнями DCA)
+"""
+
+import time
+import logging
+import threading
+import traceback
+from collections import defaultdict
+
+import ccxt
+
+from config import (
+    PORTFOLIO_SYMBOLS, PORTFOLIO_MAX_POSITIONS, PORTFOLIO_MAX_MARGIN_PCT, PORTFOLIO_BALANCE_TTL, SHADOW_CONFIGS,
+    RISK_WATCHER_ENABLED, RISK_WATCHER_REST_INTERVAL, LOOP_INTERVAL_MIN, LOOP_INTERVAL_MAX,
+    TRAILING_UPDATE_INTERVAL, METRICS_ENABLED, Col,
+)
+from trading_bot import HybridTradingBot
+from paper import ShadowManager
+from blackbox import BlackboxWriter
+from trade_journal import TradeJournal
+from log_pipeline import setup_logging
+from scheduler import Scheduler
+from metrics import (
+    METRICS, LOOP_ITERATION, LOOP_PHASE, LOOP_INTERVAL, ERRORS, instrument_exchange, instrument_telegram,
+)
+
+PORTFOLIO_MARGIN = METRICS.gauge("bot_portfolio_margin_usd", "Committed margin across symbols (positions + remaining DCA)")
+PORTFOLIO_POSITIONS = METRICS.gauge("bot_portfolio_positions", "Open positions across symbols")
+ENTRIES_BLOCKED = METRICS.counter("bot_portfolio_entries_blocked_total", "Entries rejected by portfolio limits", ("reason",))
+
+
+class SymbolTelegram:
+    """
+    Telegram символа внутри портфеля: сообщения с префиксом символа,
+    входящие команды читает только Portfolio
+    """
+
+    def __init__(self, tg, asset):
+        self._tg = tg
+        self._tag = f"<b>[{asset}]</b> "
+
+    def send(self, message, keyboard=None):
+        return self._tg.send(self._tag + message, keyboard)
+
+    def edit_message(self, message_id, text, keyboard=None):
+        return self._tg.edit_message(message_id, self._tag + text, keyboard)
+
+    def get_updates(self, timeout=0):
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self._tg, name)
+
+
+class PortfolioRiskFeed:
+    """
+    Цены для risk watcher'ов всех символов в позиции: один fetch_tickers
+    каждые RISK_WATCHER_REST_INTERVAL вместо отдельного потока и запроса на символ
+    """
+
+    def __init__(self, portfolio, interval=RISK_WATCHER_REST_INTERVAL):
+        self.portfolio = portfolio
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        for bot in portfolio.bots.values():
+            bot.risk_watcher.source = "portfolio"
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="risk-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self.portfolio.log(f"🛡️ Risk feed: fetch_tickers every {self.interval}s", Col.CYAN)
+        while not self._stop.is_set():
+            bots = [bot for bot in self.portfolio.bots.values() if bot.in_position]
+            if bots:
+                try:
+                    tickers = self.portfolio.exchange.fetch_tickers([bot.symbol for bot in bots])
+                    for bot in bots:
+                        ticker = tickers.get(bot.symbol)
+                        if ticker:
+                            bot.risk_watcher.on_price(ticker.get('last'))
+                except Exception as e:
+                    self.portfolio.log_debug("Risk feed error: %s", e)
+            self._stop.wait(self.interval)
+
+
+class Portfolio:
+    def __init__(self, exchange, telegram_bot, symbols=PORTFOLIO_SYMBOLS):
+        self.exchange = instrument_exchange(exchange) if METRICS_ENABLED else exchange
+        self.tg = instrument_telegram(telegram_bot) if METRICS_ENABLED else telegram_bot
+        self.logger = setup_logging()
+        self.blackbox = BlackboxWriter()
+        self.journal = TradeJournal()
+        self.scheduler = Scheduler(log_fn=lambda msg: self.log(msg, Col.YELLOW))
+        self.running = True
+        self.dashboard_msg_id = None
+        self._dashboard_lock = threading.Lock()  # Пул планировщика / торговый цикл (post_dashboard)
+        self.last_dashboard_update = 0
+        self._lock = threading.RLock()   # Баланс / проверка лимитов
+        self._balance = 0.0
+        self._balance_at = 0.0
+        self._candles = {}               # symbol -> (время следующего fetch_ohlcv, df)
+        self._batch_orders = True        # Биржа отдаёт fetch_open_orders() без символа
+
+        self.start_balance = self.get_balance()
+        self.bots = {
+            symbol: HybridTradingBot(self.exchange, SymbolTelegram(telegram_bot, symbol.split('/')[0]),
+                                     symbol, overrides, portfolio=self)
+            for symbol, overrides in symbols.items()
+        }
+        self.symbols = list(self.bots)
+        self.primary = self.bots[self.symbols[0]]  # AI отчёт, /profile, вопросы без символа
+        self.shadows = ShadowManager() if SHADOW_CONFIGS else None
+        if self.shadows:
+            for bot in self.bots.values():
+                self.shadows.attach(bot)
+        self.risk_feed = PortfolioRiskFeed(self)
+        self._register_jobs()
+        METRICS.add_collector(self._collect_metrics, key="portfolio")
+        self.log(f"🗂️ Portfolio: {', '.join(bot.asset for bot in self.bots.values())} | "
+                 f"max {PORTFOLIO_MAX_POSITIONS} positions, margin ≤ {PORTFOLIO_MAX_MARGIN_PCT*100:.0f}%", Col.GREEN)
+
+    def log(self, msg, color=Col.WHITE, *args, category=None):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, *args, extra={"color": color, "category": category})
+
+    def log_debug(self, msg, *args):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, *args)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Общие данные
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def get_balance(self, force=False):
+        """Баланс USDT: один fetch_balance на PORTFOLIO_BALANCE_TTL для всех символов"""
+        with self._lock:
+            if force or time.time() - self._balance_at > PORTFOLIO_BALANCE_TTL:
+                try:
+                    bal = self.exchange.fetch_balance({'type': 'swap'})
+                    if 'USDT' in bal: self._balance = float(bal['USDT']['total'])
+                    self._balance_at = time.time()
+                except Exception as e:
+                    self.log_debug("Portfolio balance error: %s", e)
+            return self._balance
+
+    def fetch_open_orders(self):
+        """Открытые ордера всех символов одним запросом: {symbol: [orders]}, None - ошибка"""
+        try:
+            if self._batch_orders:
+                try:
+                    orders = self.exchange.fetch_open_orders()
+                except (ccxt.ArgumentsRequired, ccxt.NotSupported) as e:
+                    self._batch_orders = False
+                    self.log(f"⚠️ fetch_open_orders without symbol failed ({e}), per symbol", Col.YELLOW)
+            if not self._batch_orders:
+                orders = [o for bot in self.bots.values() if bot.in_position
+                          for o in self.exchange.fetch_open_orders(bot.symbol)]
+        except Exception as e:
+            self.log_debug("Portfolio open orders error: %s", e)
+            return None
+        by_symbol = defaultdict(list)
+        for order in orders:
+            by_symbol[order.get('symbol')].append(order)
+        return by_symbol
+
+    def market_data(self, bot):
+        """Свечи символа: fetch_ohlcv только после закрытия свечи. (df, новая свеча)"""
+        now = time.time()
+        cached = self._candles.get(bot.symbol)
+        if cached and now < cached[0]:
+            return cached[1], False
+        df = bot.get_market_data_enhanced()
+        if df is None:
+            return (cached[1] if cached else None), False
+        tf_sec = self.exchange.parse_timeframe(bot.timeframe)
+        self._candles[bot.symbol] = ((now // tf_sec + 1) * tf_sec + 1.0, df)
+        return df, True
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Лимиты
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def allow_entry(self, bot, entry_usd):
+        """Глобальные лимиты перед входом: число позиций и маржа (вход + вся его DCA сетка)"""
+        with self._lock:
+            others = [b for b in self.bots.values() if b is not bot]
+            active = sum(1 for b in others if b.in_position or b.execution.busy)
+            if active >= PORTFOLIO_MAX_POSITIONS:
+                reason, detail = "positions", f"{active}/{PORTFOLIO_MAX_POSITIONS} positions open"
+            else:
+                committed = sum(b.committed_margin() for b in others)
+                needed = bot.committed_margin(entry_usd)
+                limit = self.get_balance() * PORTFOLIO_MAX_MARGIN_PCT
+                if committed + needed <= limit:
+                    return True
+                reason, detail = "margin", f"margin ${committed:.2f} + ${needed:.2f} > ${limit:.2f}"
+        ENTRIES_BLOCKED.inc(reason=reason)
+        bot.log(f"🗂️ Entry blocked by portfolio limit: {detail}", Col.YELLOW)
+        return False
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Задачи
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _register_jobs(self):
+        s = self.scheduler
+        s.every("doctor", 20, self._doctor_job, priority=1, deadline=10)
+        s.every("dashboard", 15, self.update_dashboard, jitter=1.0, priority=5, pool=True)
+        if self.primary.has_ai:
+            s.daily("ai_report", 15, 0, lambda: self.primary._generate_and_send_ai_report(False), pool=True)
+
+    def _doctor_job(self):
+        """
+        🚑 Doctor всех символов по одному снимку: fetch_open_orders + fetch_positions на портфель.
+        Ордера - до позиций, как в Reconciler.snapshot
+        """
+        orders = self.fetch_open_orders()
+        positions = self.exchange.fetch_positions(self.symbols)
+        for symbol, bot in self.bots.items():
+            snapshot = bot.reconciler.snapshot(positions, orders.get(symbol, [])) if orders is not None else None
+            bot._doctor_job(snapshot)
+
+    def _collect_metrics(self):
+        bots = list(self.bots.values())
+        PORTFOLIO_MARGIN.set(round(sum(bot.committed_margin() for bot in bots), 2))
+        PORTFOLIO_POSITIONS.set(sum(1 for bot in bots if bot.in_position))
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Telegram
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    @property
+    def trading_active(self):
+        return any(bot.trading_active for bot in self.bots.values())
+
+    @property
+    def graceful_stop_mode(self):
+        return any(bot.graceful_stop_mode for bot in self.bots.values())
+
+    def get_keyboard(self):
+        # Та же клавиатура, состояние - по всем символам
+        return HybridTradingBot.get_keyboard(self)
+
+    def wait_telegram_updates(self, timeout):
+        return HybridTradingBot.wait_telegram_updates(self, timeout)
+
+    def check_telegram_commands(self, poll_timeout=0, updates=None):
+        """Один опрос Telegram на портфель. updates - уже полученные паузой цикла"""
+        if updates is None:
+            updates = self.wait_telegram_updates(poll_timeout)
+        for up in updates:
+            self.handle_update(up)
+
+    def handle_update(self, up):
+        """Кнопки - для всех символов; текстовые команды - символу из последнего слова (/jobs ETH)"""
+        bots = list(self.bots.values())
+        if up['type'] == 'callback':
+            value = up['value']
+            if value == "start_bot":
+                for bot in bots:
+                    bot.trading_active = True
+                    bot.graceful_stop_mode = False
+            elif value == "graceful_stop":
+                for bot in bots:
+                    bot.graceful_stop_mode = True
+                    if not bot.in_position:
+                        bot.trading_active = False
+                        bot.graceful_stop_mode = False
+            elif value == "cancel_stop":
+                for bot in bots:
+                    bot.graceful_stop_mode = False
+            elif value == "panic_sell":
+                for bot in bots:
+                    bot.execution.cancel()
+                    bot.close_position_market("Panic Sell")
+            elif value == "balance":
+                self.get_balance(force=True)
+            elif value == "ai_report":
+                self.primary.trigger_ai_report_thread(manual=True)
+            for bot in bots:
+                bot.publish_state()
+            self.update_dashboard(force=True)
+
+        elif up['type'] == 'text':
+            text = up['value'].strip()
+            if text.startswith('/portfolio'):
+                self.tg.send(f"🗂️ <b>Portfolio</b>\n<pre>{self.format_stats()}</pre>")
+            elif text == '/jobs':
+                self.tg.send(f"⏰ <b>Portfolio jobs</b>\n<pre>{self.scheduler.format_stats()}</pre>")
+            else:
+                self._route(text).handle_update(up)
+
+    def _route(self, text):
+        parts = text.split()
+        if text.startswith('/') and len(parts) > 1:
+            for bot in self.bots.values():
+                if bot.asset.upper() == parts[-1].upper():
+                    return bot
+        return self.primary
+
+    def format_stats(self):
+        lines = []
+        for bot in self.bots.values():
+            snap = bot.snapshot
+            pos, session = snap.position, snap.session
+            state = (f"{pos.side} DCA {pos.safety_count}/{bot.cfg.SAFETY_ORDERS_COUNT}"
+                     if pos.in_position else "entry..." if bot.execution.busy else "flat")
+            lines.append(f"{bot.asset}: x{bot.cfg.LEVERAGE} {state} margin=${bot.committed_margin():.2f} "
+                         f"pnl=${session.pnl:+.2f} trades={session.trades_today}")
+        return "\n".join(lines)
+
+    def update_dashboard(self, force=False):
+        """📊 Один дашборд на все символы"""
+        now = time.time()
+        if not force and (now - self.last_dashboard_update < 15): return
+        self.last_dashboard_update = now
+
+        bots = list(self.bots.values())
+        snaps = [bot.snapshot for bot in bots]  # Пул планировщика: снимки, не живые атрибуты
+        balance = self.get_balance()
+        balance_change = balance - self.start_balance
+        pnl = sum(snap.session.pnl for snap in snaps)
+        wins = sum(snap.session.wins for snap in snaps)
+        losses = sum(snap.session.losses for snap in snaps)
+        committed = sum(bot.committed_margin() for bot in bots)
+        limit = balance * PORTFOLIO_MAX_MARGIN_PCT
+        positions = sum(1 for snap in snaps if snap.position.in_position)
+
+        status_icon, status_text = ("🟢", "ACTIVE") if self.trading_active else ("🔴", "STOPPED")
+        if self.graceful_stop_mode:
+            status_icon, status_text = "🟡", "STOPPING..."
+
+        dash = f"""╔══════════════════════════════
+║ 🗂️ <b>PORTFOLIO</b> {status_icon} {status_text}
+╠══════════════════════════════
+║ 💰 Баланс: <b>${balance:.2f}</b> ({balance_change:+.2f}$)
+║ 📊 PnL: <b>${pnl:+.2f}</b> | W:{wins} / L:{losses}
+║ 🧮 Маржа: ${committed:.2f} / ${limit:.2f}
+║ 📍 Позиций: {positions}/{PORTFOLIO_MAX_POSITIONS}
+╠══════════════════════════════
+"""
+        for bot, snap in zip(bots, snaps):
+            pos, price = snap.position, bot.last_price
+            if pos.in_position:
+                icon = "📈" if pos.side_mult > 0 else "📉"
+                trail = " 🎯" if pos.trailing_active else ""
+                dash += (f"║ {icon} <b>{bot.asset}</b> ${pos.unrealized(price):+.2f} | "
+                         f"DCA {pos.safety_count}/{bot.cfg.SAFETY_ORDERS_COUNT}{trail}\n")
+            elif bot.execution.busy:
+                dash += f"║ ⚡ <b>{bot.asset}</b> вход...\n"
+            else:
+                dash += f"║ 💤 {bot.asset} ${price:.4g} | ATR {snap.market.atr_pct*100:.3f}%\n"
+        dash += "╚══════════════════════════════"
+
+        HybridTradingBot.post_dashboard(self, dash)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Главный цикл
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def next_loop_interval(self):
+        """Минимум адаптивных пауз символов и ближайшей задачи портфеля"""
+        interval = min(bot.next_loop_interval() for bot in self.bots.values())
+        next_job = self.scheduler.next_due()
+        if next_job is not None:
+            interval = min(interval, next_job)
+        interval = max(LOOP_INTERVAL_MIN, min(interval, LOOP_INTERVAL_MAX))
+        LOOP_INTERVAL.set(round(interval, 3))
+        return interval
+
+    def run(self):
+        wait = 0.0
+        if RISK_WATCHER_ENABLED:
+            self.risk_feed.start()
+
+        try:
+            while self.running:
+                # Пауза - вне LOOP_ITERATION / LOOP_PHASE, как в HybridTradingBot.run()
+                updates = self.wait_telegram_updates(wait)
+                iteration_start = work_start = time.perf_counter()
+                try:
+                    self.primary.profiler.poll()
+                    with LOOP_PHASE.time(phase="telegram"):
+                        self.check_telegram_commands(updates=updates)
+
+                    with LOOP_PHASE.time(phase="ticker"):
+                        tickers = self.exchange.fetch_tickers(self.symbols)
+                    orders = None
+                    if any(bot.in_position for bot in self.bots.values()):
+                        with LOOP_PHASE.time(phase="open_orders"):
+                            orders = self.fetch_open_orders()
+
+                    for symbol, bot in self.bots.items():
+                        ticker = tickers.get(symbol)
+                        if ticker and ticker.get('last'):
+                            bot.last_price = float(ticker['last'])
+                        with LOOP_PHASE.time(phase="market_data"):
+                            df, new_candle = self.market_data(bot)
+                        if df is None:
+                            continue
+                        try:
+                            bot.step(df, time.time(), orders.get(symbol, []) if orders is not None else None,
+                                     check_entry=new_candle)
+                            if self.shadows:
+                                self.shadows.feed(symbol, ticker, df, new_candle)
+                        except Exception as e:
+                            ERRORS.inc(source="loop")
+                            bot.log(f"⚠️ Step error: {e}", Col.YELLOW)
+                            bot.log_debug(traceback.format_exc())
+
+                    with LOOP_PHASE.time(phase="jobs"):
+                        self.scheduler.run_pending()
+                except Exception as e:
+                    ERRORS.inc(source="loop")
+                    self.log(f"⚠️ Portfolio iteration error: {e}", Col.YELLOW)
+                    self.log_debug(traceback.format_exc())
+                    time.sleep(TRAILING_UPDATE_INTERVAL)
+                finally:
+                    LOOP_ITERATION.observe(time.perf_counter() - iteration_start)
+                    try:
+                        wait = max(0.0, self.next_loop_interval() - (time.perf_counter() - work_start))
+                    except Exception:
+                        wait = LOOP_INTERVAL_MIN
+        except KeyboardInterrupt:
+            self.log("🛑 Portfolio: stopping...", Col.YELLOW)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.running = False
+        METRICS.remove_collector("portfolio", self._collect_metrics)
+        self.risk_feed.stop()
+        self.scheduler.shutdown()
+        if self.shadows:
+            self.shadows.stop()
+        for bot in self.bots.values():
+            bot.shutdown()
@@ -0,0 +1,110 @@
+"""
+🎯 PRICE TRIGGERS
+Индекс ценовых уровней позиции (TP / DCA / SL / жёсткий стоп / trailing)
+в отсортированном виде: проверка тика за O(log n), пересчёт уровней
+только при изменении входных данных (ATR, RSI, тренд, средняя цена...)
+"""
+
+import bisect
+import threading
+
+
+class Trigger:
+    """
+    name        - уникальное имя уровня: "tp", "dca:2", "sl", "hard_stop", "trail_stop"...
+    action      - что означает пересечение: tp / dca / sl / hard_stop / trail_activate / trail_peak / trail_stop
+    price       - закэшированная расчётная цена
+    fires_above - True: срабатывает при цене >= price, False: при цене <= price
+    """
+
+    __slots__ = ("name", "action", "price", "fires_above", "amount")
+
+    def __init__(self, name, action, price, fires_above, amount=0.0):
+        self.name = name
+        self.action = action
+        self.price = float(price)
+        self.fires_above = fires_above
+        self.amount = amount
+
+    def distance_pct(self, price):
+        return abs(self.price - price) / price * 100 if price else 0.0
+
+    def __repr__(self):
+        return f"Trigger({self.name} {'>=' if self.fires_above else '<='} {self.price:.4f})"
+
+
+class PriceTriggerIndex:
+    """
+    Уровни хранятся группами (например "orders" и "trailing"). Каждая группа
+    пересчитывается только когда меняется её ключ входных данных.
+    """
+
+    def __init__(self):
+        self._groups = {}       # group -> (key, [Trigger])
+        self._by_name = {}
+        self._above = ([], [])  # (цены по возрастанию, триггеры)
+        self._below = ([], [])
+        self._all = []
+        self._all_prices = []
+        self._lock = threading.Lock()
+        self.recomputes = 0
+
+    def update(self, group, key, compute_fn):
+        """compute_fn() -> [Trigger] вызывается только если key изменился. True - индекс перестроен"""
+        cached = self._groups.get(group)
+        if cached is not None and cached[0] == key:
+            return False
+        triggers = [t for t in compute_fn() if t is not None and t.price > 0]
+        with self._lock:
+            self._groups[group] = (key, triggers)
+            self._rebuild()
+        self.recomputes += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._groups = {}
+            self._rebuild()
+
+    def _rebuild(self):
+        triggers = [t for _, group in self._groups.values() for t in group]
+        self._by_name = {t.name: t for t in triggers}
+        above = sorted((t for t in triggers if t.fires_above), key=lambda t: t.price)
+        below = sorted((t for t in triggers if not t.fires_above), key=lambda t: t.price)
+        self._above = ([t.price for t in above], above)
+        self._below = ([t.price for t in below], below)
+        self._all = sorted(triggers, key=lambda t: t.price)
+        self._all_prices = [t.price for t in self._all]
+
+    @property
+    def is_empty(self):
+        return not self._all
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def levels(self):
+        """Все уровни по возрастанию цены"""
+        return list(self._all)
+
+    def check(self, price, actions=None):
+        """Уровни, пересечённые ценой (O(log n) + размер результата)"""
+        above_prices, above = self._above
+        below_prices, below = self._below
+        crossed = above[:bisect.bisect_right(above_prices, price)]
+        crossed += below[bisect.bisect_left(below_prices, price):]
+        if actions is not None:
+            crossed = [t for t in crossed if t.action in actions]
+        return crossed
+
+    def nearest(self, price, actions=None):
+        """Ближайший к цене уровень (с фильтром по action) или None"""
+        if actions is None:
+            prices, levels = self._all_prices, self._all
+        else:
+            levels = [t for t in self._all if t.action in actions]
+            prices = [t.price for t in levels]
+        if not levels:
+            return None
+        idx = bisect.bisect_left(prices, price)
+        return min(levels[max(0, idx - 1):idx + 1], key=lambda t: abs(t.price - price))
@@ -0,0 +1,149 @@
+"""
+🔥 ON-DEMAND PROFILER
+Профилирование работающего бота без остановки (команды /profile в Telegram)
+- sampling: фоновый поток снимает стеки всех потоков → collapsed stacks (.folded для flamegraph)
+- cprofile: cProfile на торговом потоке с ограничением по времени → .prof + текстовый топ
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from io import StringIO
+from collections import Counter
+from datetime import datetime
+
+from config import PROFILER_DIR, PROFILER_MAX_DURATION, PROFILER_DEFAULT_DURATION, PROFILER_SAMPLE_INTERVAL
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _output_path(suffix):
+    os.makedirs(PROFILER_DIR, exist_ok=True)
+    return os.path.join(PROFILER_DIR, f"profile_{datetime.now():%Y%m%d_%H%M%S}{suffix}")
+
+
+class ProfilerController:
+    """
+    Один активный сеанс за раз. on_done(path, caption) вызывается по завершении
+    (из потока профайлера для sampling, из торгового потока для cprofile).
+    """
+
+    def __init__(self, on_done):
+        self.on_done = on_done
+        self.mode = None
+        self.started_at = 0.0
+        self.deadline = 0.0
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._cprofile = None
+        self._cprofile_thread = None
+
+    @property
+    def active(self):
+        return self.mode is not None
+
+    def _clamp(self, duration):
+        try:
+            duration = float(duration)
+        except (TypeError, ValueError):
+            duration = PROFILER_DEFAULT_DURATION
+        return max(1.0, min(duration, PROFILER_MAX_DURATION))
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Sampling
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def start_sampling(self, duration=None, interval=PROFILER_SAMPLE_INTERVAL):
+        if self.active:
+            return False
+        duration = self._clamp(duration)
+        self.mode = "sampling"
+        self.started_at = time.time()
+        self.deadline = self.started_at + duration
+        self._stop_event.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, args=(interval,), name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        return duration
+
+    def _sample_loop(self, interval):
+        stacks = Counter()
+        samples = 0
+        own_id = threading.get_ident()
+        while not self._stop_event.is_set() and time.time() < self.deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            self._stop_event.wait(interval)
+
+        path = _output_path(".folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        elapsed = time.time() - self.started_at
+        self.mode = None
+        self.on_done(path, f"🔥 Sampling profile: {elapsed:.0f}s, {samples} samples, {len(stacks)} stacks (collapsed, flamegraph.pl / speedscope)")
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # cProfile (только вызывающий поток — торговый)
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def start_cprofile(self, duration=None):
+        if self.active:
+            return False
+        duration = self._clamp(duration)
+        self.mode = "cprofile"
+        self.started_at = time.time()
+        self.deadline = self.started_at + duration
+        self._cprofile_thread = threading.get_ident()
+        self._cprofile = cProfile.Profile()
+        self._cprofile.enable()
+        return duration
+
+    def poll(self):
+        """Вызывается из торгового цикла: закрывает cProfile по дедлайну"""
+        if self.mode == "cprofile" and time.time() >= self.deadline:
+            self._finish_cprofile()
+
+    def _finish_cprofile(self):
+        if threading.get_ident() != self._cprofile_thread:
+            self.deadline = 0.0  # Закроется на ближайшем poll() в торговом потоке
+            return
+        self._cprofile.disable()
+        path = _output_path(".prof")
+        self._cprofile.dump_stats(path)
+        report = StringIO()
+        pstats.Stats(self._cprofile, stream=report).sort_stats("cumulative").print_stats(40)
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        elapsed = time.time() - self.started_at
+        self._cprofile = None
+        self.mode = None
+        self.on_done(path + ".txt", f"🔥 cProfile (trading thread): {elapsed:.0f}s, raw stats: {path}")
+
+    def stop(self):
+        if self.mode == "sampling":
+            self._stop_event.set()
+            return True
+        if self.mode == "cprofile":
+            self._finish_cprofile()
+            return True
+        return False
+
+    def status(self):
+        if not self.active:
+            return "💤 Profiler idle"
+        left = max(0.0, self.deadline - time.time())
+        return f"🔥 Profiler: {self.mode}, {time.time() - self.started_at:.0f}s elapsed, {left:.0f}s left"
@@ -0,0 +1,225 @@
+"""
+🔁 RECONCILER
+Сверка позиции и ордеров за один проход (для Doctor / perform_health_check):
+снимок (fetch_open_orders, затем fetch_positions) → сравнение с желаемым состоянием
+(TP / DCA / SL) → минимальный пакет cancel / create / amend.
+Ордер, пропавший из открытых, подтверждается fetch_order: заново ставится только отменённый
+"""
+
+from config import RECONCILE_AMOUNT_TOLERANCE
+
+
+class DesiredOrder:
+    """
+    Желаемый ордер.
+    key        - роль для бота: "tp", "sl", "dca" или "dca:<уровень>" (лестница)
+    order_id   - id, который бот сейчас считает своим (None - ордера нет)
+    tolerance  - допустимое отклонение цены в %, None - цену не сверяем (только наличие)
+    reduce     - ордер уменьшает позицию (TP/SL) - нужно для различения fill/cancel
+    """
+
+    __slots__ = ("key", "order_id", "type", "side", "amount", "price", "params",
+                 "tolerance", "check_amount", "reduce")
+
+    def __init__(self, key, order_id, type, side, amount, price=None, params=None,
+                 tolerance=None, check_amount=False, reduce=False):
+        self.key = key
+        self.order_id = str(order_id) if order_id else None
+        self.type = type
+        self.side = side
+        self.amount = amount
+        self.price = price
+        self.params = params or {}
+        self.tolerance = tolerance
+        self.check_amount = check_amount
+        self.reduce = reduce
+
+    def order_args(self, symbol):
+        return {"symbol": symbol, "type": self.type, "side": self.side,
+                "amount": self.amount, "price": self.price, "params": self.params}
+
+    @property
+    def target_price(self):
+        return self.params.get("stopPrice") or self.price
+
+
+class Snapshot:
+    """Состояние биржи на момент сверки"""
+
+    __slots__ = ("position_size", "position", "open_orders")
+
+    def __init__(self, position_size, position, open_orders):
+        self.position_size = position_size
+        self.position = position
+        self.open_orders = open_orders
+
+
+class ReconcilePlan:
+    def __init__(self):
+        self.cancels = []    # [(order_id, причина)]
+        self.creates = []    # [DesiredOrder]
+        self.amends = []     # [(order_id, DesiredOrder)]
+        self.filled = []     # key ордеров, исчезнувших из-за исполнения (обрабатывает торговый цикл)
+        self.position_gone = False
+
+    @property
+    def actions(self):
+        return len(self.cancels) + len(self.creates) + len(self.amends)
+
+    def describe(self):
+        parts = []
+        if self.cancels:
+            parts.append("cancel " + ", ".join(f"{oid} ({why})" for oid, why in self.cancels))
+        if self.amends:
+            parts.append("amend " + ", ".join(f"{d.key} {oid}" for oid, d in self.amends))
+        if self.creates:
+            parts.append("create " + ", ".join(d.key for d in self.creates))
+        return "; ".join(parts)
+
+
+def _order_price(order):
+    return order.get("stopPrice") or order.get("triggerPrice") or order.get("price")
+
+
+class Reconciler:
+    """
+    Фиксированная стоимость цикла: 2 запроса на снимок (+ fetch_order на каждый пропавший ордер) + максимум по одному
+    batch-запросу на cancel и create (плюс edit_order на каждый amend, если биржа
+    умеет editOrder; иначе amend = cancel + create внутри тех же batch)
+    """
+
+    def __init__(self, exchange, symbol, log_fn=None):
+        self.exchange = exchange
+        self.symbol = symbol
+        self._log = log_fn or (lambda msg: None)
+
+    def snapshot(self, positions=None, open_orders=None):
+        """
+        positions / open_orders - уже полученные общим batch-запросом (портфель), иначе запрос по символу.
+        Ордера - до позиций: исполнение между запросами видно как выросшая позиция, а не как пропавший ордер
+        """
+        if open_orders is None:
+            open_orders = self.exchange.fetch_open_orders(self.symbol)
+        if positions is None:
+            positions = self.exchange.fetch_positions([self.symbol])
+        position_size = 0.0
+        position = None
+        for pos in positions:
+            if pos.get('symbol', self.symbol) != self.symbol:
+                continue
+            amt = float(pos.get('contracts', 0) or pos['info'].get('positionAmt', 0))
+            if amt != 0:
+                position_size = abs(amt)
+                position = pos
+                break
+        open_orders = {str(o['id']): o for o in open_orders if o.get('symbol', self.symbol) == self.symbol}
+        return Snapshot(position_size, position, open_orders)
+
+    def plan(self, snapshot, desired, expected_size):
+        """Сравнение снимка с желаемыми ордерами. expected_size - размер позиции по данным бота"""
+        plan = ReconcilePlan()
+        if snapshot.position_size == 0:
+            plan.position_gone = True
+            return plan
+
+        eps = expected_size * RECONCILE_AMOUNT_TOLERANCE
+        grew = snapshot.position_size > expected_size + eps
+        shrank = snapshot.position_size < expected_size - eps
+        claimed = set()
+
+        for d in desired:
+            order = snapshot.open_orders.get(d.order_id) if d.order_id else None
+            if d.order_id and order is None:
+                # Ордера нет в открытых: исполнен или отменён? Спрашиваем биржу, без ответа - по размеру позиции
+                status = self._order_status(d.order_id)
+                if status == 'closed' or (status is None and ((d.reduce and shrank) or (not d.reduce and grew))):
+                    plan.filled.append(d.key)
+                elif status in ('canceled', 'rejected', 'expired') or status is None:
+                    plan.creates.append(d)
+                else:
+                    claimed.add(d.order_id)  # Открыт, но не попал в снимок - не трогаем
+                continue
+            if order is None:
+                plan.creates.append(d)
+                continue
+
+            claimed.add(d.order_id)
+            if self._needs_amend(order, d):
+                plan.amends.append((d.order_id, d))
+
+        for oid, order in snapshot.open_orders.items():
+            if oid not in claimed:
+                plan.cancels.append((oid, f"orphan @ {_order_price(order)}"))
+        return plan
+
+    def _order_status(self, order_id):
+        try:
+            return self.exchange.fetch_order(order_id, self.symbol).get('status')
+        except Exception as e:
+            self._log(f"⚠️ Reconcile: fetch_order {order_id} failed ({e})")
+            return None
+
+    def _needs_amend(self, order, d):
+        if d.tolerance is not None and d.target_price:
+            current = float(_order_price(order) or 0)
+            if current <= 0 or abs(current - d.target_price) / d.target_price * 100 > d.tolerance:
+                return True
+        if d.check_amount:
+            current = float(order.get('amount') or 0)
+            if abs(current - d.amount) > d.amount * RECONCILE_AMOUNT_TOLERANCE:
+                return True
+        return False
+
+    def apply(self, plan):
+        """Исполняет план. Возвращает {key: новый order_id или None}"""
+        results = {}
+        cancel_ids = [oid for oid, _ in plan.cancels]
+        creates = list(plan.creates)
+
+        can_edit = self.exchange.has.get('editOrder')
+        for oid, d in plan.amends:
+            if can_edit:
+                try:
+                    order = self.exchange.edit_order(oid, self.symbol, d.type, d.side, d.amount, d.price, d.params)
+                    results[d.key] = str(order['id'])
+                    continue
+                except Exception as e:
+                    self._log(f"⚠️ Reconcile: edit {oid} failed ({e}), cancel + create")
+            cancel_ids.append(oid)
+            creates.append(d)
+
+        if cancel_ids:
+            self._cancel(cancel_ids)
+        for d in plan.amends:
+            results.setdefault(d[1].key, None)
+        if creates:
+            results.update(self._create(creates))
+        return results
+
+    def _cancel(self, ids):
+        try:
+            if self.exchange.has.get('cancelOrders'):
+                self.exchange.cancel_orders(ids, self.symbol)
+                return
+        except Exception as e:
+            self._log(f"⚠️ Reconcile: batch cancel failed ({e}), one by one")
+        for oid in ids:
+            try:
+                self.exchange.cancel_order(oid, self.symbol)
+            except Exception:
+                pass
+
+    def _create(self, desired):
+        results = {d.key: None for d in desired}
+        try:
+            if self.exchange.has.get('createOrders') and len(desired) > 1:
+                orders = self.exchange.create_orders([d.order_args(self.symbol) for d in desired])
+            else:
+                orders = [self.exchange.create_order(**d.order_args(self.symbol)) for d in desired]
+        except Exception as e:
+            self._log(f"❌ Reconcile: create failed: {e}")
+            return results
+        for d, order in zip(desired, orders):
+            if order and order.get('id'):
+                results[d.key] = str(order['id'])
+        return results
@@ -0,0 +1,139 @@
+"""
+🛡️ RISK WATCHER
+Отдельный поток: trailing stop и жёсткий SL на каждом обновлении цены,
+независимо от медленного торгового цикла (Telegram, OHLCV, Doctor)
+Источник цены: websocket watch_ticker (ccxt.pro) или REST fetch_ticker раз в RISK_WATCHER_REST_INTERVAL
+"""
+
+import time
+import asyncio
+import threading
+
+from config import RISK_WATCHER_INTERVAL, RISK_WATCHER_REST_INTERVAL, RISK_WATCHER_WEBSOCKET, Col
+from metrics import METRICS
+
+try:
+    import ccxt.pro as ccxtpro
+except ImportError:
+    ccxtpro = None
+
+RISK_TICKS = METRICS.counter("bot_risk_ticks_total", "Prices evaluated by the risk watcher", ("source",))
+RISK_TICK_AGE = METRICS.gauge("bot_risk_last_tick_age_seconds", "Seconds since the last risk watcher price")
+
+# Уровни индекса, при пересечении которых нужна полная проверка под lock
+RISK_ACTIONS = ("hard_stop", "trail_activate", "trail_peak", "trail_stop")
+
+
+class RiskWatcher:
+    """
+    Использует bot.position_lock: все изменения позиции (торговый цикл, закрытие)
+    идут под тем же RLock, поэтому два пути не могут закрыть позицию дважды
+    """
+
+    def __init__(self, bot, interval=RISK_WATCHER_INTERVAL, use_websocket=RISK_WATCHER_WEBSOCKET,
+                 rest_interval=RISK_WATCHER_REST_INTERVAL):
+        self.bot = bot
+        self.interval = interval
+        self.rest_interval = rest_interval  # REST - лишний запрос к бирже, не чаще торгового цикла
+        self.use_websocket = use_websocket and ccxtpro is not None
+        self.source = None
+        self.last_tick = 0.0
+        self.ticks = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="risk-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def tick_age(self):
+        return time.time() - self.last_tick if self.last_tick else None
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Оценка риска
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def on_price(self, price):
+        bot = self.bot
+        if not price or not bot.in_position:
+            return False
+        self.ticks += 1
+        self.last_tick = time.time()
+        RISK_TICKS.inc(source=self.source)
+
+        # Быстрый путь: ни один риск-уровень не пересечён - lock не нужен
+        triggers = bot.triggers
+        if not triggers.is_empty and not triggers.check(price, RISK_ACTIONS):
+            bot.last_price = float(price)
+            return False
+
+        # Торговый цикл держит lock на время операций с ордерами - пропускаем тик, не копим очередь
+        if not bot.position_lock.acquire(timeout=self.interval):
+            return False
+        try:
+            if not bot.in_position:
+                return False
+            bot.last_price = float(price)
+            if bot.check_trailing_stop():
+                return True
+            closed = bot.check_hard_stop()
+            bot.refresh_triggers()  # Новый пик / активация trailing
+            return closed
+        finally:
+            bot.position_lock.release()
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Источники цены
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _run(self):
+        if self.use_websocket:
+            try:
+                asyncio.run(self._ws_loop())
+            except Exception as e:
+                self.bot.log(f"⚠️ Risk watcher websocket failed ({e}), falling back to REST", Col.YELLOW)
+        if not self._stop.is_set():
+            self._rest_loop()
+
+    def _rest_loop(self):
+        self.source = "rest"
+        self.bot.log(f"🛡️ Risk watcher: REST every {self.rest_interval}s", Col.CYAN)
+        while not self._stop.is_set():
+            if self.bot.in_position:
+                try:
+                    ticker = self.bot.exchange.fetch_ticker(self.bot.symbol)
+                    self.on_price(ticker.get('last'))
+                except Exception as e:
+                    self.bot.log_debug("Risk watcher ticker error: %s", e)
+            self._stop.wait(self.rest_interval)
+
+    async def _ws_loop(self):
+        self.source = "ws"
+        exchange = getattr(ccxtpro, self.bot.exchange.id)({'options': {'defaultType': 'swap'}})
+        self.bot.log("🛡️ Risk watcher: websocket ticker", Col.CYAN)
+        errors = 0
+        try:
+            while not self._stop.is_set():
+                if not self.bot.in_position:
+                    await asyncio.sleep(self.interval)
+                    continue
+                try:
+                    ticker = await exchange.watch_ticker(self.bot.symbol)
+                    errors = 0
+                except Exception as e:
+                    errors += 1
+                    if errors >= 5:
+                        raise
+                    self.bot.log_debug("Risk watcher ws error: %s", e)
+                    await asyncio.sleep(self.interval)
+                    continue
+                # Закрытие позиции - блокирующие ccxt вызовы, уводим из event loop
+                await asyncio.to_thread(self.on_price, ticker.get('last'))
+        finally:
+            await exchange.close()
@@ -0,0 +1,210 @@
+"""
+⏰ SCHEDULER
+Heap-планировщик периодических и разовых задач торгового цикла
+(дашборд, Doctor, статус, funding, AI отчёт, Future Spy):
+интервал, jitter, приоритет, дедлайн опоздания, статистика по задачам.
+Медленные задачи (pool=True) уходят в пул потоков и не задерживают цикл
+"""
+
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from config import SCHEDULER_WORKERS
+from metrics import METRICS
+
+JOB_SECONDS = METRICS.histogram("bot_job_seconds", "Scheduled job run time", ("job",))
+JOB_LATENESS = METRICS.histogram("bot_job_lateness_seconds", "Delay between due time and job start", ("job",))
+JOB_MISSED = METRICS.counter("bot_job_missed_deadline_total", "Jobs started later than their deadline", ("job",))
+JOB_ERRORS = METRICS.counter("bot_job_errors_total", "Scheduled job exceptions", ("job",))
+
+
+class Job:
+    __slots__ = ("name", "fn", "interval", "jitter", "priority", "deadline", "pool",
+                 "next_run", "cancelled", "running", "runs", "errors", "missed", "skipped",
+                 "total_time", "max_time", "max_lateness", "last_run", "last_error")
+
+    def __init__(self, name, fn, interval, jitter, priority, deadline, pool, next_run):
+        self.name = name
+        self.fn = fn
+        self.interval = interval    # None - разовая задача
+        self.jitter = jitter
+        self.priority = priority    # Меньше - раньше среди одновременно готовых
+        self.deadline = deadline    # Допустимое опоздание, сек (None - без контроля)
+        self.pool = pool
+        self.next_run = next_run
+        self.cancelled = False
+        self.running = False
+        self.runs = 0
+        self.errors = 0
+        self.missed = 0
+        self.skipped = 0            # Пропуски: предыдущий запуск в пуле ещё не завершён
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.max_lateness = 0.0
+        self.last_run = 0.0
+        self.last_error = None
+
+
+class Scheduler:
+    def __init__(self, workers=SCHEDULER_WORKERS, log_fn=None):
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._log = log_fn or (lambda msg: None)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Регистрация
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def every(self, name, interval, fn, jitter=0.0, priority=10, deadline=None, pool=False, first_run=None):
+        """Периодическая задача. first_run - unix time первого запуска (по умолчанию сразу)"""
+        return self._add(Job(name, fn, interval, jitter, priority, deadline, pool,
+                             first_run if first_run is not None else time.time()))
+
+    def once(self, name, delay, fn, priority=10, deadline=None, pool=False):
+        """Разовая задача через delay сек"""
+        return self._add(Job(name, fn, None, 0.0, priority, deadline, pool, time.time() + delay))
+
+    def daily(self, name, hour, minute, fn, priority=10, deadline=300, pool=False):
+        """Раз в сутки в hour:minute UTC"""
+        now = datetime.now(timezone.utc)
+        first = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if first <= now:
+            first += timedelta(days=1)
+        return self.every(name, 86400, fn, priority=priority, deadline=deadline, pool=pool,
+                          first_run=first.timestamp())
+
+    def _add(self, job):
+        with self._lock:
+            old = self._jobs.get(job.name)
+            if old is not None:
+                old.cancelled = True
+            self._jobs[job.name] = job
+            heapq.heappush(self._heap, (job.next_run, job.priority, next(self._seq), job))
+        return job
+
+    def cancel(self, name):
+        with self._lock:
+            job = self._jobs.pop(name, None)
+        if job is not None:
+            job.cancelled = True
+        return job is not None
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Исполнение
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def run_pending(self, now=None):
+        """Запуск готовых задач (из торгового цикла). Возвращает число запущенных"""
+        now = now or time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                due.append(job)
+
+        for job in due:
+            scheduled = job.next_run
+            self._reschedule(job, now)
+            if job.pool:
+                if job.running:
+                    job.skipped += 1
+                    continue
+                job.running = True
+                self._pool.submit(self._execute, job, scheduled)
+            else:
+                self._execute(job, scheduled)
+        return len(due)
+
+    def _reschedule(self, job, now):
+        if job.interval is None:
+            with self._lock:
+                if self._jobs.get(job.name) is job:
+                    del self._jobs[job.name]
+            return
+        # Без догоняющих запусков: следующий слот не раньше now
+        next_run = job.next_run + job.interval
+        if next_run <= now:
+            next_run = now + job.interval
+        if job.jitter:
+            next_run += random.uniform(0, job.jitter)
+        job.next_run = next_run
+        with self._lock:
+            if not job.cancelled:
+                heapq.heappush(self._heap, (next_run, job.priority, next(self._seq), job))
+
+    def _execute(self, job, scheduled):
+        start = time.time()
+        lateness = max(0.0, start - scheduled)
+        job.max_lateness = max(job.max_lateness, lateness)
+        JOB_LATENESS.observe(lateness, job=job.name)
+        if job.deadline is not None and lateness > job.deadline:
+            job.missed += 1
+            JOB_MISSED.inc(job=job.name)
+        try:
+            job.fn()
+        except Exception as e:
+            job.errors += 1
+            job.last_error = str(e)[:200]
+            JOB_ERRORS.inc(job=job.name)
+            self._log(f"⚠️ Job {job.name} error: {e}")
+        finally:
+            elapsed = time.time() - start
+            job.runs += 1
+            job.total_time += elapsed
+            job.max_time = max(job.max_time, elapsed)
+            job.last_run = start
+            job.running = False
+            JOB_SECONDS.observe(elapsed, job=job.name)
+
+    def next_due(self, now=None):
+        """Сек до ближайшей задачи (для паузы цикла), None - задач нет"""
+        now = now or time.time()
+        with self._lock:
+            while self._heap and self._heap[0][3].cancelled:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - now)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Статистика
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            job.name: {
+                "runs": job.runs,
+                "errors": job.errors,
+                "missed": job.missed,
+                "skipped": job.skipped,
+                "avg_sec": job.total_time / job.runs if job.runs else 0.0,
+                "max_sec": job.max_time,
+                "max_lateness_sec": job.max_lateness,
+                "next_in_sec": max(0.0, job.next_run - time.time()),
+                "pool": job.pool,
+            }
+            for job in jobs
+        }
+
+    def format_stats(self):
+        lines = []
+        for name, s in sorted(self.stats().items()):
+            lines.append(f"{name}{' [pool]' if s['pool'] else ''}: runs={s['runs']} avg={s['avg_sec']:.2f}s "
+                         f"max={s['max_sec']:.2f}s late={s['max_lateness_sec']:.1f}s missed={s['missed']} "
+                         f"err={s['errors']} next={s['next_in_sec']:.0f}s")
+        return "\n".join(lines) if lines else "No jobs"
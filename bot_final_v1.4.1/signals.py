@@ -0,0 +1,220 @@
+"""
+🎯 SIGNALS
+Сигнал входа check_entry_signal_hybrid и confluence (0-7) для всех свечей сразу - исследования и
+бэктест по годам истории вместо прохода по строкам:
+    python signals.py scan --symbol BTC/USDT:USDT [--rows N]   - сводка сигналов по кэшу history.py
+    python signals.py verify [--symbol ...] [--samples 3000]    - сверка с живым check_entry_signal_hybrid
+- Строка r результата - то, что живой бот получил бы на DataFrame df.iloc[:r+2]: закрытая свеча r
+  (iloc[-2]) и формирующаяся r+1, которая входит в окна 20 свечей объёма и ATR_pct, как в живом боте.
+  Последняя свеча (нет следующей) и первые две не оцениваются
+- Колонки: side (1 Buy / -1 Sell / 0), pass-флаги фильтров momentum / volatility / rsi_band / volume /
+  microtrend / knife (для стороны свечи), volume_ratio, price_change_3 (%), confluence, stage, signal
+- Не свечные условия живого бота (trading_active, graceful stop, DAILY_TRADE_LIMIT,
+  MIN_TIME_BETWEEN_TRADES) зависят от сделок и здесь не проверяются
+- Средние окон - скользящей суммой; строки, где отношение в 1e-9 от порога, пересчитываются тем же
+  pandas .mean(), что и в живом боте - решения совпадают бит в бит
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import SymbolConfig
+
+MEAN_WINDOW = 20   # df[...].iloc[-20:].mean() живого бота
+NEAR = 1e-9        # Относительная близость к порогу, при которой среднее считается как в живом боте
+
+OUTPUT_COLUMNS = ('side', 'momentum', 'volatility', 'rsi_band', 'volume', 'microtrend', 'knife',
+                  'volume_ratio', 'price_change_3', 'confluence', 'stage', 'signal')
+
+
+def _shift(values, k, fill=np.nan):
+    """values[r - k] на месте r (k > 0 - предыдущие свечи, k < 0 - следующие)"""
+    out = np.full(len(values), fill, dtype=values.dtype)
+    if k > 0:
+        out[k:] = values[:-k]
+    elif k < 0:
+        out[:k] = values[-k:]
+    else:
+        out[:] = values
+    return out
+
+
+def window_mean(values, window=MEAN_WINDOW):
+    """
+    Для каждой r - среднее values[r+2-window : r+2] без NaN (как Series.mean на df.iloc[:r+2] .iloc[-window:]);
+    окно короче в начале, для последней свечи - NaN
+    """
+    n = len(values)
+    valid = ~np.isnan(values)
+    clean = np.where(valid, values, 0.0)
+    sums = np.full(n + 1, np.nan)  # sums[e] - сумма окна, заканчивающегося перед e
+    counts = np.zeros(n + 1)
+    head = min(window - 1, n)
+    sums[1:head + 1] = np.cumsum(clean[:head])
+    counts[1:head + 1] = np.cumsum(valid[:head])
+    if n >= window:
+        view = np.lib.stride_tricks.sliding_window_view
+        sums[window:] = view(clean, window).sum(axis=1)
+        counts[window:] = view(valid, window).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    return np.concatenate((means[2:], [np.nan]))
+
+
+def _refine(mask, column, means):
+    """Средние строк mask - тем же pandas .mean(), что и в живом боте (у порогов)"""
+    for r in np.flatnonzero(mask):
+        means[r] = column.iloc[max(0, r + 2 - MEAN_WINDOW):r + 2].mean()
+
+
+def evaluate(df, cfg=None):
+    """
+    DataFrame OUTPUT_COLUMNS того же индекса, что df (колонки рыночного DataFrame бота:
+    open / close / volume, EMA9 / EMA15 / EMA20, RSI, ATR_pct, ADX). cfg - SymbolConfig (по умолчанию config.py)
+    """
+    cfg = cfg or SymbolConfig()
+    n = len(df)
+
+    def col(name):
+        return df[name].to_numpy(dtype=np.float64)
+
+    ema9, ema15, ema20 = col('EMA9'), col('EMA15'), col('EMA20')
+    close, opens, volume = col('close'), col('open'), col('volume')
+    rsi, atr_pct = col('RSI'), col('ATR_pct')
+    prev_ema9 = _shift(ema9, 1)
+
+    # Окна 20 свечей (с формирующейся r+1); у порогов - как в живом боте
+    volume_mean = window_mean(volume)
+    atr_mean = window_mean(atr_pct)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for thresholds, values, means, column in (
+                ((cfg.MIN_VOLUME_RATIO, 1.2, 1.5), volume, volume_mean, df['volume']),
+                ((1.5,), atr_pct, atr_mean, df['ATR_pct'])):
+            ratio = values / means
+            near = np.zeros(n, dtype=bool)
+            for threshold in thresholds:
+                near |= np.abs(ratio - threshold) <= NEAR * abs(threshold)
+            _refine(near, column, means)
+        volume_ratio = volume / volume_mean
+
+        # Сторона и фильтры 2-7 check_entry_signal_hybrid
+        side = np.where(ema9 > ema15, 1, np.where(ema9 < ema15, -1, 0)).astype(np.int8)
+        change = ema9 - prev_ema9
+        momentum = (side != 0) & ~((side == 1) & (change < 0)) & ~((side == -1) & (change > 0))
+        volatility = ~(bool(cfg.QUALITY_FILTER_ENABLED) & ~np.isnan(atr_pct) & (atr_pct < cfg.MIN_VOLATILITY_PCT))
+        rsi_band = ~((rsi < cfg.RSI_SAFE_MIN) | (rsi > cfg.RSI_SAFE_MAX))
+        volume_ok = ~(volume_ratio < cfg.MIN_VOLUME_RATIO)
+        bullish = (close > opens).astype(np.int8)
+        bulls = bullish + _shift(bullish, 1, fill=0)
+        microtrend = ((side == 1) & (bulls >= cfg.MIN_MICROTREND_CANDLES)) | \
+                     ((side == -1) & (2 - bulls >= cfg.MIN_MICROTREND_CANDLES))
+        close_3 = _shift(close, 2)
+        price_change_3 = (close - close_3) / close_3
+        knife = ~(np.abs(price_change_3) > cfg.KNIFE_PROTECTION_PCT)
+
+        # Confluence (calculate_confluence_score)
+        rsi_dist = np.abs(rsi - 50)
+        ema_momentum = np.where(prev_ema9 != 0, change / prev_ema9, 0.0)
+        confluence = ((rsi_dist < 15).astype(np.int8) + (ema9 > ema20) + (np.abs(ema_momentum) > 0.0001)
+                      + (volume_ratio > 1.2) + (rsi_dist < 10) + (volume_ratio > 1.5)
+                      + (atr_pct < atr_mean * 1.5)).astype(np.int8)
+
+    stage = np.where(confluence >= 5, 3, np.where(confluence >= 3, 2, 1)).astype(np.int8)
+    evaluable = np.zeros(n, dtype=bool)
+    evaluable[2:n - 1] = True  # iloc[-4] и формирующаяся свеча существуют
+    signal = (evaluable & ~np.isnan(ema9) & momentum & volatility & rsi_band & volume_ok
+              & microtrend & knife & (confluence >= cfg.MIN_CONFLUENCE_SCORE))
+
+    return pd.DataFrame({
+        'side': side, 'momentum': momentum, 'volatility': volatility, 'rsi_band': rsi_band,
+        'volume': volume_ok, 'microtrend': microtrend, 'knife': knife,
+        'volume_ratio': volume_ratio, 'price_change_3': price_change_3 * 100,
+        'confluence': confluence, 'stage': stage, 'signal': signal,
+    }, index=df.index)
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Сверка с живым ботом / сводка
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+def live_signal(df, cfg=None):
+    """check_entry_signal_hybrid живого бота на df без состояния сделок (свечные условия)"""
+    from types import SimpleNamespace
+    from trading_bot import HybridTradingBot
+    bot = SimpleNamespace(cfg=cfg or SymbolConfig(), trading_active=True, graceful_stop_mode=False,
+                          trades_today=0, last_trade_time=None)
+    bot.calculate_confluence_score = lambda frame: HybridTradingBot.calculate_confluence_score(bot, frame)
+    return HybridTradingBot.check_entry_signal_hybrid(bot, df), bot.calculate_confluence_score(df)
+
+
+def verify(df, samples=3000, seed=0, cfg=None, log_fn=print):
+    """Строки всех сигналов (до samples) и случайные строки: side / confluence / stage / signal как у живого бота"""
+    result = evaluate(df, cfg)
+    rng = np.random.default_rng(seed)
+    rows = np.flatnonzero(result['signal'].to_numpy())
+    rows = np.concatenate((rng.choice(rows, min(len(rows), samples // 2), replace=False) if len(rows) else rows,
+                           rng.integers(2, len(df) - 1, samples - min(len(rows), samples // 2))))
+    mismatches = 0
+    for r in np.unique(rows):
+        live, confluence = live_signal(df.iloc[:r + 2], cfg)
+        got = result.iloc[r]
+        expected = (bool(live), live['signal'] if live else None, live['stage'] if live else None)
+        ours = (bool(got['signal']), {1: "Buy", -1: "Sell"}.get(int(got['side'])) if got['signal'] else None,
+                int(got['stage']) if got['signal'] else None)
+        if expected != ours or confluence != got['confluence']:
+            mismatches += 1
+            if mismatches <= 10:
+                log_fn(f"   ❌ row {r}: live {expected} confluence {confluence}, "
+                       f"vectorized {ours} confluence {got['confluence']}")
+    return len(np.unique(rows)), mismatches
+
+
+def summary(result):
+    """Сигналы по сторонам / стадиям и доля прошедших каждый фильтр"""
+    signals = result[result['signal']]
+    lines = [f"🎯 {len(result):,} candles, {len(signals):,} signals "
+             f"(Buy {int((signals['side'] == 1).sum()):,} / Sell {int((signals['side'] == -1).sum()):,})"]
+    for stage in (1, 2, 3):
+        lines.append(f"   stage {stage}: {int((signals['stage'] == stage).sum()):,}")
+    sided = result[result['side'] != 0]
+    for name in ('momentum', 'volatility', 'rsi_band', 'volume', 'microtrend', 'knife'):
+        lines.append(f"   {name:<11} pass {sided[name].mean() * 100:5.1f}%")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import indicators
+
+    parser = argparse.ArgumentParser(description="Vectorized entry signals over candle history")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, help_text in (("scan", "signals summary over cached history"),
+                            ("verify", "compare with the live check_entry_signal_hybrid")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--symbol", help="symbol from the history.py cache (default - synthetic candles)")
+        p.add_argument("--timeframe", default="1m")
+        p.add_argument("--rows", type=int, default=1_000_000, help="last N candles")
+        if name == "verify":
+            p.add_argument("--samples", type=int, default=3000)
+    args = parser.parse_args()
+
+    if args.symbol:
+        from history import HistoryStore
+        ohlcv = HistoryStore().fetch_ohlcv(args.symbol, args.timeframe, limit=args.rows)
+    else:
+        ohlcv = indicators.synthetic(args.rows)
+    df = indicators.frame(ohlcv)
+
+    if args.cmd == "scan":
+        started = time.perf_counter()
+        result = evaluate(df)
+        print(summary(result))
+        print(f"⏱️ {len(df):,} candles in {time.perf_counter() - started:.2f}s")
+        sys.exit(0)
+
+    checked, mismatches = verify(df, args.samples)
+    print(f"{'❌' if mismatches else '✅'} {checked} rows checked against the live path, {mismatches} mismatch(es)")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,153 @@
+"""
+🧊 SNAPSHOTS
+Неизменяемые снимки состояния бота для чтения из других потоков:
+дашборд (пул планировщика), AI чат / отчёт, /metrics, портфель и воркер supervisor.
+Торговый цикл на каждом переходе собирает новый BotSnapshot и публикует его
+одним присваиванием атрибута (атомарно). Читатель берёт ссылку один раз
+(snap = bot.snapshot) и видит согласованные позицию, ордера, сессию и рынок
+без lock и без копии DataFrame
+"""
+
+import math
+
+
+class Frozen:
+    """База снимков: __slots__, запись атрибутов только в __init__"""
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def replace(self, **changes):
+        """Копия с изменёнными полями"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class PositionSnapshot(Frozen):
+    __slots__ = ("in_position", "side", "avg_price", "size", "first_entry_price", "base_entry_price",
+                 "entry_usd", "safety_count", "confluence", "stage", "trade_id", "fees",
+                 "trailing_active", "trailing_peak", "opened_at")
+
+    @classmethod
+    def from_state(cls, state):
+        """Из capture(bot, POSITION_FIELDS) (state_store.py): datetime уже timestamp"""
+        return cls(
+            in_position=state["in_position"], side=state["position_side"], avg_price=state["avg_price"],
+            size=state["total_size_coins"] if state["in_position"] else 0.0,
+            first_entry_price=state["first_entry_price"], base_entry_price=state["base_entry_price"],
+            entry_usd=state["entry_usd_vol"], safety_count=state["safety_count"],
+            confluence=state["current_confluence"], stage=state["current_stage"], trade_id=state["trade_id"],
+            fees=state["current_trade_fees"], trailing_active=state["trailing_active"],
+            trailing_peak=state["trailing_peak_price"], opened_at=state["trade_start_time"],
+        )
+
+    @property
+    def side_mult(self):
+        return 1 if self.side == "Buy" else -1
+
+    def unrealized(self, price):
+        if not self.in_position or not price:
+            return 0.0
+        return (price - self.avg_price) * self.size * self.side_mult
+
+    def margin(self, leverage):
+        return (self.avg_price * self.size) / leverage
+
+
+class SessionSnapshot(Frozen):
+    __slots__ = ("pnl", "fees", "wins", "losses", "trades_today", "start_balance", "peak_balance",
+                 "trading_active", "graceful_stop")
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(
+            pnl=state["session_total_pnl"], fees=state["session_total_fees"], wins=state["session_wins"],
+            losses=state["session_losses"], trades_today=state["trades_today"],
+            start_balance=state["start_balance"], peak_balance=state["peak_balance"],
+            trading_active=state["trading_active"], graceful_stop=state["graceful_stop_mode"],
+        )
+
+    @property
+    def trades(self):
+        return self.wins + self.losses
+
+    @property
+    def win_rate(self):
+        return self.wins / self.trades * 100 if self.trades else 0.0
+
+
+class OrdersSnapshot(Frozen):
+    """
+    id ордеров позиции и уровни из PriceTriggerIndex (Trigger не меняются после создания).
+    dca_ladder - ((order_id, уровень), ...) по возрастанию уровня
+    """
+
+    __slots__ = ("tp_order_id", "dca_order_id", "sl_order_id", "dca_ladder", "levels")
+
+    def with_ids(self, state):
+        ladder = tuple(sorted(state["dca_ladder"].items(), key=lambda item: item[1]))
+        return self.replace(tp_order_id=state["tp_order_id"], dca_order_id=state["dca_order_id"],
+                            sl_order_id=state["sl_order_id"], dca_ladder=ladder)
+
+    def with_levels(self, levels):
+        return self.replace(levels=tuple(levels))
+
+    def level(self, name):
+        for trigger in self.levels:
+            if trigger.name == name:
+                return trigger
+        return None
+
+
+class MarketSnapshot(Frozen):
+    """
+    Последняя закрытая свеча (iloc[-2]) и режим рынка.
+    df - ссылка на DataFrame итерации: после публикации он не меняется (build_market_df
+    каждый раз строит новый), поэтому копия не нужна
+    """
+
+    __slots__ = ("timestamp", "close", "rsi", "adx", "atr_pct", "trending", "df")
+
+    @classmethod
+    def from_df(cls, df, atr_pct, trending):
+        def closed(column):
+            value = df[column].iat[-2]
+            return None if math.isnan(value) else float(value)
+
+        return cls(timestamp=int(df['timestamp'].iat[-2]), close=closed('close'), rsi=closed('RSI'),
+                   adx=closed('ADX'), atr_pct=float(atr_pct), trending=trending, df=df)
+
+    def describe(self):
+        rsi = f"{self.rsi:.1f}" if self.rsi is not None else "N/A"
+        adx = f"{self.adx:.1f}" if self.adx is not None else "N/A"
+        return f"RSI {rsi}, ADX {adx}, ATR {self.atr_pct*100:.3f}%"
+
+
+NO_ORDERS = OrdersSnapshot(tp_order_id=None, dca_order_id=None, sl_order_id=None, dca_ladder=(), levels=())
+NO_MARKET = MarketSnapshot(timestamp=0, close=None, rsi=None, adx=None, atr_pct=0.0, trending=True, df=None)
+
+
+class BotSnapshot(Frozen):
+    """Всё вместе: одна ссылка - один согласованный момент"""
+
+    __slots__ = ("position", "orders", "session", "market", "version")
@@ -0,0 +1,182 @@
+"""
+💾 STATE STORE
+Чекпоинт состояния позиции для рестарта без пересинхронизации:
+позиция и сетка, id ордеров, trailing, комиссии сделки, счётчики сессии
+(только в тот же день - дата сессии в чекпоинте).
+Каждый переход - строка в WAL (bot_state_BTC.wal): crc32 + JSON полного
+состояния, flush + fsync до возврата. Раз в STATE_COMPACT_EVERY записей
+последнее состояние атомарно пишется в снимок (tmp + fsync + os.replace),
+WAL обнуляется. Загрузка: снимок, затем последняя целая запись WAL -
+оборванная при падении строка отбрасывается по crc
+"""
+
+import os
+import json
+import time
+import zlib
+import threading
+from datetime import datetime
+
+from config import STATE_COMPACT_EVERY
+
+STATE_VERSION = 1
+
+# Поля HybridTradingBot в чекпоинте
+POSITION_FIELDS = (
+    "in_position", "position_side", "avg_price", "total_size_coins", "first_entry_price",
+    "base_entry_price", "entry_usd_vol", "safety_count", "current_confluence", "current_stage",
+    "trade_id", "tp_order_id", "dca_order_id", "dca_ladder", "sl_order_id",
+    "trailing_active", "trailing_peak_price", "current_trade_fees", "trade_start_time", "trade_msg_id",
+)
+SESSION_FIELDS = (
+    "session_total_pnl", "session_total_fees", "session_wins", "session_losses", "trades_today",
+    "last_trade_time", "last_funding_time", "start_balance", "peak_balance",
+    "trading_active", "graceful_stop_mode", "session_date",
+)
+# Счётчики дня: из чекпоинта другого дня не восстанавливаются (DAILY_TRADE_LIMIT считается заново)
+DAILY_FIELDS = frozenset((
+    "session_total_pnl", "session_total_fees", "session_wins", "session_losses", "trades_today",
+    "start_balance", "peak_balance", "session_date",
+))
+DATETIME_FIELDS = frozenset(("trade_start_time", "last_trade_time", "last_funding_time"))
+
+
+def capture(obj, fields):
+    """Поля объекта -> dict для JSON (datetime -> timestamp)"""
+    state = {}
+    for name in fields:
+        value = getattr(obj, name)
+        if name in DATETIME_FIELDS and value is not None:
+            value = value.timestamp()
+        elif isinstance(value, dict):
+            value = dict(value)  # Копия: иначе сравнение с прошлой записью видит живой объект
+        state[name] = value
+    return state
+
+
+def restore(obj, state, fields):
+    """Обратно из dict в объект (отсутствующие в state поля не трогает)"""
+    for name in fields:
+        if name not in state:
+            continue
+        value = state[name]
+        if name in DATETIME_FIELDS and value is not None:
+            value = datetime.fromtimestamp(value)
+        setattr(obj, name, value)
+
+
+class StateStore:
+    def __init__(self, path, compact_every=STATE_COMPACT_EVERY, log_fn=None):
+        self.path = path
+        self.wal_path = os.path.splitext(path)[0] + ".wal"
+        self.compact_every = compact_every
+        self._log = log_fn or (lambda msg: None)
+        self._lock = threading.Lock()
+        self._wal = None
+        self._last = None
+        self._seq = 0
+        self._wal_records = 0
+        self.writes = 0
+        self.compactions = 0
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Запись
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def save(self, state, reason, sync=True):
+        """
+        Запись перехода, если состояние изменилось. sync=False - без fsync
+        (частые обновления пика trailing: переживают падение процесса, не питания)
+        """
+        with self._lock:
+            if state == self._last:
+                return False
+            self._seq += 1
+            record = {"v": STATE_VERSION, "seq": self._seq, "ts": round(time.time(), 3), "reason": reason, "state": state}
+            line = json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+            if self._wal is None:
+                self._wal = open(self.wal_path, "a", encoding="utf-8")
+            self._wal.write(f"{zlib.crc32(line.encode()):08x} {line}\n")
+            self._wal.flush()
+            if sync:
+                os.fsync(self._wal.fileno())
+            self._last = state
+            self._wal_records += 1
+            self.writes += 1
+            if self._wal_records >= self.compact_every:
+                self._compact(record)
+            return True
+
+    def _compact(self, record):
+        """Снимок последнего состояния (атомарно) и пустой WAL"""
+        tmp = self.path + ".tmp"
+        if self._wal is None:
+            self._wal = open(self.wal_path, "a", encoding="utf-8")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f, separators=(",", ":"), ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._wal.truncate(0)
+        self._wal.seek(0)
+        os.fsync(self._wal.fileno())
+        self._wal_records = 0
+        self.compactions += 1
+
+    def close(self):
+        with self._lock:
+            if self._wal:
+                self._wal.close()
+                self._wal = None
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Загрузка
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def load(self):
+        """Последняя целая запись {"v", "seq", "ts", "reason", "state"} или None"""
+        record = None
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            self._log(f"⚠️ State snapshot unreadable: {e}")
+
+        records, torn = 0, 0
+        try:
+            with open(self.wal_path, encoding="utf-8") as f:
+                for raw in f:
+                    crc, _, line = raw.rstrip("\n").partition(" ")
+                    try:
+                        if int(crc, 16) != zlib.crc32(line.encode()):
+                            raise ValueError("crc mismatch")
+                        entry = json.loads(line)
+                    except ValueError:
+                        torn += 1
+                        continue
+                    records += 1
+                    if record is None or entry["seq"] > record["seq"]:
+                        record = entry
+        except FileNotFoundError:
+            pass
+
+        if record is None:
+            return None
+        if record.get("v") != STATE_VERSION:
+            self._log(f"⚠️ State version {record.get('v')} != {STATE_VERSION}, ignored")
+            return None
+        self._seq = record["seq"]
+        self._last = record["state"]
+        self._wal_records = records
+        if torn:
+            # Оборванный хвост без перевода строки склеился бы со следующей записью
+            self._log(f"⚠️ State WAL: {torn} torn record(s) skipped, compacted")
+            with self._lock:
+                self._compact(record)
+        return record
+
+    def stats(self):
+        return {"seq": self._seq, "writes": self.writes, "wal_records": self._wal_records,
+                "compactions": self.compactions}
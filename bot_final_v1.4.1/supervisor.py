@@ -0,0 +1,915 @@
+"""
+🧩 SUPERVISOR
+Процесс на символ (python main.py --supervisor): индикаторы и сигналы каждого
+символа считаются в своём процессе и не делят GIL с остальными.
+Родитель один раз получает тикеры и свечи и публикует их в shared memory
+(кольцевые буферы свечей, таблица тикеров) - воркеры читают без копирования,
+согласованность - seqlock (нечётный seq = идёт запись).
+В родителе: опрос и отправка Telegram, общий дашборд, баланс, метрики,
+перезапуск упавших воркеров с растущей паузой. Глобальные лимиты портфеля -
+таблица RiskBoard в shared memory под общим multiprocessing.Lock.
+Перезапущенный воркер восстанавливает позицию из чекпоинта (state_store.py)
+"""
+
+import os
+import time
+import queue
+import signal
+import logging
+import itertools
+import threading
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import (
+    PORTFOLIO_SYMBOLS, PORTFOLIO_MAX_POSITIONS, PORTFOLIO_MAX_MARGIN_PCT, PORTFOLIO_BALANCE_TTL,
+    SUPERVISOR_CANDLES, SUPERVISOR_RING_CAPACITY, SUPERVISOR_FEED_INTERVAL, SUPERVISOR_REPORT_INTERVAL,
+    SUPERVISOR_RESTART_BACKOFF, SUPERVISOR_RESTART_MAX_BACKOFF, SUPERVISOR_STABLE_UPTIME,
+    RISK_WATCHER_ENABLED, RISK_WATCHER_INTERVAL, RISK_WATCHER_REST_INTERVAL, LOOP_INTERVAL_MIN,
+    BLACKBOX_FILE, METRICS_ENABLED,
+    SymbolConfig, Col,
+)
+from blackbox import BlackboxWriter
+from trade_journal import TradeJournal
+from log_pipeline import setup_logging, setup_worker_logging, listen_worker_logs
+from scheduler import Scheduler
+from trading_bot import HybridTradingBot
+from portfolio import SymbolTelegram, PORTFOLIO_MARGIN, PORTFOLIO_POSITIONS
+from metrics import (
+    METRICS, ERRORS, POSITION_SIZE, MARGIN_USED, DCA_DEPTH, BALANCE, LAST_PRICE,
+    instrument_exchange, instrument_telegram,
+)
+
+WORKER_UP = METRICS.gauge("bot_worker_up", "Worker process alive", ("symbol",))
+WORKER_RESTARTS = METRICS.counter("bot_worker_restarts_total", "Worker processes restarted after a crash", ("symbol",))
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Shared memory
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+class SharedArray:
+    """float64 массив numpy в multiprocessing.shared_memory: создаёт родитель, воркеры подключаются по имени"""
+
+    def __init__(self, name, shape, create=False):
+        size = int(np.prod(shape)) * 8
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.array = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+        if create:
+            self.array.fill(0.0)
+
+    def close(self, unlink=False):
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Жив view (DataFrame воркера) - память освободится при выходе процесса
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class CandleRing:
+    """
+    Кольцевой буфер свечей [timestamp, open, high, low, close, volume] одного символа.
+    Каждый слот записан дважды (i и i + capacity), поэтому последние N свечей -
+    всегда непрерывный срез: view() отдаёт его без копии. Строка 0 - заголовок
+    [seq, всего записано, время записи]. Писатель один - родитель
+    """
+
+    def __init__(self, name, capacity=SUPERVISOR_RING_CAPACITY, create=False):
+        self.capacity = capacity
+        self._mem = SharedArray(name, (2 * capacity + 1, 6), create)
+        self._header = self._mem.array[0]
+        self._data = self._mem.array[1:]
+
+    @property
+    def seq(self):
+        return int(self._header[0])
+
+    @property
+    def total(self):
+        return int(self._header[1])
+
+    @property
+    def last_ts(self):
+        total = self.total
+        return self._data[(total - 1) % self.capacity, 0] if total else None
+
+    def write(self, rows, written_at=None):
+        """Upsert по timestamp: та же свеча перезаписывается, новые добавляются, старые пропускаются"""
+        header, data, cap = self._header, self._data, self.capacity
+        header[0] += 1  # Нечётный - запись идёт
+        try:
+            total = int(header[1])
+            last_ts = data[(total - 1) % cap, 0] if total else None
+            for row in rows:
+                ts = float(row[0])
+                if last_ts is not None and ts < last_ts:
+                    continue
+                if ts == last_ts:
+                    slot = (total - 1) % cap
+                else:
+                    slot = total % cap
+                    total += 1
+                data[slot] = row[:6]
+                data[slot + cap] = row[:6]
+                last_ts = ts
+            header[1] = total
+            header[2] = written_at or time.time()
+        finally:
+            header[0] += 1
+
+    def view(self, n=SUPERVISOR_CANDLES):
+        """(seq, последние n свечей без копии, время записи) или None, если идёт запись / данных нет"""
+        seq = self.seq
+        total = self.total
+        if seq % 2 or total < 3:
+            return None
+        n = min(n, total, self.capacity - 1)  # Срез не пересекается со слотом следующей записи
+        end = total % self.capacity + self.capacity
+        return seq, self._data[end - n:end], float(self._header[2])
+
+    def stable(self, seq):
+        """Данные не менялись с view(seq) - результат посчитан по согласованному срезу"""
+        return self.seq == seq
+
+    def close(self, unlink=False):
+        self._header = self._data = None
+        self._mem.close(unlink)
+
+
+class TickerBoard:
+    """Последние тикеры всех символов: строка [seq, last, bid, ask, ts] на символ"""
+
+    def __init__(self, name, count, create=False):
+        self._mem = SharedArray(name, (count, 5), create)
+        self._rows = self._mem.array
+
+    def write(self, index, ticker):
+        row = self._rows[index]
+        row[0] += 1
+        row[1] = float(ticker.get('last') or 0.0)
+        row[2] = float(ticker.get('bid') or 0.0)
+        row[3] = float(ticker.get('ask') or 0.0)
+        row[4] = (ticker.get('timestamp') or time.time() * 1000) / 1000
+        row[0] += 1
+
+    def read(self, index):
+        """(last, bid, ask, ts) или None"""
+        row = self._rows[index]
+        for _ in range(3):
+            seq = row[0]
+            if seq % 2 == 0:
+                value = (float(row[1]), float(row[2]), float(row[3]), float(row[4]))
+                if row[0] == seq:
+                    return value if value[0] else None
+        return None
+
+    def close(self, unlink=False):
+        self._rows = None
+        self._mem.close(unlink)
+
+
+class RiskBoard:
+    """
+    Риск портфеля поверх процессов. Строка 0 - [баланс, время]; строка 1+i - воркер i:
+    [активен (позиция или вход), занятая маржа, в позиции, время обновления].
+    Проверка лимита и резерв маржи - под общим multiprocessing.Lock
+    """
+
+    def __init__(self, name, count, lock, create=False):
+        self.lock = lock
+        self._mem = SharedArray(name, (count + 1, 4), create)
+        self._rows = self._mem.array
+
+    @property
+    def balance(self):
+        return float(self._rows[0, 0])
+
+    def set_balance(self, balance):
+        self._rows[0, 0] = balance
+        self._rows[0, 1] = time.time()
+
+    def publish(self, index, active, margin, in_position):
+        self._rows[index + 1] = (float(active), margin, float(in_position), time.time())
+
+    def totals(self, exclude=None):
+        """(активных, маржа) по всем воркерам, кроме exclude"""
+        rows = np.delete(self._rows[1:], exclude, axis=0) if exclude is not None else self._rows[1:]
+        return int(rows[:, 0].sum()), float(rows[:, 1].sum())
+
+    def positions(self):
+        return int(self._rows[1:, 2].sum())
+
+    def close(self, unlink=False):
+        self._rows = None
+        self._mem.close(unlink)
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Воркер (отдельный процесс)
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+class WorkerTelegram:
+    """
+    Telegram воркера: вызовы уходят родителю, он один отправляет и опрашивает.
+    send() возвращает ссылку, которую родитель сопоставляет с message_id для edit_message
+    """
+
+    def __init__(self, outbox, asset, chat_id):
+        self.chat_id = chat_id
+        self._outbox = outbox
+        self._asset = asset
+        self._refs = itertools.count(1)
+        self._pid = os.getpid()
+
+    def send(self, message, keyboard=None):
+        ref = f"{self._asset}:{self._pid}:{next(self._refs)}"
+        self._outbox.put(("tg", self._asset, "send", (message, keyboard), ref))
+        return ref
+
+    def edit_message(self, message_id, text, keyboard=None):
+        self._outbox.put(("tg", self._asset, "edit_message", (message_id, text, keyboard), None))
+        return True
+
+    def get_updates(self, timeout=0):
+        return []
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args):
+            self._outbox.put(("tg", self._asset, name, args, None))
+        return call
+
+
+class WorkerSpec:
+    """Всё, что нужно процессу символа (передаётся в spawn - должно пиклиться)"""
+
+    def __init__(self, index, symbol, overrides, primary, names, lock, commands, outbox, log_queue,
+                 exchange_factory, chat_id, count):
+        self.index = index
+        self.symbol = symbol
+        self.overrides = overrides
+        self.primary = primary              # AI отчёт, вопросы и /profile без символа
+        self.names = names                  # Имена shared memory: candles / tickers / board
+        self.lock = lock
+        self.commands = commands            # Родитель -> воркер
+        self.outbox = outbox                # Воркер -> родитель (Telegram, отчёты)
+        self.log_queue = log_queue
+        self.exchange_factory = exchange_factory
+        self.chat_id = chat_id
+        self.count = count
+
+
+class SymbolWorker:
+    """
+    HybridTradingBot символа в своём процессе. Для бота - это его portfolio:
+    баланс и лимиты из RiskBoard, дашборд - отчёт родителю
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.index = spec.index
+        self.asset = spec.symbol.split('/')[0]
+        self.candles = CandleRing(spec.names["candles"])
+        self.tickers = TickerBoard(spec.names["tickers"], spec.count)
+        self.board = RiskBoard(spec.names["board"], spec.count, spec.lock)
+        root, ext = os.path.splitext(BLACKBOX_FILE)
+        self.blackbox = BlackboxWriter(f"{root}_{self.asset}{ext}")
+        self.journal = TradeJournal()  # SQLite WAL - общий файл для всех процессов
+        self._stop = threading.Event()
+        self._last_report = 0.0
+
+        self.bot = HybridTradingBot(spec.exchange_factory(), WorkerTelegram(spec.outbox, self.asset, spec.chat_id),
+                                    spec.symbol, spec.overrides, portfolio=self)
+        self.bot.risk_watcher.source = "shm"
+        s = self.bot.scheduler
+        s.every("doctor", 20, self.bot._doctor_job, priority=1, deadline=10)
+        if spec.primary and self.bot.has_ai:
+            s.daily("ai_report", 15, 0, lambda: self.bot._generate_and_send_ai_report(False), pool=True)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Интерфейс portfolio для HybridTradingBot
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def get_balance(self, force=False):
+        return self.board.balance
+
+    def allow_entry(self, bot, entry_usd):
+        """Лимиты портфеля по всем процессам; при успехе маржа входа сразу резервируется в RiskBoard"""
+        with self.board.lock:
+            active, committed = self.board.totals(exclude=self.index)
+            if active >= PORTFOLIO_MAX_POSITIONS:
+                detail = f"{active}/{PORTFOLIO_MAX_POSITIONS} positions open"
+            else:
+                needed = bot.committed_margin(entry_usd)
+                limit = self.board.balance * PORTFOLIO_MAX_MARGIN_PCT
+                if committed + needed <= limit:
+                    self.board.publish(self.index, True, needed, bot.in_position)
+                    return True
+                detail = f"margin ${committed:.2f} + ${needed:.2f} > ${limit:.2f}"
+        bot.log(f"🗂️ Entry blocked by portfolio limit: {detail}", Col.YELLOW)
+        return False
+
+    def update_dashboard(self, force=False):
+        self.report(force)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Данные из shared memory
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def market_data(self):
+        """(df, seq, время записи): индикаторы по view буфера, пересчёт, если родитель писал во время расчёта"""
+        for _ in range(3):
+            view = self.candles.view()
+            if view is None:
+                time.sleep(0.01)
+                continue
+            seq, rows, written_at = view
+            df = self.bot.build_market_df(rows, stable=lambda: self.candles.stable(seq))
+            if df is not None:
+                return df, seq, written_at
+        return None, None, None
+
+    def _risk_loop(self):
+        """Цены risk watcher'а - из таблицы тикеров, без своих запросов к бирже"""
+        last_ts = None
+        while not self._stop.wait(RISK_WATCHER_INTERVAL):
+            if not self.bot.in_position:
+                continue
+            tick = self.tickers.read(self.index)
+            if tick and tick[3] != last_ts:
+                last_ts = tick[3]
+                self.bot.risk_watcher.on_price(tick[0])
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Связь с родителем
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def publish(self):
+        bot = self.bot
+        self.board.publish(self.index, bot.in_position or bot.execution.busy, bot.committed_margin(), bot.in_position)
+
+    def report(self, force=False):
+        """Состояние для дашборда и метрик родителя"""
+        bot = self.bot
+        self._last_report = time.time()
+        snap, price = bot.snapshot, bot.last_price  # Может вызываться из потока risk watcher
+        pos, session = snap.position, snap.session
+        self.spec.outbox.put(("status", self.asset, {
+            "symbol": bot.symbol,
+            "pid": os.getpid(),
+            "in_position": pos.in_position,
+            "entering": bot.execution.busy,
+            "side": pos.side,
+            "safety_count": pos.safety_count,
+            "safety_max": bot.cfg.SAFETY_ORDERS_COUNT,
+            "leverage": bot.cfg.LEVERAGE,
+            "size": pos.size,
+            "avg_price": pos.avg_price,
+            "last_price": price,
+            "unrealized": pos.unrealized(price),
+            "margin": bot.committed_margin(),
+            "pnl": session.pnl,
+            "wins": session.wins,
+            "losses": session.losses,
+            "trades": session.trades_today,
+            "volatility": snap.market.atr_pct,
+            "trailing": pos.trailing_active,
+            "trading_active": session.trading_active,
+            "graceful_stop": session.graceful_stop,
+        }, force))
+
+    def handle_command(self, cmd):
+        bot = self.bot
+        kind = cmd[0]
+        if kind == "stop":
+            bot.running = False
+        elif kind == "update":
+            bot.handle_update(cmd[1])
+        elif kind == "callback":
+            value = cmd[1]
+            if value == "start_bot":
+                bot.trading_active = True
+                bot.graceful_stop_mode = False
+            elif value == "graceful_stop":
+                bot.graceful_stop_mode = True
+                if not bot.in_position:
+                    bot.trading_active = False
+                    bot.graceful_stop_mode = False
+            elif value == "cancel_stop":
+                bot.graceful_stop_mode = False
+            elif value == "panic_sell":
+                bot.execution.cancel()
+                bot.close_position_market("Panic Sell")
+            elif value == "ai_report":
+                bot.trigger_ai_report_thread(manual=True)
+            self.report()
+
+    def _wait_commands(self, timeout):
+        """Пауза цикла = ожидание команды родителя (команды прерывают паузу)"""
+        deadline = time.time() + timeout
+        while self.bot.running:
+            try:
+                cmd = self.spec.commands.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                return
+            self.handle_command(cmd)
+            if time.time() >= deadline:
+                return
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Цикл
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def run(self):
+        bot = self.bot
+        df, seq, data_received = None, None, None
+        candle_ts = None
+        if RISK_WATCHER_ENABLED:
+            threading.Thread(target=self._risk_loop, name="risk-shm", daemon=True).start()
+
+        while bot.running:
+            try:
+                bot.profiler.poll()
+                tick = self.tickers.read(self.index)
+                if tick:
+                    bot.last_price = tick[0]
+
+                check_entry = False
+                if self.candles.seq != seq:
+                    fresh, fresh_seq, written_at = self.market_data()
+                    if fresh is not None:
+                        df, seq, data_received = fresh, fresh_seq, written_at
+                        # Сигнал - один раз на закрытую свечу (iloc[-1] - открывшаяся).
+                        # Первая свеча после (пере)запуска - без входа: позицию сначала найдёт Doctor
+                        check_entry = candle_ts is not None and df['timestamp'].iloc[-1] != candle_ts
+                        candle_ts = df['timestamp'].iloc[-1]
+
+                if df is not None:
+                    bot.step(df, data_received, check_entry=check_entry)
+                self.publish()
+                if time.time() - self._last_report >= SUPERVISOR_REPORT_INTERVAL:
+                    self.report()
+            except Exception as e:
+                ERRORS.inc(source="loop")
+                bot.log(f"⚠️ Worker iteration error: {e}", Col.YELLOW)
+                bot.log_debug(traceback.format_exc())
+            try:
+                wait = bot.next_loop_interval()
+            except Exception:
+                wait = LOOP_INTERVAL_MIN
+            self._wait_commands(wait)
+
+        self._stop.set()
+        bot.shutdown()
+        self.publish()
+        self.report()
+        self.journal.close()
+        self.blackbox.close()
+        for mem in (self.candles, self.tickers, self.board):
+            mem.close()
+
+
+def worker_main(spec):
+    """Точка входа процесса символа"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C обрабатывает родитель и останавливает воркеры
+    setup_worker_logging(spec.log_queue)
+    SymbolWorker(spec).run()
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Родитель
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+class WorkerHandle:
+    def __init__(self, index, symbol, overrides):
+        self.index = index
+        self.symbol = symbol
+        self.asset = symbol.split('/')[0]
+        self.overrides = overrides
+        self.timeframe = SymbolConfig(overrides).TIMEFRAME
+        self.process = None
+        self.commands = None
+        self.started = 0.0
+        self.restarts = 0
+        self.backoff = SUPERVISOR_RESTART_BACKOFF
+        self.restart_at = None
+        self.next_candles = 0.0
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+class MarketFeed:
+    """
+    Поток родителя: fetch_tickers на все символы (в позиции - каждые RISK_WATCHER_REST_INTERVAL),
+    свечи - после закрытия (только недостающие), баланс - раз в PORTFOLIO_BALANCE_TTL
+    """
+
+    def __init__(self, supervisor):
+        self.sup = supervisor
+        self._stop = threading.Event()
+        self._thread = None
+        self._balance_at = 0.0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def refresh_balance(self, force=False):
+        if not force and time.time() - self._balance_at < PORTFOLIO_BALANCE_TTL:
+            return
+        try:
+            bal = self.sup.exchange.fetch_balance({'type': 'swap'})
+            if 'USDT' in bal:
+                self.sup.board.set_balance(float(bal['USDT']['total']))
+            self._balance_at = time.time()
+        except Exception as e:
+            self.sup.log_debug("Supervisor balance error: %s", e)
+
+    def refresh_tickers(self):
+        sup = self.sup
+        try:
+            tickers = sup.exchange.fetch_tickers(sup.symbols)
+        except Exception as e:
+            sup.log_debug("Supervisor tickers error: %s", e)
+            return
+        for w in sup.workers.values():
+            ticker = tickers.get(w.symbol)
+            if ticker and ticker.get('last'):
+                sup.tickers.write(w.index, ticker)
+
+    def refresh_candles(self, force=False):
+        sup = self.sup
+        now = time.time()
+        for w in sup.workers.values():
+            if not force and now < w.next_candles:
+                continue
+            ring = sup.candles[w.symbol]
+            tf_sec = sup.exchange.parse_timeframe(w.timeframe)
+            last_ts = ring.last_ts
+            # Только свечи после последней в буфере (+ её окончательная версия)
+            missing = int((now - last_ts / 1000) // tf_sec) + 2 if last_ts else SUPERVISOR_CANDLES
+            try:
+                ohlcv = sup.exchange.fetch_ohlcv(w.symbol, w.timeframe, limit=min(missing, SUPERVISOR_CANDLES))
+            except Exception as e:
+                sup.log_debug("Supervisor candles error %s: %s", w.symbol, e)
+                continue
+            if ohlcv:
+                ring.write(ohlcv, time.time())
+                w.next_candles = (now // tf_sec + 1) * tf_sec + 1.0
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_tickers()
+                self.refresh_candles()
+                self.refresh_balance()
+            except Exception as e:
+                ERRORS.inc(source="feed")
+                self.sup.log(f"⚠️ Market feed error: {e}", Col.YELLOW)
+            interval = RISK_WATCHER_REST_INTERVAL if self.sup.board.positions() else SUPERVISOR_FEED_INTERVAL
+            self._stop.wait(interval)
+
+
+class Supervisor:
+    def __init__(self, exchange_factory, telegram_bot, symbols=PORTFOLIO_SYMBOLS):
+        """
+        exchange_factory - функция без аргументов, создающая ccxt биржу (своя в каждом процессе,
+        передаётся в spawn - должна пиклиться, например functools.partial(ccxt.bingx, {...}))
+        """
+        self.exchange_factory = exchange_factory
+        exchange = exchange_factory()
+        self.exchange = instrument_exchange(exchange) if METRICS_ENABLED else exchange
+        self.tg = instrument_telegram(telegram_bot) if METRICS_ENABLED else telegram_bot
+        self.logger = setup_logging()
+        self.ctx = mp.get_context("spawn")  # Без fork: в родителе уже работают потоки
+        self.scheduler = Scheduler(log_fn=lambda msg: self.log(msg, Col.YELLOW))
+        self.running = True
+        self.dashboard_msg_id = None
+        self._dashboard_lock = threading.Lock()  # Поток outbox / пул планировщика / команды (post_dashboard)
+        self.last_dashboard_update = 0
+        self.start_balance = 0.0
+
+        self.workers = {symbol: WorkerHandle(i, symbol, overrides)
+                        for i, (symbol, overrides) in enumerate(symbols.items())}
+        self.symbols = list(self.workers)
+        self.primary = self.workers[self.symbols[0]]
+        self.status = {}                       # asset -> последний отчёт воркера
+        self._msg_refs = {}                    # ссылка воркера -> message_id Telegram
+        self._symbol_tg = {w.asset: SymbolTelegram(self.tg, w.asset) for w in self.workers.values()}
+
+        prefix = f"ubtc{os.getpid()}"
+        count = len(self.workers)
+        self.lock = self.ctx.Lock()
+        self.candles = {symbol: CandleRing(f"{prefix}_c{w.index}", create=True) for symbol, w in self.workers.items()}
+        self.tickers = TickerBoard(f"{prefix}_t", count, create=True)
+        self.board = RiskBoard(f"{prefix}_r", count, self.lock, create=True)
+        self._names = {symbol: {"candles": self.candles[symbol]._mem.name, "tickers": self.tickers._mem.name,
+                                "board": self.board._mem.name} for symbol in self.symbols}
+
+        self.outbox = self.ctx.Queue()
+        self.log_queue = self.ctx.Queue()
+        self.log_listener = listen_worker_logs(self.log_queue)
+        self.feed = MarketFeed(self)
+        self._outbox_thread = threading.Thread(target=self._outbox_loop, name="supervisor-outbox", daemon=True)
+
+        s = self.scheduler
+        s.every("dashboard", 15, self.update_dashboard, jitter=1.0, priority=5, pool=True)
+        METRICS.add_collector(self._collect_metrics, key="supervisor")
+        self.log(f"🧩 Supervisor: {', '.join(w.asset for w in self.workers.values())} | "
+                 f"{count} processes on {os.cpu_count()} CPUs", Col.GREEN)
+
+    def log(self, msg, color=Col.WHITE, *args, category=None):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, *args, extra={"color": color, "category": category})
+
+    def log_debug(self, msg, *args):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, *args)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Процессы
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _spawn(self, w):
+        w.commands = self.ctx.Queue()  # Новая очередь: команды мёртвого процесса не доставляются
+        spec = WorkerSpec(w.index, w.symbol, w.overrides, w is self.primary, self._names[w.symbol], self.lock,
+                          w.commands, self.outbox, self.log_queue, self.exchange_factory,
+                          getattr(self.tg, 'chat_id', None), len(self.workers))
+        w.process = self.ctx.Process(target=worker_main, args=(spec,), name=f"worker-{w.asset}", daemon=True)
+        w.process.start()
+        w.started = time.time()
+        w.restart_at = None
+        self.log(f"🧩 Worker {w.asset} started (pid {w.process.pid})", Col.CYAN)
+
+    def _supervise(self):
+        """Перезапуск упавших воркеров: пауза удваивается, сбрасывается после стабильной работы"""
+        now = time.time()
+        for w in self.workers.values():
+            if w.alive:
+                if w.backoff > SUPERVISOR_RESTART_BACKOFF and now - w.started > SUPERVISOR_STABLE_UPTIME:
+                    w.backoff = SUPERVISOR_RESTART_BACKOFF
+                continue
+            if w.restart_at is None:
+                code = w.process.exitcode if w.process else None
+                w.restart_at = now + w.backoff
+                ERRORS.inc(source="worker")
+                self.log(f"💥 Worker {w.asset} died (exit {code}), restart in {w.backoff:.0f}s", Col.RED)
+                self.tg.send(f"💥 Worker <b>{w.asset}</b> died (exit {code}), restart in {w.backoff:.0f}s")
+                w.backoff = min(w.backoff * 2, SUPERVISOR_RESTART_MAX_BACKOFF)
+            elif now >= w.restart_at:
+                w.restarts += 1
+                WORKER_RESTARTS.inc(symbol=w.symbol)
+                self._spawn(w)
+
+    def send_command(self, w, *cmd):
+        if w.alive:
+            w.commands.put(cmd)
+
+    def _outbox_loop(self):
+        """Сообщения воркеров: Telegram от имени символа и отчёты о состоянии"""
+        while True:
+            try:
+                item = self.outbox.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            try:
+                if item[0] == "status":
+                    _, asset, status, force = item
+                    self.status[asset] = status
+                    if force:
+                        self.update_dashboard(force=True)
+                elif item[0] == "tg":
+                    self._forward_telegram(*item[1:])
+            except Exception as e:
+                self.log_debug("Supervisor outbox error: %s", e)
+
+    def _forward_telegram(self, asset, method, args, ref):
+        tg = self._symbol_tg[asset]
+        if method == "send":
+            message_id = tg.send(*args)
+            if ref:
+                self._msg_refs[ref] = message_id
+                if len(self._msg_refs) > 1000:
+                    for old in list(self._msg_refs)[:500]:
+                        del self._msg_refs[old]
+        elif method == "edit_message":
+            message_id = self._msg_refs.get(args[0], args[0])
+            tg.edit_message(message_id, *args[1:])
+        else:
+            getattr(tg, method)(*args)
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Telegram и дашборд
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    @property
+    def trading_active(self):
+        return any(st.get("trading_active") for st in self.status.values())
+
+    @property
+    def graceful_stop_mode(self):
+        return any(st.get("graceful_stop") for st in self.status.values())
+
+    def get_keyboard(self):
+        # Та же клавиатура, состояние - по отчётам воркеров
+        return HybridTradingBot.get_keyboard(self)
+
+    def check_telegram_commands(self, poll_timeout=0):
+        deadline = time.time() + poll_timeout
+        updates = self.tg.get_updates(timeout=poll_timeout)
+        if not updates and deadline > time.time():
+            time.sleep(deadline - time.time())
+        for up in updates:
+            self.handle_update(up)
+
+    def handle_update(self, up):
+        """Кнопки - всем воркерам; текстовые команды - воркеру символа из последнего слова (/jobs ETH)"""
+        if up['type'] == 'callback':
+            value = up['value']
+            if value == "balance":
+                self.feed.refresh_balance(force=True)
+            elif value == "ai_report":
+                self.send_command(self.primary, "callback", value)
+            elif value != "refresh":
+                for w in self.workers.values():
+                    self.send_command(w, "callback", value)
+            self.update_dashboard(force=True)
+
+        elif up['type'] == 'text':
+            text = up['value'].strip()
+            if text.startswith('/workers'):
+                self.tg.send(f"🧩 <b>Workers</b>\n<pre>{self.format_workers()}</pre>")
+            elif text.startswith('/portfolio'):
+                self.tg.send(f"🗂️ <b>Portfolio</b>\n<pre>{self.format_stats()}</pre>")
+            else:
+                self.send_command(self._route(text), "update", up)
+
+    def _route(self, text):
+        parts = text.split()
+        if text.startswith('/') and len(parts) > 1:
+            for w in self.workers.values():
+                if w.asset.upper() == parts[-1].upper():
+                    return w
+        return self.primary
+
+    def format_workers(self):
+        now = time.time()
+        lines = []
+        for w in self.workers.values():
+            if w.alive:
+                state = f"pid {w.process.pid} up {(now - w.started) / 60:.0f}m"
+            elif w.restart_at:
+                state = f"DOWN, restart in {max(0, w.restart_at - now):.0f}s"
+            else:
+                state = "DOWN"
+            lines.append(f"{w.asset}: {state} restarts={w.restarts}")
+        return "\n".join(lines)
+
+    def format_stats(self):
+        lines = []
+        for w in self.workers.values():
+            st = self.status.get(w.asset)
+            if not st:
+                lines.append(f"{w.asset}: no report")
+                continue
+            state = (f"{st['side']} DCA {st['safety_count']}/{st['safety_max']}" if st["in_position"]
+                     else "entry..." if st["entering"] else "flat")
+            lines.append(f"{w.asset}: x{st['leverage']} {state} margin=${st['margin']:.2f} "
+                         f"pnl=${st['pnl']:+.2f} trades={st['trades']}")
+        return "\n".join(lines)
+
+    def update_dashboard(self, force=False):
+        """📊 Один дашборд по отчётам всех воркеров"""
+        now = time.time()
+        if not force and (now - self.last_dashboard_update < 15): return
+        self.last_dashboard_update = now
+
+        statuses = [(w, self.status.get(w.asset)) for w in self.workers.values()]
+        reported = [st for _, st in statuses if st]
+        balance = self.board.balance
+        pnl = sum(st["pnl"] for st in reported)
+        wins = sum(st["wins"] for st in reported)
+        losses = sum(st["losses"] for st in reported)
+        committed = sum(st["margin"] for st in reported)
+        positions = sum(1 for st in reported if st["in_position"])
+        alive = sum(1 for w in self.workers.values() if w.alive)
+
+        status_icon, status_text = ("🟢", "ACTIVE") if self.trading_active else ("🔴", "STOPPED")
+        if self.graceful_stop_mode:
+            status_icon, status_text = "🟡", "STOPPING..."
+
+        dash = f"""╔══════════════════════════════
+║ 🧩 <b>SUPERVISOR</b> {status_icon} {status_text}
+╠══════════════════════════════
+║ 💰 Баланс: <b>${balance:.2f}</b> ({balance - self.start_balance:+.2f}$)
+║ 📊 PnL: <b>${pnl:+.2f}</b> | W:{wins} / L:{losses}
+║ 🧮 Маржа: ${committed:.2f} / ${balance * PORTFOLIO_MAX_MARGIN_PCT:.2f}
+║ 📍 Позиций: {positions}/{PORTFOLIO_MAX_POSITIONS} | ⚙️ Процессов: {alive}/{len(self.workers)}
+╠══════════════════════════════
+"""
+        for w, st in statuses:
+            if not w.alive:
+                dash += f"║ 💥 <b>{w.asset}</b> DOWN (restarts {w.restarts})\n"
+            elif not st:
+                dash += f"║ ⏳ {w.asset} starting...\n"
+            elif st["in_position"]:
+                icon = "📈" if st["side"] == "Buy" else "📉"
+                trail = " 🎯" if st["trailing"] else ""
+                dash += (f"║ {icon} <b>{w.asset}</b> ${st['unrealized']:+.2f} | "
+                         f"DCA {st['safety_count']}/{st['safety_max']}{trail}\n")
+            elif st["entering"]:
+                dash += f"║ ⚡ <b>{w.asset}</b> вход...\n"
+            else:
+                dash += f"║ 💤 {w.asset} ${st['last_price']:.4g} | ATR {st['volatility']*100:.3f}%\n"
+        dash += "╚══════════════════════════════"
+
+        HybridTradingBot.post_dashboard(self, dash)
+
+    def _collect_metrics(self):
+        for w in self.workers.values():
+            WORKER_UP.set(1 if w.alive else 0, symbol=w.symbol)
+            st = self.status.get(w.asset)
+            if st:
+                POSITION_SIZE.set(st["size"], symbol=w.symbol)
+                MARGIN_USED.set(st["avg_price"] * st["size"] / st["leverage"], symbol=w.symbol)
+                DCA_DEPTH.set(st["safety_count"] if st["in_position"] else 0, symbol=w.symbol)
+                LAST_PRICE.set(st["last_price"], symbol=w.symbol)
+        BALANCE.set(self.board.balance)
+        PORTFOLIO_MARGIN.set(round(sum(st["margin"] for st in self.status.values()), 2))
+        PORTFOLIO_POSITIONS.set(self.board.positions())
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Главный цикл
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def run(self):
+        # Данные и баланс - до старта воркеров: первый же цикл символа видит свечи
+        self.feed.refresh_balance(force=True)
+        self.start_balance = self.board.balance
+        self.feed.refresh_tickers()
+        self.feed.refresh_candles(force=True)
+        self.feed.start()
+        self._outbox_thread.start()
+        for w in self.workers.values():
+            self._spawn(w)
+
+        try:
+            while self.running:
+                try:
+                    self.check_telegram_commands(poll_timeout=LOOP_INTERVAL_MIN)
+                    self._supervise()
+                    self.scheduler.run_pending()
+                except Exception as e:
+                    ERRORS.inc(source="loop")
+                    self.log(f"⚠️ Supervisor iteration error: {e}", Col.YELLOW)
+                    self.log_debug(traceback.format_exc())
+                    time.sleep(LOOP_INTERVAL_MIN)
+        except KeyboardInterrupt:
+            self.log("🛑 Supervisor: stopping workers...", Col.YELLOW)
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout=15):
+        self.running = False
+        METRICS.remove_collector("supervisor", self._collect_metrics)
+        for w in self.workers.values():
+            self.send_command(w, "stop")
+        deadline = time.time() + timeout
+        for w in self.workers.values():
+            if w.process:
+                w.process.join(max(0.1, deadline - time.time()))
+                if w.process.is_alive():
+                    self.log(f"⚠️ Worker {w.asset} did not stop, terminating", Col.YELLOW)
+                    w.process.terminate()
+                    w.process.join(2)
+        self.feed.stop()
+        self.scheduler.shutdown()
+        if self._outbox_thread.is_alive():
+            self.outbox.put(None)
+            self._outbox_thread.join(timeout=5)
+        self.log_listener.stop()
+        for ring in self.candles.values():
+            ring.close(unlink=True)
+        self.tickers.close(unlink=True)
+        self.board.close(unlink=True)
@@ -18,9 +18,7 @@ class TelegramBot:
     
     def _clear_updates(self):
         try:
-            updates = self.get_updates()
-            if updates:
-                self.offset = updates[-1]['id'] + 1
+            self.get_updates()  # offset сдвигается внутри get_updates
         except: pass
 
     def send(self, message, keyboard=None):
@@ -48,29 +46,34 @@ class TelegramBot:
             return resp.json().get('ok', False)
         except: return False
     
-    def get_updates(self):
+    def get_updates(self, timeout=5):
+        """Long polling: ждёт до timeout сек, возвращается сразу при новых апдейтах"""
         if not self.token: return []
         try:
-            resp = requests.get(f"https://api.telegram.org/bot{self.token}/getUpdates", params={"offset": self.offset, "timeout": 5}, timeout=10)
+            resp = requests.get(f"https://api.telegram.org/bot{self.token}/getUpdates", params={"offset": self.offset, "timeout": int(timeout)}, timeout=int(timeout) + 5)
             updates = resp.json().get('result', [])
             result = []
             for u in updates:
                 if u['update_id'] >= self.offset: self.offset = u['update_id'] + 1
                 msg = u.get('message')
                 cb = u.get('callback_query')
-                if msg:
+                # Формат, который разбирает HybridTradingBot.check_telegram_commands
+                if msg and 'text' in msg:
                     result.append({
-                        "id": u['update_id'],
-                        "text": msg.get('text', ''),
+                        "update_id": u['update_id'],
+                        "value": msg['text'],
                         "from_id": msg['from']['id'],
-                        "type": "message"
+                        "chat_id": msg['chat']['id'],
+                        "type": "text"
                     })
                 elif cb:
                     result.append({
-                        "id": u['update_id'],
-                        "data": cb['data'],
-                        "callback_id": cb['id'],
-                        "message_id": cb['message']['message_id'],
+                        "update_id": u['update_id'],
+                        "id": cb['id'],
+                        "value": cb['data'],
+                        "msg_id": cb['message']['message_id'],
+                        "from_id": cb['from']['id'],
+                        "chat_id": cb['message']['chat']['id'],
                         "type": "callback"
                     })
             return result
@@ -93,3 +96,15 @@ class TelegramBot:
         except Exception as e:
             print(f"❌ TG Photo Error: {e}")
             return None
+
+    def send_document(self, document_path, caption=""):
+        """Отправка файла (профили, выгрузки)"""
+        try:
+            with open(document_path, 'rb') as doc:
+                r = requests.post(f"https://api.telegram.org/bot{self.token}/sendDocument",
+                                data={'chat_id': self.chat_id, 'caption': caption[:1024]},
+                                files={'document': doc}, timeout=30)
+            return r.json() if r.status_code == 200 else None
+        except Exception as e:
+            print(f"❌ TG Document Error: {e}")
+            return None
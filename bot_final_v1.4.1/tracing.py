@@ -0,0 +1,106 @@
+"""
+⏱️ TRADE TRACING
+Штампы этапов реакции бота: свеча → сигнал → ордер → ack биржи → fill → следующие ордера
+Спаны пишутся в blackbox (событие TRACE с trade_id), перцентили — по скользящему окну
+"""
+
+import time
+import threading
+from collections import deque, defaultdict
+
+from config import TRACE_WINDOW
+from metrics import METRICS
+
+# Порядок этапов (любой этап можно пропустить)
+STAGES = (
+    "candle_close",     # Закрытие свечи, на которой сработал сигнал
+    "exchange_fill",    # Время fill по данным биржи (lastTradeTimestamp)
+    "data_received",    # OHLCV + индикаторы получены
+    "signal",           # check_entry_signal_hybrid вернул сигнал
+    "order_submit",     # Перед create_order
+    "exchange_ack",     # create_order вернул id
+    "fill_detected",    # Бот увидел исполнение
+    "followup_placed",  # TP/DCA/SL выставлены (или отменены после TP)
+)
+
+TRACE_SPANS = METRICS.histogram(
+    "bot_trace_span_seconds", "Reaction latency between trace stages", ("kind", "span"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+
+
+class TradeTracer:
+    def __init__(self, blackbox_fn, window=TRACE_WINDOW):
+        self._emit = blackbox_fn
+        self._active = {}
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def start(self, kind, **stage_times):
+        """Новый трейс (kind: entry / dca / tp). Заменяет незавершённый трейс того же kind"""
+        marks = {stage: float(t) for stage, t in stage_times.items() if t}
+        with self._lock:
+            self._active[kind] = marks
+
+    def mark(self, kind, stage, ts=None):
+        with self._lock:
+            marks = self._active.get(kind)
+            if marks is not None:
+                marks[stage] = ts or time.time()
+
+    def discard(self, kind):
+        with self._lock:
+            self._active.pop(kind, None)
+
+    def finish(self, kind, trade_id=None):
+        """Закрывает трейс: спаны между соседними этапами → blackbox, окно перцентилей, метрики"""
+        with self._lock:
+            marks = self._active.pop(kind, None)
+        if not marks:
+            return None
+
+        ordered = [(stage, marks[stage]) for stage in STAGES if stage in marks]
+        spans = {}
+        for (a, ta), (b, tb) in zip(ordered, ordered[1:]):
+            name = f"{a}->{b}"
+            spans[name] = round(tb - ta, 4)
+        total = round(ordered[-1][1] - ordered[0][1], 4) if len(ordered) > 1 else 0.0
+
+        with self._lock:
+            for name, value in spans.items():
+                self._samples[(kind, name)].append(value)
+            self._samples[(kind, "total")].append(total)
+        for name, value in spans.items():
+            TRACE_SPANS.observe(value, kind=kind, span=name)
+        TRACE_SPANS.observe(total, kind=kind, span="total")
+
+        self._emit("TRACE", {
+            "trade_id": trade_id,
+            "kind": kind,
+            "stages": {stage: round(t, 4) for stage, t in ordered},
+            "spans": spans,
+            "total_sec": total,
+        })
+        return spans
+
+    def summary(self):
+        """{(kind, span): {count, p50, p90, p99, max}} по последним TRACE_WINDOW трейсам"""
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items() if values}
+        result = {}
+        for key, values in samples.items():
+            n = len(values)
+            result[key] = {
+                "count": n,
+                "p50": values[int(0.50 * (n - 1))],
+                "p90": values[int(0.90 * (n - 1))],
+                "p99": values[int(0.99 * (n - 1))],
+                "max": values[-1],
+            }
+        return result
+
+    def format_summary(self):
+        lines = []
+        for (kind, span), s in sorted(self.summary().items()):
+            lines.append(f"{kind} {span}: p50={s['p50']:.2f}s p90={s['p90']:.2f}s p99={s['p99']:.2f}s (n={s['count']})")
+        return "\n".join(lines) if lines else "No traces yet"
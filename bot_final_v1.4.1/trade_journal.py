@@ -0,0 +1,322 @@
+"""
+📒 TRADE JOURNAL
+Журнал сделок в SQLite (WAL): сделки, исполнения, комиссии, funding
+Запись батчами в фоновом потоке, выгрузка в CSV, агрегаты для дашборда
+"""
+
+import csv
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from config import JOURNAL_DB_FILE, JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_INTERVAL, CSV_FILE, Col
+from log_pipeline import LOGGER_NAME
+
+# Колонки совместимые с прежним trades_hybrid.csv
+CSV_COLUMNS = ['timestamp', 'symbol', 'side', 'reason', 'pnl', 'fees', 'entry', 'exit',
+               'dca_count', 'order_type', 'volatility', 'confluence']
+
+FILL_KINDS = ('ENTRY', 'DCA', 'TP', 'SL', 'CLOSE')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    trade_id     TEXT PRIMARY KEY,
+    symbol       TEXT NOT NULL,
+    side         TEXT NOT NULL,
+    opened_at    REAL,
+    closed_at    REAL,
+    reason       TEXT,
+    pnl          REAL,
+    fees         REAL,
+    entry_price  REAL,
+    first_entry  REAL,
+    exit_price   REAL,
+    size         REAL,
+    entry_usd    REAL,
+    dca_count    INTEGER DEFAULT 0,
+    order_type   TEXT,
+    volatility   REAL,
+    confluence   INTEGER,
+    stage        INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_trades_closed_at ON trades(closed_at);
+CREATE INDEX IF NOT EXISTS idx_trades_opened_at ON trades(opened_at);
+CREATE INDEX IF NOT EXISTS idx_trades_side ON trades(side);
+CREATE INDEX IF NOT EXISTS idx_trades_reason ON trades(reason);
+CREATE INDEX IF NOT EXISTS idx_trades_confluence ON trades(confluence);
+
+CREATE TABLE IF NOT EXISTS fills (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    trade_id  TEXT NOT NULL,
+    ts        REAL NOT NULL,
+    kind      TEXT NOT NULL CHECK (kind IN ('ENTRY', 'DCA', 'TP', 'SL', 'CLOSE')),
+    level     INTEGER,
+    side      TEXT,
+    price     REAL,
+    amount    REAL,
+    fee       REAL,
+    order_id  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_fills_trade ON fills(trade_id);
+CREATE INDEX IF NOT EXISTS idx_fills_ts ON fills(ts);
+CREATE INDEX IF NOT EXISTS idx_fills_kind ON fills(kind);
+
+CREATE TABLE IF NOT EXISTS fees (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    trade_id   TEXT NOT NULL,
+    ts         REAL NOT NULL,
+    kind       TEXT NOT NULL,
+    order_id   TEXT,
+    cost       REAL NOT NULL,
+    estimated  INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_fees_trade ON fees(trade_id);
+CREATE INDEX IF NOT EXISTS idx_fees_ts ON fees(ts);
+
+CREATE TABLE IF NOT EXISTS funding (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    trade_id  TEXT,
+    ts        REAL NOT NULL,
+    rate      REAL,
+    notional  REAL,
+    cost      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_funding_trade ON funding(trade_id);
+CREATE INDEX IF NOT EXISTS idx_funding_ts ON funding(ts);
+"""
+
+_CLOSE_TRADE_SQL = """
+INSERT INTO trades (trade_id, symbol, side, closed_at, reason, pnl, fees, entry_price, exit_price,
+                    dca_count, order_type, volatility, confluence)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(trade_id) DO UPDATE SET
+    closed_at = excluded.closed_at, reason = excluded.reason, pnl = excluded.pnl,
+    fees = excluded.fees, entry_price = excluded.entry_price, exit_price = excluded.exit_price,
+    dca_count = excluded.dca_count, order_type = excluded.order_type,
+    volatility = excluded.volatility, confluence = excluded.confluence
+"""
+
+_STOP = object()
+
+
+class TradeJournal:
+    def __init__(self, path=JOURNAL_DB_FILE, batch_size=JOURNAL_BATCH_SIZE, flush_interval=JOURNAL_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self.errors = 0
+
+        # Схема создаётся синхронно, чтобы чтение работало сразу
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._thread = threading.Thread(target=self._writer_loop, name="trade-journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Запись (неблокирующая)
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def open_trade(self, trade_id, symbol, side, entry_price, size, entry_usd, confluence, stage, volatility, ts=None):
+        self._queue.put((
+            "INSERT OR IGNORE INTO trades (trade_id, symbol, side, opened_at, entry_price, first_entry, size, "
+            "entry_usd, confluence, stage, volatility) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (trade_id, symbol, side, ts or time.time(), entry_price, entry_price, size, entry_usd,
+             confluence, stage, volatility)
+        ))
+
+    def record_fill(self, trade_id, kind, side, price, amount, fee=0.0, order_id=None, level=None, ts=None, estimated_fee=False):
+        """Исполнение ENTRY/DCA/TP/SL/CLOSE + строка в fees"""
+        ts = ts or time.time()
+        order_id = str(order_id) if order_id else None
+        self._queue.put((
+            "INSERT INTO fills (trade_id, ts, kind, level, side, price, amount, fee, order_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (trade_id, ts, kind, level, side, price, amount, fee, order_id)
+        ))
+        if fee:
+            self._queue.put((
+                "INSERT INTO fees (trade_id, ts, kind, order_id, cost, estimated) VALUES (?, ?, ?, ?, ?, ?)",
+                (trade_id, ts, kind, order_id, fee, int(estimated_fee))
+            ))
+
+    def record_funding(self, trade_id, cost, rate=None, notional=None, ts=None):
+        self._queue.put((
+            "INSERT INTO funding (trade_id, ts, rate, notional, cost) VALUES (?, ?, ?, ?, ?)",
+            (trade_id, ts or time.time(), rate, notional, cost)
+        ))
+
+    def close_trade(self, trade_id, symbol, side, reason, pnl, fees, entry_price, exit_price,
+                    dca_count, order_type, volatility, confluence, ts=None):
+        self._queue.put((_CLOSE_TRADE_SQL, (
+            trade_id, symbol, side, ts or time.time(), reason, pnl, fees, entry_price, exit_price,
+            dca_count, order_type, volatility, confluence
+        )))
+
+    def flush(self, timeout=5.0):
+        """Ждём, пока фоновый поток запишет всё из очереди"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout=5.0):
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = _STOP in batch
+            ops = [op for op in batch if op is not _STOP]
+            if ops:
+                try:
+                    with conn:
+                        for sql, params in ops:
+                            conn.execute(sql, params)
+                except Exception:
+                    self._write_each(conn, ops)  # Откат пакета из-за одной записи - остальные не теряем
+            for _ in batch:
+                self._queue.task_done()
+
+            if stop:
+                conn.close()
+                return
+
+    def _write_each(self, conn, ops):
+        """Повтор откатившегося пакета по одной записи: в лог - только сбойная"""
+        for sql, params in ops:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            except Exception as e:
+                self.errors += 1
+                logging.getLogger(LOGGER_NAME).error("❌ Journal write failed (%s): %s %s", e,
+                                                     " ".join(sql.split())[:60], params, extra={"color": Col.RED})
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Чтение
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _where(since=None, until=None, side=None, reason=None, confluence=None):
+        clauses, params = ["closed_at IS NOT NULL"], []
+        if since is not None:
+            clauses.append("closed_at >= ?")
+            params.append(since.timestamp() if isinstance(since, datetime) else since)
+        if until is not None:
+            clauses.append("closed_at < ?")
+            params.append(until.timestamp() if isinstance(until, datetime) else until)
+        if side:
+            clauses.append("side = ?")
+            params.append(side)
+        if reason:
+            clauses.append("reason LIKE ?")
+            params.append(f"{reason}%")
+        if confluence is not None:
+            clauses.append("confluence = ?")
+            params.append(confluence)
+        return " AND ".join(clauses), params
+
+    def stats(self, **filters):
+        """Винрейт и PnL по закрытым сделкам (фильтры: since, until, side, reason, confluence)"""
+        where, params = self._where(**filters)
+        row = self._reader().execute(
+            f"SELECT COUNT(*) AS trades, SUM(pnl > 0) AS wins, SUM(pnl <= 0) AS losses, "
+            f"COALESCE(SUM(pnl), 0) AS pnl, COALESCE(AVG(pnl), 0) AS avg_pnl, COALESCE(SUM(fees), 0) AS fees, "
+            f"MAX(pnl) AS best, MIN(pnl) AS worst FROM trades WHERE {where}", params
+        ).fetchone()
+        result = dict(row)
+        result['wins'] = result['wins'] or 0
+        result['losses'] = result['losses'] or 0
+        result['win_rate'] = (result['wins'] / result['trades'] * 100) if result['trades'] else 0.0
+        return result
+
+    def breakdown(self, by="reason", **filters):
+        """Агрегаты по группам: reason / side / confluence / dca_count / day"""
+        group_expr = {
+            "reason": "reason",
+            "side": "side",
+            "confluence": "confluence",
+            "dca_count": "dca_count",
+            "day": "date(closed_at, 'unixepoch')",
+        }[by]
+        where, params = self._where(**filters)
+        rows = self._reader().execute(
+            f"SELECT {group_expr} AS grp, COUNT(*) AS trades, SUM(pnl > 0) AS wins, "
+            f"SUM(pnl) AS pnl, AVG(pnl) AS avg_pnl, SUM(fees) AS fees "
+            f"FROM trades WHERE {where} GROUP BY grp ORDER BY grp", params
+        ).fetchall()
+        result = []
+        for r in rows:
+            d = dict(r)
+            d['win_rate'] = (d['wins'] / d['trades'] * 100) if d['trades'] else 0.0
+            result.append(d)
+        return result
+
+    def fills(self, trade_id):
+        rows = self._reader().execute("SELECT * FROM fills WHERE trade_id = ? ORDER BY ts", (trade_id,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def export_csv(self, path=CSV_FILE, **filters):
+        """Выгрузка закрытых сделок в формате прежнего trades_hybrid.csv"""
+        where, params = self._where(**filters)
+        rows = self._reader().execute(
+            f"SELECT closed_at, symbol, side, reason, pnl, fees, entry_price, exit_price, dca_count, "
+            f"order_type, volatility, confluence FROM trades WHERE {where} ORDER BY closed_at", params
+        )
+        count = 0
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            for r in rows:
+                writer.writerow([datetime.fromtimestamp(r[0]), *r[1:]])
+                count += 1
+        return count
+
+
+if __name__ == "__main__":
+    import sys
+
+    journal = TradeJournal()
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        out = sys.argv[2] if len(sys.argv) > 2 else CSV_FILE
+        print(f"✅ Exported {journal.export_csv(out)} trades -> {out}")
+    else:
+        s = journal.stats()
+        print(f"📒 Trades: {s['trades']} (W:{s['wins']} / L:{s['losses']}) | WR: {s['win_rate']:.1f}% | "
+              f"PnL: ${s['pnl']:+.2f} | Fees: ${s['fees']:.2f}")
+        for row in journal.breakdown("reason"):
+            print(f"   {row['grp']}: {row['trades']} trades, WR {row['win_rate']:.1f}%, PnL ${row['pnl']:+.2f}")
+    journal.close()
@@ -10,40 +10,62 @@
 import time
 import logging
 import pandas as pd
-import ta
 import sys
 import os
-import csv
 import json
 import threading
 import traceback
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 
 from config import *
 from telegram_bot import TelegramBot
 from ai_assistant import AIAssistant
-
-                    result.append({'type': 'callback', 'id': u['callback_query']['id'], 'msg_id': u['callback_query']['message']['message_id'], 'value': u['callback_query']['data']})
-                elif 'message' in u and 'text' in u['message']:
-                    result.append({'type': 'text', 'value': u['message']['text']})
-            return result
-        except: return []
+from blackbox import BlackboxWriter
+from trade_journal import TradeJournal
+from log_pipeline import setup_logging
+from tracing import TradeTracer
+from profiler import ProfilerController
+from reconciler import Reconciler, DesiredOrder
+from risk_watcher import RiskWatcher, RISK_TICK_AGE
+from price_triggers import PriceTriggerIndex, Trigger
+from scheduler import Scheduler
+from execution import EntryExecutor, EntryRequest
+from state_store import StateStore, POSITION_FIELDS, SESSION_FIELDS, DAILY_FIELDS, capture, restore
+from warm_start import MarketFeed
+import indicators
+from snapshots import BotSnapshot, PositionSnapshot, SessionSnapshot, MarketSnapshot, NO_ORDERS, NO_MARKET
+from metrics import (
+    METRICS, LOOP_ITERATION, LOOP_PHASE, LOOP_INTERVAL, NEAREST_TRIGGER_ATR, FILLS, ERRORS, POSITION_SIZE, MARGIN_USED, DCA_DEPTH,
+    BALANCE, LAST_PRICE, instrument_exchange, instrument_telegram,
+)
 
 # ==========================================
 # 🤖 HYBRID TRADING BOT v1.1
 # ==========================================
 class HybridTradingBot:
-    def __init__(self, exchange, telegram_bot):
-        self.exchange = exchange
-        self.tg = telegram_bot
-        self.symbol = SYMBOL
-        self.timeframe = TIMEFRAME
+    def __init__(self, exchange, telegram_bot, symbol=SYMBOL, overrides=None, portfolio=None, shadow=None):
+        """
+        symbol / overrides - символ и его переопределения config (SymbolConfig)
+        portfolio - Portfolio (portfolio.py): общие баланс, дашборд, blackbox, журнал и лимиты
+        shadow - ShadowSpec (paper.py): бумажный бот рядом с живым - свои журнал и blackbox,
+                 без чекпоинта, метрик, дашборда и AI
+        """
+        instrumented = METRICS_ENABLED and not shadow
+        self.exchange = instrument_exchange(exchange) if instrumented else exchange
+        self.tg = instrument_telegram(telegram_bot) if instrumented else telegram_bot
+        self.portfolio = portfolio
+        self.shadow = shadow
+        self.shadows = None  # ShadowManager (paper.py) живого бота: тени на его рыночных данных
+        self.symbol = symbol
+        self.asset = symbol.split('/')[0]
+        self.cfg = SymbolConfig(overrides)
+        self.timeframe = self.cfg.TIMEFRAME
+        self.log_prefix = f"[paper:{shadow.name}] " if shadow else f"[{self.asset}] " if portfolio else ""
         
         # AI
-        self.has_ai = HAS_AI and AI_GEMINI_KEY
+        self.has_ai = HAS_AI and AI_GEMINI_KEY and not shadow
         self.ai_key = AI_GEMINI_KEY
         self.ai_model_name = AI_MODEL_NAME
-        self.report_sent_today = False
         
         # Баланс
         self.balance = 0.0
@@ -60,13 +82,16 @@ class HybridTradingBot:
         self.first_entry_price = 0.0
         self.base_entry_price = 0.0
         self.entry_usd_vol = 0.0
+        self.pending_entry_usd = 0.0  # Объём входа, который сейчас набирает smart entry
         self.safety_count = 0
         self.current_confluence = 0
         self.current_stage = 0
+        self.trade_id = None
         
         # Ордера
         self.tp_order_id = None
         self.dca_order_id = None
+        self.dca_ladder = {}     # DCA_LADDER_MODE: {order_id: уровень (0..SAFETY_ORDERS_COUNT-1)}
         self.sl_order_id = None  # 🆕 Stop Loss ордер
         
         # Трейлинг
@@ -80,6 +105,7 @@ class HybridTradingBot:
         self.session_losses = 0
         self.current_trade_fees = 0.0
         self.trades_today = 0
+        self.session_date = datetime.now().date().isoformat()  # День счётчиков сессии (чекпоинт)
         self.trade_start_time = None
         
         # Рынок
@@ -92,6 +118,7 @@ class HybridTradingBot:
         
         # UI
         self.dashboard_msg_id = None
+        self._dashboard_lock = threading.Lock()
         self.trade_msg_id = None
         self.last_dashboard_update = 0
         
@@ -99,17 +126,41 @@ class HybridTradingBot:
         self.running = True
         self.trading_active = True
         self.graceful_stop_mode = False
+        self.position_lock = threading.RLock()  # Торговый цикл / risk watcher / Telegram
         
         # Логирование
-        logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format='%(asctime)s %(message)s')
+        self.logger = setup_logging()
+        if shadow:
+            self.blackbox, self.journal = shadow.blackbox, shadow.journal
+        else:
+            self.blackbox = portfolio.blackbox if portfolio else BlackboxWriter()
+            self.journal = portfolio.journal if portfolio else TradeJournal()
+        self.tracer = TradeTracer(self.log_blackbox)
+        self.profiler = ProfilerController(self._on_profile_done)
+        self.reconciler = Reconciler(self.exchange, self.symbol, lambda msg: self.log(msg, Col.YELLOW))
+        self.triggers = PriceTriggerIndex()
+        self.risk_watcher = RiskWatcher(self)
+        self.scheduler = Scheduler(log_fn=lambda msg: self.log(msg, Col.YELLOW))
+        self.execution = EntryExecutor(self.exchange, self.symbol, lambda msg: self.log(msg, Col.YELLOW))
+        state_root, state_ext = os.path.splitext(STATE_FILE)
+        self.state_store = StateStore(f"{state_root}_{self.asset}{state_ext}",
+                                      log_fn=lambda msg: self.log(msg, Col.YELLOW)) if STATE_ENABLED and not shadow else None
+        warm_root, warm_ext = os.path.splitext(WARM_START_FILE)
+        self.market_feed = MarketFeed(self.symbol, self.timeframe, f"{warm_root}_{self.asset}{warm_ext}",
+                                      log_fn=lambda msg: self.log(msg, Col.CYAN)) if WARM_START_ENABLED and not shadow else None
+        self._snapshot_lock = threading.Lock()  # Только между публикующими потоками, читатели без lock
+        self._published_state = None
+        self.snapshot = BotSnapshot(position=None, orders=NO_ORDERS, session=None, market=NO_MARKET, version=0)
+        self.publish_state()
+        self._register_jobs()
+        if not shadow:
+            METRICS.add_collector(self._collect_metrics, key=f"bot:{self.symbol}")
         self.log("🚀 Hybrid Bot v1.1 Started!", Col.GREEN)
         self.log(f"💰 Starting Balance: ${self.balance:.2f}", Col.CYAN)
         if self.has_ai: self.log("🤖 AI Analytics & Chat: ENABLED", Col.CYAN)
-        
-        # CSV заголовки
-        if not os.path.exists(CSV_FILE):
-            with open(CSV_FILE, 'w', newline='') as f:
-                csv.writer(f).writerow(['timestamp', 'symbol', 'side', 'reason', 'pnl', 'fees', 'entry', 'exit', 'dca_count', 'order_type', 'volatility', 'confluence'])
+        if self.state_store: self.restore_state()
+        if self.market_feed: self.market_feed.load()
+        self.publish_state()
     
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     # 🆕 v1.3: НОВЫЕ ФУНКЦИИ
@@ -119,27 +170,21 @@ class HybridTradingBot:
         """
         🆕 v1.3: Blackbox JSON логирование
         Записывает все события в JSON для детального анализа
+        Запись, fsync и ротация — в фоновом потоке BlackboxWriter,
+        здесь только неблокирующая постановка в очередь
         """
-        import json
-        from datetime import datetime
-        
-        entry = {
-            "timestamp": datetime.now().isoformat(),
-            "event": event_type,
-            **data
-        }
-        
-        try:
-            with open("blackbox.json", "a", encoding='utf-8') as f:
-                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-        except Exception as e:
-            pass  # Тихо игнорируем ошибки логирования
+        if self.trade_id and "trade_id" not in data:
+            data = {"trade_id": self.trade_id, **data}
+        if self.portfolio:
+            data = {"symbol": self.symbol, **data}
+        self.blackbox.write(event_type, data)
     
-    def check_pnl_audit(self):
+    def check_pnl_audit(self, position=None):
         """
         🆕 v1.3: PnL Audit - проверка корректности расчётов
         Сравнивает расчётный PnL с данными биржи
         Детектор скрытых комиссий, багов, лагов
+        position - позиция из снимка Reconciler (без повторного fetch_positions)
         """
         if not self.in_position or self.total_size_coins == 0:
             return
@@ -150,7 +195,7 @@ class HybridTradingBot:
             calc_pnl = (self.last_price - self.avg_price) * self.total_size_coins * side_mult
             
             # PnL от биржи
-            positions = self.exchange.fetch_positions([self.symbol])
+            positions = [position] if position else self.exchange.fetch_positions([self.symbol])
             for pos in positions:
                 amt = float(pos.get('contracts', 0) or pos['info'].get('positionAmt', 0))
                 
@@ -185,30 +230,15 @@ class HybridTradingBot:
     def start_future_spy(self, exit_price, exit_side, exit_size):
         """
         🆕 v1.3: Future Spy - анализ упущенной прибыли
-        Следит за ценой 15 минут после выхода
+        Следит за ценой 15 минут после выхода (задача планировщика каждые 10 сек)
         Помогает оптимизировать TP и Trailing
         """
-        import threading
+        trade_id = self.trade_id
+        job_name = f"future_spy:{trade_id}"
+        spy = {"start": time.time(), "max": exit_price, "min": exit_price}
         
-        def spy_thread():
-            start_time = time.time()
-            max_price = exit_price
-            min_price = exit_price
-            
-            self.log(f"🔮 Future Spy started: monitoring for 15 minutes...", Col.MAGENTA)
-            
-            while time.time() - start_time < 900:  # 15 минут
-                try:
-                    ticker = self.exchange.fetch_ticker(self.symbol)
-                    price = float(ticker['last'])
-                    
-                    max_price = max(max_price, price)
-                    min_price = min(min_price, price)
-                    
-                    time.sleep(10)  # Проверка каждые 10 секунд
-                except:
-                    break
-            
+        def report():
+            max_price, min_price = spy["max"], spy["min"]
             # Вычисляем упущенную прибыль
             if exit_side == "Buy":
                 missed_profit = (max_price - exit_price) * exit_size
@@ -230,6 +260,7 @@ class HybridTradingBot:
                 
                 # Логируем в blackbox
                 self.log_blackbox("FUTURE_SPY", {
+                    "trade_id": trade_id,
                     "missed_profit": missed_profit,
                     "missed_pct": missed_pct,
                     "exit_price": exit_price,
@@ -240,59 +271,110 @@ class HybridTradingBot:
             else:
                 self.log(f"🔮 Future Spy: Exit was optimal (missed < $0.5)", Col.GRAY)
         
-        # Запускаем в отдельном потоке
-        threading.Thread(target=spy_thread, daemon=True).start()
+        def sample():
+            if time.time() - spy["start"] >= 900:  # 15 минут
+                self.scheduler.cancel(job_name)
+                report()
+                return
+            try:
+                price = float(self.exchange.fetch_ticker(self.symbol)['last'])
+            except:
+                self.scheduler.cancel(job_name)
+                report()
+                return
+            spy["max"] = max(spy["max"], price)
+            spy["min"] = min(spy["min"], price)
+        
+        self.log(f"🔮 Future Spy started: monitoring for 15 minutes...", Col.MAGENTA)
+        self.scheduler.every(job_name, 10, sample, priority=20, pool=True)
 
-    def log(self, msg, color=Col.WHITE):
-        print(f"{color}{msg}{Col.RESET}")
-        logging.info(msg)
+    def log(self, msg, color=Col.WHITE, *args, category=None, level=logging.INFO):
+        """
+        Неблокирующее логирование: запись уходит в очередь, консоль и файлы пишет listener.
+        args форматируются лениво (msg % args) уже в фоновом потоке.
+        category — ключ для LOG_RATE_LIMITS / LOG_SAMPLING
+        """
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, self.log_prefix + msg, *args, extra={"color": color, "category": category})
     
-    def log_debug(self, msg):
-        logging.debug(msg)
+    def log_debug(self, msg, *args):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(self.log_prefix + msg, *args)
 
     def get_effective_balance(self):
-        return self.balance * ALLOWED_CAPITAL_PCT
+        return self.balance * self.cfg.ALLOWED_CAPITAL_PCT
+
+    def committed_margin(self, entry_usd=None):
+        """
+        Маржа позиции + ещё не исполненных уровней DCA (худший случай) - для лимита портфеля.
+        entry_usd - оценка нового входа такого объёма
+        """
+        _, weights = self.get_dca_parameters()
+        if entry_usd is not None:
+            margin, levels = entry_usd, range(self.cfg.SAFETY_ORDERS_COUNT)
+        elif self.in_position:
+            margin = (self.avg_price * self.total_size_coins) / self.cfg.LEVERAGE
+            entry_usd, levels = self.entry_usd_vol, range(self.safety_count, self.cfg.SAFETY_ORDERS_COUNT)
+        elif self.pending_entry_usd:
+            entry_usd = margin = self.pending_entry_usd
+            levels = range(self.cfg.SAFETY_ORDERS_COUNT)
+        else:
+            return 0.0
+        return margin + sum(max(entry_usd * weights[lvl], self.cfg.MIN_EXCHANGE_ORDER_USD) for lvl in levels)
 
     def get_market_data_enhanced(self):
         """Получение рыночных данных с индикаторами"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, limit=200)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            
-            # EMA
-            df['EMA9'] = ta.trend.EMAIndicator(df['close'], 9).ema_indicator()
-            df['EMA15'] = ta.trend.EMAIndicator(df['close'], 15).ema_indicator()
-            df['EMA20'] = ta.trend.EMAIndicator(df['close'], 20).ema_indicator()
-            df['EMA50'] = ta.trend.EMAIndicator(df['close'], 50).ema_indicator()
-            
-            # RSI
-            df['RSI'] = ta.momentum.RSIIndicator(df['close'], 14).rsi()
-            
-            # ATR
-            df['ATR'] = ta.volatility.AverageTrueRange(df['high'], df['low'], df['close'], 14).average_true_range()
-            df['ATR_pct'] = df['ATR'] / df['close']
-            
-            # ADX
-            df['ADX'] = ta.trend.ADXIndicator(df['high'], df['low'], df['close'], 14).adx()
-            
-            # MACD
-            macd = ta.trend.MACD(df['close'])
-            df['MACD'] = macd.macd()
-            df['MACD_signal'] = macd.macd_signal()
-            df['MACD_hist'] = macd.macd_diff()
-            
-            self.current_volatility = df['ATR_pct'].iloc[-2] if not pd.isna(df['ATR_pct'].iloc[-2]) else 0.0
-            
-            # Определение тренда
-            if not pd.isna(df['ADX'].iloc[-2]):
-                self.is_trending_market = df['ADX'].iloc[-2] > 25
-            
-            self.current_market_df = df
+            # Тёплый старт: только свечи после последней обработанной (обычно 2)
+            limit = self.market_feed.fetch_limit() if self.market_feed else 200
+            ohlcv = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, limit=limit)
+            return self.build_market_df(ohlcv)
+        except Exception as e: 
+            self.log(f"Market Data Error: {e}", Col.RED)
+            return None
+
+    def build_market_df(self, ohlcv, stable=None):
+        """
+        Индикаторы по свечам [timestamp, open, high, low, close, volume].
+        ohlcv - список ccxt или numpy массив (в воркере supervisor - view в shared memory без копии).
+        С тёплым стартом - рекурсия от прошлой свечи (warm_start.py), иначе ядро indicators.py по окну.
+        stable() - данные не менялись во время расчёта (seqlock supervisor), иначе None без публикации
+        """
+        try:
+            if self.market_feed:
+                df, warm = self.market_feed.build(ohlcv)
+            else:
+                df = indicators.frame(ohlcv)
+            if stable is not None and not stable():
+                return None
+            if self.market_feed:
+                self.market_feed.accept(warm)
+            self.set_market_df(df)
             return df
         except Exception as e: 
             self.log(f"Market Data Error: {e}", Col.RED)
             return None
 
+    def save_market_state(self):
+        """🔥 Буфер свечей и рекурсия индикаторов на диск (warm_start.py): по расписанию и при остановке"""
+        if not self.market_feed:
+            return
+        try:
+            self.market_feed.save()
+        except OSError as e:
+            self.log(f"⚠️ Warm start save error: {e}", Col.YELLOW)
+
+    def set_market_df(self, df):
+        """DataFrame итерации с индикаторами: режим рынка + снимок (тени paper.py получают df живого бота)"""
+        self.current_volatility = df['ATR_pct'].iloc[-2] if not pd.isna(df['ATR_pct'].iloc[-2]) else 0.0
+        
+        # Определение тренда
+        if not pd.isna(df['ADX'].iloc[-2]):
+            self.is_trending_market = df['ADX'].iloc[-2] > 25
+        
+        self.current_market_df = df
+        self._publish(market=MarketSnapshot.from_df(df, self.current_volatility, self.is_trending_market))
+
     def calculate_confluence_score(self, df):
         """🎯 Система confluence scoring (0-7)"""
         row = df.iloc[-2]
@@ -337,10 +419,10 @@ class HybridTradingBot:
         if not self.trading_active or self.graceful_stop_mode:
             return None
         
-        if self.trades_today >= DAILY_TRADE_LIMIT:
+        if self.trades_today >= self.cfg.DAILY_TRADE_LIMIT:
             return None
         
-        if self.last_trade_time and (datetime.now() - self.last_trade_time).total_seconds() < MIN_TIME_BETWEEN_TRADES:
+        if self.last_trade_time and (datetime.now() - self.last_trade_time).total_seconds() < self.cfg.MIN_TIME_BETWEEN_TRADES:
             return None
         
         row, prev = df.iloc[-2], df.iloc[-3]
@@ -364,17 +446,17 @@ class HybridTradingBot:
             return None
         
         # 3. Волатильность
-        if QUALITY_FILTER_ENABLED:
-            if not pd.isna(row['ATR_pct']) and row['ATR_pct'] < MIN_VOLATILITY_PCT:
+        if self.cfg.QUALITY_FILTER_ENABLED:
+            if not pd.isna(row['ATR_pct']) and row['ATR_pct'] < self.cfg.MIN_VOLATILITY_PCT:
                 return None
         
         # 4. RSI безопасность
-        if row['RSI'] < RSI_SAFE_MIN or row['RSI'] > RSI_SAFE_MAX:
+        if row['RSI'] < self.cfg.RSI_SAFE_MIN or row['RSI'] > self.cfg.RSI_SAFE_MAX:
             return None
         
         # 5. Фильтр объёма
         volume_ratio = row['volume'] / df['volume'].iloc[-20:].mean()
-        if volume_ratio < MIN_VOLUME_RATIO:
+        if volume_ratio < self.cfg.MIN_VOLUME_RATIO:
             return None
         
         # 6. Микротренд
@@ -385,22 +467,22 @@ class HybridTradingBot:
         
         if side == "Buy":
             bullish_count = sum(candles)
-            if bullish_count < MIN_MICROTREND_CANDLES:
+            if bullish_count < self.cfg.MIN_MICROTREND_CANDLES:
                 return None
         else:
             bearish_count = sum([not c for c in candles])
-            if bearish_count < MIN_MICROTREND_CANDLES:
+            if bearish_count < self.cfg.MIN_MICROTREND_CANDLES:
                 return None
         
         # 7. Защита от ножа
         price_change_3 = (row['close'] - df.iloc[-4]['close']) / df.iloc[-4]['close']
-        if abs(price_change_3) > KNIFE_PROTECTION_PCT:
+        if abs(price_change_3) > self.cfg.KNIFE_PROTECTION_PCT:
             return None
         
         # 8. Confluence scoring
         confluence = self.calculate_confluence_score(df)
         
-        if confluence < MIN_CONFLUENCE_SCORE:
+        if confluence < self.cfg.MIN_CONFLUENCE_SCORE:
             return None
         
         # Определяем стадию
@@ -432,17 +514,17 @@ class HybridTradingBot:
         
         # Базовый по стадии
         if stage == 3:
-            min_pct = STAGE3_MIN_ENTRY
-            base_pct = STAGE3_BASE_ENTRY
-            max_pct = STAGE3_MAX_ENTRY
+            min_pct = self.cfg.STAGE3_MIN_ENTRY
+            base_pct = self.cfg.STAGE3_BASE_ENTRY
+            max_pct = self.cfg.STAGE3_MAX_ENTRY
         elif stage == 2:
-            min_pct = STAGE2_MIN_ENTRY
-            base_pct = STAGE2_BASE_ENTRY
-            max_pct = STAGE2_MAX_ENTRY
+            min_pct = self.cfg.STAGE2_MIN_ENTRY
+            base_pct = self.cfg.STAGE2_BASE_ENTRY
+            max_pct = self.cfg.STAGE2_MAX_ENTRY
         else:
-            min_pct = STAGE1_MIN_ENTRY
-            base_pct = STAGE1_BASE_ENTRY
-            max_pct = STAGE1_MAX_ENTRY
+            min_pct = self.cfg.STAGE1_MIN_ENTRY
+            base_pct = self.cfg.STAGE1_BASE_ENTRY
+            max_pct = self.cfg.STAGE1_MAX_ENTRY
         
         # Адаптация
         score = 0
@@ -506,9 +588,9 @@ class HybridTradingBot:
                 logs = "Logs unavailable"
 
             m_info = "N/A"
-            if self.current_market_df is not None:
-                row = self.current_market_df.iloc[-2]
-                m_info = f"Close:{row['close']}, ADX:{row['ADX']:.1f}, RSI:{row['RSI']:.1f}"
+            market = self.snapshot.market  # Поток AI: только снимок, без живых атрибутов
+            if market.df is not None:
+                m_info = f"Close:{market.close}, {market.describe()}"
             
             prompt = f"Ты — AI-аналитик. Рынок: {m_info}. Логи: {logs}. Дай совет."
             response = client.models.generate_content(model=self.ai_model_name, contents=prompt)
@@ -530,26 +612,23 @@ class HybridTradingBot:
             import google.genai as genai
             client = genai.Client(api_key=self.ai_key)
             
-            # Собираем контекст
+            # Собираем контекст (один снимок - согласованные позиция, сессия и рынок)
             context = []
+            snap, price = self.snapshot, self.last_price
+            pos, session = snap.position, snap.session
             
             # Текущее состояние
-            if self.in_position:
-                side_mult = 1 if self.position_side == "Buy" else -1
-                unrealized = (self.last_price - self.avg_price) * self.total_size_coins * side_mult
-                context.append(f"Current position: {self.position_side}, PnL: ${unrealized:.2f}, DCA: {self.safety_count}/{SAFETY_ORDERS_COUNT}")
+            if pos.in_position:
+                context.append(f"Current position: {pos.side}, PnL: ${pos.unrealized(price):.2f}, DCA: {pos.safety_count}/{self.cfg.SAFETY_ORDERS_COUNT}")
             else:
                 context.append("No position")
             
             # Статистика
-            total = self.session_wins + self.session_losses
-            wr = (self.session_wins / total * 100) if total > 0 else 0
-            context.append(f"Session: PnL ${self.session_total_pnl:.2f}, Trades: {total} (WR: {wr:.1f}%)")
+            context.append(f"Session: PnL ${session.pnl:.2f}, Trades: {session.trades} (WR: {session.win_rate:.1f}%)")
             
             # Рынок
-            if self.current_market_df is not None:
-                row = self.current_market_df.iloc[-2]
-                context.append(f"Market: Price ${self.last_price:.2f}, RSI {row['RSI']:.1f}, ADX {row['ADX']:.1f}, ATR {self.current_volatility*100:.3f}%")
+            if snap.market.df is not None:
+                context.append(f"Market: Price ${price:.2f}, {snap.market.describe()}")
             
             # Логи (последние 20 строк)
             try:
@@ -573,140 +652,126 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
         except Exception as e:
             self.tg.send(f"❌ AI chat error: {str(e)[:100]}")
 
-    def perform_health_check(self):
-        """🆕 v1.2.1 - АГРЕССИВНАЯ проверка здоровья позиции"""
+    def perform_health_check(self, snapshot=None):
+        """
+        🆕 v1.2.1 - АГРЕССИВНАЯ проверка здоровья позиции
+        Один снимок позиции и ордеров → сверка с желаемыми TP / DCA / SL → batch действий
+        snapshot - готовый снимок (портфель), иначе запрос по символу
+        """
         try:
             if not self.in_position: 
                 return
             
-            # 1. Проверяем наличие TP ордера
-            if not self.tp_order_id:
-                self.log("🚑 Doctor: No TP order! Placing...", Col.YELLOW)
-                self.place_limit_tp()
-            else:
-                # Проверяем что TP ордер существует на бирже
-                try:
-                    order = self.exchange.fetch_order(self.tp_order_id, self.symbol)
-                    if order['status'] in ['canceled', 'rejected', 'expired']:
-                        self.log(f"🚑 Doctor: TP order {self.tp_order_id} is {order['status']}! Re-placing...", Col.YELLOW)
-                        self.tp_order_id = None
-                        self.place_limit_tp()
-                except Exception as e:
-                    # Если ордер не найден - переставляем
-                    self.log(f"🚑 Doctor: TP order {self.tp_order_id} not found! Re-placing...", Col.YELLOW)
-                    self.tp_order_id = None
-                    self.place_limit_tp()
+            snap = snapshot or self.reconciler.snapshot()
+            plan = self.reconciler.plan(snap, self._desired_orders(), self.total_size_coins)
             
-            # 2. Проверяем DCA только если не на максимальном уровне
-            if self.safety_count < SAFETY_ORDERS_COUNT:
-                
-                # 2.1 Вычисляем правильную цену DCA
-                dists, weights = self.get_dca_parameters()
-                dist_multiplier = self.get_smart_distance_multiplier(self.safety_count)
-                base_dist = dists[self.safety_count]
-                actual_dist = base_dist * dist_multiplier
-                
-                # Правильное направление для SHORT/LONG
-                if self.position_side == "Buy":
-                    expected_dca_price = self.base_entry_price * (1 - actual_dist)
-                else:
-                    expected_dca_price = self.base_entry_price * (1 + actual_dist)
-                
-                # 2.2 Проверяем существующий DCA ордер
-                dca_needs_replacement = False
-                
-                if not self.dca_order_id:
-                    dca_needs_replacement = True
-                    self.log("🚑 Doctor: No DCA order! Placing...", Col.YELLOW)
-                else:
-                    try:
-                        order = self.exchange.fetch_order(self.dca_order_id, self.symbol)
-                        
-                        # Проверяем статус
-                        if order['status'] in ['canceled', 'rejected', 'expired']:
-                            dca_needs_replacement = True
-                            self.log(f"🚑 Doctor: DCA order {self.dca_order_id} is {order['status']}! Re-placing...", Col.YELLOW)
-                        
-                        # 🆕 ПРОВЕРЯЕМ ЦЕНУ - если ордер старый (цена отличается > 0.5%)
-                        elif order['status'] == 'open':
-                            current_price = float(order['price'])
-                            price_diff_pct = abs((current_price - expected_dca_price) / expected_dca_price * 100)
-                            
-                            if price_diff_pct > 0.5:  # Если цена отличается больше чем на 0.5%
-                                dca_needs_replacement = True
-                                self.log(f"🚑 Doctor: DCA price outdated! Current: {current_price:.4f}, Expected: {expected_dca_price:.4f} (diff: {price_diff_pct:.2f}%)", Col.YELLOW)
-                                # Отменяем старый
-                                try:
-                                    self.exchange.cancel_order(self.dca_order_id, self.symbol)
-                                    self.log(f"🗑️ Cancelled outdated DCA {self.dca_order_id}", Col.GRAY)
-                                except:
-                                    pass
-                        
-                    except Exception as e:
-                        # Ордер не найден или ошибка - переставляем
-                        dca_needs_replacement = True
-                        self.log(f"🚑 Doctor: DCA order {self.dca_order_id} check failed! Re-placing...", Col.YELLOW)
-                
-                # 2.3 Переставляем DCA если нужно
-                if dca_needs_replacement:
-                    self.dca_order_id = None
-                    self.place_limit_dca()
+            if plan.position_gone:
+                # Закрытие по TP проведёт проверка ордеров в step(), иначе позиция закрыта мимо бота
+                if self._order_filled(self.tp_order_id):
+                    self.log_debug("🚑 Doctor: position gone, TP filled - leaving to order check")
+                    return
+                self.log("🚑 Doctor: Position not found on exchange!", Col.YELLOW)
+                self._drop_gone_position("GONE")
+                return
+            if plan.filled:
+                self.log_debug("🚑 Doctor: filled %s, leaving to order check", plan.filled)
             
-            # 3. 🆕 ДОПОЛНИТЕЛЬНО: Отменяем ВСЕ лишние ордера на бирже
-            try:
-                open_orders = self.exchange.fetch_open_orders(self.symbol)
-                valid_order_ids = set()
-                if self.tp_order_id:
-                    valid_order_ids.add(str(self.tp_order_id))
-                if self.dca_order_id:
-                    valid_order_ids.add(str(self.dca_order_id))
-                
-                for order in open_orders:
-                    order_id = str(order['id'])
-                    if order_id not in valid_order_ids:
-                        # Это какой-то старый/лишний ордер - отменяем
-                        try:
-                            self.exchange.cancel_order(order_id, self.symbol)
-                            self.log(f"🗑️ Doctor: Cancelled orphan order {order_id} @ {order['price']}", Col.MAGENTA)
-                        except:
-                            pass
-            except Exception as e:
-                self.log(f"⚠️ Doctor: Orphan cleanup error: {e}", Col.YELLOW)
+            if plan.actions:
+                self.log(f"🚑 Doctor: {plan.describe()}", Col.YELLOW)
+                self._apply_reconciled_ids(self.reconciler.apply(plan))
             
-            # 4. 🆕 v1.3: PnL Audit
-            self.check_pnl_audit()
+            # 🆕 v1.3: PnL Audit (по тому же снимку)
+            self.check_pnl_audit(snap.position)
             
         except Exception as e:
             self.log(f"⚠️ Health Check Error: {e}", Col.YELLOW)
-            import traceback
             self.log_debug(traceback.format_exc())
 
+    def _desired_orders(self):
+        """Желаемое состояние ордеров позиции для Reconciler"""
+        pos_side = 'LONG' if self.position_side == 'Buy' else 'SHORT'
+        close_side = "sell" if self.position_side == "Buy" else "buy"
+        desired = []
+        
+        triggers = self.refresh_triggers()
+        tp = triggers.get("tp")
+        if tp and tp.amount > 0:
+            desired.append(DesiredOrder("tp", self.tp_order_id, 'limit', close_side, tp.amount, tp.price,
+                                        {'positionSide': pos_side}, tolerance=RECONCILE_TP_TOLERANCE_PCT,
+                                        check_amount=True, reduce=True))
+        
+        if self.cfg.DCA_LADDER_MODE:
+            ids_by_level = {lvl: oid for oid, lvl in self.dca_ladder.items()}
+            levels = range(self.safety_count, self.cfg.SAFETY_ORDERS_COUNT)
+        else:
+            ids_by_level = {self.safety_count: self.dca_order_id}
+            levels = [self.safety_count] if self.safety_count < self.cfg.SAFETY_ORDERS_COUNT else []
+        for lvl in levels:
+            dca = triggers.get(f"dca:{lvl}")
+            if not dca or dca.amount <= 0:
+                continue
+            # Лестница не перекотируется, одиночный DCA - при отклонении > RECONCILE_DCA_TOLERANCE_PCT
+            desired.append(DesiredOrder(f"dca:{lvl}" if self.cfg.DCA_LADDER_MODE else "dca", ids_by_level.get(lvl),
+                                        'limit', self.position_side.lower(), dca.amount, dca.price,
+                                        {'positionSide': pos_side},
+                                        tolerance=None if self.cfg.DCA_LADDER_MODE else RECONCILE_DCA_TOLERANCE_PCT))
+        
+        sl = triggers.get("sl")
+        if sl and sl.amount > 0:
+            desired.append(DesiredOrder("sl", self.sl_order_id, 'stop_market', close_side, sl.amount, None,
+                                        {'stopPrice': sl.price, 'positionSide': pos_side, 'reduceOnly': True},
+                                        reduce=True))
+        return desired
+
+    def _apply_reconciled_ids(self, results):
+        """Новые id ордеров после Reconciler.apply"""
+        for key, oid in results.items():
+            if key == "tp":
+                self.tp_order_id = oid
+            elif key == "sl":
+                self.sl_order_id = oid
+            elif key == "dca":
+                self.dca_order_id = oid
+            elif key.startswith("dca:"):
+                lvl = int(key.split(":")[1])
+                self.dca_ladder = {o: l for o, l in self.dca_ladder.items() if l != lvl}
+                if oid:
+                    self.dca_ladder[oid] = lvl
+                self.dca_order_id = self._next_ladder_order_id()
+        self.save_state("doctor")
+
     def update_dashboard(self, force=False):
         """📊 🆕 УЛУЧШЕННЫЙ ДАШБОРД"""
+        if self.portfolio:
+            return self.portfolio.update_dashboard(force)  # Один дашборд на все символы
         now = time.time()
         if not force and (now - self.last_dashboard_update < 15): return
         self.last_dashboard_update = now
         
+        # Один снимок на весь дашборд: пул планировщика не читает живые атрибуты торгового цикла
+        snap, price, balance = self.snapshot, self.last_price, self.balance
+        pos, session, market = snap.position, snap.session, snap.market
+        
         # Статус
-        status_icon = "🟢" if self.trading_active else "🔴"
-        status_text = "ACTIVE" if self.trading_active else "STOPPED"
-        if self.graceful_stop_mode:
+        status_icon = "🟢" if session.trading_active else "🔴"
+        status_text = "ACTIVE" if session.trading_active else "STOPPED"
+        if session.graceful_stop:
             status_icon = "🟡"
             status_text = "STOPPING..."
         
         # Баланс и прогресс
-        balance_change = self.balance - self.start_balance
-        balance_pct = (balance_change / self.start_balance * 100) if self.start_balance > 0 else 0
+        balance_change = balance - session.start_balance
+        balance_pct = (balance_change / session.start_balance * 100) if session.start_balance > 0 else 0
         balance_icon = "📈" if balance_change >= 0 else "📉"
         
         # Винрейт
-        total_trades = self.session_wins + self.session_losses
-        win_rate = (self.session_wins / total_trades * 100) if total_trades > 0 else 0
+        total_trades = session.trades
+        win_rate = session.win_rate
         wr_icon = "🟢" if win_rate >= 60 else "🟡" if win_rate >= 50 else "🔴"
         
         # Рыночные условия
-        vol_icon = "🔥" if self.current_volatility > 0.004 else "📊" if self.current_volatility > 0.0025 else "😴"
-        trend_icon = "📈" if self.is_trending_market else "↔️"
+        vol_icon = "🔥" if market.atr_pct > 0.004 else "📊" if market.atr_pct > 0.0025 else "😴"
+        trend_icon = "📈" if market.trending else "↔️"
         
         # Начало дашборда
         dash = f"""╔══════════════════════════════
@@ -714,88 +779,80 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
 ╠══════════════════════════════
 ║
 ║ 💰 <b>БАЛАНС</b>
-║ ├─ Текущий: <b>${self.balance:.2f}</b>
-║ ├─ Стартовый: ${self.start_balance:.2f}
+║ ├─ Текущий: <b>${balance:.2f}</b>
+║ ├─ Стартовый: ${session.start_balance:.2f}
 ║ └─ Изменение: {balance_icon} <b>${balance_change:+.2f}</b> ({balance_pct:+.2f}%)
 ║
 ║ 📊 <b>СЕССИЯ</b>
-║ ├─ PnL: <b>${self.session_total_pnl:+.2f}</b>
-║ ├─ Комиссии: -${self.session_total_fees:.2f}
-║ ├─ Сделок: {total_trades} (W:{self.session_wins} / L:{self.session_losses})
+║ ├─ PnL: <b>${session.pnl:+.2f}</b>
+║ ├─ Комиссии: -${session.fees:.2f}
+║ ├─ Сделок: {total_trades} (W:{session.wins} / L:{session.losses})
 ║ └─ Винрейт: {wr_icon} <b>{win_rate:.1f}%</b>
 ║
 ║ 🌍 <b>РЫНОК</b>
-║ ├─ Цена: <b>${self.last_price:.2f}</b>
-║ ├─ Волатильность: {vol_icon} {self.current_volatility*100:.3f}%
-║ └─ Режим: {trend_icon} {'TREND' if self.is_trending_market else 'RANGE'}
+║ ├─ Цена: <b>${price:.2f}</b>
+║ ├─ Волатильность: {vol_icon} {market.atr_pct*100:.3f}%
+║ └─ Режим: {trend_icon} {'TREND' if market.trending else 'RANGE'}
 """
         
         # Если в позиции - добавляем детали
-        if self.in_position:
-            side_mult = 1 if self.position_side == "Buy" else -1
-            unrealized = (self.last_price - self.avg_price) * self.total_size_coins * side_mult
-            margin = (self.avg_price * self.total_size_coins) / LEVERAGE
+        if pos.in_position:
+            unrealized = pos.unrealized(price)
+            margin = pos.margin(self.cfg.LEVERAGE)
             pnl_pct = (unrealized / margin * 100) if margin > 0 else 0
             pnl_icon = "🟢" if unrealized >= 0 else "🔴"
             
             # Stage icon
             stage_icons = ["", "🟡", "🟠", "🔴"]
-            stage_icon = stage_icons[self.current_stage] if self.current_stage <= 3 else "⭐"
+            stage_icon = stage_icons[pos.stage] if pos.stage <= 3 else "⭐"
             
             # Время в позиции
-            if self.trade_start_time:
-                time_in_trade = (datetime.now() - self.trade_start_time).total_seconds()
+            if pos.opened_at:
+                time_in_trade = time.time() - pos.opened_at
                 hours = int(time_in_trade // 3600)
                 minutes = int((time_in_trade % 3600) // 60)
                 time_str = f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
             else:
                 time_str = "N/A"
             
-            # TP дистанция
-            tp_distance = float(self.get_dynamic_tp_steps())
-            target_tp = self.avg_price * (1 + (tp_distance * side_mult))
-            dist_tp_pct = abs((target_tp - self.last_price) / self.last_price * 100)
-            
-            # DCA дистанция
-            if self.safety_count < SAFETY_ORDERS_COUNT:
-                dists, _ = self.get_dca_parameters()
-                mult = self.get_smart_distance_multiplier(self.safety_count)
-                target_dca = self.base_entry_price * (1 + ((dists[self.safety_count] * mult) * (-side_mult)))
-                dist_dca_pct = abs((self.last_price - target_dca) / self.last_price * 100)
-                dca_str = f"{dist_dca_pct:.2f}%"
-            else:
-                dca_str = "MAX"
+            # TP / DCA дистанция (уровни индекса из снимка, пересчитывает только торговый цикл)
+            tp = snap.orders.level("tp")
+            target_tp = tp.price if tp else 0.0
+            dist_tp_pct = tp.distance_pct(price) if tp else 0.0
+            
+            next_dca = snap.orders.level(f"dca:{pos.safety_count}")
+            dca_str = f"{next_dca.distance_pct(price):.2f}%" if next_dca else "MAX"
             
             # Trailing status
-            if self.trailing_active:
+            if pos.trailing_active:
                 trail_icon = "🎯"
-                trail_str = f"ACTIVE @ ${self.trailing_peak_price:.2f}"
+                trail_str = f"ACTIVE @ ${pos.trailing_peak:.2f}"
             else:
                 trail_icon = "💤"
                 trail_str = "Waiting..."
             
             dash += f"""║
 ╠══════════════════════════════
-║ 📍 <b>ПОЗИЦИЯ</b> {stage_icon} Stage{self.current_stage}
+║ 📍 <b>ПОЗИЦИЯ</b> {stage_icon} Stage{pos.stage}
 ╠══════════════════════════════
 ║
 ║ 🎯 <b>ВХОД</b>
-║ ├─ Сторона: <b>{"📈 LONG" if self.position_side == "Buy" else "📉 SHORT"}</b>
-║ ├─ Цена входа: ${self.avg_price:.4f}
-║ ├─ Размер: {self.total_size_coins:.4f} BTC
-║ ├─ Объём: ${self.entry_usd_vol:.2f}
-║ ├─ Confluence: ⭐ {self.current_confluence}/7
+║ ├─ Сторона: <b>{"📈 LONG" if pos.side == "Buy" else "📉 SHORT"}</b>
+║ ├─ Цена входа: ${pos.avg_price:.4f}
+║ ├─ Размер: {pos.size:.4f} {self.asset}
+║ ├─ Объём: ${pos.entry_usd:.2f}
+║ ├─ Confluence: ⭐ {pos.confluence}/7
 ║ └─ Время: ⏱️ {time_str}
 ║
 ║ 💹 <b>P&L</b>
 ║ ├─ Нереализ.: {pnl_icon} <b>${unrealized:+.2f}</b>
 ║ ├─ ROI: <b>{pnl_pct:+.2f}%</b>
-║ └─ Комиссии: -${self.current_trade_fees:.2f}
+║ └─ Комиссии: -${pos.fees:.2f}
 ║
 ║ 🔨 <b>DCA СЕТКА</b>
-║ ├─ Уровень: <b>{self.safety_count}/{SAFETY_ORDERS_COUNT}</b>
+║ ├─ Уровень: <b>{pos.safety_count}/{self.cfg.SAFETY_ORDERS_COUNT}</b>
 ║ ├─ След. DCA: {dca_str}
-║ └─ Режим: {trend_icon} {'TREND' if self.is_trending_market else 'RANGE'}
+║ └─ Режим: {trend_icon} {'TREND' if market.trending else 'RANGE'}
 ║
 ║ 🏁 <b>ВЫХОД</b>
 ║ ├─ TP дист.: {dist_tp_pct:.2f}%
@@ -811,18 +868,25 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
 ║
 ║ Ожидание сигнала...
 ║
-║ 📋 Сегодня сделок: {self.trades_today}/{DAILY_TRADE_LIMIT}
+║ 📋 Сегодня сделок: {session.trades_today}/{self.cfg.DAILY_TRADE_LIMIT}
 """
         
         # Футер
         dash += """║
 ╚══════════════════════════════"""
-        
-        if not self.dashboard_msg_id: 
-            self.dashboard_msg_id = self.tg.send(dash, self.get_keyboard())
-        else: 
-            success = self.tg.edit_message(self.dashboard_msg_id, dash, self.get_keyboard())
-            if not success: self.dashboard_msg_id = None
+        self.post_dashboard(dash)
+
+    def post_dashboard(self, dash):
+        """
+        Новое сообщение дашборда или правка текущего. Под _dashboard_lock: задача пула планировщика
+        и update_dashboard(force=True) торгового цикла иначе обе отправят новое сообщение
+        """
+        with self._dashboard_lock:
+            if not self.dashboard_msg_id: 
+                self.dashboard_msg_id = self.tg.send(dash, self.get_keyboard())
+            else: 
+                success = self.tg.edit_message(self.dashboard_msg_id, dash, self.get_keyboard())
+                if not success: self.dashboard_msg_id = None
 
     def get_real_order_fee(self, order_id):
         """Получение реальной комиссии"""
@@ -860,7 +924,7 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             f"💰 PnL: <b>{pnl_val:+.2f}$</b> (ROI: {roi:+.2f}%)\n"
             f"💸 Комиссия: -{fee_display:.2f}$\n"
             f"📊 Вход: {self.avg_price:.4f} | Текущая: {current:.4f}\n"
-            f"🔨 DCA: {self.safety_count}/{SAFETY_ORDERS_COUNT}"
+            f"🔨 DCA: {self.safety_count}/{self.cfg.SAFETY_ORDERS_COUNT}"
         )
         if self.trade_msg_id:
             self.tg.edit_message(self.trade_msg_id, msg, self.get_keyboard())
@@ -882,48 +946,120 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             [{"text": "🔄 Refresh", "callback_data": "refresh"}, {"text": "💣 Panic Sell", "callback_data": "panic_sell"}]
         ]}
 
-    def check_telegram_commands(self):
-        """Обработка команд Telegram"""
-        for up in self.tg.get_updates():
-            if up['type'] == 'callback':
-                cid, mid = up['id'], up['msg_id']
-                if up['value'] == "start_bot":
-                    self.trading_active = True
-                    self.graceful_stop_mode = False
-                    self.tg.edit_message(mid, "✅ Started!", self.get_keyboard())
-                elif up['value'] == "graceful_stop":
-                    self.graceful_stop_mode = True
-                    self.tg.edit_message(mid, "⏳ Finishing trade...", self.get_keyboard())
-                    if not self.in_position: 
-                        self.trading_active = False
-                        self.graceful_stop_mode = False
-                elif up['value'] == "cancel_stop":
+    def wait_telegram_updates(self, timeout):
+        """Пауза цикла - long-poll Telegram на timeout сек (прерывается входящей командой) -> updates"""
+        deadline = time.time() + timeout
+        updates = self.tg.get_updates(timeout=timeout)
+        if not updates and deadline > time.time():
+            time.sleep(deadline - time.time())  # Дробная часть / Telegram отключён
+        return updates
+
+    def check_telegram_commands(self, poll_timeout=0, updates=None):
+        """Обработка команд Telegram. updates - уже полученные паузой цикла (иначе опрос с poll_timeout)"""
+        if updates is None:
+            updates = self.wait_telegram_updates(poll_timeout)
+        for up in updates:
+            self.handle_update(up)
+        if updates:
+            self.publish_state()  # start / stop сразу видны дашборду
+
+    def handle_update(self, up):
+        """Одна команда Telegram (callback кнопки / текст)"""
+        if up['type'] == 'callback':
+            mid = up['msg_id']
+            if up['value'] == "start_bot":
+                self.trading_active = True
+                self.graceful_stop_mode = False
+                self.tg.edit_message(mid, "✅ Started!", self.get_keyboard())
+            elif up['value'] == "graceful_stop":
+                self.graceful_stop_mode = True
+                self.tg.edit_message(mid, "⏳ Finishing trade...", self.get_keyboard())
+                if not self.in_position: 
+                    self.trading_active = False
                     self.graceful_stop_mode = False
-                    self.tg.edit_message(mid, "✅ Continued.", self.get_keyboard())
-                elif up['value'] == "panic_sell":
-                    self.close_position_market("Panic Sell")
-                elif up['value'] == "balance":
-                    self.refresh_wallet_status()
-                    self.tg.edit_message(mid, f"💵 Bal: ${self.balance:.2f}", self.get_keyboard())
-                elif up['value'] == "refresh":
-                    self.update_dashboard(force=True)
-                elif up['value'] == "ai_report":
-                    self.trigger_ai_report_thread(manual=True)
-            
-            # 🆕 Обработка текстовых сообщений (AI чат)
-            elif up['type'] == 'text':
-                text = up['value'].strip()
-                if text.startswith('?') or text.startswith('/ask '):
-                    q = text.lstrip('?/').replace('ask', '').strip()
-                    if q:
-                        self.tg.send(f"⏳ Думаю над вопросом: {q[:50]}...")
-                        self.trigger_ai_chat_reply(q)
+            elif up['value'] == "cancel_stop":
+                self.graceful_stop_mode = False
+                self.tg.edit_message(mid, "✅ Continued.", self.get_keyboard())
+            elif up['value'] == "panic_sell":
+                self.execution.cancel()
+                self.close_position_market("Panic Sell")
+            elif up['value'] == "balance":
+                self.refresh_wallet_status()
+                self.tg.edit_message(mid, f"💵 Bal: ${self.balance:.2f}", self.get_keyboard())
+            elif up['value'] == "refresh":
+                self.update_dashboard(force=True)
+            elif up['value'] == "ai_report":
+                self.trigger_ai_report_thread(manual=True)
+        
+        # 🆕 Обработка текстовых сообщений (AI чат)
+        elif up['type'] == 'text':
+            text = up['value'].strip()
+            if text.startswith('/profile'):
+                self.handle_profile_command(text, up.get('chat_id'))
+            elif text.startswith('/jobs'):
+                self.tg.send(f"⏰ <b>Jobs</b>\n<pre>{self.scheduler.format_stats()}</pre>")
+            elif text.startswith('/entry'):
+                self.tg.send(f"⚡ <b>Smart entry</b>\n<pre>{self.execution.format_stats()}</pre>")
+            elif text.startswith('/shadow'):
+                stats = self.shadows.format_stats() if self.shadows else "SHADOW_CONFIGS is empty"
+                self.tg.send(f"👥 <b>Shadow</b>\n<pre>{stats}</pre>")
+            elif text.startswith('?') or text.startswith('/ask '):
+                q = text.lstrip('?/').replace('ask', '').strip()
+                if q:
+                    self.tg.send(f"⏳ Думаю над вопросом: {q[:50]}...")
+                    self.trigger_ai_chat_reply(q)
+
+    def handle_profile_command(self, text, chat_id):
+        """
+        /profile [сек]          - sampling профайлер всех потоков (collapsed stacks)
+        /profile cprofile [сек] - cProfile торгового потока
+        /profile stop | status
+        Только для чата из настроек, длительность ограничена PROFILER_MAX_DURATION
+        """
+        if str(chat_id) != str(self.tg.chat_id):
+            self.log(f"⛔ /profile from foreign chat {chat_id} ignored", Col.YELLOW)
+            return
+        
+        args = text.split()[1:]
+        cmd = args[0].lower() if args else "sampling"
+        if cmd == "stop":
+            if not self.profiler.stop():
+                self.tg.send(self.profiler.status())
+            return
+        if cmd == "status":
+            self.tg.send(self.profiler.status())
+            return
+        
+        if cmd.replace('.', '', 1).isdigit():
+            cmd, args = "sampling", ["sampling"] + args
+        duration = args[1] if len(args) > 1 else None
+        if cmd == "cprofile":
+            started = self.profiler.start_cprofile(duration)
+        elif cmd == "sampling":
+            started = self.profiler.start_sampling(duration)
+        else:
+            self.tg.send("ℹ️ /profile [sec] | /profile cprofile [sec] | /profile stop | /profile status")
+            return
+        
+        if started is False:
+            self.tg.send(f"⚠️ Already running. {self.profiler.status()}")
+        else:
+            self.log(f"🔥 Profiler started: {cmd} for {started:.0f}s", Col.MAGENTA)
+            self.tg.send(f"🔥 Profiler started: <b>{cmd}</b> for {started:.0f}s")
+
+    def _on_profile_done(self, path, caption):
+        self.log(f"🔥 Profile saved: {path}", Col.MAGENTA)
+        if PROFILER_SEND_TO_TELEGRAM:
+            threading.Thread(target=self.tg.send_document, args=(path, caption), daemon=True).start()
+        else:
+            self.tg.send(f"{caption}\n💾 {path}")
 
     def cancel_all_orders(self):
         """Отмена всех ордеров"""
         try:
             if self.tp_order_id: self.exchange.cancel_order(self.tp_order_id, self.symbol)
-            if self.dca_order_id: self.exchange.cancel_order(self.dca_order_id, self.symbol)
+            if self.dca_ladder: self.cancel_dca_ladder()
+            elif self.dca_order_id: self.exchange.cancel_order(self.dca_order_id, self.symbol)
             if self.sl_order_id: self.exchange.cancel_order(self.sl_order_id, self.symbol)
         except: pass
         self.tp_order_id = None
@@ -933,7 +1069,11 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
         except: pass
 
     def refresh_wallet_status(self, notify=False):
-        """Обновление баланса"""
+        """Обновление баланса (в портфеле - общий кэшированный fetch_balance)"""
+        if self.portfolio:
+            self.balance = self.portfolio.get_balance()
+            if self.peak_balance < self.balance: self.peak_balance = self.balance
+            return
         try:
             bal = self.exchange.fetch_balance({'type': 'swap'})
             if 'USDT' in bal: self.balance = float(bal['USDT']['total'])
@@ -958,15 +1098,16 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
         # Ограничения: минимум 0.25%, максимум 1.0%
         dynamic_tp = max(0.0025, min(dynamic_tp, 0.010))
         
-        self.log(f"🎯 Dynamic TP: {dynamic_tp*100:.2f}% (Base: {base_tp*100:.2f}%, ATR: +{atr_component*100:.3f}%)", Col.GRAY)
+        self.log("🎯 Dynamic TP: %.2f%% (Base: %.2f%%, ATR: +%.3f%%)", Col.GRAY,
+                 dynamic_tp * 100, base_tp * 100, atr_component * 100, category="dynamic_tp")
         
         return float(dynamic_tp)
 
     def get_dca_parameters(self):
         """Параметры DCA"""
         if self.is_trending_market: 
-            return HAMMER_DISTANCES_TREND, HAMMER_WEIGHTS_TREND
-        return HAMMER_DISTANCES_RANGE, HAMMER_WEIGHTS_RANGE
+            return self.cfg.HAMMER_DISTANCES_TREND, self.cfg.HAMMER_WEIGHTS_TREND
+        return self.cfg.HAMMER_DISTANCES_RANGE, self.cfg.HAMMER_WEIGHTS_RANGE
 
     def process_funding(self):
         """Обработка funding fee"""
@@ -974,22 +1115,25 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             self.last_funding_time = datetime.now()
             return
         if (datetime.now() - self.last_funding_time).total_seconds() >= 8 * 3600:
-            cost = (self.total_size_coins * self.avg_price) * FUNDING_RATE_8H
+            notional = self.total_size_coins * self.avg_price
+            cost = notional * self.cfg.FUNDING_RATE_8H
             self.log(f"📉 Funding estimated: -{cost:.2f}$", Col.GRAY)
+            self.journal.record_funding(self.trade_id, cost, rate=self.cfg.FUNDING_RATE_8H, notional=notional)
             self.last_funding_time = datetime.now()
 
     def check_trailing_stop(self):
         """Trailing stop"""
-        if not TRAILING_ENABLED or not self.in_position: return False
+        if not self.cfg.TRAILING_ENABLED or not self.in_position: return False
         current_price = self.last_price 
         side_mult = 1 if self.position_side == "Buy" else -1
         pnl_pct = (current_price - self.avg_price) / self.avg_price * side_mult
         
         if not self.trailing_active:
-            if pnl_pct >= TRAILING_ACTIVATION_PCT:
+            if pnl_pct >= self.cfg.TRAILING_ACTIVATION_PCT:
                 self.trailing_active = True
                 self.trailing_peak_price = current_price
                 self.log(f"🎯 Trailing ACTIVATED @ {current_price:.4f}", Col.CYAN)
+                self.save_state("trailing")
                 return False
         
         if self.trailing_active:
@@ -1001,13 +1145,113 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                 if current_price < self.trailing_peak_price: 
                     self.trailing_peak_price = current_price
                 callback = (current_price - self.trailing_peak_price) / self.trailing_peak_price
+            self.save_state("trailing_peak", sync=False)
             
-            if callback >= TRAILING_CALLBACK_PCT:
+            if callback >= self.cfg.TRAILING_CALLBACK_PCT:
                 self.log(f"🔔 TRAILING STOP TRIGGERED!", Col.MAGENTA)
                 self.close_position_market(f"Trailing Stop (+{pnl_pct*100:.2f}%)")
                 return True
         return False
 
+    def refresh_triggers(self):
+        """Индекс уровней позиции: пересчёт только при изменении входных данных"""
+        if not self.in_position or self.total_size_coins <= 0 or self.avg_price <= 0:
+            if not self.triggers.is_empty:
+                self.triggers.clear()
+                self._publish_levels(())
+            return self.triggers
+        rsi = self.current_market_df['RSI'].iloc[-2] if self.current_market_df is not None else 50.0
+        changed = self.triggers.update("orders", (
+            self.position_side, self.avg_price, self.base_entry_price, self.total_size_coins,
+            self.safety_count, self.entry_usd_vol, self.current_volatility, float(rsi),
+            self.is_trending_market, self.balance,
+        ), self._order_triggers)
+        changed |= self.triggers.update("trailing", (
+            self.position_side, self.avg_price, self.trailing_active, self.trailing_peak_price,
+        ), self._trailing_triggers)
+        if changed:
+            self._publish_levels(self.triggers.levels())
+        return self.triggers
+
+    def _order_triggers(self):
+        """TP, оставшиеся уровни DCA, SL и жёсткий стоп по балансу"""
+        is_long = self.position_side == "Buy"
+        side_mult = 1 if is_long else -1
+        tp_price, tp_amount = self._tp_target()
+        sl_price, sl_amount = self._sl_target()
+        triggers = [
+            Trigger("tp", "tp", tp_price, is_long, tp_amount),
+            Trigger("sl", "sl", sl_price, not is_long, sl_amount),
+        ]
+        for lvl in range(self.safety_count, self.cfg.SAFETY_ORDERS_COUNT):
+            dca_price, dca_amount, _, _, _ = self._dca_level_order(lvl)
+            triggers.append(Trigger(f"dca:{lvl}", "dca", dca_price, not is_long, dca_amount))
+        
+        # Цена, при которой сработает check_hard_stop
+        max_loss = self.get_effective_balance() * self.cfg.MAX_ACCOUNT_LOSS_PCT
+        hard_stop = self.avg_price - (max_loss / self.total_size_coins) * side_mult
+        triggers.append(Trigger("hard_stop", "hard_stop", hard_stop, not is_long))
+        return triggers
+
+    def _trailing_triggers(self):
+        """Активация trailing или (после активации) новый пик и откат на TRAILING_CALLBACK_PCT"""
+        if not self.cfg.TRAILING_ENABLED:
+            return []
+        is_long = self.position_side == "Buy"
+        side_mult = 1 if is_long else -1
+        if not self.trailing_active:
+            return [Trigger("trail_activate", "trail_activate",
+                            self.avg_price * (1 + self.cfg.TRAILING_ACTIVATION_PCT * side_mult), is_long)]
+        return [
+            Trigger("trail_peak", "trail_peak", self.trailing_peak_price, is_long),
+            Trigger("trail_stop", "trail_stop",
+                    self.trailing_peak_price * (1 - self.cfg.TRAILING_CALLBACK_PCT * side_mult), not is_long),
+        ]
+
+    def next_loop_interval(self):
+        """
+        Пауза до следующей итерации: пропорционально расстоянию до ближайшего уровня
+        (TP / DCA / SL / trailing) в единицах ATR, в пределах LOOP_INTERVAL_MIN..MAX.
+        Без позиции - до закрытия текущей свечи (сигнал считается по закрытым свечам),
+        во время smart entry - минимальная, чтобы быстро забрать результат
+        """
+        if self.execution.busy:
+            interval = LOOP_INTERVAL_MIN
+            NEAREST_TRIGGER_ATR.set(0, symbol=self.symbol)
+        elif not self.in_position:
+            tf_sec = self.exchange.parse_timeframe(self.timeframe) if hasattr(self.exchange, 'parse_timeframe') else 60
+            interval = tf_sec - (time.time() % tf_sec) + 1.0
+            NEAREST_TRIGGER_ATR.set(0, symbol=self.symbol)
+        else:
+            nearest = self.refresh_triggers().nearest(self.last_price) if self.last_price > 0 else None
+            atr = self.current_volatility
+            if nearest is None or atr <= 0:
+                interval = LOOP_INTERVAL_MIN
+                NEAREST_TRIGGER_ATR.set(0, symbol=self.symbol)
+            else:
+                dist_atr = (nearest.distance_pct(self.last_price) / 100) / atr
+                interval = LOOP_INTERVAL_MIN + (LOOP_INTERVAL_MAX - LOOP_INTERVAL_MIN) * min(1.0, dist_atr / LOOP_CADENCE_FAR_ATR)
+                NEAREST_TRIGGER_ATR.set(round(dist_atr, 3), symbol=self.symbol)
+        next_job = self.scheduler.next_due()
+        if next_job is not None:
+            interval = min(interval, next_job)
+        interval = max(LOOP_INTERVAL_MIN, min(interval, LOOP_INTERVAL_MAX))
+        LOOP_INTERVAL.set(round(interval, 3))
+        return interval
+
+    def check_hard_stop(self):
+        """Жёсткий SL: нереализованный убыток >= MAX_ACCOUNT_LOSS_PCT от баланса"""
+        try:
+            max_loss = self.get_effective_balance() * self.cfg.MAX_ACCOUNT_LOSS_PCT
+            side_mult = 1 if self.position_side == "Buy" else -1
+            u_pnl = (self.last_price - self.avg_price) * self.total_size_coins * side_mult
+            
+            if u_pnl <= -max_loss:
+                self.close_position_market(f"STOP LOSS -{self.cfg.MAX_ACCOUNT_LOSS_PCT*100}%")
+                return True
+        except: pass
+        return False
+
     def reset_trailing(self):
         """Сброс trailing"""
         self.trailing_active = False
@@ -1029,6 +1273,107 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                 pass
         return False, 0
 
+    def save_state(self, reason="step", sync=True):
+        """💾 Снимок для других потоков + чекпоинт (state_store.py): только если состояние изменилось"""
+        state = self.publish_state()
+        if state is None or not self.state_store:
+            return
+        try:
+            self.state_store.save(state, reason, sync)
+        except Exception as e:
+            self._published_state = None  # Повтор записи на следующем переходе
+            self.log(f"⚠️ State save error: {e}", Col.YELLOW)
+
+    def publish_state(self):
+        """🧊 Новый self.snapshot (snapshots.py) по полям чекпоинта. None - ничего не изменилось"""
+        state = capture(self, POSITION_FIELDS + SESSION_FIELDS)
+        with self._snapshot_lock:
+            if state == self._published_state:
+                return None
+            self._published_state = state
+            snap = self.snapshot
+            self.snapshot = snap.replace(position=PositionSnapshot.from_state(state),
+                                         session=SessionSnapshot.from_state(state),
+                                         orders=snap.orders.with_ids(state), version=snap.version + 1)
+        return state
+
+    def _publish(self, **parts):
+        """Замена частей снимка (рынок) - одно присваивание self.snapshot"""
+        with self._snapshot_lock:
+            snap = self.snapshot
+            self.snapshot = snap.replace(version=snap.version + 1, **parts)
+
+    def _publish_levels(self, levels):
+        """Уровни TP / DCA / SL после пересчёта индекса"""
+        with self._snapshot_lock:
+            snap = self.snapshot
+            self.snapshot = snap.replace(orders=snap.orders.with_levels(levels), version=snap.version + 1)
+
+    def restore_state(self):
+        """
+        💾 Рестарт по чекпоинту + одна сверка с биржей (снимок Reconciler).
+        Позиция восстанавливается как была: сетка, id ордеров, trailing, комиссии.
+        Что изменилось, пока бот стоял, решает обычная логика: fill ордеров -
+        проверка ордеров в step(), недостающие / лишние ордера - Doctor по тому же снимку.
+        Без чекпоинта или при расхождении стороны - прежний _sync_position_with_exchange
+        """
+        record = self.state_store.load()
+        if not record:
+            return False
+        state = record["state"]
+        try:
+            snap = self.reconciler.snapshot()
+        except Exception as e:
+            self.log(f"⚠️ State restore: exchange snapshot failed ({e}), Doctor will sync", Col.YELLOW)
+            return False
+
+        age = time.time() - record["ts"]
+        if state.get("session_date") == self.session_date:
+            restore(self, state, SESSION_FIELDS)
+        else:
+            restore(self, state, [name for name in SESSION_FIELDS if name not in DAILY_FIELDS])
+            self.log(f"💾 Checkpoint session from {state.get('session_date') or 'unknown day'}: "
+                     f"daily counters reset", Col.CYAN)
+        if not state.get("in_position"):
+            self.log(f"💾 Restored session (seq {record['seq']}, {age:.0f}s old), no position", Col.CYAN)
+            if snap.position_size:
+                self._sync_position_with_exchange()
+            return True
+
+        side = state["position_side"]
+        if snap.position_size == 0:
+            # Закрылась, пока бот стоял: по TP - закрытие с учётом проведёт step(), иначе чекпоинт устарел
+            tp_filled = False
+            if state.get("tp_order_id"):
+                try:
+                    tp_filled = self.exchange.fetch_order(state["tp_order_id"], self.symbol)['status'] == 'closed'
+                except Exception:
+                    pass
+            if not tp_filled:
+                self.log(f"💾 Checkpoint position {side} {state['total_size_coins']} is gone on exchange, dropped", Col.YELLOW)
+                restore(self, state, POSITION_FIELDS)  # Ордера и сделка журнала чекпоинта
+                self._drop_gone_position("gone while down")
+                return False
+        elif snap.position is not None:
+            exch_side = snap.position.get('side')
+            if exch_side and exch_side.lower() != ('long' if side == "Buy" else 'short'):
+                self.log(f"💾 Checkpoint side {side} != exchange {exch_side}, re-sync", Col.YELLOW)
+                self._sync_position_with_exchange()
+                return False
+
+        restore(self, state, POSITION_FIELDS)
+        if self.dca_ladder:
+            self.dca_ladder = {str(oid): int(lvl) for oid, lvl in self.dca_ladder.items()}
+        self.log(f"💾 Restored {side} {self.total_size_coins} @ {self.avg_price:.4f} | DCA {self.safety_count} | "
+                 f"trade {self.trade_id} (seq {record['seq']}, {age:.0f}s old)", Col.CYAN)
+        if snap.position_size and abs(snap.position_size - self.total_size_coins) > self.total_size_coins * RECONCILE_AMOUNT_TOLERANCE:
+            self.log(f"💾 Exchange size {snap.position_size} differs - fills while down go through order check", Col.YELLOW)
+        if snap.position_size:
+            self.perform_health_check(snap)
+        else:
+            self.refresh_triggers()
+        return True
+
     def _sync_position_with_exchange(self):
         """Синхронизация позиции - УЛУЧШЕННАЯ"""
         try:
@@ -1052,12 +1397,12 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                     
                     # Восстанавливаем entry_usd_vol если нужно
                     if self.entry_usd_vol == 0:
-                        real_lev = float(pos.get('leverage', LEVERAGE))
+                        real_lev = float(pos.get('leverage', self.cfg.LEVERAGE))
                         self.entry_usd_vol = (self.avg_price * self.total_size_coins) / real_lev
                     
                     # Восстанавливаем safety_count (грубая оценка)
                     if self.safety_count == 0 and self.entry_usd_vol > 0:
-                        position_usd = (self.avg_price * self.total_size_coins) / LEVERAGE
+                        position_usd = (self.avg_price * self.total_size_coins) / self.cfg.LEVERAGE
                         if position_usd > self.entry_usd_vol * 1.5:
                             # Примерно вычисляем уровень DCA
                             _, weights = self.get_dca_parameters()
@@ -1069,6 +1414,12 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                                     self.log(f"🔄 Restored DCA level: {self.safety_count}", Col.CYAN)
                                     break
                     
+                    if not self.trade_id:
+                        self.trade_id = self._new_trade_id()
+                        self.journal.open_trade(self.trade_id, self.symbol, self.position_side, self.avg_price,
+                                                self.total_size_coins, self.entry_usd_vol, self.current_confluence,
+                                                self.current_stage, self.current_volatility)
+                    
                     found = True
                     self.log(f"🔄 Sync: {self.position_side} {self.total_size_coins:.4f} @ {self.avg_price:.2f}", Col.BLUE)
                     break
@@ -1086,6 +1437,7 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             for pos in positions:
                 if float(pos.get('contracts', 0) or pos['info'].get('positionAmt', 0)) != 0:
                     self.in_position = True
+                    self.tracer.discard("entry")
                     self._sync_position_with_exchange()
                     return
         except: pass
@@ -1104,16 +1456,32 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             self.refresh_wallet_status()
             
             vol_pct = self.calculate_smart_position_size_hybrid(df, stage)
-            vol_usd = max(self.get_effective_balance() * vol_pct, MIN_EXCHANGE_ORDER_USD)
+            vol_usd = max(self.get_effective_balance() * vol_pct, self.cfg.MIN_EXCHANGE_ORDER_USD)
+            if self.portfolio and not self.portfolio.allow_entry(self, vol_usd):
+                self.tracer.discard("entry")
+                return
             
             ticker = self.exchange.fetch_ticker(self.symbol)
             limit_price = ticker['bid'] if side == 'Buy' else ticker['ask']
             
-            raw_amount = (vol_usd * LEVERAGE) / limit_price
+            raw_amount = (vol_usd * self.cfg.LEVERAGE) / limit_price
             size_coins = float(self.exchange.amount_to_precision(self.symbol, raw_amount))
             
             self.log(f"📝 Ordering: {size_coins} coins (~{vol_usd:.2f}$ = {vol_pct*100:.2f}%) @ {limit_price}", Col.GRAY)
 
+            self.tracer.mark("entry", "order_submit")
+            if self.cfg.SMART_ENTRY_ENABLED:
+                # ⚡ Асинхронно: результат заберёт run() через _poll_entry_execution
+                signal_price = float(ticker["last"] or limit_price)
+                request = EntryRequest(side, size_coins, signal_price, stage, confluence, {"vol_usd": vol_usd})
+                if self.execution.submit(request):
+                    self.pending_entry_usd = vol_usd
+                    self.log(f"⚡ Smart entry: post-only {side} {size_coins} from {signal_price:.2f} "
+                             f"(budget {ENTRY_SLIPPAGE_BUDGET_PCT}%, {ENTRY_TIME_LIMIT}s)", Col.YELLOW)
+                else:
+                    self.tracer.discard("entry")
+                return
+
             order = self.exchange.create_order(
                 symbol=self.symbol, 
                 type='limit', 
@@ -1123,6 +1491,8 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                 params={'positionSide': 'LONG' if side == 'Buy' else 'SHORT'}
             )
             
+            self.tracer.mark("entry", "exchange_ack")
+            
             success, final_fill_price = self.wait_for_order_fill(order['id'])
             if not success:
                 self.log("⚠️ Order timed out. Cancelling...", Col.YELLOW)
@@ -1135,52 +1505,140 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                         final_fill_price = float(check['average'])
                         success = True
                     else: 
+                        self.tracer.discard("entry")
                         return
                 except: 
+                    self.tracer.discard("entry")
                     return
 
-            self.in_position = True
-            self.position_side = side
-            self.avg_price = final_fill_price
-            self.first_entry_price = final_fill_price
-            self.base_entry_price = final_fill_price
-            self.total_size_coins = size_coins
-            self.entry_usd_vol = vol_usd
-            self.safety_count = 0
-            self.current_confluence = confluence
-            self.current_stage = stage
-            self.trade_start_time = datetime.now()
-            self.trades_today += 1
-            self.current_trade_fees = self.get_real_order_fee(order['id']) or ((size_coins * final_fill_price) * MAKER_FEE)
-            
-            self._sync_position_with_exchange()
-            self.log(f"🟢 OPENED {stage_emoji}: {side} @ {final_fill_price:.4f} (Confluence: {confluence}/7)", Col.GREEN)
-            
-            # 🆕 v1.3: Blackbox логирование
-            self.log_blackbox("ENTRY", {
-                "side": side,
-                "price": final_fill_price,
-                "size": size_coins,
-                "confluence": confluence,
-                "stage": stage,
-                "balance": self.balance,
-                "entry_usd": vol_usd
-            })
-            
-            self.send_or_update_trade_message(f"Open {stage_emoji} Stage{stage} 🚀")
-            self.place_limit_tp()
-            self.place_limit_dca()
-            self.place_stop_loss()  # 🆕 Stop Loss
-            self.reset_trailing()
-            self.update_dashboard(force=True)
+            self.tracer.mark("entry", "fill_detected")
+            self._finalize_entry(side, stage, confluence, final_fill_price, size_coins, vol_usd, [order['id']])
 
         except Exception as e:
+            self.tracer.discard("entry")
             self.log(f"❌ Entry failed: {e}", Col.RED)
             try: 
                 self.exchange.cancel_all_orders(self.symbol)
             except: pass
             self._sync_position_with_exchange()
 
+    def _poll_entry_execution(self):
+        """Результаты ⚡ smart entry (вызывается из run() под position_lock)"""
+        for result in self.execution.poll():
+            req = result.request
+            self.pending_entry_usd = 0.0
+            self.log_blackbox("ENTRY_EXECUTION", {
+                "status": result.status,
+                "reason": result.reason,
+                "side": req.side,
+                "requested": req.amount,
+                "filled": result.filled,
+                "signal_price": req.signal_price,
+                "avg_price": result.avg_price,
+                "slippage_pct": result.slippage_pct,
+                "time_to_fill": result.time_to_fill,
+                "quotes": result.reprices,
+                "taker": bool(result.taker_order_id),
+            })
+            if result.status == "failed":
+                self.tracer.discard("entry")
+                self.log(f"⚠️ Smart entry not filled: {result.reason}", Col.YELLOW)
+                continue
+            if self.in_position:
+                # Исполнение уже подхватил _sync_position_with_exchange - второй сделки не открываем
+                self.tracer.discard("entry")
+                self.log(f"⚠️ Smart entry fill {result.filled} already synced, result dropped", Col.YELLOW)
+                continue
+            if result.cancelled:
+                # Panic Sell во время входа: исполненную часть не открываем, а закрываем
+                self.tracer.discard("entry")
+                self.log(f"🚨 Smart entry cancelled with fill {result.filled}, closing it", Col.RED)
+                self._sync_position_with_exchange()
+                self.close_position_market("Panic Sell (entry fill)")
+                continue
+            
+            self.tracer.mark("entry", "exchange_ack", result.first_ack)
+            self.tracer.mark("entry", "fill_detected", result.filled_at)
+            size_coins = float(self.exchange.amount_to_precision(self.symbol, result.filled))
+            vol_usd = req.context["vol_usd"] * result.filled / req.amount
+            self.log(f"⚡ Smart entry {result.status}: {result.filled} @ {result.avg_price:.4f} "
+                     f"(slippage {result.slippage_pct:+.3f}%, {result.time_to_fill:.1f}s, {result.reason})", Col.CYAN)
+            try:
+                self._finalize_entry(req.side, req.stage, req.confluence, result.avg_price, size_coins, vol_usd,
+                                     result.order_ids, taker_order_id=result.taker_order_id)
+            except Exception as e:
+                self.tracer.discard("entry")
+                self.log(f"❌ Entry failed: {e}", Col.RED)
+                self._sync_position_with_exchange()
+
+    def _finalize_entry(self, side, stage, confluence, final_fill_price, size_coins, vol_usd, order_ids, taker_order_id=None):
+        """Позиция открыта: состояние, журнал, blackbox, TP / DCA / SL"""
+        stage_emoji = ["", "🟡", "🟠", "🔴"][stage]
+        self.in_position = True
+        self.position_side = side
+        self.avg_price = final_fill_price
+        self.first_entry_price = final_fill_price
+        self.base_entry_price = final_fill_price
+        self.total_size_coins = size_coins
+        self.entry_usd_vol = vol_usd
+        self.safety_count = 0
+        self.current_confluence = confluence
+        self.current_stage = stage
+        self.trade_start_time = datetime.now()
+        self.trades_today += 1
+        real_fee = sum(self.get_real_order_fee(oid) or 0.0 for oid in order_ids)
+        fee_rate = TAKER_FEE if taker_order_id else MAKER_FEE
+        self.current_trade_fees = real_fee or ((size_coins * final_fill_price) * fee_rate)
+        
+        self.trade_id = self._new_trade_id()
+        self.journal.open_trade(self.trade_id, self.symbol, side, final_fill_price, size_coins, vol_usd,
+                                confluence, stage, self.current_volatility)
+        FILLS.inc(kind="entry")
+        self.journal.record_fill(self.trade_id, "ENTRY", side, final_fill_price, size_coins,
+                                 fee=self.current_trade_fees, order_id=",".join(str(o) for o in order_ids),
+                                 estimated_fee=not real_fee)
+        self.save_state("entry")
+        
+        self._sync_position_with_exchange()
+        self.log(f"🟢 OPENED {stage_emoji}: {side} @ {final_fill_price:.4f} (Confluence: {confluence}/7)", Col.GREEN)
+        
+        # 🆕 v1.3: Blackbox логирование
+        self.log_blackbox("ENTRY", {
+            "side": side,
+            "price": final_fill_price,
+            "size": size_coins,
+            "confluence": confluence,
+            "stage": stage,
+            "balance": self.balance,
+            "entry_usd": vol_usd
+        })
+        
+        self.send_or_update_trade_message(f"Open {stage_emoji} Stage{stage} 🚀")
+        self.place_limit_tp()
+        self.place_limit_dca()
+        self.place_stop_loss()  # 🆕 Stop Loss
+        self.tracer.mark("entry", "followup_placed")
+        self.tracer.finish("entry", self.trade_id)
+        self.reset_trailing()
+        self.save_state("entry_orders")
+        self.update_dashboard(force=True)
+
+
+    def _sl_target(self):
+        """Цена и объём SL: MAX_ACCOUNT_LOSS_PCT от средней"""
+        side_mult = 1 if self.position_side == "Buy" else -1
+        sl_price = self.avg_price * (1 + (self.cfg.MAX_ACCOUNT_LOSS_PCT * (-side_mult)))
+        price = float(self.exchange.price_to_precision(self.symbol, sl_price))
+        amount = float(self.exchange.amount_to_precision(self.symbol, self.total_size_coins))
+        return price, amount
+
+    def _tp_target(self):
+        """Цена и объём TP: 🆕 v1.3 динамический TP от ATR"""
+        side_mult = 1 if self.position_side == "Buy" else -1
+        tp_distance = float(self.get_dynamic_tp_steps())
+        price = float(self.exchange.price_to_precision(self.symbol, self.avg_price * (1 + (tp_distance * side_mult))))
+        amount = float(self.exchange.amount_to_precision(self.symbol, self.total_size_coins))
+        return price, amount
 
     def place_stop_loss(self):
         """🆕 Размещение Stop Loss ордера"""
@@ -1188,14 +1646,7 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             return False
         
         try:
-            side_mult = 1 if self.position_side == "Buy" else -1
-            
-            # SL на уровне MAX_ACCOUNT_LOSS_PCT
-            sl_distance = MAX_ACCOUNT_LOSS_PCT
-            sl_price = self.avg_price * (1 + (sl_distance * (-side_mult)))
-            
-            price = float(self.exchange.price_to_precision(self.symbol, sl_price))
-            amount = float(self.exchange.amount_to_precision(self.symbol, self.total_size_coins))
+            price, amount = self._sl_target()
             
             # Стоп-маркет ордер
             order = self.exchange.create_order(
@@ -1234,17 +1685,8 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             return False
         
         try:
-            side_mult = 1 if self.position_side == "Buy" else -1
-            
-            # 🆕 v1.3: Используем динамический TP от ATR
-            tp_distance = float(self.get_dynamic_tp_steps())
-            
-            price = float(self.exchange.price_to_precision(
-                self.symbol, 
-                self.avg_price * (1 + (tp_distance * side_mult))
-            ))
-            
-            amount = float(self.exchange.amount_to_precision(self.symbol, self.total_size_coins))
+            price, amount = self._tp_target()
+            tp_distance = abs(price / self.avg_price - 1)
             
             # 🆕 v1.4.1: Логирование параметров
             order_side = "sell" if self.position_side == "Buy" else "buy"
@@ -1280,6 +1722,9 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
         if hasattr(self, '_dca_placing') and self._dca_placing:
             return False
         
+        if self.cfg.DCA_LADDER_MODE:
+            return self.place_dca_ladder()
+        
         self._dca_placing = True
         
         try:
@@ -1291,33 +1736,11 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                     pass
                 self.dca_order_id = None
             
-            if self.safety_count >= SAFETY_ORDERS_COUNT:
+            if self.safety_count >= self.cfg.SAFETY_ORDERS_COUNT:
                 self._dca_placing = False
                 return False
             
-            dists, weights = self.get_dca_parameters()
-            base_dist = dists[self.safety_count]
-            
-            dist_multiplier = self.get_smart_distance_multiplier(self.safety_count)
-            actual_dist = base_dist * dist_multiplier
-            
-            # 🔧 v1.3: ИСПРАВЛЕНО! DCA для SHORT теперь ВЫШЕ входа
-            if self.position_side == "Buy":
-                # LONG: DCA размещается НИЖЕ входа (при падении)
-                dca_price = self.base_entry_price * (1 - actual_dist)
-            else:
-                # SHORT: DCA размещается ВЫШЕ входа (при росте)
-                dca_price = self.base_entry_price * (1 + actual_dist)
-            
-            dca_price = float(self.exchange.price_to_precision(self.symbol, dca_price))
-            
-            weight = weights[self.safety_count]
-            first_order_usd = self.entry_usd_vol
-            dca_vol_usd = first_order_usd * weight
-            dca_vol_usd = max(dca_vol_usd, MIN_EXCHANGE_ORDER_USD)
-            
-            dca_size_coins = (dca_vol_usd * LEVERAGE) / dca_price
-            dca_size_coins = float(self.exchange.amount_to_precision(self.symbol, dca_size_coins))
+            dca_price, dca_size_coins, actual_dist, weight, dca_vol_usd = self._dca_level_order(self.safety_count)
             
             # 🆕 v1.4.1: Логирование параметров
             self.log(f"📝 DCA{self.safety_count+1} Params: side={self.position_side.lower()}, amount={dca_size_coins}, price={dca_price:.4f}, base={self.base_entry_price:.4f}, dist={actual_dist*100:.2f}%, weight={weight}x", Col.GRAY)
@@ -1351,7 +1774,131 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             self._dca_placing = False
             return False
 
-    def execute_dca(self, fill_price, fill_amount, order_id):
+    def _dca_level_order(self, level):
+        """Цена и объём DCA уровня level (0..SAFETY_ORDERS_COUNT-1) от base_entry_price"""
+        dists, weights = self.get_dca_parameters()
+        actual_dist = dists[level] * self.get_smart_distance_multiplier(level)
+        
+        # 🔧 v1.3: ИСПРАВЛЕНО! DCA для SHORT теперь ВЫШЕ входа
+        if self.position_side == "Buy":
+            # LONG: DCA размещается НИЖЕ входа (при падении)
+            dca_price = self.base_entry_price * (1 - actual_dist)
+        else:
+            # SHORT: DCA размещается ВЫШЕ входа (при росте)
+            dca_price = self.base_entry_price * (1 + actual_dist)
+        
+        dca_price = float(self.exchange.price_to_precision(self.symbol, dca_price))
+        
+        weight = weights[level]
+        dca_vol_usd = max(self.entry_usd_vol * weight, self.cfg.MIN_EXCHANGE_ORDER_USD)
+        
+        dca_size_coins = (dca_vol_usd * self.cfg.LEVERAGE) / dca_price
+        dca_size_coins = float(self.exchange.amount_to_precision(self.symbol, dca_size_coins))
+        return dca_price, dca_size_coins, actual_dist, weight, dca_vol_usd
+
+    def place_dca_ladder(self):
+        """
+        🪜 DCA_LADDER_MODE: все оставшиеся уровни сетки сразу, одним batch-запросом
+        (create_orders, если биржа поддерживает). Уже стоящие уровни не трогаем
+        """
+        resting = set(self.dca_ladder.values())
+        levels = [lvl for lvl in range(self.safety_count, self.cfg.SAFETY_ORDERS_COUNT) if lvl not in resting]
+        if not levels:
+            return False
+        
+        pos_side = 'LONG' if self.position_side == 'Buy' else 'SHORT'
+        orders = []
+        for lvl in levels:
+            dca_price, dca_size_coins, actual_dist, weight, _ = self._dca_level_order(lvl)
+            if dca_size_coins <= 0:
+                self.log(f"❌ DCA{lvl+1}: amount rounded to 0", Col.RED)
+                continue
+            self.log(f"📝 DCA{lvl+1} Params: amount={dca_size_coins}, price={dca_price:.4f}, dist={actual_dist*100:.2f}%, weight={weight}x", Col.GRAY)
+            orders.append((lvl, {
+                'symbol': self.symbol,
+                'type': 'limit',
+                'side': self.position_side.lower(),
+                'amount': dca_size_coins,
+                'price': dca_price,
+                'params': {'positionSide': pos_side},
+            }))
+        if not orders:
+            return False
+        
+        try:
+            if DCA_LADDER_BATCH and self.exchange.has.get('createOrders'):
+                results = self.exchange.create_orders([o for _, o in orders])
+            else:
+                results = [self.exchange.create_order(**o) for _, o in orders]
+        except Exception as e:
+            self.log(f"❌ DCA ladder placement FAILED: {e}", Col.RED)
+            self.log_debug(traceback.format_exc())
+            return False
+        
+        placed = []
+        for (lvl, o), res in zip(orders, results):
+            if res and res.get('id'):
+                self.dca_ladder[str(res['id'])] = lvl
+                placed.append(f"DCA{lvl+1}@{o['price']:.4f}")
+            else:
+                self.log(f"❌ DCA{lvl+1} rejected: {res}", Col.RED)
+        self.dca_order_id = self._next_ladder_order_id()
+        if placed:
+            self.log(f"✅ DCA ladder placed: {', '.join(placed)}", Col.CYAN)
+        return bool(placed)
+
+    def _next_ladder_order_id(self):
+        """Ближайший к цене уровень лестницы (для дашборда и совместимости с dca_order_id)"""
+        if not self.dca_ladder:
+            return None
+        return min(self.dca_ladder, key=self.dca_ladder.get)
+
+    def cancel_dca_ladder(self):
+        """Отмена всей лестницы (cancel_orders одним запросом, если поддерживается)"""
+        ids = list(self.dca_ladder)
+        self.dca_ladder = {}
+        self.dca_order_id = None
+        if not ids:
+            return
+        try:
+            if self.exchange.has.get('cancelOrders'):
+                self.exchange.cancel_orders(ids, self.symbol)
+                return
+        except Exception as e:
+            self.log(f"⚠️ Batch cancel error: {e}", Col.YELLOW)
+        for oid in ids:
+            try: self.exchange.cancel_order(oid, self.symbol)
+            except: pass
+
+    def check_dca_ladder_fills(self, open_ids):
+        """
+        Исполненные уровни лестницы: несколько fill за одну итерацию (гэп)
+        обрабатываются подряд, TP переставляется один раз
+        """
+        filled = []
+        for oid, lvl in sorted(self.dca_ladder.items(), key=lambda kv: kv[1]):
+            if oid in open_ids:
+                continue
+            check = self.exchange.fetch_order(oid, self.symbol)
+            if check['status'] == 'closed':
+                filled.append((oid, check))
+            elif check['status'] in ['canceled', 'rejected', 'expired']:
+                self.log(f"⚠️ DCA{lvl+1} Order {check['status']}! Will re-place...", Col.RED)
+                self.dca_ladder.pop(oid, None)
+        
+        for i, (oid, check) in enumerate(filled):
+            self.dca_ladder.pop(oid, None)
+            if i == 0:
+                self.tracer.start("dca", exchange_fill=(check.get('lastTradeTimestamp') or 0) / 1000,
+                                  fill_detected=time.time())
+            self.execute_dca(float(check['average']), float(check['filled'] or check['amount']), oid,
+                             place_followups=(i == len(filled) - 1))
+        
+        self.dca_order_id = self._next_ladder_order_id()
+        if self.safety_count + len(self.dca_ladder) < self.cfg.SAFETY_ORDERS_COUNT:
+            self.place_dca_ladder()
+
+    def execute_dca(self, fill_price, fill_amount, order_id, place_followups=True):
         """Исполнение DCA (из ultrabtc7 - БЕЗ ИЗМЕНЕНИЙ!)"""
         try:
             self.safety_count += 1
@@ -1360,8 +1907,12 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             self.total_size_coins += fill_amount
             self.avg_price = ((self.avg_price * prev_total) + (fill_price * fill_amount)) / self.total_size_coins
             
-            dca_fee = self.get_real_order_fee(order_id) or ((fill_amount * fill_price) * MAKER_FEE)
+            real_fee = self.get_real_order_fee(order_id)
+            dca_fee = real_fee or ((fill_amount * fill_price) * MAKER_FEE)
             self.current_trade_fees += dca_fee
+            FILLS.inc(kind="dca")
+            self.journal.record_fill(self.trade_id, "DCA", self.position_side, fill_price, fill_amount,
+                                     fee=dca_fee, order_id=order_id, level=self.safety_count, estimated_fee=not real_fee)
             
             self.dca_order_id = None
             
@@ -1376,20 +1927,75 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
                 "total_size": self.total_size_coins,
                 "fee": dca_fee
             })
+            self.save_state("dca")
+            
+            if not place_followups:
+                return  # Следующий fill лестницы в этой же итерации
             
             self.send_or_update_trade_message(f"DCA{self.safety_count} 🔨")
             
             self.place_limit_tp()
             
-            if self.safety_count < SAFETY_ORDERS_COUNT:
+            # В режиме лестницы следующие уровни уже стоят на бирже
+            if self.safety_count < self.cfg.SAFETY_ORDERS_COUNT and not self.cfg.DCA_LADDER_MODE:
                 self.place_limit_dca()
             
+            self.tracer.mark("dca", "followup_placed")
+            self.tracer.finish("dca", self.trade_id)
+            self.save_state("dca_orders")
             self.update_dashboard(force=True)
         except Exception as e:
+            self.tracer.discard("dca")
             self.log(f"❌ DCA Execute Error: {e}", Col.RED)
 
+    def _new_trade_id(self):
+        """ID сделки для журнала и blackbox (в портфеле с символом - журнал общий)"""
+        trade_id = datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
+        return f"{trade_id}-{self.asset}" if self.portfolio else trade_id
+
+    def _order_filled(self, order_id):
+        if not order_id:
+            return False
+        try:
+            return self.exchange.fetch_order(order_id, self.symbol)['status'] == 'closed'
+        except Exception:
+            return False
+
+    def _drop_gone_position(self, reason):
+        """Позиции нет на бирже, TP не исполнен (ручное закрытие, ликвидация): снимаем ордера, закрываем сделку без PnL"""
+        self.cancel_all_orders()
+        if self.trade_id:
+            self.journal.close_trade(self.trade_id, self.symbol, self.position_side, reason, None,
+                                     self.current_trade_fees, self.avg_price, None, self.safety_count,
+                                     "EXTERNAL", self.current_volatility, self.current_confluence)
+        self.in_position = False
+        self.reset_trailing()
+        self.current_trade_fees = 0.0
+        self.current_confluence = 0
+        self.current_stage = 0
+        self.trade_id = None
+        self.save_state("gone")
+
+    def _journal_closed_trade(self, reason, exit_price, net_pnl, order_type, fill_kind, order_id, amount, exit_fee, estimated_fee):
+        """Запись закрытой сделки в журнал (общая для market-закрытия и TP)"""
+        if not self.trade_id:
+            self.trade_id = self._new_trade_id()
+        FILLS.inc(kind=fill_kind.lower())
+        self.journal.record_fill(self.trade_id, fill_kind, self.position_side, exit_price, amount,
+                                 fee=exit_fee, order_id=order_id, estimated_fee=estimated_fee)
+        self.journal.close_trade(self.trade_id, self.symbol, self.position_side, reason, net_pnl,
+                                 self.current_trade_fees, self.avg_price, exit_price, self.safety_count,
+                                 order_type, self.current_volatility, self.current_confluence)
+
     def close_position_market(self, reason):
-        """Закрытие позиции"""
+        """Закрытие позиции (торговый цикл, risk watcher, Telegram) - не более одного раза"""
+        with self.position_lock:
+            if not self.in_position:
+                self.log_debug("Close skipped (%s): already flat", reason)
+                return False
+            return self._close_position_market(reason)
+
+    def _close_position_market(self, reason):
         try:
             self.cancel_all_orders()
             
@@ -1409,7 +2015,8 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             )
             time.sleep(1) 
             
-            exit_fee = self.get_real_order_fee(order['id']) or (real_amount * price_guess * TAKER_FEE)
+            real_fee = self.get_real_order_fee(order['id'])
+            exit_fee = real_fee or (real_amount * price_guess * TAKER_FEE)
             self.current_trade_fees += exit_fee
             
             try:
@@ -1435,23 +2042,8 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             if net_pnl > 0: self.session_wins += 1
             else: self.session_losses += 1
             
-            try:
-                with open(CSV_FILE, 'a', newline='') as f:
-                    csv.writer(f).writerow([
-                        datetime.now(), 
-                        self.symbol, 
-                        self.position_side, 
-                        reason, 
-                        net_pnl, 
-                        self.current_trade_fees, 
-                        self.avg_price, 
-                        exec_price, 
-                        self.safety_count, 
-                        "MARKET", 
-                        self.current_volatility, 
-                        self.current_confluence
-                    ])
-            except: pass
+            fill_kind = "SL" if reason.startswith("STOP LOSS") else "CLOSE"
+            self._journal_closed_trade(reason, exec_price, net_pnl, "MARKET", fill_kind, order['id'], real_amount, exit_fee, not real_fee)
 
             self.log(f"🏁 CLOSED: {reason} | PnL: ${net_pnl:.2f}", Col.MAGENTA)
             
@@ -1474,129 +2066,269 @@ Provide a short, helpful answer (max 200 words). Be specific and actionable if p
             self.current_trade_fees = 0.0
             self.current_confluence = 0
             self.current_stage = 0
+            self.trade_id = None
             
             if self.graceful_stop_mode:
                 self.trading_active = False
                 self.graceful_stop_mode = False
                 self.tg.send("🛑 Stopped (Graceful)", self.get_keyboard())
             
+            self.save_state("close")
             self.update_dashboard(force=True)
+            return True
             
         except Exception as e:
             self.log(f"❌ CRITICAL CLOSE ERROR: {e}", Col.RED)
+            return False
 
-    def run(self):
-        """Главный цикл"""
-        last_doctor_check = 0
-        last_pnl_log = 0
-        
-        while self.running:
-            try:
-                self.check_telegram_commands()
-                if time.time() - self.last_dashboard_update > 15: 
-                    self.update_dashboard()
-                
+    def _register_jobs(self):
+        """Периодические задачи торгового цикла (см. /jobs)"""
+        s = self.scheduler
+        s.every("status", 30, self._status_job, priority=8)
+        s.every("funding", 60, self._funding_job, priority=8)
+        if self.shadow:
+            return  # Бумажная биржа не расходится с ботом, дашборда и AI у тени нет
+        if self.market_feed:
+            s.every("warm_start", WARM_START_SAVE_INTERVAL, self.save_market_state, priority=9, pool=True,
+                    first_run=time.time() + WARM_START_SAVE_INTERVAL)
+        if self.portfolio:
+            return  # Doctor (общий снимок), дашборд и AI отчёт - задачи Portfolio
+        s.every("doctor", 20, self._doctor_job, priority=1, deadline=10)
+        s.every("dashboard", 15, self.update_dashboard, jitter=1.0, priority=5, pool=True)
+        if self.has_ai:
+            s.daily("ai_report", 15, 0, lambda: self._generate_and_send_ai_report(False), pool=True)
+
+    def _doctor_job(self, snapshot=None):
+        """
+        🚑 Doctor: сиротская позиция без бота / здоровье ордеров позиции.
+        snapshot - снимок Reconciler из общего batch-запроса портфеля
+        """
+        with self.position_lock:
+            if not self.in_position:
+                if self.execution.busy:
+                    return  # Позиция набирается smart entry - это не сирота
                 try:
-                    ticker = self.exchange.fetch_ticker(self.symbol)
-                    self.last_price = float(ticker['last'])
-                except: 
-                    pass
+                    if snapshot is not None:
+                        orphan = snapshot.position_size != 0
+                    else:
+                        positions = self.exchange.fetch_positions([self.symbol])
+                        orphan = any(float(pos.get('contracts', 0) or pos['info'].get('positionAmt', 0)) != 0
+                                     for pos in positions)
+                    if orphan:
+                        self.log("🚑 Doctor: Found orphan position!", Col.MAGENTA)
+                        self._sync_position_with_exchange()
+                except: pass
+            else:
+                self.perform_health_check(snapshot)
 
-                if self.has_ai:
-                    now_utc = datetime.now(timezone.utc)
-                    if now_utc.hour == 15 and now_utc.minute == 0 and not self.report_sent_today:
-                         self.trigger_ai_report_thread(manual=False)
-                         self.report_sent_today = True
-                    elif now_utc.hour == 15 and now_utc.minute > 1:
-                         self.report_sent_today = False
+    def _status_job(self):
+        if not self.in_position:
+            return
+        side_mult = 1 if self.position_side == "Buy" else -1
+        cur_pnl = (self.last_price - self.avg_price) * self.total_size_coins * side_mult
+        pnl_perc = (cur_pnl / self.balance) * 100 if self.balance > 0 else 0
+        self.log("📉 Status: PnL %.2f$ (%.2f%%) | DCA: %d", Col.BLUE,
+                 cur_pnl, pnl_perc, self.safety_count, category="status")
 
-                df = self.get_market_data_enhanced()
-                if df is None: 
-                    time.sleep(TRAILING_UPDATE_INTERVAL)
-                    continue
+    def _funding_job(self):
+        if self.in_position:
+            self.process_funding()
+
+    def _collect_metrics(self):
+        """Gauges позиции/баланса (вызывается при запросе /metrics, не в цикле)"""
+        pos = self.snapshot.position  # Поток HTTP-сервера метрик
+        POSITION_SIZE.set(pos.size, symbol=self.symbol)
+        MARGIN_USED.set(pos.margin(self.cfg.LEVERAGE), symbol=self.symbol)
+        DCA_DEPTH.set(pos.safety_count if pos.in_position else 0, symbol=self.symbol)
+        BALANCE.set(self.balance)
+        LAST_PRICE.set(self.last_price, symbol=self.symbol)
+        RISK_TICK_AGE.set(round(self.risk_watcher.tick_age() or 0.0, 3))
+        bb = self.blackbox.stats()
+        METRICS.gauge("bot_blackbox_dropped", "Blackbox events dropped (queue full)").set(bb["dropped"])
+        METRICS.gauge("bot_blackbox_queue_depth", "Blackbox writer queue depth").set(bb["queue_depth"])
+
+    def step(self, df, data_received, open_orders=None, check_entry=True):
+        """
+        Торговая логика одной итерации после получения цены и свечей (run() / Portfolio).
+        open_orders - открытые ордера символа из общего batch-запроса портфеля,
+        check_entry - искать сигнал (портфель: только на новой закрытой свече)
+        """
+        if not self.in_position:
+            # До задач: исполненный, но не забранный вход Doctor не должен принять за сироту
+            with LOOP_PHASE.time(phase="entry_fill"), self.position_lock:
+                self._poll_entry_execution()
+
+        # Doctor, статус, funding, дашборд, AI отчёт, Future Spy
+        with LOOP_PHASE.time(phase="jobs"):
+            self.scheduler.run_pending()
+
+        if not self.in_position:
+            with LOOP_PHASE.time(phase="entry"), self.position_lock:
+                ready = check_entry and not self.execution.busy and not self.in_position
+                signal_data = self.check_entry_signal_hybrid(df) if ready else None
+                if signal_data: 
+                    # Свеча iloc[-2] закрылась в момент открытия iloc[-1]
+                    self.tracer.start("entry", candle_close=df['timestamp'].iloc[-1] / 1000,
+                                      data_received=data_received, signal=time.time())
+                    self.open_position_limit(signal_data, df)
+        else:
+            # Дублирует risk watcher на случай, если поток цены отстал
+            with LOOP_PHASE.time(phase="risk"), self.position_lock:
+                self.refresh_triggers()
+                if self.cfg.TRAILING_ENABLED and self.check_trailing_stop(): 
+                    return
+                if self.in_position and self.check_hard_stop():
+                    return
+
+            with LOOP_PHASE.time(phase="orders"), self.position_lock:
+                try:
+                    if open_orders is None:
+                        open_orders = self.exchange.fetch_open_orders(self.symbol)
+                    oids = [str(o['id']) for o in open_orders]  # 🆕 v1.4.1: Приведение к строкам
                 
-                if time.time() - last_doctor_check > 20:
-                    if not self.in_position:
-                         try:
-                             positions = self.exchange.fetch_positions([self.symbol])
-                             for pos in positions:
-                                 if float(pos.get('contracts', 0) or pos['info'].get('positionAmt', 0)) != 0:
-                                     self.log("🚑 Doctor: Found orphan position!", Col.MAGENTA)
-                                     self._sync_position_with_exchange()
-                         except: pass
-                    else:
-                        self.perform_health_check()
-                    last_doctor_check = time.time()
+                    if self.cfg.DCA_LADDER_MODE:
+                        if self.dca_ladder:
+                            self.check_dca_ladder_fills(set(oids))
+                    elif self.dca_order_id:
+                         if str(self.dca_order_id) not in oids:  # 🆕 v1.4.1: Сравнение строк
+                             check = self.exchange.fetch_order(self.dca_order_id, self.symbol)
+                             if check['status'] == 'closed':
+                                 self.tracer.start("dca", exchange_fill=(check.get('lastTradeTimestamp') or 0) / 1000,
+                                                   fill_detected=time.time())
+                                 self.execute_dca(float(check['average']), float(check['amount']), self.dca_order_id)
+                             elif check['status'] in ['canceled', 'rejected', 'expired']:
+                                 self.log("⚠️ DCA Order Canceled! Resetting...", Col.RED)
+                                 self.dca_order_id = None
+                                 self.place_limit_dca()
 
-                if not self.in_position:
-                    signal_data = self.check_entry_signal_hybrid(df)
-                    if signal_data: 
-                        self.open_position_limit(signal_data, df)
-                else:
-                    self.process_funding()
-                    
-                    if time.time() - last_pnl_log > 30:
-                        try:
+                    if self.tp_order_id and str(self.tp_order_id) not in oids:  # 🆕 v1.4.1: Сравнение строк
+                        check = self.exchange.fetch_order(self.tp_order_id, self.symbol)
+                        if check['status'] == 'closed':
+                            self.tracer.start("tp", exchange_fill=(check.get('lastTradeTimestamp') or 0) / 1000,
+                                              fill_detected=time.time())
+                            self.log("🎯 TP Executed!", Col.GREEN)
+                            try: 
+                                if self.dca_ladder: self.cancel_dca_ladder()
+                                else: self.exchange.cancel_order(self.dca_order_id, self.symbol)
+                            except: pass
+                        
+                            fill_price = float(check['average'])
+                            real_fee = self.get_real_order_fee(self.tp_order_id)
+                            tp_fee = real_fee or (self.total_size_coins * fill_price * MAKER_FEE)
+                            self.current_trade_fees += tp_fee
+                        
                             side_mult = 1 if self.position_side == "Buy" else -1
-                            cur_pnl = (self.last_price - self.avg_price) * self.total_size_coins * side_mult
-                            pnl_perc = (cur_pnl / self.balance) * 100 if self.balance > 0 else 0
-                            self.log(f"📉 Status: PnL {cur_pnl:.2f}$ ({pnl_perc:.2f}%) | DCA: {self.safety_count}", Col.BLUE)
-                            last_pnl_log = time.time()
-                        except: pass
+                            net = ((fill_price - self.avg_price) * self.total_size_coins * side_mult) - self.current_trade_fees
+                            self.balance += net
+                            self.in_position = False
+                        
+                            self.last_trade_time = datetime.now() - timedelta(hours=2)
 
-                    if TRAILING_ENABLED and self.check_trailing_stop(): 
-                        continue
-                    
-                    try:
-                        max_loss = self.get_effective_balance() * MAX_ACCOUNT_LOSS_PCT
-                        side_mult = 1 if self.position_side == "Buy" else -1
-                        u_pnl = (self.last_price - self.avg_price) * self.total_size_coins * side_mult
+                            self.session_total_pnl += net
+                            self.session_total_fees += self.current_trade_fees
+                            if net > 0: self.session_wins += 1
+                            else: self.session_losses += 1
+                        
+                            self._journal_closed_trade("TP", fill_price, net, "LIMIT", "TP", self.tp_order_id, self.total_size_coins, tp_fee, not real_fee)
+                        
+                            self.log(f"🏁 CLOSED: TP | PnL: ${net:.2f}", Col.MAGENTA)
+                        
+                            trade_duration = (datetime.now() - self.trade_start_time).total_seconds() if self.trade_start_time else 0
+                            self.log_blackbox("EXIT", {
+                                "reason": "TP",
+                                "price": fill_price,
+                                "pnl": net,
+                                "pnl_pct": (net / self.entry_usd_vol * 100) if self.entry_usd_vol > 0 else 0,
+                                "fees": self.current_trade_fees,
+                                "duration_sec": trade_duration,
+                                "dca_count": self.safety_count
+                            })
+                        
+                            self.start_future_spy(fill_price, self.position_side, self.total_size_coins)
                         
-                        if u_pnl <= -max_loss:
-                            self.close_position_market(f"STOP LOSS -{MAX_ACCOUNT_LOSS_PCT*100}%")
-                            continue
-                    except: pass
+                            self.send_or_update_trade_message("TP 🎯", pnl=net, exit_price=fill_price, is_final=True, calculated_fee_only=self.current_trade_fees)
+                            self.cancel_all_orders()
+                            self.tracer.mark("tp", "followup_placed")
+                            self.tracer.finish("tp", self.trade_id)
+                            self.reset_trailing()
+                            self.current_trade_fees = 0.0
+                            self.current_confluence = 0
+                            self.current_stage = 0
+                            self.trade_id = None
+                        
+                            if self.graceful_stop_mode:
+                                self.trading_active = False
+                                self.graceful_stop_mode = False
+                                self.tg.send("🛑 Stopped (Graceful)", self.get_keyboard())
+                        
+                            self.save_state("close")
+                            self.update_dashboard(force=True)
+                        elif check['status'] in ['canceled', 'rejected', 'expired']:
+                            self.log("⚠️ TP Order Canceled! Re-placing...", Col.RED)
+                            self.tp_order_id = None
+                            self.place_limit_tp()
+                except Exception as e:
+                    self.log(f"⚠️ Order check error: {e}", Col.YELLOW)
+                self.refresh_triggers()
+        self.save_state()
 
+    def run(self):
+        """Главный цикл"""
+        wait = 0.0
+        if RISK_WATCHER_ENABLED:
+            self.risk_watcher.start()
+        
+        try:
+            while self.running:
+                # Пауза - вне LOOP_ITERATION / LOOP_PHASE: гистограммы меряют работу, а не ожидание
+                updates = self.wait_telegram_updates(wait)
+                iteration_start = work_start = time.perf_counter()
+                try:
+                    self.profiler.poll()
+                    with LOOP_PHASE.time(phase="telegram"):
+                        self.check_telegram_commands(updates=updates)
+                
+                    with LOOP_PHASE.time(phase="ticker"):
+                        ticker = None
+                        try:
+                            ticker = self.exchange.fetch_ticker(self.symbol)
+                            self.last_price = float(ticker['last'])
+                        except: 
+                            pass
+
+                    with LOOP_PHASE.time(phase="market_data"):
+                        df = self.get_market_data_enhanced()
+                    data_received = time.time()
+                    if df is None: 
+                        time.sleep(TRAILING_UPDATE_INTERVAL)
+                        continue
+                
+                    self.step(df, data_received)
+                    if self.shadows:
+                        self.shadows.feed(self.symbol, ticker, df, data_received=data_received)
+                except Exception as e:
+                    ERRORS.inc(source="loop")
+                    self.log(f"⚠️ Loop iteration error: {e}", Col.YELLOW)
+                    self.log_debug(traceback.format_exc())
+                    time.sleep(TRAILING_UPDATE_INTERVAL)
+                finally:
+                    LOOP_ITERATION.observe(time.perf_counter() - iteration_start)
+                    # Пауза учитывает длительность работы только что завершённой итерации
                     try:
-                        open_orders = self.exchange.fetch_open_orders(self.symbol)
-                        oids = [str(o['id']) for o in open_orders]  # 🆕 v1.4.1: Приведение к строкам
-                        
-                        if self.dca_order_id:
-                             if str(self.dca_order_id) not in oids:  # 🆕 v1.4.1: Сравнение строк
-                                 check = self.exchange.fetch_order(self.dca_order_id, self.symbol)
-                                 if check['status'] == 'closed':
-                                     self.execute_dca(float(check['average']), float(check['amount']), self.dca_order_id)
-                                 elif check['status'] in ['canceled', 'rejected', 'expired']:
-                                     self.log("⚠️ DCA Order Canceled! Resetting...", Col.RED)
-                                     self.dca_order_id = None
-                                     self.place_limit_dca()
-
-                        if self.tp_order_id and str(self.tp_order_id) not in oids:  # 🆕 v1.4.1: Сравнение строк
-                            check = self.exchange.fetch_order(self.tp_order_id, self.symbol)
-                            if check['status'] == 'closed':
-                                self.log("🎯 TP Executed!", Col.GREEN)
-                                try: 
-                                    self.exchange.cancel_order(self.dca_order_id, self.symbol)
-                                except: pass
-                                
-                                fill_price = float(check['average'])
-                                tp_fee = self.get_real_order_fee(self.tp_order_id) or (self.total_size_coins * fill_price * MAKER_FEE)
-                                self.current_trade_fees += tp_fee
-                                
-                                side_mult = 1 if self.position_side == "Buy" else -1
-                                net = ((fill_price - self.avg_price) * self.total_size_coins * side_mult) - self.current_trade_fees
-                                self.balance += net
-                                self.in_position = False
-                                
-                                self.last_trade_time = datetime.now() - timedelta(hours=2)
-
-                                self.session_total_pnl += net
-                                self.session_total_fees += self.current_trade_fees
-                                if net > 0: self.session_wins += 1
-                                else: self.session_losses += 1
-                                
-                                try:
-                                    with open(CSV_FILE, 'a', newline='') as f:
-                                        csv.writer(f).writerow([
-                                            datetime.now(), 
-                                            self.symbol, 
+                        wait = max(0.0, self.next_loop_interval() - (time.perf_counter() - work_start))
+                    except Exception:
+                        wait = LOOP_INTERVAL_MIN
+        except KeyboardInterrupt:
+            self.log("🛑 Stopping...", Col.YELLOW)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Остановка потоков и последнее сохранение (конец run() / Portfolio.run)"""
+        self.running = False
+        METRICS.remove_collector(f"bot:{self.symbol}", self._collect_metrics)
+        self.risk_watcher.stop()
+        self.scheduler.shutdown()
+        if self.shadows: self.shadows.stop()
+        if self.state_store: self.state_store.close()
+        self.save_market_state()
@@ -0,0 +1,262 @@
+"""
+🔥 WARM START
+Индикаторы как рекурсия по закрытым свечам вместо пересчёта ta по окну из 200:
+EMA (9/15/20/50, MACD 12/26/9) и средние Уайлдера RSI / ATR / ADX продолжаются
+с прошлой свечи, EMA50 и ADX(14) не "прогреваются" заново после каждого рестарта.
+- Холодный старт: рекурсия по всему окну повторяет формулы ta (те же NaN / 0 в начале)
+- Каждая новая закрытая свеча - один шаг рекурсии, формирующаяся (iloc[-1]) считается
+  от состояния без сохранения
+- Буфер свечей с индикаторами и состояние рекурсии пишутся на диск
+  (market_state_BTC.json, атомарно) при остановке и раз в WARM_START_SAVE_INTERVAL;
+  после рестарта запрашивается только пропущенный интервал
+"""
+
+import os
+import json
+import math
+import time
+import threading
+
+import ccxt
+import numpy as np
+import pandas as pd
+
+from config import WARM_START_CANDLES, WARM_START_MAX_GAP
+
+WARM_VERSION = 1
+NAN = float("nan")
+
+OHLCV_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+INDICATOR_COLUMNS = ('EMA9', 'EMA15', 'EMA20', 'EMA50', 'RSI', 'ATR', 'ATR_pct', 'ADX',
+                     'MACD', 'MACD_signal', 'MACD_hist')
+COLUMNS = OHLCV_COLUMNS + INDICATOR_COLUMNS
+
+EMA_SPANS = (9, 15, 20, 50, 12, 26)
+MACD_SIGNAL = 9
+WILDER = 14  # RSI / ATR / ADX
+
+
+def initial_state():
+    """Состояние рекурсии до первой свечи"""
+    return {
+        "n": 0, "close": NAN, "high": NAN, "low": NAN,
+        "ema": {str(span): NAN for span in EMA_SPANS},
+        "signal": NAN, "signal_n": 0,
+        "rsi_up": 0.0, "rsi_dn": 0.0,
+        "atr": 0.0,
+        "adx_tr": 0.0, "adx_pos": 0.0, "adx_neg": 0.0, "adx": 0.0,
+    }
+
+
+def advance(state, o, h, l, c):
+    """
+    Один шаг по свече -> (новое состояние, значения INDICATOR_COLUMNS).
+    Формулы и прогрев как в ta: EMA - ewm(span, adjust=False), NaN до span-1 свечи;
+    RSI - ewm(alpha=1/14) приращений (первое = 0); ATR - среднее первых 14 TR, затем Уайлдер;
+    ADX - суммы Уайлдера TR / +DM / -DM с 14-й свечи, ADX - среднее 14 DX, затем Уайлдер, до этого 0
+    """
+    w = WILDER
+    n = state["n"]
+    pc, ph, pl = state["close"], state["high"], state["low"]
+    s = dict(state, n=n + 1, close=c, high=h, low=l)
+
+    # EMA: пока n < span-1 значение есть, но в DataFrame - NaN (min_periods)
+    ema = {}
+    for span in EMA_SPANS:
+        prev = state["ema"][str(span)]
+        alpha = 2.0 / (span + 1)
+        ema[str(span)] = c if n == 0 else alpha * c + (1 - alpha) * prev
+    s["ema"] = ema
+
+    def shown(span):
+        return ema[str(span)] if n >= span - 1 else NAN
+
+    # MACD: сигнал - EMA9 по MACD, который определён только с 26-й свечи
+    macd = shown(12) - shown(26)
+    signal = NAN
+    if not math.isnan(macd):
+        a = 2.0 / (MACD_SIGNAL + 1)
+        s["signal"] = macd if state["signal_n"] == 0 else a * macd + (1 - a) * state["signal"]
+        s["signal_n"] = state["signal_n"] + 1
+        if s["signal_n"] >= MACD_SIGNAL:
+            signal = s["signal"]
+
+    # RSI
+    diff = c - pc if n else 0.0
+    up, dn = max(diff, 0.0), max(-diff, 0.0)
+    if n:
+        s["rsi_up"] = state["rsi_up"] + (up - state["rsi_up"]) / w
+        s["rsi_dn"] = state["rsi_dn"] + (dn - state["rsi_dn"]) / w
+    else:
+        s["rsi_up"], s["rsi_dn"] = up, dn
+    rsi = NAN
+    if n >= w - 1:
+        rsi = 100.0 if s["rsi_dn"] == 0 else 100 - 100 / (1 + s["rsi_up"] / s["rsi_dn"])
+
+    # ATR: до 14-й свечи копится сумма TR
+    tr = h - l if n == 0 else max(h - l, abs(h - pc), abs(l - pc))
+    if n < w - 1:
+        s["atr"] = state["atr"] + tr
+        atr = 0.0
+    elif n == w - 1:
+        atr = s["atr"] = (state["atr"] + tr) / w
+    else:
+        atr = s["atr"] = (state["atr"] * (w - 1) + tr) / w
+
+    # ADX
+    adx = 0.0
+    if n:
+        dm = max(h, pc) - min(l, pc)
+        up_move, down_move = h - ph, pl - l
+        pos = up_move if up_move > down_move and up_move > 0 else 0.0
+        neg = down_move if down_move > up_move and down_move > 0 else 0.0
+        if n <= w:
+            s["adx_tr"], s["adx_pos"], s["adx_neg"] = state["adx_tr"] + dm, state["adx_pos"] + pos, state["adx_neg"] + neg
+        else:
+            s["adx_tr"] = state["adx_tr"] - state["adx_tr"] / w + dm
+            s["adx_pos"] = state["adx_pos"] - state["adx_pos"] / w + pos
+            s["adx_neg"] = state["adx_neg"] - state["adx_neg"] / w + neg
+        if n >= w:
+            trs = s["adx_tr"]
+            dip = 100 * (s["adx_pos"] / trs) if trs != 0 else 0.0
+            din = 100 * (s["adx_neg"] / trs) if trs != 0 else 0.0
+            dx = 100 * abs((dip - din) / (dip + din)) if dip + din != 0 else 0.0
+            if n < 2 * w - 1:
+                s["adx"] = state["adx"] + dx  # Сумма DX до первого среднего
+            elif n == 2 * w - 1:
+                adx = s["adx"] = (state["adx"] + dx) / w
+            else:
+                adx = s["adx"] = (state["adx"] * (w - 1) + dx) / w
+
+    return s, (shown(9), shown(15), shown(20), shown(50), rsi, atr, atr / c if c else NAN, adx,
+               macd, signal, macd - signal)
+
+
+class WarmState:
+    """Неизменяемый результат: закрытые свечи с индикаторами [N, COLUMNS] и состояние после последней"""
+
+    __slots__ = ("rows", "state")
+
+    def __init__(self, rows, state):
+        self.rows = rows
+        self.state = state
+
+    @property
+    def last_ts(self):
+        return int(self.rows[-1, 0])
+
+
+class MarketFeed:
+    def __init__(self, symbol, timeframe, path=None, candles=WARM_START_CANDLES, log_fn=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.step = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        self.path = path
+        self.candles = candles
+        self._log = log_fn or (lambda msg: None)
+        self.warm = None          # WarmState последней принятой закрытой свечи
+        self.restored = False
+        self.reseeds = 0
+        self._save_lock = threading.Lock()  # Задача warm_start в пуле и остановка run() пишут один .tmp
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Расчёт
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def fetch_limit(self, now=None):
+        """
+        Сколько свечей запросить: последняя принятая (проверка стыка) + пропущенные + формирующаяся.
+        Без состояния - всё окно
+        """
+        if self.warm is None:
+            return self.candles
+        now_ms = (time.time() if now is None else now) * 1000
+        missing = int((now_ms - self.warm.last_ts) // self.step) + 1
+        return max(2, min(missing, WARM_START_MAX_GAP + 1))
+
+    def build(self, ohlcv):
+        """
+        (df, WarmState) по свечам [timestamp, open, high, low, close, volume] (последняя - формирующаяся).
+        Свечи до последней принятой пропускаются; окно, не доходящее до неё, - холодный пересчёт.
+        Состояние принимает accept() после успешной итерации (build его только сбрасывает,
+        если короткое окно не стыкуется - следующий запрос будет на всё окно)
+        """
+        arr = np.asarray(ohlcv, dtype=np.float64)
+        closed, forming = arr[:-1], arr[-1]
+        warm = self.warm
+        if warm is not None and (forming[0] <= warm.last_ts or arr[0, 0] > warm.last_ts + self.step):
+            if len(arr) < self.candles:
+                self.warm = None  # Следующий fetch_limit() - всё окно
+                raise ValueError(f"candle window {arr[0, 0]:.0f}..{forming[0]:.0f} "
+                                 f"does not continue {warm.last_ts}, full window needed")
+            self._log(f"🔥 Warm start: candles do not continue {warm.last_ts}, indicators recomputed")
+            self.reseeds += 1
+            warm = None
+
+        if warm is None:
+            state, kept = initial_state(), np.empty((0, len(COLUMNS)))
+        else:
+            state, kept = warm.state, warm.rows
+            closed = closed[closed[:, 0] > warm.last_ts]
+        fresh = np.empty((len(closed), len(COLUMNS)))
+        for i, row in enumerate(closed):
+            state, values = advance(state, *row[1:5])
+            fresh[i, :6], fresh[i, 6:] = row, values
+        _, values = advance(state, *forming[1:5])
+
+        rows = np.concatenate((kept, fresh))[-(self.candles - 1):] if len(fresh) else kept
+        table = np.empty((len(rows) + 1, len(COLUMNS)))
+        table[:-1], table[-1, :6], table[-1, 6:] = rows, forming, values
+        df = pd.DataFrame(table, columns=list(COLUMNS), copy=False)
+        return df, WarmState(rows, state) if len(rows) else None
+
+    def accept(self, warm):
+        if warm is not None:
+            self.warm = warm
+
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    # Диск
+    # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+    def save(self):
+        """Атомарная запись буфера и состояния (из любого потока: WarmState не меняется)"""
+        warm = self.warm
+        if warm is None or not self.path:
+            return False
+        record = {"v": WARM_VERSION, "symbol": self.symbol, "timeframe": self.timeframe,
+                  "saved_at": round(time.time(), 3), "columns": COLUMNS,
+                  "state": warm.state, "rows": warm.rows.tolist()}
+        tmp = self.path + ".tmp"
+        with self._save_lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(record, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        return True
+
+    def load(self, now=None):
+        """Состояние с диска, если оно того же символа / формата и пропуск не больше WARM_START_MAX_GAP свечей"""
+        if not self.path:
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            self._log(f"⚠️ Warm start file unreadable: {e}")
+            return False
+        if (record.get("v") != WARM_VERSION or record.get("symbol") != self.symbol
+                or record.get("timeframe") != self.timeframe or tuple(record.get("columns", ())) != COLUMNS):
+            self._log("⚠️ Warm start file is for another symbol / format, cold start")
+            return False
+        warm = WarmState(np.array(record["rows"], dtype=np.float64), record["state"])
+        gap = ((time.time() if now is None else now) * 1000 - warm.last_ts) // self.step
+        if gap > WARM_START_MAX_GAP:
+            self._log(f"🔥 Warm start state is {gap:.0f} candles old, cold start")
+            return False
+        self.warm = warm
+        self.restored = True
+        self._log(f"🔥 Warm start: {len(warm.rows)} candles and indicator state restored, {gap:.0f} candle(s) to fetch")
+        return True